@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+from sys import argv
+
+from dash.api.service.DataServices.sample_tracking_services import MonocleSampleTracking
+from dash.api.service.DataSources.dashboard_snapshot import DashboardSnapshot
+
+
+def create_dashboard_snapshot(project, snapshot_store):
+    """
+    Computes the dashboard data for all institutions in the project, and saves them as a new snapshot.
+    Returns the path of the snapshot file.
+    """
+    sample_tracking = MonocleSampleTracking()
+    sample_tracking.current_project = project
+    return snapshot_store.save(project, sample_tracking.create_dashboard_snapshot())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create dashboard snapshot")
+    parser.add_argument("-P", "--project", choices=["juno", "gps"], default="juno", help="Project")
+    parser.add_argument(
+        "-L",
+        "--log_level",
+        help="Logging level [default: WARNING]",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        default="WARNING",
+    )
+    options = parser.parse_args(argv[1:])
+
+    logging.basicConfig(format="%(asctime)-15s %(levelname)s %(module)s:  %(message)s", level=options.log_level)
+
+    snapshot_store = DashboardSnapshot()
+    if not snapshot_store.enabled:
+        raise SystemExit("Dashboard snapshot directory is not configured (see dashboard_snapshot in data_sources.yml)")
+    logging.info("Creating {} dashboard snapshot".format(options.project))
+    snapshot_file = create_dashboard_snapshot(options.project, snapshot_store)
+    logging.info("Created {}".format(snapshot_file))
@@ -10,11 +10,22 @@ from pathlib import Path
 from time import sleep, time
 from urllib.error import HTTPError
 from uuid import uuid4
+from zipfile import is_zipfile
 
 import yaml
 from dash.api.exceptions import NotAuthorisedException
-from dash.api.service.service_factory import ServiceFactory
-from dash.api.utils.file import ZIP_SUFFIX, complete_zipfile, zip_files
+from dash.api.service.service_factory import ServiceFactory, set_request_user_record
+from dash.api.utils.file import ZIP_SUFFIX, complete_zipfile, stream_zip_files, zip_files
+from dash.api.utils.zip_cache import ZipArchiveCache
+from dash.api.utils.zip_jobs import (
+    ZIP_JOB_FAILED,
+    ZIP_JOB_READY,
+    ZipJobQueueFullError,
+    read_zip_job_status,
+    shared_zip_job_queue,
+    zip_job_can_be_resubmitted,
+    zip_job_retry_after,
+)
 from flask import Response, jsonify, request
 
 logger = logging.getLogger()
@@ -29,6 +40,12 @@ GET_METADATA_INPUT_SCHEMA = "GetMetadataInput"
 
 AUTH_COOKIE_NAME_ENVIRON = "AUTH_COOKIE_NAME"
 
+# seconds clients are asked to wait before repeating a data download request while the ZIP archive is prepared
+ZIP_JOB_POLL_INTERVAL_SECONDS = 5
+ZIP_JOB_QUEUE_FULL_RETRY_SECONDS = 60
+# path of data_download_route() as known to the client (see the proxy config)
+DATA_DOWNLOAD_URL_PATH = "data_download"
+
 
 def set_auth_cookie_route(body):
     """Given a username and password provided by the user, set cookie to be used by NGINX auth module
@@ -41,7 +58,14 @@ def set_auth_cookie_route(body):
         logging.error("endpoint handler {} must be passed the username and password provided".format(__name__))
         raise
 
-    auth_token = ServiceFactory.authentication_service().get_auth_token(username_provided, password_provided)
+    authentication_service = ServiceFactory.authentication_service()
+    if authentication_service.session_tokens_enabled():
+        # the password is checked now, and the cookie is a signed session token carrying the user's record
+        auth_token = authentication_service.get_session_token(username_provided, password_provided)
+    else:
+        auth_token = authentication_service.get_auth_token(username_provided, password_provided)
+        # the user's record is read from LDAP afresh after logging in, so changes made to it are seen straight away
+        authentication_service.invalidate_user_record(username_provided)
     target_url = call_request_headers().get("X-Target", "/")
 
     auth_response = Response(
@@ -52,13 +76,41 @@ def set_auth_cookie_route(body):
     )
 
     cookie_name = os.environ[AUTH_COOKIE_NAME_ENVIRON]
-    auth_response.set_cookie(
-        cookie_name, value=auth_token.encode("utf8"), max_age=None  # age in seconds; `None` for session cookie
-    )
+    if auth_token is None:
+        # invalid credentials:  with no cookie, the user will be redirected to the log in page by NGINX
+        auth_response.set_cookie(cookie_name, value="", expires=0)
+    elif authentication_service.session_tokens_enabled():
+        auth_response.set_cookie(cookie_name, value=auth_token.encode("utf8"), max_age=None, httponly=True)
+    else:
+        auth_response.set_cookie(
+            cookie_name, value=auth_token.encode("utf8"), max_age=None  # age in seconds; `None` for session cookie
+        )
 
     return auth_response
 
 
+def verify_auth_token_route(employee_type=None):
+    """Checks the session token in the auth cookie, for use by the NGINX auth_request module.
+    Responds 200 (with the username in the X-Remote-User header) if the token is valid, and the user has the
+    employee type passed (if any); otherwise 401.  No LDAP requests are made.
+    """
+    authentication_service = ServiceFactory.authentication_service()
+    if not authentication_service.session_tokens_enabled():
+        logging.error("session token verification requested, but session tokens are not enabled")
+        return Response("Session tokens are not enabled", status=HTTPStatus.UNAUTHORIZED, mimetype="text/plain")
+
+    auth_token = call_request_cookies().get(os.environ[AUTH_COOKIE_NAME_ENVIRON])
+    user_record = authentication_service.get_user_record_from_session_token(auth_token)
+    if user_record is None:
+        return Response("Not authenticated", status=HTTPStatus.UNAUTHORIZED, mimetype="text/plain")
+    if employee_type is not None and user_record.get("type") != employee_type:
+        logging.info("user {} is not of employee type {}".format(user_record["username"], employee_type))
+        return Response("Not authorised", status=HTTPStatus.UNAUTHORIZED, mimetype="text/plain")
+    return Response(
+        "Authenticated", status=HTTPStatus.OK, mimetype="text/plain", headers={"X-Remote-User": user_record["username"]}
+    )
+
+
 def delete_auth_cookie_route():
     """Delete the cookie to be used by NGINX auth module
     Response is a redirect to URL in the X-Target request header ('/' by default)
@@ -72,6 +124,15 @@ def delete_auth_cookie_route():
         headers={"Location": target_url},
     )
 
+    # the user's record is read from LDAP afresh when they next log in, so changes made to it are seen straight away
+    try:
+        username = get_authenticated_username()
+    except NotAuthorisedException:
+        # not logged in (e.g. the cookie has already gone): there's nothing to invalidate, but the cookie is deleted
+        username = None
+    if username:
+        ServiceFactory.authentication_service().invalidate_user_record(username)
+
     cookie_name = os.environ[AUTH_COOKIE_NAME_ENVIRON]
     delete_cookie_response.set_cookie(cookie_name, value="", expires=0)  # expires immediately
 
@@ -87,9 +148,10 @@ def get_user_details_route():
 
 def get_batches_route():
     """Get dashboard batch information"""
-    data = ServiceFactory.sample_tracking_service(get_authenticated_username()).get_batches()
+    sample_tracking_service = ServiceFactory.sample_tracking_service(get_authenticated_username())
+    data = sample_tracking_service.get_batches()
     response_dict = {"batches": data}
-    return call_jsonify(response_dict), HTTPStatus.OK
+    return call_jsonify(response_dict), HTTPStatus.OK, _dashboard_snapshot_headers(sample_tracking_service)
 
 
 def get_institutions_route():
@@ -101,16 +163,18 @@ def get_institutions_route():
 
 def get_progress_route():
     """Get dashboard progress graph information"""
-    data = ServiceFactory.sample_tracking_service(get_authenticated_username()).get_progress()
+    sample_tracking_service = ServiceFactory.sample_tracking_service(get_authenticated_username())
+    data = sample_tracking_service.get_progress()
     response_dict = {"progress_graph": {"data": data}}
-    return call_jsonify(response_dict), HTTPStatus.OK
+    return call_jsonify(response_dict), HTTPStatus.OK, _dashboard_snapshot_headers(sample_tracking_service)
 
 
 def sequencing_status_summary_route():
     """Get dashboard sequencing status summary information"""
-    data = ServiceFactory.sample_tracking_service(get_authenticated_username()).sequencing_status_summary()
+    sample_tracking_service = ServiceFactory.sample_tracking_service(get_authenticated_username())
+    data = sample_tracking_service.sequencing_status_summary()
     response_dict = {"sequencing_status": data}
-    return call_jsonify(response_dict), HTTPStatus.OK
+    return call_jsonify(response_dict), HTTPStatus.OK, _dashboard_snapshot_headers(sample_tracking_service)
 
 
 def project_route():
@@ -122,9 +186,21 @@ def project_route():
 
 def pipeline_status_summary_route():
     """Get dashboard pipeline status summary information"""
-    data = ServiceFactory.sample_tracking_service(get_authenticated_username()).pipeline_status_summary()
+    sample_tracking_service = ServiceFactory.sample_tracking_service(get_authenticated_username())
+    data = sample_tracking_service.pipeline_status_summary()
     response_dict = {"pipeline_status": data}
-    return call_jsonify(response_dict), HTTPStatus.OK
+    return call_jsonify(response_dict), HTTPStatus.OK, _dashboard_snapshot_headers(sample_tracking_service)
+
+
+def _dashboard_snapshot_headers(sample_tracking_service):
+    """
+    Returns response headers for a dashboard route: if the data were taken from a dashboard snapshot,
+    the `Age` header is the number of seconds since the snapshot was created.
+    """
+    snapshot_age = sample_tracking_service.dashboard_snapshot_age()
+    if snapshot_age is None:
+        return {}
+    return {"Age": str(int(snapshot_age))}
 
 
 def get_metadata_route(body):
@@ -264,6 +340,18 @@ def data_download_route(token: str):
     By default 303 response is returned providing a download of the ZIP archive via the static file route;
     but if the query uses `?redirect=false` then the resp[onse is a 200 with the static download
     route in the response body.
+    If the data source config has a ZIP archive job queue (`data_download.zip_job_workers`), the ZIP archive
+    is built by a background job, which the first request for the token submits; until the job is complete,
+    the response is a 202 with the status of the job (see data_download_status_route()), and the client should
+    repeat the request.  A 503 is returned if the job queue is full, or if the job failed (in which case it is
+    submitted again by the first request after the Retry-After delay).
+    If the data source config has a ZIP archive cache quota (`data_download.zip_cache_quota_gb`), the token is
+    mapped onto a ZIP archive named for its content, which is shared by all tokens for the same data; after an
+    archive is created, the least recently used archives are deleted to keep within the quota.
+    If the data source config has a maximum size for streamed downloads (`data_download.stream_max_size_mb`) and
+    the data files are no bigger than that (their total size is found by the first request for the token, and
+    recorded alongside the download params; see _record_download_size()), the ZIP archive is streamed in a 200 response as it is written,
+    without writing it to disk; with `?redirect=false`, the download location in the response is this route.
     If the JSON file isn't found a 404 is returned (this will happen if the download link that
     was used is old, and the housekeeping cron job has deleted the JSON file in the interim).
     """
@@ -282,9 +370,101 @@ def data_download_route(token: str):
         logging.error("data downloads directory {} does not exist".format(download_param_file_location))
         raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), download_param_file_location)
 
-    zip_file_basename = token
+    read_ahead_config = monocle_data.get_bulk_download_read_ahead_config()
+    public_name_to_lane_files = None
+    stream_max_size = monocle_data.get_bulk_download_stream_max_size()
+    if stream_max_size is not None:
+        download_size = _read_download_size(download_param_file_location, token)
+        if download_size is None:
+            public_name_to_lane_files = _read_download_params(download_param_file_location, token)
+            if public_name_to_lane_files is None:
+                return _download_not_available_response()
+            download_size = _record_download_size(
+                monocle_data, download_param_file_location, token, public_name_to_lane_files
+            )
+        if download_size <= stream_max_size:
+            if redirect_wanted:
+                if public_name_to_lane_files is None:
+                    public_name_to_lane_files = _read_download_params(download_param_file_location, token)
+                if public_name_to_lane_files is None:
+                    return _download_not_available_response()
+                return _zip_stream_response(token, public_name_to_lane_files, read_ahead_config)
+            # the client is sent back to this route for the download, which will then be streamed
+            data_download_url = "/".join([_uri_scheme_hostname(), DATA_DOWNLOAD_URL_PATH, token])
+            return call_jsonify({"download location": data_download_url}), HTTPStatus.OK
+
+    zip_cache = _zip_archive_cache(monocle_data, download_param_file_location)
+    if zip_cache is None:
+        zip_file_basename = token
+    else:
+        # the token is mapped onto a ZIP archive shared by all tokens for the same data
+        zip_file_basename = zip_cache.archive_basename(token)
+        if zip_file_basename is None:
+            public_name_to_lane_files = _read_download_params(download_param_file_location, token)
+            if public_name_to_lane_files is None:
+                return _download_not_available_response()
+            zip_file_basename = zip_cache.map_token(token, public_name_to_lane_files)
     zip_file_name = zip_file_basename + ZIP_SUFFIX
-    if Path(download_param_file_location, zip_file_name).is_file():
+    zip_job_config = monocle_data.get_bulk_download_zip_job_config()
+
+    def build_zip_file(progress_callback=None, temporary=False):
+        # with `temporary`, the archive is built under a temporary name, and only moved into place when complete
+        basename = zip_file_basename
+        if temporary:
+            basename = "{}.{}".format(zip_file_basename, uuid4().hex)
+        try:
+            zip_files(
+                public_name_to_lane_files,
+                basename=basename,
+                location=download_param_file_location,
+                progress_callback=progress_callback,
+                read_ahead_config=read_ahead_config,
+            )
+            if temporary:
+                os.replace(
+                    Path(download_param_file_location, basename + ZIP_SUFFIX),
+                    Path(download_param_file_location, zip_file_name),
+                )
+        except BaseException:
+            if temporary:
+                try:
+                    Path(download_param_file_location, basename + ZIP_SUFFIX).unlink()
+                except FileNotFoundError:
+                    pass
+            raise
+        if zip_cache is not None:
+            zip_cache.evict(keep=[zip_file_basename])
+
+    if zip_job_config is not None:
+        zip_job_queue = shared_zip_job_queue(**zip_job_config)
+        job_status = zip_job_queue.status(zip_file_basename, download_param_file_location)
+        if job_status is None or zip_job_can_be_resubmitted(job_status):
+            if public_name_to_lane_files is None:
+                public_name_to_lane_files = _read_download_params(download_param_file_location, token)
+            if public_name_to_lane_files is None:
+                return _download_not_available_response()
+            try:
+                job_status = zip_job_queue.submit(zip_file_basename, download_param_file_location, build_zip_file)
+            except ZipJobQueueFullError as err:
+                logging.warning(err)
+                return Response(
+                    "Too many downloads are being prepared.  Please try again in a few minutes",
+                    content_type="text/plain; charset=UTF-8",
+                    status=HTTPStatus.SERVICE_UNAVAILABLE,
+                    headers={"Retry-After": str(ZIP_JOB_QUEUE_FULL_RETRY_SECONDS)},
+                )
+        if ZIP_JOB_FAILED == job_status["status"]:
+            # the job will be resubmitted by a request made after the retry delay
+            logging.error("ZIP archive job for {} failed: {}".format(zip_file_name, job_status.get("error")))
+            return _zip_job_failed_response(job_status)
+        if ZIP_JOB_READY != job_status["status"]:
+            return _zip_job_pending_response(job_status, redirect_wanted)
+        logging.info("ZIP file {}/{} is ready".format(download_param_file_location, zip_file_name))
+    elif zip_cache is not None and is_zipfile(Path(download_param_file_location, zip_file_name)):
+        # A shared archive is only moved into place once it is complete (see below), so it can be used right away.
+        # Anything else under its name was left behind by a build that died, and is replaced.
+        logging.info("Reusing existing ZIP file {}/{}".format(download_param_file_location, zip_file_name))
+    elif zip_cache is None and Path(download_param_file_location, zip_file_name).is_file():
         # The ZIP file exists. This means we have a repeat download request.
         # If the ZIP file is complete, we can just use it for the download immediately.
         # If is is not complete, this mostly likely indicates a user has clicked a download link
@@ -298,40 +478,206 @@ def data_download_route(token: str):
     else:
         # the ZIP file does not exist, so we ceate it.
         logging.info("Creating ZIP file {}/{}".format(download_param_file_location, zip_file_name))
-        # read params from JSON file on disk containing
-        download_param_file_name = "{}.params.json".format(token)
-        param_file_path = os.path.join(download_param_file_location, download_param_file_name)
-        logging.debug("retrieving download params from {}".format(param_file_path))
+        if public_name_to_lane_files is None:
+            public_name_to_lane_files = _read_download_params(download_param_file_location, token)
         # if the JSON file doesn't exist return a 404
-        if not Path(param_file_path).is_file():
-            logging.warning(
-                "A data download request was made with token {} but {} does not exist. If this is an old token the file may correctly have been deleted.".format(
-                    token, param_file_path
-                )
-            )
-            return Response(
-                "These data are no longer available for download.  Please make a new data download request",
-                content_type="text/plain; charset=UTF-8",
-                status=HTTPStatus.NOT_FOUND,
+        if public_name_to_lane_files is None:
+            return _download_not_available_response()
+
+        # create the ZIP archive; an archive shared by every token for the same data is built under a temporary
+        # name, so a build that dies part-way doesn't leave a partial archive that all those tokens then wait for
+        build_zip_file(temporary=zip_cache is not None)
+
+    if zip_cache is not None:
+        zip_cache.touch(zip_file_basename)
+    zip_file_url = _zip_file_url(monocle_data, zip_file_name)
+    logging.info("Redirecting data download to {}".format(zip_file_url))
+
+    if redirect_wanted:
+        # redirect user to the ZIP file download URL
+        return Response(
+            "Data for these samples are available for download from {}".format(zip_file_url),
+            content_type="text/plain; charset=UTF-8",
+            status=HTTPStatus.SEE_OTHER,
+            headers={"Location": zip_file_url},
+        )
+    else:
+        return call_jsonify({"download location": zip_file_url}), HTTPStatus.OK
+
+
+def data_download_status_route(token: str):
+    """Reports the status of the ZIP archive for the data associated with the token passed.
+    The response is a 200 with the status (queued, running, ready or failed) and the percentage of files
+    added to the ZIP archive; when the ZIP archive is ready, the download location is included.
+    A 404 is returned if the ZIP archive is not being, and has not been, created (it will be created
+    by a request to data_download_route()).
+    """
+    logging.info("endpoint handler {} was passed token = {}".format(__name__, token))
+    monocle_data = ServiceFactory.sample_data_service(get_authenticated_username())
+    download_param_file_location = monocle_data.get_bulk_download_location()
+    zip_file_basename = token
+    zip_cache = _zip_archive_cache(monocle_data, download_param_file_location)
+    if zip_cache is not None:
+        zip_file_basename = zip_cache.archive_basename(token)
+        if zip_file_basename is None:
+            return _no_download_prepared_response()
+    zip_file_name = zip_file_basename + ZIP_SUFFIX
+
+    job_status = read_zip_job_status(zip_file_basename, download_param_file_location)
+    if job_status is None or zip_job_can_be_resubmitted(job_status):
+        # ZIP archives created without the job queue have no job status; a job that was interrupted, or whose ZIP
+        # archive has been deleted, will only be resubmitted by data_download_route()
+        zip_file_path = Path(download_param_file_location, zip_file_name)
+        if not (zip_file_path.is_file() and complete_zipfile(zip_file_path)):
+            return _no_download_prepared_response()
+        job_status = {"status": ZIP_JOB_READY, "percent complete": 100}
+
+    response_dict = {"status": job_status["status"], "percent complete": job_status["percent complete"]}
+    if ZIP_JOB_READY == job_status["status"]:
+        response_dict["download location"] = _zip_file_url(monocle_data, zip_file_name)
+    return call_jsonify(response_dict), HTTPStatus.OK
+
+
+def _read_download_params(download_param_file_location, token):
+    """
+    Returns the dict of data files to be put in the ZIP archive for a download token, keyed on public name,
+    read from the download params file written by bulk_download_urls_route(); or None if the file doesn't exist.
+    """
+    # read params from JSON file on disk containing
+    download_param_file_name = "{}.params.json".format(token)
+    param_file_path = os.path.join(download_param_file_location, download_param_file_name)
+    logging.debug("retrieving download params from {}".format(param_file_path))
+    if not Path(param_file_path).is_file():
+        logging.warning(
+            "A data download request was made with token {} but {} does not exist. If this is an old token the file may correctly have been deleted.".format(
+                token, param_file_path
             )
-        public_name_to_lane_files = json.loads(read_text_file(param_file_path))
-
-        # the file paths need to be prefixed with the value of environment variable `data_inst_view_environ` and then turned into PosixPath objects
-        data_inst_view_environ = DATA_INST_VIEW_ENVIRON[get_authenticated_project()]
-        data_inst_view_path = os.environ[data_inst_view_environ]
-        for this_public_name in public_name_to_lane_files:
-            complete_file_paths = []
-            for this_file in public_name_to_lane_files[this_public_name]:
-                if "/" == this_file[0]:
-                    this_file = str(this_file)[1:]
-                complete_file_paths.append(Path(data_inst_view_path, this_file))
-            public_name_to_lane_files[this_public_name] = complete_file_paths
-        logging.debug("Public name to data files: {}".format(public_name_to_lane_files))
-
-        # create the ZIP archive
-        zip_file_location = download_param_file_location
-        zip_files(public_name_to_lane_files, basename=zip_file_basename, location=zip_file_location)
+        )
+        return None
+    public_name_to_lane_files = json.loads(read_text_file(param_file_path))
 
+    # the file paths need to be prefixed with the value of environment variable `data_inst_view_environ` and then turned into PosixPath objects
+    data_inst_view_environ = DATA_INST_VIEW_ENVIRON[get_authenticated_project()]
+    data_inst_view_path = os.environ[data_inst_view_environ]
+    for this_public_name in public_name_to_lane_files:
+        complete_file_paths = []
+        for this_file in public_name_to_lane_files[this_public_name]:
+            if "/" == this_file[0]:
+                this_file = str(this_file)[1:]
+            complete_file_paths.append(Path(data_inst_view_path, this_file))
+        public_name_to_lane_files[this_public_name] = complete_file_paths
+    logging.debug("Public name to data files: {}".format(public_name_to_lane_files))
+    return public_name_to_lane_files
+
+
+def _read_download_size(download_param_file_location, token):
+    """
+    Returns the total size in bytes of the data files for a download token, as recorded by _record_download_size();
+    or None if it hasn't been recorded.
+    """
+    size_file_path = _download_size_file_path(download_param_file_location, token)
+    if not Path(size_file_path).is_file():
+        return None
+    try:
+        return json.loads(read_text_file(size_file_path))["total size"]
+    except (ValueError, KeyError):
+        # probably being written by another request; the size will be found again
+        logging.warning("download size file {} could not be read".format(size_file_path))
+        return None
+
+
+def _record_download_size(monocle_data, download_param_file_location, token, public_name_to_lane_files):
+    """
+    Finds the total size in bytes of the data files for a download token (using the lane files manifests and the
+    file probe), and records it in a file alongside the download params, so that later requests for the token
+    needn't look at the data files.  Returns the size.
+    """
+    download_size = monocle_data.get_lane_files_size(public_name_to_lane_files)
+    write_text_file(
+        _download_size_file_path(download_param_file_location, token), json.dumps({"total size": download_size})
+    )
+    logging.info("data files for download {} total {} bytes".format(token, download_size))
+    return download_size
+
+
+def _download_size_file_path(download_param_file_location, token):
+    return os.path.join(download_param_file_location, "{}.size.json".format(token))
+
+
+def _download_not_available_response():
+    return Response(
+        "These data are no longer available for download.  Please make a new data download request",
+        content_type="text/plain; charset=UTF-8",
+        status=HTTPStatus.NOT_FOUND,
+    )
+
+
+def _no_download_prepared_response():
+    return Response(
+        "No download is being prepared for this token",
+        content_type="text/plain; charset=UTF-8",
+        status=HTTPStatus.NOT_FOUND,
+    )
+
+
+def _zip_archive_cache(monocle_data, download_param_file_location):
+    """Returns the ZipArchiveCache for the download directory, or None if ZIP archives aren't cached"""
+    quota_bytes = monocle_data.get_bulk_download_zip_cache_quota()
+    if quota_bytes is None:
+        return None
+    return ZipArchiveCache(download_param_file_location, quota_bytes)
+
+
+def _zip_job_pending_response(job_status, redirect_wanted):
+    retry_after = str(ZIP_JOB_POLL_INTERVAL_SECONDS)
+    if redirect_wanted:
+        # probably a browser following a download link: the Refresh header has it reload the page (so repeat
+        # the request) until the ZIP archive is ready and the response is a redirect to the download
+        return Response(
+            "Your download is being prepared ({}% complete).  This page will refresh until it is ready.".format(
+                job_status["percent complete"]
+            ),
+            content_type="text/plain; charset=UTF-8",
+            status=HTTPStatus.ACCEPTED,
+            headers={"Refresh": retry_after, "Retry-After": retry_after},
+        )
+    return (
+        call_jsonify({"status": job_status["status"], "percent complete": job_status["percent complete"]}),
+        HTTPStatus.ACCEPTED,
+        {"Retry-After": retry_after},
+    )
+
+
+def _zip_job_failed_response(job_status):
+    return Response(
+        "Your download could not be prepared.  Please try again in a few minutes",
+        content_type="text/plain; charset=UTF-8",
+        status=HTTPStatus.SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(max(zip_job_retry_after(job_status), ZIP_JOB_POLL_INTERVAL_SECONDS))},
+    )
+
+
+def _zip_stream_response(token, public_name_to_lane_files, read_ahead_config):
+    logging.info("Streaming ZIP file {}".format(token + ZIP_SUFFIX))
+    return Response(
+        stream_zip_files(public_name_to_lane_files, basename=token, read_ahead_config=read_ahead_config),
+        content_type="application/zip",
+        # X-Accel-Buffering stops the proxy buffering the response, so the first bytes reach the client immediately
+        headers={
+            "Content-Disposition": 'attachment; filename="{}"'.format(token + ZIP_SUFFIX),
+            "X-Accel-Buffering": "no",
+        },
+        status=HTTPStatus.OK,
+    )
+
+
+def _zip_file_url(monocle_data, zip_file_name):
+    return "/".join(
+        [_uri_scheme_hostname(), monocle_data.make_download_symlink(cross_institution=True).rstrip("/"), zip_file_name]
+    )
+
+
+def _uri_scheme_hostname():
     # look for Sanger proxy HTTP headers indicating the hostname as known to the client
     # so this can be used for the data download redirect
     try:
@@ -345,22 +691,7 @@ def data_download_route(token: str):
             "Cannot find Sanger proxy header X-Forwarded-Host and/or X-Forwarded-Port (hopefully this is a request on the internal network?)"
         )
         uri_scheme_hostname = ""
-
-    zip_file_url = "/".join(
-        [uri_scheme_hostname, monocle_data.make_download_symlink(cross_institution=True).rstrip("/"), zip_file_name]
-    )
-    logging.info("Redirecting data download to {}".format(zip_file_url))
-
-    if redirect_wanted:
-        # redirect user to the ZIP file download URL
-        return Response(
-            "Data for these samples are available for download from {}".format(zip_file_url),
-            content_type="text/plain; charset=UTF-8",
-            status=HTTPStatus.SEE_OTHER,
-            headers={"Location": zip_file_url},
-        )
-    else:
-        return call_jsonify({"download location": zip_file_url}), HTTPStatus.OK
+    return uri_scheme_hostname
 
 
 def get_metadata_for_download_route(institution_key: str, category: str, status: str):
@@ -390,6 +721,7 @@ def _metadata_as_csv_response(metadata_for_download):
             content = metadata_for_download.get("message", "Server Error")
         return Response(content, content_type="text/plain; charset=UTF-8", status=http_status)
     else:
+        # content may be a string, or an iterator of strings, in which case the CSV is streamed
         return Response(
             metadata_for_download["content"],
             content_type="text/csv; charset=UTF-8",  # text/csv is correct MIME type, but could try 'application/vnd.ms-excel' for windows??
@@ -450,10 +782,19 @@ def get_authenticated_username():
     if not ServiceFactory.TEST_MODE:
         try:
             auth_token = call_request_cookies().get(os.environ[AUTH_COOKIE_NAME_ENVIRON])
-            username = ServiceFactory.authentication_service().get_username_from_token(auth_token)
-            logging.info(
-                "{} cookie = {}, username = {}".format(os.environ[AUTH_COOKIE_NAME_ENVIRON], auth_token, username)
-            )
+            authentication_service = ServiceFactory.authentication_service()
+            if authentication_service.session_tokens_enabled():
+                # the user record carried by a valid session token is used for the request, instead of LDAP
+                user_record = authentication_service.get_user_record_from_session_token(auth_token)
+                if user_record is not None:
+                    username = user_record["username"]
+                    set_request_user_record(username, user_record)
+                logging.info("session token verified, username = {}".format(username))
+            else:
+                username = authentication_service.get_username_from_token(auth_token)
+                logging.info(
+                    "{} cookie = {}, username = {}".format(os.environ[AUTH_COOKIE_NAME_ENVIRON], auth_token, username)
+                )
         except KeyError:
             msg = "Auth cookie name not defined in environment:  variable {} missing".format(AUTH_COOKIE_NAME_ENVIRON)
             logger.error(msg)
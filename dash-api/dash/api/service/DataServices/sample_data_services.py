@@ -2,10 +2,8 @@ import logging
 import urllib.error
 import urllib.parse
 import urllib.request
-from copy import deepcopy
 from csv import QUOTE_NONNUMERIC
 from datetime import datetime
-from functools import reduce
 from math import ceil
 from os import environ
 from pathlib import Path
@@ -16,11 +14,16 @@ import DataSources.metadata_download
 import DataSources.sample_metadata
 import pandas
 import yaml
-from utils.file import format_file_size
+from dash.api.utils.file import format_file_size
+from dash.api.utils.file_probe import shared_file_probe
+from dash.api.utils.lane_files_manifest import shared_lane_files_manifests
+from DataServices.sample_status_filter import filter_samples_by_lane_status
 
 API_ERROR_KEY = "_ERROR"
 DATA_INST_VIEW_ENVIRON = {"juno": "JUNO_DATA_INSTITUTION_VIEW", "gps": "GPS_DATA_INSTITUTION_VIEW"}
 FIELD_NAME_SUBMITTING_INSTITUTION = "submitting_institution"
+IN_SILICO_DATA_TYPE = "in silico data"
+QC_DATA_TYPE = "QC data"
 MIN_ZIP_NUM_SAMPLES_CAPACITY = 3
 MIN_ZIP_NUM_SAMPLES_CAPACITY_WITH_READS = 1
 READ_MODE = "r"
@@ -424,10 +427,8 @@ class MonocleSampleData:
             annotations=kwargs.get("annotations", False),
             reads=kwargs.get("reads", False),
         )
-        total_lane_files_size = 0
-        for lane_files in public_name_to_lane_files.values():
-            lane_files_size = reduce(lambda accum, fl: accum + self._get_file_size(fl), lane_files, 0)
-            total_lane_files_size = total_lane_files_size + lane_files_size
+        # the sizes of files checked by the file probe while listing them are cached, so aren't looked up again
+        total_lane_files_size = self.get_lane_files_size(public_name_to_lane_files)
 
         num_samples = len(filtered_samples)
         total_lane_files_size_zipped = total_lane_files_size / ZIP_COMPRESSION_FACTOR_ASSEMBLIES_ANNOTATIONS
@@ -480,7 +481,9 @@ class MonocleSampleData:
         if not disable_public_name_fetch:
             sanger_sample_id_to_public_name = self._get_sanger_sample_id_to_public_name_dict(institution_keys)
         filtered_samples = []
-        sequencing_status_data = deepcopy(self.get_sample_tracking_service().get_sequencing_status())
+        sample_tracking_service = self.get_sample_tracking_service()
+        sequencing_status_data = sample_tracking_service.get_sequencing_status()
+        batch_sample_ids = sample_tracking_service.get_batch_sample_ids()
         # lane_data is a temporary store of lane data that are needed for filters
         # (we don't want all of the lane data permanetly stored in filtered_samples)
         lane_data = {}
@@ -488,119 +491,90 @@ class MonocleSampleData:
             inst_key = this_inst_key_batch_date_pair["institution key"]
             batch_date_stamp = this_inst_key_batch_date_pair["batch date"]
             try:
-                samples = [
-                    (sanger_sample_id, sample)
-                    for sanger_sample_id, sample in sequencing_status_data[inst_key].items()
-                    if sample
-                ]
+                sanger_sample_ids = batch_sample_ids[inst_key].get(batch_date_stamp, [])
             except KeyError:
                 logging.warning(f'No key "{inst_key}" in sequencing status data.')
                 continue
-            for sanger_sample_id, sample in samples:
-                if (
-                    self.get_sample_tracking_service().convert_mlwh_datetime_stamp_to_date_stamp(
-                        sample["creation_datetime"]
-                    )
-                    == batch_date_stamp
-                ):
-                    lane_data[sanger_sample_id] = sample.get("lanes", [])
-                    # `sample` contains all sequencing status data (because it was copy from the dict returned by
-                    # get_sequencing_status()) but we only want a subset, so strip it down to what's needed:
-                    for this_key in list(sample):
-                        if "lanes" == this_key:
-                            sample[this_key] = [lane["id"] for lane in sample[this_key]]
-                        elif this_key not in ["creation_datetime", "inst_key", "public_name", "sanger_sample_id"]:
-                            del sample[this_key]
-                    # sample ID is the key in sequencing_status_data, so was not included in the dict, but it is useful to
-                    # add it as otherwise functions that call get_filtered_samples() wouldn't have access to the sample ID
-                    sample["sanger_sample_id"] = sanger_sample_id
-                    sample["inst_key"] = inst_key
-                    if not disable_public_name_fetch:
-                        sample["public_name"] = sanger_sample_id_to_public_name[sanger_sample_id]
-                    filtered_samples.append(sample)
-        logging.info("batch from {} on {}:  found {} samples".format(inst_key, batch_date_stamp, len(filtered_samples)))
+            for sanger_sample_id in sanger_sample_ids:
+                sample = sequencing_status_data[inst_key][sanger_sample_id]
+                lane_data[sanger_sample_id] = sample.get("lanes", [])
+                # `sample` contains all sequencing status data, and is shared with the sequencing status cache, so
+                # it mustn't be modified; instead create a new dict with just the subset that's needed
+                filtered_sample = {
+                    this_key: sample[this_key]
+                    for this_key in ["creation_datetime", "public_name"]
+                    if this_key in sample
+                }
+                if "lanes" in sample:
+                    filtered_sample["lanes"] = [lane["id"] for lane in sample["lanes"]]
+                # sample ID is the key in sequencing_status_data, so was not included in the dict, but it is useful to
+                # add it as otherwise functions that call get_filtered_samples() wouldn't have access to the sample ID
+                filtered_sample["sanger_sample_id"] = sanger_sample_id
+                filtered_sample["inst_key"] = inst_key
+                if not disable_public_name_fetch:
+                    filtered_sample["public_name"] = sanger_sample_id_to_public_name[sanger_sample_id]
+                filtered_samples.append(filtered_sample)
+            logging.info(
+                "batch from {} on {}:  found {} samples".format(inst_key, batch_date_stamp, len(sanger_sample_ids))
+            )
 
         # if filters based on sequencing or pipeline status were passed, filter the results
+        status_filters = []
         if "sequencing" in sample_filters:
-            filtered_samples = self._apply_sequencing_filters(filtered_samples, sample_filters["sequencing"], lane_data)
+            status_filters.append((sample_filters["sequencing"], self._get_sequencing_outcomes(lane_data)))
         if "pipeline" in sample_filters:
-            filtered_samples = self._apply_pipeline_filters(filtered_samples, sample_filters["pipeline"], lane_data)
+            status_filters.append((sample_filters["pipeline"], self._get_pipeline_outcomes(lane_data)))
+        if status_filters:
+            lane_ids_by_sample_id = {
+                this_sample_id: [this_lane["id"] for this_lane in this_sample_lanes]
+                for this_sample_id, this_sample_lanes in lane_data.items()
+            }
+            filtered_samples = filter_samples_by_lane_status(filtered_samples, lane_ids_by_sample_id, status_filters)
 
         logging.info("fully filtered sample list contains {} samples".format(len(filtered_samples)))
         return filtered_samples
 
-    def _apply_sequencing_filters(self, filtered_samples, sequencing_filters, lane_data):
-        logging.info(
-            "{}._apply_sequencing_filters filtering initial list of {} samples".format(
-                __class__.__name__, len(filtered_samples)
-            )
-        )
-        failed_samples = []
-        for this_sample in filtered_samples:
-            this_sample_id = this_sample["sanger_sample_id"]
-            at_least_one_lane_passes_sequencing_filters = False
-            for this_lane in lane_data[this_sample_id]:
+    def _get_sequencing_outcomes(self, lane_data):
+        """
+        Pass lane data (lists of lane dicts from sequencing status data, keyed on sample ID)
+        Returns a dict of the sequencing outcome of each lane, keyed on lane ID, for use as a status filter
+        (see DataServices.sample_status_filter)
+        """
+        sample_tracking_service = self.get_sample_tracking_service()
+        lane_outcomes = {}
+        for this_sample_id, this_sample_lanes in lane_data.items():
+            for this_lane in this_sample_lanes:
                 (
                     this_lane_complete,
                     this_lane_success,
                     discard_this,
-                ) = self.get_sample_tracking_service().get_sequencing_outcome_for_lane(this_sample_id, this_lane)
-                this_lane_passes_sequencing_filters = True
-                if "complete" in sequencing_filters:
-                    if not sequencing_filters["complete"] == this_lane_complete:
-                        this_lane_passes_sequencing_filters = False
-                if "success" in sequencing_filters:
-                    if not sequencing_filters["success"] == this_lane_success:
-                        this_lane_passes_sequencing_filters = False
-                if this_lane_passes_sequencing_filters:
-                    at_least_one_lane_passes_sequencing_filters = True
-                    break
-            if not at_least_one_lane_passes_sequencing_filters:
-                logging.debug("sample {} FAILS filter {}".format(this_sample_id, sequencing_filters))
-                failed_samples.append(this_sample_id)
-
-            # remove failed samples from filtered_samples
-            filtered_samples = list(filter(lambda s: s["sanger_sample_id"] not in failed_samples, filtered_samples))
-        return filtered_samples
+                ) = sample_tracking_service.get_sequencing_outcome_for_lane(this_sample_id, this_lane)
+                lane_outcomes[this_lane["id"]] = {"complete": this_lane_complete, "success": this_lane_success}
+        return lane_outcomes
 
-    def _apply_pipeline_filters(self, filtered_samples, pipeline_filters, lane_data):
-        logging.info(
-            "{}._apply_pipeline_filters filtering initial list of {} samples".format(
-                __class__.__name__, len(filtered_samples)
-            )
-        )
-        failed_samples = []
-        for this_sample in filtered_samples:
-            this_sample_id = this_sample["sanger_sample_id"]
-            at_least_one_lane_passes_pipeline_filters = False
-            for this_lane in lane_data[this_sample_id]:
-                this_lane_complete, this_lane_success = self._get_pipeline_outcome_for_lane(this_lane["id"])
-                this_lane_passes_pipeline_filters = True
-                if "complete" in pipeline_filters:
-                    if not pipeline_filters["complete"] == this_lane_complete:
-                        this_lane_passes_pipeline_filters = False
-                if "success" in pipeline_filters:
-                    if not pipeline_filters["success"] == this_lane_success:
-                        this_lane_passes_pipeline_filters = False
-                if this_lane_passes_pipeline_filters:
-                    at_least_one_lane_passes_pipeline_filters = True
-                    break
-            if not at_least_one_lane_passes_pipeline_filters:
-                logging.debug("sample {} FAILS filter {}".format(this_sample_id, pipeline_filters))
-                failed_samples.append(this_sample_id)
-
-            # remove failed samples from filtered_samples
-            filtered_samples = list(filter(lambda s: s["sanger_sample_id"] not in failed_samples, filtered_samples))
-        return filtered_samples
+    def _get_pipeline_outcomes(self, lane_data):
+        """
+        Pass lane data (lists of lane dicts from sequencing status data, keyed on sample ID)
+        Returns a dict of the pipeline outcome of each lane, keyed on lane ID, for use as a status filter
+        (see DataServices.sample_status_filter)
+        """
+        # get the pipeline status of every lane in one go (much faster than looking up each lane)
+        lane_ids = [this_lane["id"] for this_sample_lanes in lane_data.values() for this_lane in this_sample_lanes]
+        lanes_pipeline_status = self.get_sample_tracking_service().get_pipeline_status().lanes_status(lane_ids)
+        lane_outcomes = {}
+        for this_lane_id, this_lane_pipeline_status in lanes_pipeline_status.items():
+            this_lane_complete, this_lane_success = self._get_pipeline_outcome_for_lane(this_lane_pipeline_status)
+            lane_outcomes[this_lane_id] = {"complete": this_lane_complete, "success": this_lane_success}
+        return lane_outcomes
 
     # sequencing status for a lane is provided by sample_tracking_services.MonocleSampleTracking.get_sequencing_outcome_for_lane()
     # but there is no exact equivalent for pipelines, that has a different method of collecting status data via
     # pipeline_status.PipelineStatus
     # this method provides a similar function to get_sequencing_outcome_for_lane(), for pipelines
-    def _get_pipeline_outcome_for_lane(self, lane_id):
+    # pass the lane's pipeline status, as returned by pipeline_status.PipelineStatus.lanes_status()
+    def _get_pipeline_outcome_for_lane(self, this_lane_pipeline_status):
         this_lane_complete = False
         this_lane_success = False
-        this_lane_pipeline_status = self.get_sample_tracking_service().get_pipeline_status().lane_status(lane_id)
         # keys FAILED and SUCCESS are always defined
         # they are both False if we have no status for the lane (i.e. pending in the pipeline)
         if this_lane_pipeline_status["FAILED"] or this_lane_pipeline_status["SUCCESS"]:
@@ -678,6 +652,10 @@ class MonocleSampleData:
            <public name 1>: [<lane files>],
            <public name 2>: ...
         }
+
+        Only files that exist are included.  This is looked up in the institution's lane files manifest (written by
+        the data view job), if there is one; otherwise each file is checked on the data file mount (concurrently,
+        if a file probe is configured -- see get_bulk_download_file_probe_config()).
         """
         data_inst_view_environ = DATA_INST_VIEW_ENVIRON[self.current_project]
         try:
@@ -690,23 +668,45 @@ class MonocleSampleData:
         annotations = kwargs.get("annotations", False)
         reads = kwargs.get("reads", False)
 
+        # list of (public name, lane file, whether the file is in the lane files manifest -- None if no manifest)
+        lane_files = []
+        lane_files_manifests = shared_lane_files_manifests()
         for sample in samples:
             if not sample:
                 continue
             public_name = sample["public_name"]
             institution_key = sample["inst_key"]
+            manifest = lane_files_manifests.get(Path(data_inst_view_path, institution_key))
             for lane_id in sample["lanes"]:
                 lane_file_names = self._get_lane_file_names(
                     lane_id, assemblies=assemblies, annotations=annotations, reads=reads
                 )
                 for lane_file_name in lane_file_names:
                     lane_file = Path(data_inst_view_path, institution_key, public_name, lane_file_name)
-                    if not lane_file.exists():
-                        logging.debug(f"File {lane_file} doesn't exist")
-                        continue
-                    if public_name not in public_name_to_lane_files:
-                        public_name_to_lane_files[public_name] = []
-                    public_name_to_lane_files[public_name].append(lane_file)
+                    in_manifest = None
+                    if manifest is not None:
+                        in_manifest = lane_file_name in manifest.get(public_name, {}).get(lane_id, {})
+                    lane_files.append((public_name, lane_file, in_manifest))
+
+        file_probe = self._get_file_probe()
+        probed_file_sizes = {}
+        if file_probe is not None:
+            probed_file_sizes = file_probe.sizes(
+                lane_file for _, lane_file, in_manifest in lane_files if in_manifest is None
+            )
+        for public_name, lane_file, in_manifest in lane_files:
+            if in_manifest is not None:
+                file_exists = in_manifest
+            elif file_probe is not None:
+                file_exists = probed_file_sizes[lane_file] is not None
+            else:
+                file_exists = lane_file.exists()
+            if not file_exists:
+                logging.debug(f"File {lane_file} doesn't exist")
+                continue
+            if public_name not in public_name_to_lane_files:
+                public_name_to_lane_files[public_name] = []
+            public_name_to_lane_files[public_name].append(lane_file)
 
         return public_name_to_lane_files
 
@@ -771,6 +771,123 @@ class MonocleSampleData:
             )
         return max_samples_per_zip
 
+    def get_bulk_download_zip_job_config(self):
+        """
+        Returns the parameters of the job queue that builds ZIP archives for bulk downloads, as a dict with
+        `max_workers` and `max_queued`; or None if archives are built while the download request waits
+        (i.e. `data_download` has no `zip_job_workers`).
+        """
+        download_config = self._get_data_source_config()["data_download"]
+        if download_config.get("zip_job_workers") is None:
+            return None
+        zip_job_config = {}
+        for param, config_key in (("max_workers", "zip_job_workers"), ("max_queued", "zip_job_max_queued")):
+            try:
+                zip_job_config[param] = int(download_config[config_key])
+            except (KeyError, ValueError) as err:
+                self._download_config_error(err)
+        if not zip_job_config["max_workers"] > 0 or zip_job_config["max_queued"] < 0:
+            self._download_config_error(
+                "data source config data_download.zip_job_workers must be a positive integer, and "
+                'data_download.zip_job_max_queued must not be negative, not "{}" and "{}"'.format(
+                    zip_job_config["max_workers"], zip_job_config["max_queued"]
+                )
+            )
+        return zip_job_config
+
+    def get_bulk_download_read_ahead_config(self):
+        """
+        Returns the parameters for reading data files ahead while ZIP archives for bulk downloads are written, as a
+        dict with `prefetch_depth` (number of files read at once) and `buffer_size` (bytes); or None if files are
+        read one at a time (i.e. `data_download` has no `zip_read_ahead_files`).
+        """
+        download_config = self._get_data_source_config()["data_download"]
+        if download_config.get("zip_read_ahead_files") is None:
+            return None
+        try:
+            read_ahead_config = {
+                "prefetch_depth": int(download_config["zip_read_ahead_files"]),
+                "buffer_size": int(download_config["zip_read_ahead_buffer_mb"]) * 1024 * 1024,
+            }
+        except (KeyError, ValueError) as err:
+            self._download_config_error(err)
+        if not (read_ahead_config["prefetch_depth"] > 0 and read_ahead_config["buffer_size"] > 0):
+            self._download_config_error(
+                "data source config data_download.zip_read_ahead_files and data_download.zip_read_ahead_buffer_mb "
+                'must be positive integers, not "{}" and "{}"'.format(
+                    download_config["zip_read_ahead_files"], download_config["zip_read_ahead_buffer_mb"]
+                )
+            )
+        return read_ahead_config
+
+    def get_bulk_download_zip_cache_quota(self):
+        """
+        Returns the number of bytes the ZIP archives for bulk downloads may take up before the least recently used
+        are deleted; or None if archives aren't shared between download tokens, and are only deleted by the
+        housekeeping job (i.e. `data_download` has no `zip_cache_quota_gb`).
+        """
+        download_config = self._get_data_source_config()["data_download"]
+        if download_config.get("zip_cache_quota_gb") is None:
+            return None
+        try:
+            quota_bytes = int(float(download_config["zip_cache_quota_gb"]) * 1024 * 1024 * 1024)
+        except ValueError as err:
+            self._download_config_error(err)
+        if not quota_bytes > 0:
+            self._download_config_error(
+                'data source config data_download.zip_cache_quota_gb must be positive, not "{}"'.format(
+                    download_config["zip_cache_quota_gb"]
+                )
+            )
+        return quota_bytes
+
+    def get_bulk_download_file_probe_config(self):
+        """
+        Returns the parameters for checking which lane files exist, and their sizes, on the data file mount, as a
+        dict with `workers` (number of files checked at once) and `cache_ttl_seconds` (how long the results are
+        cached); or None if files are checked one at a time, and not cached (i.e. `data_download` has no
+        `file_probe_workers`).
+        """
+        download_config = self._get_data_source_config()["data_download"]
+        if download_config.get("file_probe_workers") is None:
+            return None
+        try:
+            probe_config = {
+                "workers": int(download_config["file_probe_workers"]),
+                "cache_ttl_seconds": int(download_config.get("file_probe_cache_ttl_seconds", 0)),
+            }
+        except ValueError as err:
+            self._download_config_error(err)
+        if not (probe_config["workers"] > 0 and probe_config["cache_ttl_seconds"] >= 0):
+            self._download_config_error(
+                "data source config data_download.file_probe_workers must be a positive integer, and "
+                'data_download.file_probe_cache_ttl_seconds must not be negative, not "{}" and "{}"'.format(
+                    download_config["file_probe_workers"], download_config.get("file_probe_cache_ttl_seconds")
+                )
+            )
+        return probe_config
+
+    def get_bulk_download_stream_max_size(self):
+        """
+        Returns the size in bytes of the largest bulk downloads that are streamed to the client as the ZIP archive
+        is written, rather than written to disk first; or None if ZIP archives are always written to disk
+        (i.e. `data_download` has no `stream_max_size_mb`).
+        """
+        download_config = self._get_data_source_config()["data_download"]
+        if download_config.get("stream_max_size_mb") is None:
+            return None
+        try:
+            max_size = int(download_config["stream_max_size_mb"]) * 1024 * 1024
+        except ValueError as err:
+            self._download_config_error(err)
+        if max_size < 0:
+            self._download_config_error(
+                'data source config data_download.stream_max_size_mb must not be negative, not "{}"'.format(
+                    download_config["stream_max_size_mb"]
+                )
+            )
+        return max_size
+
     def get_metadata_for_download(self, download_hostname, institution_key, category, status):
         """
         This acts as a wrapper for get_csv_download().
@@ -865,6 +982,10 @@ class MonocleSampleData:
            'content'   : 'a,very,long,multi-line,CSV,string'
            }
 
+        If the config has a `csv_stream_chunk_size` in `metadata_download_common`, the content is instead an
+        iterator that yields the CSV in pieces, each covering up to that number of samples (see _metadata_as_csv_stream()).
+        This can be passed to a Flask Response to stream the CSV, without it ever being held in memory all at once.
+
         On failure, returns reasons ('not found', 'request' or 'internal'; could extend in future if required??)
         that can be used to provide suitable HTTP status.  Optionally can include a message with details.
 
@@ -900,11 +1021,17 @@ class MonocleSampleData:
             download_base_url = "/".join([host_url, institution_download_symlink_url_path])
             logging.info("Data download base URL = {}".format(download_base_url))
 
-        csv_response_string = self._metadata_as_csv(sample_filters, download_base_url=download_base_url)
+        csv_stream_chunk_size = self._get_csv_stream_chunk_size()
+        if csv_stream_chunk_size is None:
+            csv_response_content = self._metadata_as_csv(sample_filters, download_base_url=download_base_url)
+        else:
+            csv_response_content = self._metadata_as_csv_stream(
+                sample_filters, csv_stream_chunk_size, download_base_url=download_base_url
+            )
 
-        if csv_response_string is None:
+        if csv_response_content is None:
             return {"success": False, "error": "not found", "message": "No matching samples were found."}
-        return {"success": True, "filename": csv_response_filename, "content": csv_response_string}
+        return {"success": True, "filename": csv_response_filename, "content": csv_response_content}
 
     def _metadata_as_csv(self, sample_filters, download_base_url=None):
         """
@@ -917,19 +1044,71 @@ class MonocleSampleData:
             return None
         return self._metadata_df_to_csv(metadata_df, column_order)
 
-    def _metadata_as_df(self, sample_filters, download_base_url=None):
+    def _metadata_as_csv_stream(self, sample_filters, chunk_size, download_base_url=None):
         """
-        Pass sample filters (as understood by get_filtered_samples() to indicate the samples to
-        be downloaded.
+        Streaming equivalent of _metadata_as_csv(): pass sample filters, the number of samples per chunk and,
+        optionally, the download base URL (all as _metadata_as_df()).
 
-        Optionally pass a base URL for the download; if provided, a download URL for each sample
-        (this base URL with the public name appended) will be added as an extra column.
+        Returns an iterator that yields the CSV in pieces, or None if there are no matching samples.  The samples
+        are processed in chunks: metadata, QC data and in silico data are retrieved and merged for one chunk at
+        a time, so the memory used depends on the chunk size rather than the total number of samples.
+        """
+        samples_for_download = self._get_samples_for_download(sample_filters)
+        if 1 > len(samples_for_download):
+            return None
+        return self._metadata_csv_chunks(samples_for_download, chunk_size, download_base_url=download_base_url)
 
-        When available, in silico data for each sample are included.
+    def _metadata_csv_chunks(self, samples_for_download, chunk_size, download_base_url=None):
+        """
+        Generator for _metadata_as_csv_stream(): pass a dict of lane IDs for each sample (as returned by
+        _get_samples_for_download()), the number of samples per chunk and, optionally, the download base URL.
+        Yields the CSV for each chunk of samples, preceded by the header row.
+
+        The CSV columns are all the columns the metadata API can download (see
+        MetadataDownload.get_download_columns()), so that each chunk can be output as soon as it is retrieved:
+        the columns of a type of data that none of the samples have (e.g. in silico data) are left empty, rather
+        than being left out as they are by _metadata_as_csv().
+        """
+        download_columns = self.metadata_download_source.get_download_columns(self.current_project)
+        data_col_orders = {IN_SILICO_DATA_TYPE: download_columns["in_silico_data"]}
+        if self._get_merge_qc_data_flag():
+            data_col_orders[QC_DATA_TYPE] = download_columns["qc_data"]
+        column_order = self._download_column_order(
+            download_columns["metadata"], data_col_orders, download_base_url is not None
+        )
+        sanger_sample_ids = list(samples_for_download)
+        for chunk_start in range(0, len(sanger_sample_ids), chunk_size):
+            chunk_sanger_sample_ids = sanger_sample_ids[chunk_start : chunk_start + chunk_size]
+            logging.info(
+                "metadata CSV: processing samples {} to {} of {}".format(
+                    chunk_start + 1, chunk_start + len(chunk_sanger_sample_ids), len(sanger_sample_ids)
+                )
+            )
+            chunk_df, _, _ = self._samples_metadata_as_df(
+                {this_sample_id: samples_for_download[this_sample_id] for this_sample_id in chunk_sanger_sample_ids},
+                download_base_url=download_base_url,
+            )
+            yield self._metadata_dfs_to_csv([chunk_df], column_order, header=(0 == chunk_start))
 
-        The config file states if QC data, when available, should be included.
+    def _metadata_dfs_to_csv(self, metadata_dfs, metadata_col_order, header=True):
+        """
+        Pass a list of pandas dataframes and the column order; columns missing from a dataframe are left empty.
+        Optionally pass `header=False` if the CSV header row is not wanted.
+        Returns CSV of the dataframes' rows, in order.
+        """
+        return "".join(
+            this_metadata_df.reindex(columns=metadata_col_order).to_csv(
+                index=False, header=(header and 0 == i), quoting=QUOTE_NONNUMERIC
+            )
+            for i, this_metadata_df in enumerate(metadata_dfs)
+        )
 
-        Returns pandas data frame and column order; or None if there are no matching samples
+    def _get_samples_for_download(self, sample_filters):
+        """
+        Pass sample filters (as understood by get_filtered_samples() to indicate the samples to
+        be downloaded.
+        Returns a dict of the lane IDs of each matching sample, keyed on sample ID; the dict is empty if
+        there are no matching samples.
         """
         # for metadata downloads, we just need a dict with sample IDs as keys,
         # value are arrays of lane ID(s) for each sample
@@ -950,9 +1129,43 @@ class MonocleSampleData:
         except urllib.error.HTTPError as e:
             if "404" not in str(e):
                 raise e
+        return samples_for_download
+
+    def _metadata_as_df(self, sample_filters, download_base_url=None):
+        """
+        Pass sample filters (as understood by get_filtered_samples() to indicate the samples to
+        be downloaded.
 
+        Optionally pass a base URL for the download; if provided, a download URL for each sample
+        (this base URL with the public name appended) will be added as an extra column.
+
+        When available, in silico data for each sample are included.
+
+        The config file states if QC data, when available, should be included.
+
+        Returns pandas data frame and column order; or None if there are no matching samples
+        """
+        samples_for_download = self._get_samples_for_download(sample_filters)
         if 1 > len(samples_for_download):
             return (None, None)
+        metadata_df, metadata_col_order, data_col_orders = self._samples_metadata_as_df(
+            samples_for_download, download_base_url=download_base_url
+        )
+        return (
+            metadata_df,
+            self._download_column_order(metadata_col_order, data_col_orders, download_base_url is not None),
+        )
+
+    def _samples_metadata_as_df(self, samples_for_download, download_base_url=None):
+        """
+        Pass a dict of the lane IDs of each sample to be downloaded, keyed on sample ID (as returned
+        by _get_samples_for_download()), and optionally the download base URL (see _metadata_as_df()).
+
+        Returns pandas data frame, metadata column order, and a dict with the column order of each other type
+        of data (QC_DATA_TYPE and/or IN_SILICO_DATA_TYPE) that was found and merged into the metadata; these
+        are combined by _download_column_order().
+        """
+        data_col_orders = {}
 
         # retrieve the sample metadata and load into DataFrame
         logging.debug("Requesting metadata for samples: {}".format(samples_for_download))
@@ -1038,7 +1251,7 @@ class MonocleSampleData:
                 )
                 del qc_data_df
                 # add QC data columns to the list
-                metadata_col_order = metadata_col_order + qc_data_col_order
+                data_col_orders[QC_DATA_TYPE] = qc_data_col_order
             else:
                 logging.info("There are no QC data to be merged")
 
@@ -1075,7 +1288,26 @@ class MonocleSampleData:
             )
             del in_silico_data_df
             # add silico data columns to the list
-            metadata_col_order = metadata_col_order + in_silico_data_col_order
+            data_col_orders[IN_SILICO_DATA_TYPE] = in_silico_data_col_order
+
+        return (metadata_df, metadata_col_order, data_col_orders)
+
+    def _download_column_order(self, metadata_col_order, data_col_orders, include_download_link):
+        """
+        Pass the metadata column order, a dict of the column orders of other types of data merged into the
+        metadata (as returned by _samples_metadata_as_df()), and a flag to indicate if download links are included.
+        Returns the list of the columns to be included in the CSV output, in order.
+        """
+        (
+            sanger_sample_id_field,
+            public_name_field,
+            metadata_merge_field,
+            in_silico_merge_field,
+            qc_data_merge_field,
+        ) = self._get_download_id_and_merge_fields()
+        metadata_col_order = (
+            metadata_col_order + data_col_orders.get(QC_DATA_TYPE, []) + data_col_orders.get(IN_SILICO_DATA_TYPE, [])
+        )
 
         # list of columns in `metadata_col_order` defines the CSV output
         # remove the fields used for merging the QC and in silico data into the metadata
@@ -1094,10 +1326,10 @@ class MonocleSampleData:
             metadata_col_order.remove(public_name_field)
         metadata_col_order.insert(0, public_name_field)
         # if download links are included, put them in last column
-        if download_base_url is not None:
+        if include_download_link:
             metadata_col_order.append("Download_Link")
 
-        return (metadata_df, metadata_col_order)
+        return metadata_col_order
 
     def _get_download_id_and_merge_fields(self):
         data_source_config = self._get_data_source_config()
@@ -1129,6 +1361,26 @@ class MonocleSampleData:
             self._download_config_error(err)
         return merge_qc_data
 
+    def _get_csv_stream_chunk_size(self):
+        """
+        Returns the number of samples in each chunk when metadata CSV downloads are streamed, or None
+        if they are not streamed (i.e. `metadata_download_common` has no `csv_stream_chunk_size`).
+        """
+        common_config = self._get_data_source_config().get("metadata_download_common") or {}
+        if common_config.get("csv_stream_chunk_size") is None:
+            return None
+        try:
+            csv_stream_chunk_size = int(common_config["csv_stream_chunk_size"])
+        except ValueError as err:
+            self._download_config_error(err)
+        if not csv_stream_chunk_size > 0:
+            self._download_config_error(
+                'data source config metadata_download_common.csv_stream_chunk_size must be a positive integer, not "{}"'.format(
+                    csv_stream_chunk_size
+                )
+            )
+        return csv_stream_chunk_size
+
     def _metadata_df_to_csv(self, metadata_df, metadata_col_order):
         """
         Pass panda dataframe and column order.
@@ -1250,7 +1502,46 @@ class MonocleSampleData:
         data_download_link.symlink_to(download_host_dir.absolute())
         return download_url_path
 
+    def get_lane_files_size(self, public_name_to_lane_files):
+        """
+        Pass a dict of lists of lane files (as returned by get_public_name_to_lane_files_dict()).
+        Returns the total size in bytes of the files that exist.
+        """
+        return sum(
+            self._get_file_sizes(
+                lane_file for lane_files in public_name_to_lane_files.values() for lane_file in lane_files
+            ).values()
+        )
+
+    def _get_file_sizes(self, lane_files):
+        """
+        Pass an iterable of lane file paths.
+        Returns a dict of the size in bytes of each file (0 if it doesn't exist), keyed on path.  Sizes are taken
+        from the lane files manifests where possible; the other files are all checked by the file probe at once
+        (or, without a file probe, one at a time).
+        """
+        lane_files_manifests = shared_lane_files_manifests()
+        sizes = {}
+        not_in_manifest = []
+        for lane_file in lane_files:
+            manifest_entry = lane_files_manifests.file_entry(lane_file)
+            if manifest_entry is None:
+                not_in_manifest.append(lane_file)
+            else:
+                sizes[lane_file] = manifest_entry["size"]
+        file_probe = self._get_file_probe()
+        if file_probe is None:
+            for lane_file in not_in_manifest:
+                sizes[lane_file] = self._get_file_size(lane_file)
+        elif not_in_manifest:
+            for lane_file, file_size in file_probe.sizes(not_in_manifest).items():
+                sizes[lane_file] = 0 if file_size is None else file_size
+        return sizes
+
     def _get_file_size(self, path_instance):
+        manifest_entry = shared_lane_files_manifests().file_entry(path_instance)
+        if manifest_entry is not None:
+            return manifest_entry["size"]
         try:
             logging.debug("counting size of download file: {}  {}".format(path_instance, path_instance.stat().st_size))
             return path_instance.stat().st_size
@@ -1258,6 +1549,12 @@ class MonocleSampleData:
             logging.info(f"Failed to open file {path_instance}: {err}")
             return 0
 
+    def _get_file_probe(self):
+        probe_config = self.get_bulk_download_file_probe_config()
+        if probe_config is None:
+            return None
+        return shared_file_probe(probe_config)
+
     def _get_data_source_config(self):
         # read file if not cached
         if self.data_source_config is None:
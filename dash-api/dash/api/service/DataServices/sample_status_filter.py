@@ -0,0 +1,58 @@
+import logging
+
+# the lane outcomes that status filters can test, e.g. {"complete": True, "success": False}
+LANE_OUTCOMES = ("complete", "success")
+
+
+def lane_outcome_passes(lane_outcome, criteria):
+    """
+    Pass a lane outcome dict ({"complete": <bool>, "success": <bool>}) and a filter criteria dict with
+    the required value of some or all of the outcomes.
+    Returns True if the lane has all the required outcomes.  Criteria other than LANE_OUTCOMES are ignored.
+    """
+    return all(
+        lane_outcome[this_outcome] == criteria[this_outcome]
+        for this_outcome in LANE_OUTCOMES
+        if this_outcome in criteria
+    )
+
+
+def filter_samples_by_lane_status(samples, lanes_by_sample_id, status_filters):
+    """
+    Pass a list of sample dicts (each with a `sanger_sample_id`), a dict of the lane IDs of each sample, keyed
+    on sample ID, and a list of status filters.
+
+    Each status filter is a tuple (criteria, lane outcomes), where criteria is a dict such as {"success": True}
+    and lane outcomes is a dict of the outcome of every lane, keyed on lane ID (see lane_outcome_passes()).
+    Status filters would typically be for sequencing and pipeline status.
+
+    Returns the list of samples that pass every status filter; a sample passes a filter if at least one of its
+    lanes has the outcomes required by the criteria (not necessarily the same lane for each filter).
+
+    The lanes that pass each filter are found first, as a set; the samples are then checked in a single pass,
+    so the time taken is proportional to the number of lanes.
+    """
+    passing_lane_id_sets = [
+        {
+            this_lane_id
+            for this_lane_id, this_outcome in lane_outcomes.items()
+            if lane_outcome_passes(this_outcome, criteria)
+        }
+        for criteria, lane_outcomes in status_filters
+    ]
+    passing_samples = [
+        this_sample
+        for this_sample in samples
+        if all(
+            any(
+                this_lane_id in passing_lane_ids for this_lane_id in lanes_by_sample_id[this_sample["sanger_sample_id"]]
+            )
+            for passing_lane_ids in passing_lane_id_sets
+        )
+    ]
+    logging.info(
+        "{} of {} samples pass status filters {}".format(
+            len(passing_samples), len(samples), [criteria for criteria, lane_outcomes in status_filters]
+        )
+    )
+    return passing_samples
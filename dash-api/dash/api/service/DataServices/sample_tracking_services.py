@@ -2,15 +2,19 @@ import logging
 import urllib.error
 import urllib.request
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import datetime
+from functools import lru_cache
 from os import environ
 
+import DataSources.dashboard_snapshot
 import DataSources.institution_data
 import DataSources.metadata_download
 import DataSources.pipeline_status
 import DataSources.sample_metadata
 import DataSources.sequencing_status
+import numpy
 from dateutil.relativedelta import relativedelta
 
 # This key indicates the error status for MLWH requests for sample status information for each institution
@@ -23,9 +27,53 @@ FORMAT_DATE = "%Y-%m-%d"
 # format of timestamp returned in MLWH queries
 FORMAT_MLWH_DATETIME = f"{FORMAT_DATE}T%H:%M:%S%z"
 SAMPLE_TABLE_INST_KEY_COLUMN_NAME = "submitting_institution"
+# number of converted MLWH timestamps kept (every sample and lane has its own timestamp, so they are not all kept)
+MLWH_DATETIME_STAMP_CACHE_SIZE = 4096
 
 UNWANTED_LANES_FILE_ENVIRON = "UNWANTED_LANES_FILE"
 
+# keys of the sections of a dashboard snapshot (see DataSources.dashboard_snapshot)
+DASHBOARD_BATCHES = "batches"
+DASHBOARD_PROGRESS = "progress"
+DASHBOARD_SEQUENCING_STATUS = "sequencing_status"
+DASHBOARD_PIPELINE_STATUS = "pipeline_status"
+
+# name of the batch index kept with each sequencing status cache entry (see get_batch_sample_ids())
+_BATCH_SAMPLE_IDS = "batch sample ids"
+
+
+@lru_cache(maxsize=MLWH_DATETIME_STAMP_CACHE_SIZE)
+def _convert_mlwh_datetime_stamp_to_date_stamp(datetime_stamp):
+    return datetime.strptime(datetime_stamp, FORMAT_MLWH_DATETIME).strftime(FORMAT_DATE)
+
+
+def convert_mlwh_datetime_stamps_to_dates(datetime_stamps):
+    """
+    Pass a list of MLWH timestamps (see FORMAT_MLWH_DATETIME).
+    Returns a numpy datetime64[D] array of their dates.  The whole list is converted at once: the date is the
+    leading ISO8601 date of each timestamp, so (like convert_mlwh_datetime_stamp_to_date_stamp()) it is the
+    date in the timestamp's own time zone.  Raises ValueError if a timestamp does not start with a valid date.
+    """
+    # a 10 character string dtype keeps just the "YYYY-MM-DD" date from the start of each timestamp
+    return numpy.array(datetime_stamps, dtype="U10").astype("datetime64[D]")
+
+
+def _index_samples_by_batch(samples):
+    """
+    Pass an institution's sequencing status data.
+    Returns a dict of the IDs of the samples received on each date (ISO8601 date stamps).
+    """
+    samples = [
+        (this_sanger_sample_id, this_sample)
+        for this_sanger_sample_id, this_sample in samples.items()
+        if this_sanger_sample_id != API_ERROR_KEY and this_sample
+    ]
+    received = convert_mlwh_datetime_stamps_to_dates([this_sample["creation_datetime"] for _, this_sample in samples])
+    batch_sample_ids = defaultdict(list)
+    for (this_sanger_sample_id, _), batch_date in zip(samples, received.astype(str)):
+        batch_sample_ids[batch_date].append(this_sanger_sample_id)
+    return dict(batch_sample_ids)
+
 
 class MonocleSampleTracking:
     """
@@ -45,8 +93,20 @@ class MonocleSampleTracking:
         self.institutions_data = None
         self.samples_data = None
         self.sequencing_status_data = None
+        self.sequencing_dates = None
+        self.sequencing_dates_source = None
+        self.batch_sample_ids = None
+        self.batch_sample_ids_source = None
+        # the cache entries (DataSources.sequencing_status.InstitutionSamples) that sequencing_status_entries_source
+        # (the sequencing status data) came from, keyed on institution
+        self.sequencing_status_entries = {}
+        self.sequencing_status_entries_source = None
         self.pipeline_status_instance = None
         self.all_institutions_data_irrespective_of_user_membership = None
+        self.dashboard_snapshot_source = None
+        self.dashboard_snapshot = None
+        self.dashboard_snapshot_used = False
+        self.use_dashboard_snapshot = True
         # set_up flag causes data objects to be loaded on instantiation
         # only set to False if you know what you're doing
         if set_up:
@@ -54,6 +114,7 @@ class MonocleSampleTracking:
             self.institution_ldap_data = DataSources.institution_data.InstitutionData()
             self.sample_metadata = DataSources.sample_metadata.SampleMetadata()
             self.sequencing_status_source = DataSources.sequencing_status.SequencingStatus()
+            self.dashboard_snapshot_source = DataSources.dashboard_snapshot.DashboardSnapshot()
 
     # date from which progress is counted
     def _get_day_zero(self):
@@ -62,53 +123,46 @@ class MonocleSampleTracking:
         raise ValueError("The current project is not set, or invalid")
 
     def get_progress(self):
+        snapshot_progress = self._get_from_dashboard_snapshot(DASHBOARD_PROGRESS)
+        if snapshot_progress is not None:
+            return snapshot_progress
         institutions_data = self.get_all_institutions_irrespective_of_user_membership()
-        total_num_samples_received_by_month = defaultdict(int)
-        total_num_lanes_sequenced_by_month = defaultdict(int)
-        progress = {
-            "date": [],
-            "samples received": [],
-            "samples sequenced": [],
-        }
+        day_zero = self._get_day_zero()
+        day_zero_month = numpy.datetime64(day_zero, "M")
+        project_months_elapsed = int(numpy.datetime64(self.updated, "M") - day_zero_month)
+        num_months = max(project_months_elapsed + 1, 0)
+        total_num_samples_received_by_month = numpy.zeros(num_months, dtype=int)
+        total_num_lanes_sequenced_by_month = numpy.zeros(num_months, dtype=int)
+        sequencing_dates = self.get_sequencing_dates()
         # get number of samples received and number of lanes sequenced during each month counted from "day zero"
         for this_institution in institutions_data:
-            # samples received
-            this_institution_num_samples_received_by_date = self._num_samples_received_by_date(this_institution)
-            for this_date_string in this_institution_num_samples_received_by_date:
-                this_date = datetime.fromisoformat(this_date_string)
-                # days_elapsed   = (this_date - self._get_day_zero()).days
-                months_elapsed = ((this_date.year - self._get_day_zero().year) * 12) + (
-                    this_date.month - self._get_day_zero().month
-                )
-                total_num_samples_received_by_month[months_elapsed] += this_institution_num_samples_received_by_date[
-                    this_date_string
-                ]
-            # lanes sequenced
-            this_institution_num_lanes_sequenced_by_date = self._num_lanes_sequenced_by_date(this_institution)
-            for this_date_string in this_institution_num_lanes_sequenced_by_date:
-                this_date = datetime.fromisoformat(this_date_string)
-                months_elapsed = ((this_date.year - self._get_day_zero().year) * 12) + (
-                    this_date.month - self._get_day_zero().month
-                )
-                total_num_lanes_sequenced_by_month[months_elapsed] += this_institution_num_lanes_sequenced_by_date[
-                    this_date_string
-                ]
-        # get cumulative numbers received/sequenced for *every* month from 0 to most recent month for which we found something
-        num_samples_received_cumulative = 0
-        num_lanes_sequenced_cumulative = 0
-        project_months_elapsed = ((self.updated.year - self._get_day_zero().year) * 12) + (
-            self.updated.month - self._get_day_zero().month
-        )
-        for this_month_elapsed in range(0, project_months_elapsed + 1, 1):
-            if this_month_elapsed in total_num_samples_received_by_month:
-                num_samples_received_cumulative += total_num_samples_received_by_month[this_month_elapsed]
-            if this_month_elapsed in total_num_lanes_sequenced_by_month:
-                num_lanes_sequenced_cumulative += total_num_lanes_sequenced_by_month[this_month_elapsed]
-            # progress['date'].append( this_month_elapsed )
-            progress["date"].append((self._get_day_zero() + relativedelta(months=this_month_elapsed)).strftime("%b %Y"))
-            progress["samples received"].append(num_samples_received_cumulative)
-            progress["samples sequenced"].append(num_lanes_sequenced_cumulative)
-        return progress
+            this_institution_dates = sequencing_dates[this_institution]
+            if this_institution_dates is None:
+                continue
+            total_num_samples_received_by_month += self._count_by_month(
+                this_institution_dates["received"], day_zero_month, num_months
+            )
+            total_num_lanes_sequenced_by_month += self._count_by_month(
+                this_institution_dates["sequenced"], day_zero_month, num_months
+            )
+        # get cumulative numbers received/sequenced for *every* month from 0 to the current month
+        return {
+            "date": [
+                (day_zero + relativedelta(months=this_month_elapsed)).strftime("%b %Y")
+                for this_month_elapsed in range(num_months)
+            ],
+            "samples received": numpy.cumsum(total_num_samples_received_by_month).tolist(),
+            "samples sequenced": numpy.cumsum(total_num_lanes_sequenced_by_month).tolist(),
+        }
+
+    def _count_by_month(self, dates, first_month, num_months):
+        """
+        Pass a numpy datetime64 array of dates, the first month to count, and the number of months to count.
+        Returns a numpy array with the number of dates in each month; dates outside the months counted are ignored.
+        """
+        months_elapsed = (dates.astype("datetime64[M]") - first_month).astype(int)
+        months_elapsed = months_elapsed[(months_elapsed >= 0) & (months_elapsed < num_months)]
+        return numpy.bincount(months_elapsed, minlength=num_months)
 
     def get_institutions(self):
         """
@@ -234,13 +288,17 @@ class MonocleSampleTracking:
         ID will not appear as a key in the dict of sequencing data for its institution.
 
         The data are cached so this can safely be called multiple times without
-        repeated MLWH queries being made.
+        repeated MLWH queries being made.  MLWH data for each institution are also held
+        in a process-wide cache shared by all users (see SequencingStatus.get_institution_samples_entry()),
+        so only the institutions in this user's record are projected out of it here.
         """
         if self.sequencing_status_data is not None:
             return self.sequencing_status_data
         samples_data = self.get_samples()
         institutions_data = self.get_institutions()
         sequencing_status = {}
+        sequencing_status_entries = {}
+        sample_ids_by_institution = {}
         for this_institution in institutions_data:
             sequencing_status[this_institution] = {}
             sanger_sample_id_list = [s["sanger_sample_id"] for s in samples_data[this_institution]]
@@ -250,36 +308,163 @@ class MonocleSampleTracking:
                         __class__.__name__, sanger_sample_id_list
                     )
                 )
-                try:
-                    sequencing_status[this_institution] = self.sequencing_status_source.get_multiple_samples(
-                        sanger_sample_id_list
-                    )
-                except urllib.error.HTTPError:
-                    logging.warning(
-                        "{}.get_sequencing_status() failed to collect {} samples for unknown reason".format(
-                            __class__.__name__, len(sanger_sample_id_list)
-                        )
+                sample_ids_by_institution[this_institution] = sanger_sample_id_list
+        for this_institution, this_result in self._get_sequencing_status_by_institution(sample_ids_by_institution):
+            if isinstance(this_result, urllib.error.HTTPError):
+                sanger_sample_id_list = sample_ids_by_institution[this_institution]
+                logging.warning(
+                    "{}.get_sequencing_status() failed to collect {} samples for unknown reason".format(
+                        __class__.__name__, len(sanger_sample_id_list)
                     )
-                    logging.info(
-                        "{}.get_sequencing_status() failed to collect these {} samples: {}".format(
-                            __class__.__name__, len(sanger_sample_id_list), sanger_sample_id_list
-                        )
+                )
+                logging.info(
+                    "{}.get_sequencing_status() failed to collect these {} samples: {}".format(
+                        __class__.__name__, len(sanger_sample_id_list), sanger_sample_id_list
                     )
-                    sequencing_status[this_institution][
-                        API_ERROR_KEY
-                    ] = "Server Error: Records cannot be collected at this time. Please try again later."
+                )
+                sequencing_status[this_institution][
+                    API_ERROR_KEY
+                ] = "Server Error: Records cannot be collected at this time. Please try again later."
+            else:
+                sequencing_status_entries[this_institution] = this_result
+                sequencing_status[this_institution] = dict(this_result.samples)
+        for this_institution in sequencing_status:
             if API_ERROR_KEY not in sequencing_status[this_institution]:
                 sequencing_status[this_institution][API_ERROR_KEY] = None
         self._remove_unwanted_lanes(sequencing_status)
         self.sequencing_status_data = sequencing_status
+        self.sequencing_status_entries = sequencing_status_entries
+        self.sequencing_status_entries_source = sequencing_status
         return self.sequencing_status_data
 
+    def get_sequencing_dates(self):
+        """
+        Returns the dates on which samples were received, and lanes were sequenced, for each institution
+        the user is a member of:
+
+        {  institution_1: {  'sample_ids': [sanger_sample_id_1, sanger_sample_id_2, ...],
+                             'received':   date received of each sample, in the same order as `sample_ids`
+                             'sequenced':  date of completion of every lane of the samples that has completed
+                             },
+           institution_2...
+           }
+
+        Dates are numpy datetime64[D] arrays.  Institutions for which the sequencing status request failed
+        have the value None.
+
+        The MLWH timestamps are converted once, the first time they are needed for the current sequencing status
+        data (see get_sequencing_status()), so dates can be grouped and counted without parsing timestamps again.
+        """
+        sequencing_status_data = self.get_sequencing_status()
+        if self.sequencing_dates is not None and self.sequencing_dates_source is sequencing_status_data:
+            return self.sequencing_dates
+        sequencing_dates = {}
+        for this_institution, this_institution_samples in sequencing_status_data.items():
+            if this_institution_samples.get(API_ERROR_KEY) is not None:
+                sequencing_dates[this_institution] = None
+                continue
+            samples = [
+                (this_sanger_sample_id, this_sample)
+                for this_sanger_sample_id, this_sample in this_institution_samples.items()
+                if this_sanger_sample_id != API_ERROR_KEY and this_sample
+            ]
+            sequencing_dates[this_institution] = {
+                "sample_ids": [this_sanger_sample_id for this_sanger_sample_id, this_sample in samples],
+                "received": convert_mlwh_datetime_stamps_to_dates(
+                    [this_sample["creation_datetime"] for this_sanger_sample_id, this_sample in samples]
+                ),
+                "sequenced": convert_mlwh_datetime_stamps_to_dates(
+                    [
+                        this_lane["complete_datetime"]
+                        for this_sanger_sample_id, this_sample in samples
+                        for this_lane in this_sample.get("lanes", [])
+                        if "complete_datetime" in this_lane
+                    ]
+                ),
+            }
+        self.sequencing_dates = sequencing_dates
+        self.sequencing_dates_source = sequencing_status_data
+        return self.sequencing_dates
+
+    def get_batch_sample_ids(self):
+        """
+        Returns an index of the sequencing status data, with the IDs of the samples received in each batch
+        (i.e. on each date) for each institution the user is a member of:
+
+        {  institution_1: {  batch_date_1: [sanger_sample_id_1, sanger_sample_id_2, ...],
+                             batch_date_2...
+                             },
+           institution_2...
+           }
+
+        Batch dates are ISO8601 date stamps.  Institutions for which the sequencing status request failed
+        have an empty dict.
+
+        The index of each institution is built once per entry in the process-wide sequencing status cache, and
+        kept with it (see SequencingStatus.get_institution_samples_entry()), so it is shared by every request
+        using the same data, and must not be modified.
+        """
+        sequencing_status_data = self.get_sequencing_status()
+        if self.batch_sample_ids is not None and self.batch_sample_ids_source is sequencing_status_data:
+            return self.batch_sample_ids
+        sequencing_status_entries = {}
+        if self.sequencing_status_entries_source is sequencing_status_data:
+            sequencing_status_entries = self.sequencing_status_entries
+        batch_sample_ids = {}
+        for this_institution, this_institution_samples in sequencing_status_data.items():
+            if this_institution_samples.get(API_ERROR_KEY) is not None:
+                batch_sample_ids[this_institution] = {}
+            elif this_institution in sequencing_status_entries:
+                batch_sample_ids[this_institution] = sequencing_status_entries[this_institution].derived(
+                    _BATCH_SAMPLE_IDS, _index_samples_by_batch
+                )
+            else:
+                batch_sample_ids[this_institution] = _index_samples_by_batch(this_institution_samples)
+        self.batch_sample_ids = batch_sample_ids
+        self.batch_sample_ids_source = sequencing_status_data
+        return self.batch_sample_ids
+
+    def _get_sequencing_status_by_institution(self, sample_ids_by_institution):
+        """
+        Pass a dict of sample ID lists, keyed on institution.
+        Requests the sequencing status data for each institution, making up to `max_concurrent_requests`
+        (see SequencingStatus) requests concurrently, so the time taken is determined by the slowest institution
+        rather than the total for all institutions.
+        Returns a list of (institution key, result) tuples, where the result is either the sequencing status data
+        for that institution (as a DataSources.sequencing_status.InstitutionSamples), or the urllib.error.HTTPError
+        raised if the request failed.
+        """
+
+        def get_institution_samples(this_institution):
+            try:
+                return self.sequencing_status_source.get_institution_samples_entry(
+                    self.current_project, this_institution, sample_ids_by_institution[this_institution]
+                )
+            except urllib.error.HTTPError as e:
+                return e
+
+        max_workers = min(len(sample_ids_by_institution), self.sequencing_status_source.max_concurrent_requests())
+        if max_workers < 2:
+            return [(i, get_institution_samples(i)) for i in sample_ids_by_institution]
+        logging.debug(
+            "{} requesting sequencing status for {} institutions, {} at a time".format(
+                __class__.__name__, len(sample_ids_by_institution), max_workers
+            )
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(
+                zip(sample_ids_by_institution, executor.map(get_institution_samples, sample_ids_by_institution))
+            )
+
     def get_batches(self):
         """
         Returns dict with details of batches delivered.
 
         TODO:  find out a way to get the genuine total number of expected samples for each institution
         """
+        snapshot_batches = self._get_from_dashboard_snapshot(DASHBOARD_BATCHES)
+        if snapshot_batches is not None:
+            return snapshot_batches
         samples = self.get_samples()
         institutions_data = self.get_institutions()
         sequencing_status_data = self.get_sequencing_status()
@@ -344,6 +529,9 @@ class MonocleSampleTracking:
 
         TODO:  improve 'failed' dict 'issue' strings
         """
+        snapshot_status = self._get_from_dashboard_snapshot(DASHBOARD_SEQUENCING_STATUS)
+        if snapshot_status is not None:
+            return snapshot_status
         sequencing_status_data = self.get_sequencing_status()
         status = {}
         for this_institution in sequencing_status_data:
@@ -490,9 +678,22 @@ class MonocleSampleTracking:
 
         TODO:  decide what to do about about 'failed' dict 'issue' strings
         """
+        snapshot_status = self._get_from_dashboard_snapshot(DASHBOARD_PIPELINE_STATUS)
+        if snapshot_status is not None:
+            return snapshot_status
         institutions_data = self.get_institutions()
         sequencing_status_data = self.get_sequencing_status()
         pipeline_status = self.get_pipeline_status()
+        # get the pipeline status of every lane in one go (much faster than looking up each lane)
+        lane_ids = [
+            this_lane["id"]
+            for this_institution in institutions_data
+            if sequencing_status_data[this_institution][API_ERROR_KEY] is None
+            for this_sanger_sample_id, this_sample in sequencing_status_data[this_institution].items()
+            if this_sanger_sample_id != API_ERROR_KEY
+            for this_lane in this_sample["lanes"]
+        ]
+        lanes_pipeline_status = pipeline_status.lanes_status(lane_ids)
         status = {}
         for this_institution in institutions_data.keys():
             if sequencing_status_data[this_institution][API_ERROR_KEY] is not None:
@@ -514,7 +715,7 @@ class MonocleSampleTracking:
                     continue
                 this_sample_lanes = sequencing_status_data[this_institution][this_sanger_sample_id]["lanes"]
                 for this_lane_id in [lane["id"] for lane in this_sample_lanes]:
-                    this_pipeline_status = pipeline_status.lane_status(this_lane_id)
+                    this_pipeline_status = lanes_pipeline_status[this_lane_id]
                     # if the lane failed, increment failed and completed counter
                     if this_pipeline_status["FAILED"]:
                         status[this_institution]["failed"] += 1
@@ -541,42 +742,101 @@ class MonocleSampleTracking:
                         status[this_institution]["running"] += 1
         return status
 
+    def create_dashboard_snapshot(self):
+        """
+        Returns a dict with the dashboard data for every institution in the current project, to be saved
+        by DataSources.dashboard_snapshot.DashboardSnapshot.save()
+
+        {  'batches':           <as returned by get_batches()>,
+           'progress':          <as returned by get_progress()>,
+           'sequencing_status': <as returned by sequencing_status_summary()>,
+           'pipeline_status':   <as returned by pipeline_status_summary()>,
+           }
+
+        The data are always computed from the data sources, never taken from an existing snapshot.
+        This must not be used when there is a user record, as a snapshot must include all institutions.
+        """
+        if self.user_record is not None:
+            raise ValueError("dashboard snapshots must be created without a user record, to include all institutions")
+        self.use_dashboard_snapshot = False
+        return {
+            DASHBOARD_BATCHES: self.get_batches(),
+            DASHBOARD_PROGRESS: self.get_progress(),
+            DASHBOARD_SEQUENCING_STATUS: self.sequencing_status_summary(),
+            DASHBOARD_PIPELINE_STATUS: self.pipeline_status_summary(),
+        }
+
+    def get_dashboard_snapshot(self):
+        """
+        Returns the latest dashboard snapshot for the current project, or None if there is no usable snapshot
+        (see DataSources.dashboard_snapshot).
+
+        The snapshot is cached so this can safely be called multiple times.
+        Always returns None if `use_dashboard_snapshot` is False, even if a snapshot was cached already.
+        """
+        if not self.use_dashboard_snapshot:
+            return None
+        if self.dashboard_snapshot is None and self.dashboard_snapshot_source is not None:
+            self.dashboard_snapshot = self.dashboard_snapshot_source.latest(self.current_project)
+        return self.dashboard_snapshot
+
+    def dashboard_snapshot_age(self):
+        """
+        Returns the age, in seconds, of the dashboard snapshot that data returned by this object were taken from,
+        or None if no data were taken from a snapshot.
+        """
+        if not self.dashboard_snapshot_used:
+            return None
+        return DataSources.dashboard_snapshot.DashboardSnapshot.age_seconds(self.dashboard_snapshot)
+
+    def _get_from_dashboard_snapshot(self, section):
+        """
+        Pass the key of a dashboard snapshot section (DASHBOARD_BATCHES etc.)
+        Returns the data in that section of the latest snapshot, filtered for the institutions returned by
+        get_institutions(); or None if there is no snapshot, or it doesn't include all of those institutions
+        (e.g. an institution added since the snapshot was created), in which case the caller should compute the data.
+        Progress data aren't filtered, as they are for the whole project.
+        Institutions' data are shared with the cached snapshot, and must not be modified.
+        """
+        snapshot = self.get_dashboard_snapshot()
+        if snapshot is None:
+            return None
+        section_data = snapshot[section]
+        if DASHBOARD_PROGRESS != section:
+            institutions_data = self.get_institutions()
+            missing_institutions = [i for i in institutions_data if i not in section_data]
+            if missing_institutions:
+                logging.info(
+                    "{}: institutions {} not in dashboard snapshot, so {} data will not be taken from the snapshot".format(
+                        __class__.__name__, missing_institutions, section
+                    )
+                )
+                return None
+            section_data = {i: section_data[i] for i in institutions_data}
+        self.dashboard_snapshot_used = True
+        return section_data
+
     def convert_mlwh_datetime_stamp_to_date_stamp(self, datetime_stamp):
-        return datetime.strptime(datetime_stamp, FORMAT_MLWH_DATETIME).strftime(FORMAT_DATE)
+        return _convert_mlwh_datetime_stamp_to_date_stamp(datetime_stamp)
 
     def _num_samples_received_by_date(self, institution):
-        sequencing_status_data = self.get_sequencing_status()
-        samples_received = sequencing_status_data[institution]
-        if sequencing_status_data[institution][API_ERROR_KEY] is not None:
-            return {}
-        num_samples_received_by_date = defaultdict(int)
-        for this_sanger_sample_id in samples_received:
-            if this_sanger_sample_id == API_ERROR_KEY:
-                continue
-            received_date = self.convert_mlwh_datetime_stamp_to_date_stamp(
-                sequencing_status_data[institution][this_sanger_sample_id]["creation_datetime"]
-            )
-            num_samples_received_by_date[received_date] += 1
-        return num_samples_received_by_date
+        return self._count_by_date(self.get_sequencing_dates()[institution], "received")
 
     def _num_lanes_sequenced_by_date(self, institution):
-        sequencing_status_data = self.get_sequencing_status()
-        if sequencing_status_data[institution][API_ERROR_KEY] is not None:
-            return {}
-        samples_received = sequencing_status_data[institution]
-        num_lanes_sequenced_by_date = defaultdict(int)
+        return self._count_by_date(self.get_sequencing_dates()[institution], "sequenced")
 
-        for this_sanger_sample_id in samples_received:
-            if this_sanger_sample_id == API_ERROR_KEY:
-                continue
-            # get each lane (some samples may have non lanes yet)
-            for this_lane in sequencing_status_data[institution][this_sanger_sample_id]["lanes"]:
-                # get timestamp for completion (some lanes may not have one yet)
-                if "complete_datetime" in this_lane:
-                    this_lane["complete_datetime"]
-                    sequenced_date = self.convert_mlwh_datetime_stamp_to_date_stamp(this_lane["complete_datetime"])
-                    num_lanes_sequenced_by_date[sequenced_date] += 1
-        return num_lanes_sequenced_by_date
+    def _count_by_date(self, institution_dates, date_type):
+        """
+        Pass an institution's dates (from get_sequencing_dates()) and the type of date to count ("received" or
+        "sequenced").
+        Returns a dict of the number of each date, keyed on ISO8601 date stamp, in the order in which each
+        date first appears in the sequencing status data.
+        """
+        if institution_dates is None:
+            return {}
+        dates, first_index, counts = numpy.unique(institution_dates[date_type], return_index=True, return_counts=True)
+        in_order_found = numpy.argsort(first_index, kind="stable")
+        return dict(zip(dates[in_order_found].astype(str).tolist(), counts[in_order_found].tolist()))
 
     def _remove_unwanted_lanes(self, sequencing_status):
         # get uwanted lanes' ID from file specified by environment variable
@@ -620,7 +880,11 @@ class MonocleSampleTracking:
                                     this_institution, this_sample, len(this_sample_lanes_list), len(filtered_lanes_list)
                                 )
                             )
-                            sequencing_status[this_institution][this_sample]["lanes"] = filtered_lanes_list
+                            # replace (rather than modify) the sample dict, as it may be shared via the sequencing status cache
+                            sequencing_status[this_institution][this_sample] = {
+                                **sequencing_status[this_institution][this_sample],
+                                "lanes": filtered_lanes_list,
+                            }
                         else:
                             logging.debug("{} sample {} lanes unnaffected".format(this_institution, this_sample))
 
@@ -17,6 +17,29 @@ class MonocleAuthentication:
     def get_username_from_token(self, auth_token):
         return self.user_authentication.get_username_from_token(auth_token)
 
+    def session_tokens_enabled(self):
+        return self.user_authentication.session_tokens_enabled()
+
+    def get_session_token(self, username_provided, password_provided):
+        """
+        Checks the username and password provided by the user against LDAP.
+        Returns a session token carrying the user's record, or None if the credentials are invalid.
+        """
+        user_data = DataSources.user_data.UserData()
+        if not user_data.verify_password(username_provided, password_provided):
+            return None
+        # the user's record is read from LDAP afresh when logging in, so changes made to it are seen straight away
+        self.invalidate_user_record(username_provided)
+        return self.user_authentication.get_session_token(user_data.get_user_details(username_provided))
+
+    def get_user_record_from_session_token(self, session_token):
+        """Returns the user record carried by a session token, or None if the token isn't valid"""
+        return self.user_authentication.get_user_details_from_session_token(session_token)
+
+    def invalidate_user_record(self, username):
+        """Removes the user's record from the user details cache, so it is read from LDAP next time"""
+        DataSources.user_data.invalidate_user_details(username)
+
 
 class MonocleUser:
     """
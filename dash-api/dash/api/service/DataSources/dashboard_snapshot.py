@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+
+import yaml
+
+# bump this if the snapshot content changes in a way that older snapshots can't be used any more
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_FILE_PREFIX = "dashboard_snapshot_"
+SNAPSHOT_FILE_SUFFIX = ".json"
+# used in snapshot file names, so they sort in the order they were created
+FORMAT_SNAPSHOT_FILE_TIMESTAMP = "%Y%m%dT%H%M%S%f"
+
+DEFAULT_MAX_AGE_SECONDS = 3600
+DEFAULT_VERSIONS_TO_KEEP = 3
+
+# the most recently loaded snapshot for each project, so each worker parses a snapshot file only once:
+# project => (snapshot file path, snapshot dict)
+_loaded_snapshots = {}
+_loaded_snapshots_lock = Lock()
+
+
+class DashboardSnapshot:
+    """
+    Stores precomputed dashboard data (batches, progress, sequencing and pipeline status summaries
+    for every institution in a project), so that dashboard requests can be answered without querying
+    the metadata API and MLWH, or parsing the pipeline status file.
+
+    Snapshots are written by a scheduled job (see `bin/create_dashboard_snapshot.py`) as JSON files in a directory
+    for each project; each new snapshot is a new file, and older files are deleted once there are more than
+    `versions_to_keep`.  Snapshots older than `max_age_seconds` are ignored, so that stale data won't be
+    displayed if the scheduled job stops running.
+
+    If the environment variable named by `snapshot_dir_environ` is not set, snapshots are disabled.
+    """
+
+    data_sources_config = "data_sources.yml"
+    data_source = "dashboard_snapshot"
+
+    def __init__(self, set_up=True):
+        self.snapshot_dir = None
+        self.max_age_seconds = DEFAULT_MAX_AGE_SECONDS
+        self.versions_to_keep = DEFAULT_VERSIONS_TO_KEEP
+        # set_up flag causes config to be loaded on instantiation
+        if set_up:
+            self.set_up(self.data_sources_config)
+
+    def set_up(self, config_file_name):
+        with open(config_file_name, "r") as file:
+            data_sources = yaml.load(file, Loader=yaml.FullLoader)
+        config = data_sources.get(self.data_source)
+        if config is None:
+            return
+        snapshot_dir_environ = config.get("snapshot_dir_environ")
+        if snapshot_dir_environ is not None and snapshot_dir_environ in os.environ:
+            self.snapshot_dir = Path(os.environ[snapshot_dir_environ])
+        self.max_age_seconds = config.get("max_age_seconds", DEFAULT_MAX_AGE_SECONDS)
+        self.versions_to_keep = config.get("versions_to_keep", DEFAULT_VERSIONS_TO_KEEP)
+
+    @property
+    def enabled(self):
+        return self.snapshot_dir is not None
+
+    def save(self, project, snapshot_data):
+        """
+        Pass the project and a dict of dashboard data.
+        Writes a new snapshot for the project, adding the creation time and format version, and deletes old snapshots.
+        The file is written under a temporary name and then renamed, so a partly written snapshot is never read.
+        Returns the path of the new snapshot file.
+        """
+        if not self.enabled:
+            raise RuntimeError("cannot save dashboard snapshot: snapshot directory is not configured")
+        project_dir = self.snapshot_dir / project
+        project_dir.mkdir(parents=True, exist_ok=True)
+        created = datetime.now()
+        snapshot = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "project": project,
+            "created": created.isoformat(),
+            **snapshot_data,
+        }
+        snapshot_file = project_dir / "{}{}{}".format(
+            SNAPSHOT_FILE_PREFIX, created.strftime(FORMAT_SNAPSHOT_FILE_TIMESTAMP), SNAPSHOT_FILE_SUFFIX
+        )
+        with NamedTemporaryFile("w", dir=project_dir, suffix=".tmp", delete=False) as temp_file:
+            json.dump(snapshot, temp_file)
+        os.replace(temp_file.name, snapshot_file)
+        logging.info("saved {} dashboard snapshot {}".format(project, snapshot_file))
+        self._delete_old_snapshots(project_dir)
+        return snapshot_file
+
+    def latest(self, project):
+        """
+        Returns the most recent snapshot for the project, or None if there is no snapshot, or it is too old to be used.
+        The returned dict is shared with other requests and must not be modified.
+        """
+        if not self.enabled:
+            return None
+        snapshot_files = self._snapshot_files(self.snapshot_dir / project)
+        if not snapshot_files:
+            logging.info("no {} dashboard snapshot found in {}".format(project, self.snapshot_dir))
+            return None
+        snapshot = self._load(project, snapshot_files[-1])
+        if snapshot is None:
+            return None
+        age = self.age_seconds(snapshot)
+        if age > self.max_age_seconds:
+            logging.warning(
+                "{} dashboard snapshot is {}s old (maximum {}s): it will not be used".format(
+                    project, int(age), self.max_age_seconds
+                )
+            )
+            return None
+        return snapshot
+
+    @staticmethod
+    def age_seconds(snapshot):
+        return (datetime.now() - datetime.fromisoformat(snapshot["created"])).total_seconds()
+
+    def _load(self, project, snapshot_file):
+        with _loaded_snapshots_lock:
+            loaded = _loaded_snapshots.get(project)
+            if loaded is not None and loaded[0] == snapshot_file:
+                return loaded[1]
+        try:
+            with open(snapshot_file, "r") as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.error("failed to read dashboard snapshot {}: {}".format(snapshot_file, e))
+            return None
+        if snapshot.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            logging.warning(
+                "dashboard snapshot {} has format version {} (expected {}): it will not be used".format(
+                    snapshot_file, snapshot.get("format_version"), SNAPSHOT_FORMAT_VERSION
+                )
+            )
+            return None
+        with _loaded_snapshots_lock:
+            _loaded_snapshots[project] = (snapshot_file, snapshot)
+        return snapshot
+
+    def _delete_old_snapshots(self, project_dir):
+        snapshot_files = self._snapshot_files(project_dir)
+        for old_snapshot_file in snapshot_files[: -max(self.versions_to_keep, 1)]:
+            try:
+                old_snapshot_file.unlink()
+                logging.debug("deleted old dashboard snapshot {}".format(old_snapshot_file))
+            except FileNotFoundError:
+                pass
+
+    def _snapshot_files(self, project_dir):
+        """Returns a list of the snapshot files in the directory, oldest first"""
+        try:
+            return sorted(
+                Path(this_entry.path)
+                for this_entry in os.scandir(project_dir)
+                if this_entry.name.startswith(SNAPSHOT_FILE_PREFIX) and this_entry.name.endswith(SNAPSHOT_FILE_SUFFIX)
+            )
+        except FileNotFoundError:
+            return []
@@ -1,8 +1,74 @@
 import logging
+from copy import deepcopy
+from threading import Lock
+from time import monotonic
 
 from dash.api.service.DataSources.ldap_data import LdapData, LdapDataError
 
 UTF_8 = "utf-8"
+MODIFY_TIMESTAMP_ATTR = "modifyTimestamp"
+
+# process-wide copy of the institution records; see institution_directory()
+_institution_directory = None
+_institution_directory_lock = Lock()
+
+
+def institution_directory(ldap_config):
+    """
+    Returns the process-wide InstitutionDirectory, creating it on first use.
+    Its TTL is read from the LDAP config param `institution_cache_ttl_seconds`; if it isn't set (or is 0) the
+    directory is disabled, and the institutions are read from LDAP every time.
+    """
+    global _institution_directory
+    with _institution_directory_lock:
+        if _institution_directory is None:
+            _institution_directory = InstitutionDirectory(ldap_config.get("institution_cache_ttl_seconds", 0))
+            logging.info("institution directory TTL = {}s".format(_institution_directory.ttl_seconds))
+    return _institution_directory
+
+
+class InstitutionDirectory:
+    """
+    An in-memory copy of the institution records in LDAP, shared by every request handled by the worker process.
+
+    Once the records are `ttl_seconds` old, the next lookup checks whether any institution has been added, removed
+    or changed since they were loaded, by comparing the number of institutions and their latest `modifyTimestamp`
+    (a search that returns no other attributes); the records are only read again if something has changed.
+    """
+
+    def __init__(self, ttl_seconds, clock=monotonic):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._institutions = None
+        self._version = None
+        self._expires = None
+        self._lock = Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds is not None and self.ttl_seconds > 0
+
+    def institutions(self, institution_data):
+        """
+        Pass an InstitutionData object, which is used to read from LDAP if need be.
+        Returns the list of institutions (see InstitutionData.get_all_institutions_regardless_of_user_membership())
+        """
+        if not self.enabled:
+            return institution_data._get_all_institutions_from_ldap()
+        with self._lock:
+            if self._institutions is None or self._clock() >= self._expires:
+                version = institution_data._get_institutions_version()
+                if self._institutions is None or version is None or version != self._version:
+                    self._institutions = institution_data._get_all_institutions_from_ldap()
+                    logging.info("institution directory loaded {} institutions".format(len(self._institutions)))
+                self._version = version
+                self._expires = self._clock() + self.ttl_seconds
+            return deepcopy(self._institutions)
+
+    def invalidate(self):
+        """Drops the records, so they are read from LDAP on the next lookup"""
+        with self._lock:
+            self._institutions = None
 
 
 class InstitutionData(LdapData):
@@ -23,6 +89,21 @@ class InstitutionData(LdapData):
         self.ldap_filter_string_institutions = None
 
     def get_all_institutions_regardless_of_user_membership(self):
+        """
+        Returns a list of all institutions, each a dict with `key`, `name` and (unless the institution has none)
+        `countries`.  The institutions come from the process-wide institution directory (see
+        institution_directory()), so repeated calls don't each search LDAP.
+        """
+        return institution_directory(self.config).institutions(self)
+
+    def get_institution_names_by_key_regardless_of_user_membership(self):
+        """Returns a dict of the names of all institutions, keyed on institution key"""
+        return {
+            institution["key"]: institution["name"]
+            for institution in self.get_all_institutions_regardless_of_user_membership()
+        }
+
+    def _get_all_institutions_from_ldap(self):
         try:
             institutions = []
             institution_ldap_data = self._get_all_institution_ldap_data_regardless_of_user_membership()
@@ -46,19 +127,30 @@ class InstitutionData(LdapData):
         return institutions
 
     def get_all_institution_keys_regardless_of_user_membership(self):
-        return self._get_all_institution_attribute_values_regardless_of_user_membership(self.config["inst_id_attr"])
+        return [institution["key"] for institution in self.get_all_institutions_regardless_of_user_membership()]
 
     def get_all_institution_names_regardless_of_user_membership(self):
-        return self._get_all_institution_attribute_values_regardless_of_user_membership(self.config["inst_name_attr"])
+        return [institution["name"] for institution in self.get_all_institutions_regardless_of_user_membership()]
 
-    def _get_all_institution_attribute_values_regardless_of_user_membership(self, attribute):
-        institution_ldap_data = self._get_all_institution_ldap_data_regardless_of_user_membership()
-        return [
-            self._decode_byte_string(this_institution_ldap_data[attribute][0])
-            for this_institution_ldap_data in institution_ldap_data
+    def _get_institutions_version(self):
+        """
+        Returns a value that changes whenever an institution is added, removed or changed:  the number of
+        institutions and their latest modification timestamp (which sort as strings, being in LDAP generalized
+        time format).  Returns None if the timestamps aren't available.
+        """
+        institution_ldap_tuples = self.ldap_search(self._get_institutions_ldap_filter(), [MODIFY_TIMESTAMP_ATTR])
+        if not institution_ldap_tuples:
+            return None
+        timestamps = [
+            institution_ldap_tuple[1].get(MODIFY_TIMESTAMP_ATTR, [None])[0]
+            for institution_ldap_tuple in institution_ldap_tuples
         ]
+        if None in timestamps:
+            logging.warning("LDAP institution records have no {} attribute".format(MODIFY_TIMESTAMP_ATTR))
+            return None
+        return (len(timestamps), max(timestamps))
 
-    def _get_all_institution_ldap_data_regardless_of_user_membership(self):
+    def _get_institutions_ldap_filter(self):
         if self.ldap_filter_string_institutions is None:
             self.ldap_filter_string_institutions = (
                 # fmt: off
@@ -69,7 +161,10 @@ class InstitutionData(LdapData):
                 ")"
                 # fmt: on
             )
-        institution_ldap_tuples = self.ldap_search(self.ldap_filter_string_institutions)
+        return self.ldap_filter_string_institutions
+
+    def _get_all_institution_ldap_data_regardless_of_user_membership(self):
+        institution_ldap_tuples = self.ldap_search(self._get_institutions_ldap_filter())
 
         if institution_ldap_tuples is None or len(institution_ldap_tuples) == 0:
             logging.error(f"LDAP search: No ({institution_ldap_tuples}) institutions found")
@@ -0,0 +1,179 @@
+import logging
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition, Lock
+from time import monotonic
+
+import ldap
+from dash.api.exceptions import LdapDataError
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CHECK_INTERVAL_SECONDS = 30
+DEFAULT_ACQUIRE_TIMEOUT_SECONDS = 10
+
+_shared_pools = {}
+_shared_pools_lock = Lock()
+
+
+def shared_ldap_connection_pool(pool_config):
+    """
+    Pass the connection pool parameters (see LdapData.get_connection_pool_config()).
+    Returns the process-wide LdapConnectionPool for the LDAP server and bind DN, creating it on first use, so the
+    connections are shared by every LdapData object (and every request) in the worker process.
+    """
+    key = (pool_config["ldap_url"], pool_config["bind_dn"])
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is None:
+            pool = LdapConnectionPool(**pool_config)
+            _shared_pools[key] = pool
+            logging.info(
+                "LDAP connection pool for {} created with up to {} connections".format(pool.ldap_url, pool.size)
+            )
+    return pool
+
+
+class LdapConnectionPool:
+    """
+    A thread-safe pool of up to `size` connections to an LDAP server, each bound once (as `bind_dn`) when it is
+    created, and then reused for as long as it works.
+
+    A connection that has been idle for more than `check_interval_seconds` is checked (with a "who am I?" request)
+    before it is handed out, and replaced if it is dead.  If a connection reports that the server is down, it is
+    dropped along with all the idle connections (they were very likely dropped by the server too), and the
+    operation is retried once with a new connection.
+    """
+
+    def __init__(
+        self,
+        ldap_url,
+        bind_dn,
+        bind_password,
+        size=DEFAULT_POOL_SIZE,
+        check_interval_seconds=DEFAULT_CHECK_INTERVAL_SECONDS,
+        acquire_timeout_seconds=DEFAULT_ACQUIRE_TIMEOUT_SECONDS,
+    ):
+        if size < 1:
+            raise ValueError("LDAP connection pool size must be at least 1, not {}".format(size))
+        self.ldap_url = ldap_url
+        self.size = size
+        self.check_interval_seconds = check_interval_seconds
+        self.acquire_timeout_seconds = acquire_timeout_seconds
+        self._bind_dn = bind_dn
+        self._bind_password = bind_password
+        # idle connections, as (connection, time last used) tuples; the most recently used is on the right
+        self._idle = deque()
+        self._num_connections = 0
+        self._available = Condition(Lock())
+
+    def call(self, operation):
+        """
+        Pass a function that takes an LDAP connection (`ldap.ldapobject.SimpleLDAPObject`).
+        Calls it with a connection from the pool, and returns its result.
+        """
+        try:
+            with self.connection() as conn:
+                return operation(conn)
+        except ldap.SERVER_DOWN as err:
+            logging.warning("LDAP server {} is down ({}): retrying with a new connection".format(self.ldap_url, err))
+        with self.connection() as conn:
+            return operation(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that takes a connection from the pool, and puts it back when done.
+        If the server turns out to be down, the connection is dropped (with any idle connections) instead.
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+        except ldap.SERVER_DOWN:
+            self._discard(conn, discard_idle=True)
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        self._release(conn)
+
+    def close(self):
+        """Unbinds and drops all the idle connections"""
+        with self._available:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._num_connections -= len(idle)
+            self._available.notify_all()
+        for conn in idle:
+            _unbind(conn)
+
+    def _acquire(self):
+        deadline = monotonic() + self.acquire_timeout_seconds
+        with self._available:
+            while not self._idle and self._num_connections >= self.size:
+                remaining = deadline - monotonic()
+                if remaining <= 0 or not self._available.wait(remaining):
+                    raise LdapDataError(
+                        "timed out waiting for one of the {} connections to LDAP server {}".format(
+                            self.size, self.ldap_url
+                        )
+                    )
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._num_connections += 1
+        # connections are checked and created outside the lock, so slow network calls don't hold up other threads
+        try:
+            if conn is not None and monotonic() - last_used > self.check_interval_seconds and not _is_alive(conn):
+                logging.info("replacing dead connection to LDAP server {}".format(self.ldap_url))
+                _unbind(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except BaseException:
+            with self._available:
+                self._num_connections -= 1
+                self._available.notify()
+            raise
+        return conn
+
+    def _release(self, conn):
+        with self._available:
+            self._idle.append((conn, monotonic()))
+            self._available.notify()
+
+    def _discard(self, conn, discard_idle=False):
+        with self._available:
+            dropped = [conn]
+            if discard_idle:
+                dropped.extend(idle_conn for idle_conn, _ in self._idle)
+                self._idle.clear()
+            self._num_connections -= len(dropped)
+            self._available.notify_all()
+        for dropped_conn in dropped:
+            _unbind(dropped_conn)
+
+    def _connect(self):
+        logging.info("Connecting to LDAP server {}".format(self.ldap_url))
+        conn = ldap.initialize(self.ldap_url)
+        assert isinstance(
+            conn, ldap.ldapobject.SimpleLDAPObject
+        ), "ldap.initialize was expected to return an instance of ldap.ldapobject.SimpleLDAPObject, not {}".format(conn)
+        conn.simple_bind_s(self._bind_dn, self._bind_password)
+        return conn
+
+
+def _is_alive(conn):
+    try:
+        conn.whoami_s()
+    except ldap.LDAPError as err:
+        logging.debug("LDAP connection check failed: {}".format(err))
+        return False
+    return True
+
+
+def _unbind(conn):
+    try:
+        conn.unbind_s()
+    except ldap.LDAPError:
+        pass
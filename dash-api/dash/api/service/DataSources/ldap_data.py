@@ -4,6 +4,7 @@ from copy import deepcopy
 import ldap
 import yaml
 from dash.api.exceptions import LdapDataError
+from dash.api.service.DataSources.ldap_connection_pool import shared_ldap_connection_pool
 
 DATA_SOURCES_CONFIG = "data_sources.yml"
 OPENLDAP_CONFIC_FILE_CONFIG_KEY = "openldap_config"
@@ -29,7 +30,6 @@ OPENLDAP_PARAMS_SECRET = [
 
 class LdapData:
     def __init__(self, required_config_params, set_up=True):
-        self._current_ldap_connection = None
         self.required_config_params = MIN_REQUIRED_CONFIG_PARAMS + required_config_params
 
         if set_up:
@@ -77,33 +77,59 @@ class LdapData:
                 raise KeyError
         self.config["openldap"] = openldap_config
 
-    def connection(self):
+    def get_connection_pool_config(self):
         """
-        If already connected to LDAP server, returns the connection.
-        If not connected, initializes LDAP connection, using URL from config value `ldap_url`, and returns the connection
-        Stores instance of `ldap.ldapobject.SimpleLDAPObject` connection class as self.connection, and returns same.
+        Returns the parameters of the LDAP connection pool:  the LDAP URL and bind credentials, and the optional
+        config values `connection_pool_size`, `connection_check_interval_seconds` and
+        `connection_acquire_timeout_seconds` (defaults are used for any that are absent).
         """
-        if self._current_ldap_connection is None:
-            logging.info("Connecting to LDAP server {}".format(self.config["ldap_url"]))
-            conn = ldap.initialize(self.config["ldap_url"])
-            assert isinstance(
-                conn, ldap.ldapobject.SimpleLDAPObject
-            ), "ldap.initialize was expected to return an instance of ldap.ldapobject.SimpleLDAPObject, not {}".format(
-                conn
-            )
-            conn.simple_bind_s(
-                self.config["openldap"]["MONOCLE_LDAP_BIND_DN"], self.config["openldap"]["MONOCLE_LDAP_BIND_PASSWORD"]
-            )
-            self._current_ldap_connection = conn
-        return self._current_ldap_connection
+        pool_config = {
+            "ldap_url": self.config["ldap_url"],
+            "bind_dn": self.config["openldap"]["MONOCLE_LDAP_BIND_DN"],
+            "bind_password": self.config["openldap"]["MONOCLE_LDAP_BIND_PASSWORD"],
+        }
+        for config_key, pool_param in (
+            ("connection_pool_size", "size"),
+            ("connection_check_interval_seconds", "check_interval_seconds"),
+            ("connection_acquire_timeout_seconds", "acquire_timeout_seconds"),
+        ):
+            if config_key in self.config:
+                pool_config[pool_param] = self.config[config_key]
+        return pool_config
 
-    def disconnect(self):
+    def connection_pool(self):
         """
-        If currently connected to LDAP server, disconnects.
-        Does nothing if already disconnected.
+        Returns the process-wide pool of connections to the LDAP server (see
+        DataSources.ldap_connection_pool.LdapConnectionPool), so connections are bound once and then shared by
+        every LdapData object, rather than each object connecting and binding for itself.
+        """
+        return shared_ldap_connection_pool(self.get_connection_pool_config())
+
+    def ldap_bind_as(self, dn, password):
         """
-        if self._current_ldap_connection is not None:
-            self._current_ldap_connection = None
+        Checks a password, by binding to the LDAP server as the entry with the DN passed.
+        A new connection is used (and then closed), rather than one from the connection pool, because the pooled
+        connections must stay bound as the Monocle LDAP user.
+        Returns True if the bind succeeded, False if the credentials are invalid.  An empty password is always
+        invalid (LDAP would treat it as an unauthenticated bind, which succeeds).
+        """
+        if not password:
+            return False
+        conn = ldap.initialize(self.config["ldap_url"])
+        try:
+            conn.simple_bind_s(dn, password)
+        except ldap.INVALID_CREDENTIALS:
+            logging.info("LDAP bind as {} failed:  invalid credentials".format(dn))
+            return False
+        except Exception as e:
+            logging.error(f"LDAP bind as {dn}: {e}")
+            raise LdapDataError(e)
+        finally:
+            try:
+                conn.unbind_s()
+            except ldap.LDAPError:
+                pass
+        return True
 
     def ldap_search_group_by_gid(self, gid, group_object_config_key, required_attributes):
         """
@@ -134,6 +160,57 @@ class LdapData:
             )
             raise LdapDataError("GID {} is not unique".format(gid))
         result = result_list[0]
+        self._check_group_attributes(gid, result, required_attributes)
+        logging.debug("found group: {}".format(result))
+        return result
+
+    def ldap_search_groups_by_gids(self, gids, group_object_config_key, required_attributes):
+        """
+        Like ldap_search_group_by_gid(), but searches for the groups with any of the GIDs passed in a single LDAP
+        search, so the number of round trips to the LDAP server doesn't grow with the number of groups.
+        Returns a dict of LDAP group records keyed on GID; GIDs that aren't found are missing from the dict.
+        Raises LdapDataError if any GID has more than 1 match, or if returned data are not valid for a group record.
+        """
+        if required_attributes is None or len(required_attributes) == 0:
+            logging.error("`required_attributes` argument is empty")
+            raise ValueError("`required_attributes` argument must not be empty")
+        # (duplicates removed, keeping the order)
+        gids = list(dict.fromkeys(gids))
+        if len(gids) == 0:
+            return {}
+        for gid in gids:
+            if gid is None or len(str(gid)) < 1:
+                raise LdapDataError("LDAP search string must not be None and must not be an empty string")
+
+        logging.debug("searching for GIDs {}".format(gids))
+        gid_attr = self.config["gid_attr"]
+        gid_filter = "".join(f"({gid_attr}={gid})" for gid in gids)
+        result_list = self.ldap_search(f"(&(objectClass={self.config[group_object_config_key]})(|{gid_filter}))")
+
+        results_by_gid = {}
+        for result in result_list:
+            group_attr = result[1]
+            if gid_attr not in group_attr or len(group_attr[gid_attr]) < 1:
+                logging.error(
+                    "group search for GIDs {} returned a group without a {} attribute (complete data = {})".format(
+                        gids, gid_attr, result
+                    )
+                )
+                raise LdapDataError("group {} doesn't contain the required attribute {}".format(result[0], gid_attr))
+            gid = group_attr[gid_attr][0].decode("UTF-8")
+            if gid in results_by_gid:
+                logging.error(
+                    "The GID {} matched multiple entries in {}.{}:  it should be unique".format(
+                        gid, self.config[group_object_config_key], gid_attr
+                    )
+                )
+                raise LdapDataError("GID {} is not unique".format(gid))
+            self._check_group_attributes(gid, result, required_attributes)
+            results_by_gid[gid] = result
+        logging.debug("found groups: {}".format(results_by_gid))
+        return results_by_gid
+
+    def _check_group_attributes(self, gid, result, required_attributes):
         group_attr = result[1]
         for required_attr in required_attributes:
             if required_attr not in group_attr or len(group_attr[required_attr]) < 1:
@@ -143,8 +220,6 @@ class LdapData:
                     )
                 )
                 raise LdapDataError("group {} doesn't contain the required attribute {}".format(gid, required_attr))
-        logging.debug("found group: {}".format(result))
-        return result
 
     def ldap_search_by_attribute_value(self, object_class, attr, value):
         """
@@ -156,16 +231,18 @@ class LdapData:
 
         return self.ldap_search(f"(&(objectClass={object_class})({attr}={value}))")
 
-    def ldap_search(self, ldap_search_string):
+    def ldap_search(self, ldap_search_string, attributes=None):
         """
         Low-level LDAP search: wraps LDAP's own `search_s()`.
         `ldap_search_string` is a search filter in the format understood by LDAP.
+        Optionally pass a list of the attributes to be returned (by default, all the user attributes are returned).
         """
         logging.debug(f"LDAP search: {ldap_search_string}")
+        search_args = [self.config["openldap"]["MONOCLE_LDAP_BASE_DN"], ldap.SCOPE_SUBTREE, ldap_search_string]
+        if attributes is not None:
+            search_args.append(attributes)
         try:
-            result = self.connection().search_s(
-                self.config["openldap"]["MONOCLE_LDAP_BASE_DN"], ldap.SCOPE_SUBTREE, ldap_search_string
-            )
+            result = self.connection_pool().call(lambda conn: conn.search_s(*search_args))
         # The docs are silent on what exception the underlying `ldap_get_dn` may raise. So catch generic `Exception`:
         except Exception as e:
             logging.error(f"LDAP search: {e}")
@@ -1,10 +1,10 @@
 import json
 import logging
-import urllib.parse
-import urllib.request
+import urllib.error
 
 import yaml
-from dash.api.service.DataServices.sample_tracking_services import MonocleSampleTracking
+from dash.api.utils.http_transport import shared_transport
+from DataSources.institution_data import InstitutionData
 
 # run test metadata api server with:
 #
@@ -12,7 +12,6 @@ from dash.api.service.DataServices.sample_tracking_services import MonocleSample
 # docker run -p 8080:80 -v`pwd`/dash/my.cnf:/app/my.cnf -v`pwd`/metadata/juno/config.json:/app/config.json --env ENABLE_SWAGGER_UI=true --rm ${IMAGE}
 
 COLUMN_NAME_SUBMITTING_INSTITUTION = "Submitting_Institution"
-DICT_KEY_NAME = "name"
 DICT_KEY_SUBMITTING_INSTITUTION = "submitting_institution"
 DICT_KEY_VALUE = "value"
 
@@ -60,19 +59,31 @@ class MetadataDownload:
         logging.info("{}.get_in_silico_data() got {} result(s)".format(__class__.__name__, len(results_list)))
         return results_list
 
+    def get_download_columns(self, project):
+        """
+        Returns a dict with the column titles of the metadata, QC data and in silico data downloads (keyed by
+        "metadata", "qc_data" and "in_silico_data"), each a list in the order the columns are downloaded.
+        """
+        download_columns = self.download_client.download_columns(project)
+        assert isinstance(
+            download_columns, dict
+        ), "MonocleDownloadClient.download_columns() was expected to return a dict, not {}".format(
+            type(download_columns)
+        )
+        logging.debug("{}.get_download_columns() got {}".format(__class__.__name__, download_columns))
+        return download_columns
+
     def _in_place_replace_submitting_institution_keys_with_names(self, metadata):
         if len(metadata) == 0:
             return metadata
 
         if self._institutions is None:
-            self._institutions = MonocleSampleTracking().get_institutions()
+            self._institutions = InstitutionData().get_institution_names_by_key_regardless_of_user_membership()
         for sample in metadata:
             try:
                 submitting_institution_cell = sample[DICT_KEY_SUBMITTING_INSTITUTION]
                 submitting_institution_key = submitting_institution_cell[DICT_KEY_VALUE]
-                submitting_institution_cell[DICT_KEY_VALUE] = self._institutions[submitting_institution_key][
-                    DICT_KEY_NAME
-                ]
+                submitting_institution_cell[DICT_KEY_VALUE] = self._institutions[submitting_institution_key]
             except KeyError as e:
                 if DICT_KEY_SUBMITTING_INSTITUTION in str(e):
                     logging.error(
@@ -80,7 +91,7 @@ class MetadataDownload:
                     )
                 elif "submitting_institution_key" in locals() and submitting_institution_key in str(e):
                     logging.error(
-                        f"Institution {submitting_institution_key} isn't in the institution list returned by the sample tracking service."
+                        f"Institution {submitting_institution_key} isn't in the institution list returned by LDAP."
                     )
                 else:
                     raise
@@ -105,6 +116,8 @@ class MonocleDownloadClient:
         "in_silico_data_key",
         "download_qc_data",
         "qc_data_key",
+        "download_columns",
+        "download_columns_key",
     ]
 
     def __init__(self, set_up=True):
@@ -116,6 +129,7 @@ class MonocleDownloadClient:
         with open(config_file_name, "r") as file:
             data_sources = yaml.load(file, Loader=yaml.FullLoader)
             common_config = data_sources[self.metadata_common_source]
+            self.http_transport = shared_transport(data_sources)
             for this_project in self.metadata_project_source:
                 self.config[this_project] = {
                     **common_config,
@@ -193,6 +207,14 @@ class MonocleDownloadClient:
         results = self.parse_response(endpoint_url, response, required_keys=[this_config["in_silico_data_key"]])
         return results[this_config["in_silico_data_key"]]
 
+    def download_columns(self, project):
+        this_config = self.config[project]
+        endpoint_url = this_config["base_url"] + this_config["download_columns"]
+        logging.debug("{}.download_columns() using endpoint {}".format(__class__.__name__, endpoint_url))
+        response = self.make_request(endpoint_url)
+        results = self.parse_response(endpoint_url, response, required_keys=[this_config["download_columns_key"]])
+        return results[this_config["download_columns_key"]]
+
     def make_request(self, request_url, post_data=None):
         request_data = None
         request_headers = {}
@@ -207,10 +229,10 @@ class MonocleDownloadClient:
             request_headers = {"Content-type": "application/json;charset=utf-8"}
         try:
             logging.info("request to Monocle Download: {}".format(request_url))
-            http_request = urllib.request.Request(request_url, data=request_data, headers=request_headers)
-            with urllib.request.urlopen(http_request) as this_response:
-                response_as_string = this_response.read().decode("utf-8")
-                logging.debug("response from Monocle Download: {}".format(response_as_string))
+            response_as_string = self.http_transport.request(
+                request_url, data=request_data, headers=request_headers
+            ).decode("utf-8")
+            logging.debug("response from Monocle Download: {}".format(response_as_string))
         except urllib.error.HTTPError as e:
             if 404 == e.code:
                 logging.info(
@@ -1,5 +1,7 @@
 import logging
-from os import environ
+from functools import lru_cache
+from os import environ, stat
+from threading import Lock, Thread
 
 import pandas
 import yaml
@@ -11,6 +13,36 @@ class PipelineStatusDataError(Exception):
     pass
 
 
+@lru_cache(maxsize=None)
+def _load_data_sources_config(config_file_name):
+    with open(config_file_name, "r") as file:
+        return yaml.load(file, Loader=yaml.FullLoader)
+
+
+def _file_signature(file_name):
+    """Returns a tuple that changes if the file is modified"""
+    file_stat = stat(file_name)
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+
+class _SharedPipelineStatus:
+    """pipeline status data for one CSV file, shared by all PipelineStatus instances"""
+
+    def __init__(self):
+        self.dataframe = None
+        self.lane_status_index = None
+        self.file_signature = None
+        # signature of a version of the file that could not be loaded
+        self.failed_file_signature = None
+        self.reloading = False
+        self.lock = Lock()
+
+
+# CSV file name => _SharedPipelineStatus
+_shared_pipeline_status = {}
+_shared_pipeline_status_lock = Lock()
+
+
 class PipelineStatus:
     """provides access to pipeline status data"""
 
@@ -32,10 +64,9 @@ class PipelineStatus:
     def __init__(self, project, config=None):
         if config is None:
             config = self.data_sources_config
-        with open(config, "r") as file:
-            data_sources = yaml.load(file, Loader=yaml.FullLoader)
-            common_config = data_sources[self.data_source_common]
-            project_config = data_sources[self.data_source_project[project]]
+        data_sources = _load_data_sources_config(config)
+        common_config = data_sources[self.data_source_common]
+        project_config = data_sources[self.data_source_project[project]]
         this_source = {**common_config, **project_config}
         # check required params are in config
         for required_param in self.required_config_params:
@@ -58,21 +89,32 @@ class PipelineStatus:
             raise PipelineStatusDataError(message)
         self.csv_file = "/".join([data_path, this_source["csv_file"]])
         self.num_columns = this_source["num_columns"]
-        self.populate_dataframe(self.csv_file)
+        self.dataframe, self.lane_status_index = self._get_shared_pipeline_status()
 
     def populate_dataframe(self, csv_filename):
+        """
+        Reads (and validates) the pipeline status data from the CSV file, regardless of any data already
+        loaded by this process.  Normally the data are loaded when the object is created (see _get_shared_pipeline_status()).
+        """
+        self.dataframe = self._read_dataframe(csv_filename)
+        self.lane_status_index = self._build_lane_status_index(self.dataframe)
+        return self.dataframe
+
+    def _read_dataframe(self, csv_filename):
         logging.info("reading pipeline status data from {}".format(csv_filename))
         with open(csv_filename, "r") as csv:
-            self.dataframe = pandas.read_csv(csv).set_index(self.pipeline_lane_field)
-        logging.debug(self.dataframe)
-        self.validate_dataframe()
-        return self.dataframe
+            dataframe = pandas.read_csv(csv).set_index(self.pipeline_lane_field)
+        logging.debug(dataframe)
+        self.validate_dataframe(dataframe)
+        return dataframe
 
     # some basic validation
     # TODO consider adding a proper schema for pandas to do thorough validation
-    def validate_dataframe(self):
+    def validate_dataframe(self, dataframe=None):
+        if dataframe is None:
+            dataframe = self.dataframe
         # because one columns is used as index, number of ciolumns is the CSV is one greater than pandas tells us
-        num_columns_read = len(self.dataframe.columns) + 1
+        num_columns_read = len(dataframe.columns) + 1
         if self.num_columns != num_columns_read:
             logging.error(
                 "Pipeline status data file {} has {} columns, but {} are expected".format(
@@ -80,48 +122,119 @@ class PipelineStatus:
                 )
             )
             raise PipelineStatusDataError("pipeline status data is badly formatted")
-        row_error_found = False
-        for this_row_num_columns_read in [c + 1 for c in self.dataframe.count(axis="columns")]:
-            if self.num_columns != this_row_num_columns_read:
+        rows_num_columns_read = dataframe.count(axis="columns") + 1
+        bad_rows_num_columns_read = rows_num_columns_read[rows_num_columns_read != self.num_columns]
+        if len(bad_rows_num_columns_read) > 0:
+            for this_row_num_columns_read in bad_rows_num_columns_read:
                 logging.error(
                     "Pipeline status data file {} contains a row with {} columns, but {} are expected for all rows".format(
                         self.csv_file, this_row_num_columns_read, self.num_columns
                     )
                 )
-                row_error_found = True
-        if row_error_found:
             raise PipelineStatusDataError("pipeline status data is badly formatted")
 
+    def _get_shared_pipeline_status(self):
+        """
+        Returns the dataframe and lane status index for the CSV file, shared by all instances in this process.
+
+        The CSV file is parsed when it is first needed.  After that, if the file's modification time or size
+        has changed, the data are reloaded by a background thread while the previous data continue to be
+        returned, so no request waits for the file to be parsed (except the first).  If the new file can't be
+        read, or fails validation, an error is logged and the previous data continue to be used until the
+        file changes again.
+        """
+        file_signature = _file_signature(self.csv_file)
+        with _shared_pipeline_status_lock:
+            shared = _shared_pipeline_status.setdefault(self.csv_file, _SharedPipelineStatus())
+        start_reload = False
+        with shared.lock:
+            if shared.dataframe is None:
+                # nothing loaded yet, so there's no choice but to wait
+                shared.dataframe = self._read_dataframe(self.csv_file)
+                shared.lane_status_index = self._build_lane_status_index(shared.dataframe)
+                shared.file_signature = file_signature
+            elif file_signature not in (shared.file_signature, shared.failed_file_signature) and not shared.reloading:
+                logging.info("pipeline status data file {} has changed: reloading".format(self.csv_file))
+                shared.reloading = True
+                start_reload = True
+            dataframe, lane_status_index = shared.dataframe, shared.lane_status_index
+        if start_reload:
+            Thread(target=self._reload_shared_pipeline_status, args=(shared, file_signature), daemon=True).start()
+        return dataframe, lane_status_index
+
+    def _reload_shared_pipeline_status(self, shared, file_signature):
+        try:
+            dataframe = self._read_dataframe(self.csv_file)
+            lane_status_index = self._build_lane_status_index(dataframe)
+        except Exception as e:
+            logging.error(
+                "failed to reload pipeline status data file {}: {} (previous data will still be used)".format(
+                    self.csv_file, repr(e)
+                )
+            )
+            with shared.lock:
+                shared.failed_file_signature = file_signature
+                shared.reloading = False
+            return
+        with shared.lock:
+            shared.dataframe = dataframe
+            shared.lane_status_index = lane_status_index
+            shared.file_signature = file_signature
+            shared.reloading = False
+        logging.info("reloaded pipeline status data file {}".format(self.csv_file))
+
+    def _build_lane_status_index(self, dataframe):
+        """
+        Pass a pipeline status dataframe.
+        Returns a dict of the status of every lane in the dataframe, keyed on lane ID (see lanes_status() for the
+        content).  The FAILED/SUCCESS flags are computed column-wise for all lanes.
+        """
+        # if a lane appears more than once in the data, use the first row for that lane
+        if not dataframe.index.is_unique:
+            dataframe = dataframe[~dataframe.index.duplicated(keep="first")]
+        stage_values = dataframe[self.pipeline_stage_fields].to_numpy(dtype=object)
+        stage_values[pandas.isna(stage_values) | (stage_values == self.stage_null_string)] = None
+        # any occurrence of the "failed" string sets FAILED flag; if all stages are done, SUCCESS flag is set
+        lanes_failed = (stage_values == self.stage_failed_string).any(axis=1)
+        lanes_succeeded = (stage_values == self.stage_done_string).all(axis=1)
+        return {
+            this_lane_id: {
+                "FAILED": bool(this_lane_failed),
+                "SUCCESS": bool(this_lane_succeeded),
+                **dict(zip(self.pipeline_stage_fields, this_lane_stage_values)),
+            }
+            for this_lane_id, this_lane_failed, this_lane_succeeded, this_lane_stage_values in zip(
+                dataframe.index, lanes_failed, lanes_succeeded, stage_values.tolist()
+            )
+        }
+
     def lane_status(self, lane_id):
-        assert self.dataframe is not None, "lane_status() called before dataframe was populated"
-        logging.debug("extracting pipeline status data for lane {}".format(lane_id))
-        status_data = {
-            "FAILED": False,
-            "SUCCESS": False,
+        """
+        Pass a lane ID.
+        Returns a dict of the pipeline status of the lane, as described for lanes_status()
+        """
+        return self.lanes_status([lane_id])[lane_id]
+
+    def lanes_status(self, lane_ids):
+        """
+        Pass a list of lane IDs.
+        Returns a dict of pipeline status data, keyed on lane ID:
+
+        {  lane_id_1:  {  'FAILED':   True if any stage failed,
+                          'SUCCESS':  True if all stages are done,
+                          'Import':   stage status string,
+                          'QC':       stage status string,
+                          ...
+                          },
+           lane_id_2...
+           }
+
+        A stage status is `None` if the lane is not in the pipeline status data, or the stage has the null string.
+
+        The status of every lane is precomputed when the data are loaded, so this is just a lookup for each lane.
+        """
+        assert self.lane_status_index is not None, "lanes_status() called before dataframe was populated"
+        not_found_status = {"FAILED": False, "SUCCESS": False, **{f: None for f in self.pipeline_stage_fields}}
+        return {
+            this_lane_id: dict(self.lane_status_index.get(this_lane_id, not_found_status)) for this_lane_id in lane_ids
         }
-        num_stages_done = 0
-        for this_field in self.pipeline_stage_fields:
-            try:
-                this_value = self.dataframe.loc[lane_id, this_field]
-            except KeyError:
-                this_value = None
-            # if a value was read...
-            if this_value is not None:
-                # convert "null" string to `None`
-                if this_value == self.stage_null_string:
-                    this_value = None
-                # any occurrence of the "failed" string sets FAILED flag
-                elif this_value == self.stage_failed_string:
-                    # if any stage fails, flag lane as failed
-                    status_data["FAILED"] = True
-                    logging.debug("   found failed status for {} stage".format(this_field))
-                # the "done" string increments the count of stages done
-                elif this_value == self.stage_done_string:
-                    num_stages_done += 1
-            status_data[this_field] = this_value
-        # if all stages are done, flag lane as completed successfully
-        if len(self.pipeline_stage_fields) == num_stages_done:
-            status_data["SUCCESS"] = True
-            logging.debug("   all stages are '{}'".format(self.stage_done_string))
-        logging.debug("   lane status: {}".format(status_data))
-        return status_data
@@ -1,9 +1,9 @@
 import json
 import logging
-import urllib.parse
-import urllib.request
+import urllib.error
 
 import yaml
+from dash.api.utils.http_transport import shared_transport
 
 # logging.basicConfig(format='%(asctime)-15s %(levelname)s:  %(message)s', level='DEBUG')
 
@@ -79,6 +79,7 @@ class MonocleClient:
         self.config = {}
         with open(config_file_name, "r") as file:
             data_sources = yaml.load(file, Loader=yaml.FullLoader)
+        self.http_transport = shared_transport(data_sources)
         common_config = data_sources[self.metadata_common_source]
         for this_project in self.metadata_project_source:
             self.config[this_project] = {
@@ -150,10 +151,10 @@ class MonocleClient:
                     request_url, request_headers, request_data
                 )
             )
-            http_request = urllib.request.Request(request_url, data=request_data, headers=request_headers)
-            with urllib.request.urlopen(http_request) as this_response:
-                response_as_string = this_response.read().decode("utf-8")
-                logging.debug("response from Metadata API: {}".format(response_as_string))
+            response_as_string = self.http_transport.request(
+                request_url, data=request_data, headers=request_headers
+            ).decode("utf-8")
+            logging.debug("response from Metadata API: {}".format(response_as_string))
         except urllib.error.HTTPError as e:
             msg = "HTTP error during Metadata API request {}: {} {}\nData:\n{}".format(
                 request_url, e.code, e.read().decode("utf-8"), request_data
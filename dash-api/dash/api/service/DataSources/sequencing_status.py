@@ -1,21 +1,83 @@
 import json
 import logging
 import urllib.error
-import urllib.parse
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from time import sleep
 
 import yaml
+from dash.api.utils.cache import TTLCache
+from dash.api.utils.http_transport import shared_transport
+
+# initial delay before retrying a failed findByIds request; doubled for each subsequent retry
+RETRY_BACKOFF_SECONDS = 0.5
+
+# process-wide cache of sequencing status data, keyed on (project, institution key); see institution_samples_cache()
+_institution_samples_cache = None
+
+
+def institution_samples_cache(mlwh_config):
+    """
+    Returns the process-wide cache of per-institution sequencing status data, creating it on first use.
+    Its TTL and maximum number of entries are read from the MLWH config params `cache_ttl_seconds` and
+    `cache_max_entries`; if `cache_ttl_seconds` isn't set (or is 0) the cache is disabled.
+    """
+    global _institution_samples_cache
+    if _institution_samples_cache is None:
+        _institution_samples_cache = TTLCache(
+            mlwh_config.get("cache_ttl_seconds", 0), max_entries=mlwh_config.get("cache_max_entries")
+        )
+        logging.info(
+            "sequencing status cache TTL = {}s, max entries = {}".format(
+                _institution_samples_cache.ttl_seconds, _institution_samples_cache.max_entries
+            )
+        )
+    return _institution_samples_cache
+
+
+class InstitutionSamples:
+    """
+    The sequencing status data of an institution's samples (`samples`, as returned by
+    SequencingStatus.get_multiple_samples()), as held in the process-wide cache, along with any data derived from
+    them (see derived()); so derived data are built once per cache entry, and shared by every request that uses it.
+    """
+
+    def __init__(self, sample_ids_fingerprint, samples):
+        self.sample_ids_fingerprint = sample_ids_fingerprint
+        self.samples = samples
+        self._derived = {}
+        self._lock = Lock()
+
+    def derived(self, name, build):
+        """
+        Pass a name for some data derived from the samples, and a function that builds them from `samples`.
+        Returns the data, which are built the first time they are asked for; they may be shared with other
+        requests, so must not be modified.
+        """
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = build(self.samples)
+            return self._derived[name]
 
 
 class SequencingStatus:
     """provides access to pipeline status data"""
 
     def __init__(self, set_up=True):
+        self.cache = None
         if set_up:
             self.set_up()
 
     def set_up(self):
         self.mlwh_client = MLWH_Client()
+        self.cache = institution_samples_cache(self.mlwh_client.config)
+
+    def max_concurrent_requests(self):
+        """
+        Returns the maximum number of MLWH API requests that should be made concurrently (by default, 1), as set by the
+        MLWH config param `max_concurrent_requests`
+        """
+        return max(1, int(self.mlwh_client.config.get("max_concurrent_requests", 1)))
 
     def get_sample(self, sample_id):
         result = self.mlwh_client.find_by_id(sample_id)
@@ -29,17 +91,47 @@ class SequencingStatus:
         Returns a dict, keys are sample IDs, values are the sequencing status data as a dict
         If a sample ID is passed that is not found by the API, it will be missing from the returned dict.
         """
+        # turn results into dict keys on the sample IDs; results are merged in as each chunk is returned
+        results_by_sample_id = {}
         try:
-            results_list = self.mlwh_client.find_by_ids(sample_ids)
+            for results_list in self.mlwh_client.find_by_ids_in_chunks(sample_ids):
+                for this_result in results_list:
+                    results_by_sample_id[this_result.pop("id")] = this_result
         except urllib.error.HTTPError:
             raise
-        logging.info("{}.get_multiple_samples() got {} result(s)".format(__class__.__name__, len(results_list)))
-        # turn results list into dict keys on the sample IDs
-        results_by_sample_id = {}
-        for this_result in results_list:
-            results_by_sample_id[this_result.pop("id")] = this_result
+        logging.info("{}.get_multiple_samples() got {} result(s)".format(__class__.__name__, len(results_by_sample_id)))
         return results_by_sample_id
 
+    def get_institution_samples(self, project, institution_key, sample_ids):
+        """
+        Pass a project, an institution key and a list of that institution's sample IDs.
+        Returns the same dict as get_multiple_samples(), but uses the process-wide cache (if enabled) so
+        that the MLWH API is queried at most once per institution per cache TTL, no matter how many
+        requests or users ask for the data.  A cached entry is only used if it was created for exactly
+        the same set of sample IDs.  If several requests miss the cache for the same institution at the same
+        time, only one of them queries the MLWH API, and the others wait for its results.
+        The sample dicts in the returned dict may be shared with other requests, so must not be modified.
+        """
+        return dict(self.get_institution_samples_entry(project, institution_key, sample_ids).samples)
+
+    def get_institution_samples_entry(self, project, institution_key, sample_ids):
+        """
+        As get_institution_samples(), but returns the InstitutionSamples held in the cache (or, if the cache
+        is disabled, a new one), so data derived from the samples can be kept with them.
+        """
+        sample_ids_fingerprint = frozenset(sample_ids)
+        if self.cache is None:
+            return InstitutionSamples(sample_ids_fingerprint, self.get_multiple_samples(sample_ids))
+        cache_key = (project, institution_key)
+
+        def load():
+            logging.debug("{}: sequencing status cache miss for {}".format(__class__.__name__, cache_key))
+            return InstitutionSamples(sample_ids_fingerprint, self.get_multiple_samples(sample_ids))
+
+        return self.cache.get_or_load(
+            cache_key, load, is_valid=lambda cached: cached.sample_ids_fingerprint == sample_ids_fingerprint
+        )
+
 
 class ProtocolError(Exception):
     pass
@@ -70,6 +162,7 @@ class MLWH_Client:
         with open(config_file_name, "r") as file:
             data_sources = yaml.load(file, Loader=yaml.FullLoader)
             self.config = data_sources[self.data_source]
+        self.http_transport = shared_transport(data_sources)
         for required_param in self.required_config_params:
             if required_param not in self.config:
                 logging.error(
@@ -105,20 +198,85 @@ class MLWH_Client:
         return results[self.config["findById_key"]]
 
     def find_by_ids(self, sample_ids):
+        results = []
+        for chunk_results in self.find_by_ids_in_chunks(sample_ids):
+            results.extend(chunk_results)
+        return results
+
+    def find_by_ids_in_chunks(self, sample_ids):
+        """
+        Generator that yields the results of the findByIds endpoint for the sample IDs passed, one list per chunk.
+        The sample IDs are split into chunks of (at most) `find_by_ids_chunk_size` IDs, so no single request or
+        response is unmanageably large; up to `find_by_ids_max_concurrent_chunks` chunks are requested at once,
+        and results are yielded as each chunk completes (i.e. not necessarily in order).
+        If `find_by_ids_chunk_size` isn't configured, all the sample IDs are requested in a single chunk.
+        """
+        chunk_size = self.config.get("find_by_ids_chunk_size")
+        if not chunk_size or len(sample_ids) <= chunk_size:
+            yield self._find_by_ids_chunk(sample_ids)
+            return
+        chunks = [sample_ids[i : i + chunk_size] for i in range(0, len(sample_ids), chunk_size)]
+        max_workers = min(len(chunks), max(1, int(self.config.get("find_by_ids_max_concurrent_chunks", 1))))
+        logging.info(
+            "{}.find_by_ids() requesting {} sample IDs in {} chunks, {} at a time".format(
+                __class__.__name__, len(sample_ids), len(chunks), max_workers
+            )
+        )
+        if max_workers < 2:
+            for this_chunk in chunks:
+                yield self._find_by_ids_chunk(this_chunk)
+            return
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self._find_by_ids_chunk, this_chunk) for this_chunk in chunks]
+            try:
+                for this_future in as_completed(futures):
+                    yield this_future.result()
+            finally:
+                # if a chunk failed (or the caller stopped early) don't start the requests still waiting
+                for this_future in futures:
+                    this_future.cancel()
+
+    def _find_by_ids_chunk(self, sample_ids):
+        """
+        Requests a single chunk of sample IDs from the findByIds endpoint.  Failures that may be transient
+        (server errors, connection problems) are retried up to `find_by_ids_retries` times, with backoff.
+        """
         endpoint = self.config["findByIds"]
+        max_retries = int(self.config.get("find_by_ids_retries", 0))
         logging.debug(
             "{}.find_by_ids() using endpoint {}, passing list of {} sample IDs".format(
                 __class__.__name__, endpoint, len(sample_ids)
             )
         )
-        try:
-            response = self.make_request(endpoint, post_data=sample_ids)
-            logging.debug("{}.find_by_ids([{}]) returned {}".format(__class__.__name__, ",".join(sample_ids), response))
-            results = self.parse_response(response, endpoint, required_keys=[self.config["findByIds_key"]])
-        except urllib.error.HTTPError:
-            raise
+        num_retries = 0
+        while True:
+            try:
+                response = self.make_request(endpoint, post_data=sample_ids)
+                break
+            except urllib.error.URLError as e:
+                if num_retries >= max_retries or not self._is_retryable(e):
+                    raise
+                num_retries += 1
+                delay = RETRY_BACKOFF_SECONDS * (2 ** (num_retries - 1))
+                logging.warning(
+                    "{}.find_by_ids() request for {} sample IDs failed ({}): retry {} of {} in {}s".format(
+                        __class__.__name__, len(sample_ids), e, num_retries, max_retries, delay
+                    )
+                )
+                sleep(delay)
+        logging.debug("{}.find_by_ids([{}]) returned {}".format(__class__.__name__, ",".join(sample_ids), response))
+        results = self.parse_response(response, endpoint, required_keys=[self.config["findByIds_key"]])
         return results[self.config["findByIds_key"]]
 
+    def _is_retryable(self, error):
+        # an HTTP error response is only worth retrying if it was a server error; other URL errors are connection problems
+        if isinstance(error, urllib.error.HTTPError):
+            try:
+                return int(error.code) >= 500
+            except (TypeError, ValueError):
+                return False
+        return True
+
     def make_request(self, endpoint, post_data=None):
         request_url = self.config["mlwh_api_connection"]["base_url"] + endpoint
         request_data = None
@@ -134,10 +292,10 @@ class MLWH_Client:
             request_headers = {"Content-type": "application/json;charset=utf-8"}
         try:
             logging.info("request to MLWH API: {}".format(request_url))
-            http_request = urllib.request.Request(request_url, data=request_data, headers=request_headers)
-            with urllib.request.urlopen(http_request) as this_response:
-                response_as_string = this_response.read().decode("utf-8")
-                logging.debug("response from MLWH API: {}".format(response_as_string))
+            response_as_string = self.http_transport.request(
+                request_url, data=request_data, headers=request_headers
+            ).decode("utf-8")
+            logging.debug("response from MLWH API: {}".format(response_as_string))
         except urllib.error.HTTPError:
             logging.error("HTTP error during MLWH API request {}".format(request_url))
             raise
@@ -1,20 +1,82 @@
 import logging
 from base64 import b64decode, b64encode
+from copy import deepcopy
 
 from dash.api.exceptions import LdapDataError
 from dash.api.service.DataSources.ldap_data import LdapData
+from dash.api.utils.cache import TTLCache
+from dash.api.utils.session_token import session_tokens_from_environ
 
 DEFAULT_TOKEN_ENCODING = "utf8"
 TOKEN_DELIMITER = ":"
 
 GROUP_OBJ_CONFIG_KEY = "user_group_obj"
 
+# process-wide cache of user details, keyed on username; see user_details_cache()
+_user_details_cache = None
+
+
+def user_details_cache(ldap_config):
+    """
+    Returns the process-wide cache of user details, creating it on first use.
+    Its TTL and maximum number of entries are read from the LDAP config params `user_cache_ttl_seconds` and
+    `user_cache_max_entries`; if `user_cache_ttl_seconds` isn't set (or is 0) the cache is disabled.
+    """
+    global _user_details_cache
+    if _user_details_cache is None:
+        _user_details_cache = TTLCache(
+            ldap_config.get("user_cache_ttl_seconds", 0), max_entries=ldap_config.get("user_cache_max_entries")
+        )
+        logging.info(
+            "user details cache TTL = {}s, max entries = {}".format(
+                _user_details_cache.ttl_seconds, _user_details_cache.max_entries
+            )
+        )
+    return _user_details_cache
+
+
+def invalidate_user_details(username=None):
+    """
+    Removes the cached details of a user (e.g. when they log in or out, so changes to their LDAP record are seen
+    straight away); if no username is passed, the details of all users are removed.
+    """
+    if _user_details_cache is not None:
+        _user_details_cache.invalidate(username)
+
 
 class UserAuthentication:
     """
     Methods related to user authentication
+
+    By default the authentication token is just the username and password provided by the user, and is checked
+    against LDAP by NGINX for every request.  If session tokens are enabled (see
+    dash.api.utils.session_token.session_tokens_from_environ()), the token is instead a signed, expiring session
+    token carrying the user's details, issued once the user's password has been checked.
     """
 
+    def __init__(self):
+        self.session_tokens = session_tokens_from_environ()
+
+    def session_tokens_enabled(self):
+        return self.session_tokens is not None
+
+    def get_session_token(self, user_details):
+        """
+        Pass the details of an authenticated user (as returned by UserData.get_user_details()).
+        Returns a session token carrying the details.
+        """
+        return self.session_tokens.issue(user_details)
+
+    def get_user_details_from_session_token(self, session_token):
+        """
+        Pass a session token.
+        Returns the user details it carries, or None if it isn't a valid session token (or has expired).
+        """
+        user_details = self.session_tokens.verify(session_token)
+        if user_details is None or not user_details.get("username"):
+            return None
+        return user_details
+
     def get_auth_token(self, username_provided, password_provided, encoding=DEFAULT_TOKEN_ENCODING):
         """
         Pass username and password supplited by the user.  Optionally pass encodung (defaults to UTF-8).
@@ -64,6 +126,18 @@ class UserData(LdapData):
         )
         self.required_attributes_for_group_search = None
 
+    def verify_password(self, username, password):
+        """
+        Checks the password provided by a user, by binding to LDAP as the user.
+        Returns True if the password is correct, False if it isn't or there is no such user.
+        """
+        ldap_user_rec = self.ldap_search_user_by_username(username)
+        if ldap_user_rec is None:
+            logging.info("log in attempt by unknown username {}".format(username))
+            return False
+        # note the user's DN is the first element of the `ldap_user_rec` tuple
+        return self.ldap_bind_as(ldap_user_rec[0], password)
+
     def get_user_details(self, username):
         """
         Retrieves details of a user from LDAP, given a username.
@@ -72,7 +146,20 @@ class UserData(LdapData):
         if this doesn't match a valid user something has gone badly wrong.  Consequently,
         will raise LdapDataError unless the username matches a user who is a member of at
         least one institution, which is the minimum we should expect.
+        Details are kept in the process-wide cache (if enabled; see user_details_cache()), so LDAP is searched at
+        most once per user per cache TTL.
         """
+        cache = user_details_cache(self.config)
+        user_details = cache.get(username)
+        if user_details is not None:
+            logging.debug("user details cache hit for username {}".format(username))
+        else:
+            user_details = self._get_user_details_from_ldap(username)
+            cache.set(username, user_details)
+        # a copy is returned, so the cached details can't be modified
+        return deepcopy(user_details)
+
+    def _get_user_details_from_ldap(self, username):
         logging.info("retrieving user information for username {}".format(username))
         user_details = {"username": username, "memberOf": [], "projects": []}
         ldap_user_rec = self.ldap_search_user_by_username(username)
@@ -130,10 +217,12 @@ class UserData(LdapData):
                 self.config["inst_name_attr"],
                 self.config["country_names_attr"],
             ]
+        # all the groups are found with one LDAP search
+        ldap_group_recs = self.ldap_search_groups_by_gids(
+            org_gids, GROUP_OBJ_CONFIG_KEY, self.required_attributes_for_group_search
+        )
         for this_gid in org_gids:
-            ldap_group_rec = self.ldap_search_group_by_gid(
-                this_gid, GROUP_OBJ_CONFIG_KEY, self.required_attributes_for_group_search
-            )
+            ldap_group_rec = ldap_group_recs.get(this_gid)
             if ldap_group_rec is None:
                 logging.error(
                     "A group with GID {} could not be found in LDAP, which indicates an invalid user record.".format(
@@ -3,6 +3,7 @@ import logging
 from dash.api.service.DataServices.sample_data_services import MonocleSampleData
 from dash.api.service.DataServices.sample_tracking_services import MonocleSampleTracking
 from dash.api.service.DataServices.user_services import MonocleAuthentication, MonocleUser
+from flask import g, has_request_context
 
 
 class AuthenticationService(MonocleAuthentication):
@@ -12,28 +13,51 @@ class AuthenticationService(MonocleAuthentication):
     # currently this wrapper needs no specific initlialization
 
 
+def _get_user_record(username):
+    """
+    Returns the user record for the username.  Within a request, the record is looked up only once (it is kept in
+    flask.g), however many services are created for the request.
+    """
+    if not has_request_context():
+        return MonocleUser(username).record
+    user_records = g.setdefault("user_records", {})
+    if username not in user_records:
+        user_records[username] = MonocleUser(username).record
+    return user_records[username]
+
+
+def set_request_user_record(username, user_record):
+    """
+    Sets the user record for the username for the rest of the request (e.g. the verified record carried by a
+    session token), so the services created for the request don't look it up in LDAP.
+    """
+    g.setdefault("user_records", {})[username] = user_record
+
+
 def _add_user_record(username, obj_ref):
-    user = MonocleUser(username)
-    obj_ref.user_record = user.record
+    user_record = _get_user_record(username)
+    obj_ref.user_record = user_record
     # Set the project
     # (in future we will probably support membership of multiple projects)
-    project_list = user.record.get("projects")
+    project_list = user_record.get("projects")
     if project_list is None or 0 == len(project_list):
-        raise RuntimeError("User accounts must have a projects attribute (user record: {})".format(user.record))
+        raise RuntimeError("User accounts must have a projects attribute (user record: {})".format(user_record))
     elif len(project_list) > 1:
         raise RuntimeError(
-            "Multiple project membership for users is not currently supported (user record: {})".format(user.record)
+            "Multiple project membership for users is not currently supported (user record: {})".format(user_record)
         )
     else:
         obj_ref.current_project = project_list[0]
-    logging.debug("Setting current_project = {} (user record = {})".format(obj_ref.current_project, user.record))
+    logging.debug("Setting current_project = {} (user record = {})".format(obj_ref.current_project, user_record))
 
 
 class UserService(MonocleUser):
     """Wrapper class for MonocleUser"""
 
     def __init__(self, authenticated_username=None, set_up=True):
-        MonocleUser.__init__(self, authenticated_username, set_up=set_up)
+        super().__init__(set_up=set_up)
+        if authenticated_username is not None and set_up:
+            self.record = _get_user_record(authenticated_username)
 
     @property
     def user_details(self):
@@ -0,0 +1,102 @@
+import logging
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+# returned by get() for a key that isn't cached, so a cached None can be told apart
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded key/value cache whose entries expire a fixed number of seconds after they were stored.
+
+    Instances are intended to be held at module level, so that cached data are shared by every request (and every
+    user) handled by a worker process.  When the cache is full, the least recently used entry is evicted.
+
+    A TTL of 0 (or less) disables the cache:  nothing is stored and every lookup is a miss.
+
+    get_or_load() loads each key at most once at a time:  if several threads miss the same key together, one of
+    them loads the value while the others wait for it, rather than all of them loading it.
+    """
+
+    def __init__(self, ttl_seconds, max_entries=None, clock=monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        # for each key being loaded by get_or_load(), a lock held while it is loaded, and the number of threads
+        # loading or waiting for it
+        self._loading = {}
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds is not None and self.ttl_seconds > 0
+
+    def get(self, key, default=None):
+        """
+        Returns the value cached for `key`, or `default` if there is no such key or the entry has expired
+        """
+        if not self.enabled:
+            return default
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if self._clock() >= expires:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                logging.debug("cache full ({} entries): evicted {}".format(self.max_entries, evicted_key))
+
+    def get_or_load(self, key, load, is_valid=None):
+        """
+        Returns the value cached for `key`; if there is none (or `is_valid` is passed, and returns False for the
+        cached value), calls `load()`, caches the value it returns, and returns that.
+        While one thread is loading a key, other threads that want the same key wait for it to finish, then use
+        the value it cached (or, if loading failed, try loading it themselves).
+        """
+        if not self.enabled:
+            return load()
+        with self._lock:
+            key_loading = self._loading.setdefault(key, [Lock(), 0])
+            key_loading[1] += 1
+        try:
+            with key_loading[0]:
+                value = self.get(key, _MISSING)
+                if value is not _MISSING and (is_valid is None or is_valid(value)):
+                    return value
+                value = load()
+                self.set(key, value)
+                return value
+        finally:
+            with self._lock:
+                key_loading[1] -= 1
+                if 0 == key_loading[1]:
+                    del self._loading[key]
+
+    def invalidate(self, key=None):
+        """
+        Removes the entry for `key`; if no key is passed, all entries are removed
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -1,16 +1,14 @@
 import logging
 from pathlib import PurePath
 from subprocess import check_output
-from zipfile import ZIP_DEFLATED, ZipFile, is_zipfile
+from zipfile import ZipFile, is_zipfile
+
+from dash.api.utils.read_ahead import ReadAheadFiles
+from dash.api.utils.zip_writer import StoredZipWriter, StreamingZipWriter
 
 CURRENT_FOLDER = "."
 ENCODING_UTF_8 = "UTF-8"
 FORMAT_NUMBER_TO_FILE_SIZE_CLI = ["numfmt", "--to=iec", "--suffix=B"]
-WRITE_MODE = "w"
-# From 0 (fastest) to 9 (most compact). See https://docs.python.org/3/library/zlib.html#zlib.compressobj
-# Going above lvl 1 gains us little while increasing the compression time significantly (esp. when reads are included).
-# Note: when changing this constant, update `ZIP_COMPRESSION_FACTOR_ASSEMBLIES_ANNOTATIONS` in `sample_data_services.py` accordingly.
-ZIP_COMPRESSION_LEVEL = 0
 ZIP_SUFFIX = ".zip"
 
 
@@ -40,19 +38,89 @@ def complete_zipfile(filename):
     return True
 
 
-def zip_files(dir_name_to_files, *, basename, location=CURRENT_FOLDER, injected_zip_file_lib=ZipFile):
+def zip_files(
+    dir_name_to_files,
+    *,
+    basename,
+    location=CURRENT_FOLDER,
+    injected_zip_file_lib=StoredZipWriter,
+    progress_callback=None,
+    read_ahead_config=None,
+):
+    """
+    Pass a dict of lists of files, keyed on the directory they should be put in within the ZIP archive, and
+    the basename and location of the ZIP archive.
+    If a progress callback is passed, it is called with the number of files processed so far and the total
+    number of files after each file is added to the archive.
+    If a read ahead config is passed (a dict of ReadAheadFiles parameters, e.g. `prefetch_depth` and `buffer_size`)
+    the files are read ahead by a pool of reader threads while the archive is written; otherwise they are read
+    one at a time.
+    The files are stored in the archive without compression (see utils/zip_writer.py): they are mostly compressed
+    already.  Note: if this changes, update `ZIP_COMPRESSION_FACTOR_ASSEMBLIES_ANNOTATIONS` in
+    `sample_data_services.py` accordingly.
+    """
     no_files = not dir_name_to_files or all(len(lane_files) == 0 for lane_files in dir_name_to_files.values())
     if no_files:
         logging.info("No files passed. Creating an empty zip archive.")
 
     zfile_name = basename + ZIP_SUFFIX
     zfile_full_name = PurePath(location) / zfile_name
-    with injected_zip_file_lib(
-        zfile_full_name, mode=WRITE_MODE, compression=ZIP_DEFLATED, compresslevel=ZIP_COMPRESSION_LEVEL
-    ) as zfile:
-        for dir_name, files in dir_name_to_files.items():
-            for this_file in files:
-                try:
-                    zfile.write(this_file, PurePath(dir_name, this_file.name))
-                except FileNotFoundError:
-                    logging.debug(f"Excluding non-existent file from download: {this_file}")
+    with injected_zip_file_lib(zfile_full_name) as zfile:
+        files_to_zip = _FilesToZip(dir_name_to_files, read_ahead_config)
+        for num_files_done, (arcname, this_file, prefetched_file) in enumerate(files_to_zip, start=1):
+            try:
+                if prefetched_file is None:
+                    zfile.write(this_file, arcname)
+                else:
+                    zfile.write_blocks(this_file, prefetched_file.stat(), prefetched_file.read_blocks(), arcname)
+            except FileNotFoundError:
+                logging.debug(f"Excluding non-existent file from download: {this_file}")
+            if progress_callback is not None:
+                progress_callback(num_files_done, len(files_to_zip))
+
+
+def stream_zip_files(dir_name_to_files, *, basename, read_ahead_config=None):
+    """
+    Pass a dict of lists of files, keyed on the directory they should be put in within the ZIP archive, and
+    the basename of the ZIP archive (used only in messages).
+    Returns an iterator of the chunks of bytes of the ZIP archive, which is written as it is iterated over, e.g.
+    for a streamed HTTP response; nothing is written to disk.
+    The archive is the same as one written by zip_files(), except that CRC32s are in data descriptors.
+    """
+    zstream = StreamingZipWriter(basename + ZIP_SUFFIX)
+    for arcname, this_file, prefetched_file in _FilesToZip(dir_name_to_files, read_ahead_config):
+        try:
+            if prefetched_file is None:
+                yield from zstream.stream(this_file, arcname)
+            else:
+                yield from zstream.stream_blocks(
+                    this_file, prefetched_file.stat(), prefetched_file.read_blocks(), arcname
+                )
+        except FileNotFoundError:
+            logging.debug(f"Excluding non-existent file from download: {this_file}")
+    yield from zstream.stream_central_directory()
+    logging.info("Streamed ZIP archive {} ({} bytes of file data)".format(zstream.filename, zstream.bytes_copied))
+
+
+class _FilesToZip:
+    """
+    The files to put in a ZIP archive, as a sized iterable of (path within the archive, path, PrefetchedFile)
+    tuples; the PrefetchedFile is None unless the files are read ahead.
+    """
+
+    def __init__(self, dir_name_to_files, read_ahead_config):
+        self.files = [(dir_name, this_file) for dir_name, files in dir_name_to_files.items() for this_file in files]
+        self.read_ahead_config = read_ahead_config
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        if self.read_ahead_config is None:
+            prefetched_files = [None] * len(self.files)
+        else:
+            prefetched_files = ReadAheadFiles(
+                [this_file for dir_name, this_file in self.files], **self.read_ahead_config
+            )
+        for (dir_name, this_file), prefetched_file in zip(self.files, prefetched_files):
+            yield PurePath(dir_name, this_file.name), this_file, prefetched_file
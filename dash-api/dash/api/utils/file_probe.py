@@ -0,0 +1,87 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import time
+
+from dash.api.utils.cache import TTLCache
+
+DEFAULT_CACHE_MAX_ENTRIES = 200000
+
+# cached for a file that doesn't exist (a cache miss returns _NOT_CACHED)
+_NO_SUCH_FILE = None
+_NOT_CACHED = object()
+
+_shared_file_probe = None
+_shared_file_probe_lock = Lock()
+
+
+def shared_file_probe(probe_config):
+    """
+    Pass the file probe parameters (see MonocleSampleData.get_bulk_download_file_probe_config()).
+    Returns the process-wide FileProbe, creating it on first use, so its cache is shared by every request handled
+    by the worker process.
+    """
+    global _shared_file_probe
+    with _shared_file_probe_lock:
+        if _shared_file_probe is None:
+            _shared_file_probe = FileProbe(probe_config["workers"], probe_config["cache_ttl_seconds"])
+            logging.info(
+                "file probe created with {} workers, cache TTL {} seconds".format(
+                    _shared_file_probe.workers, probe_config["cache_ttl_seconds"]
+                )
+            )
+    return _shared_file_probe
+
+
+class FileProbe:
+    """
+    Finds out which of a list of files exist, and their sizes, by stat'ing up to `workers` files at the same time
+    in a pool of threads, so the round trips to a network file system (such as an rclone mount) overlap.
+
+    Results are cached for `cache_ttl_seconds`, including for files that don't exist; so the size of a file found
+    while listing the lane files for a download is not looked up again when the download size is estimated.
+    """
+
+    def __init__(self, workers, cache_ttl_seconds, max_entries=DEFAULT_CACHE_MAX_ENTRIES):
+        self.workers = workers
+        self._cache = TTLCache(cache_ttl_seconds, max_entries=max_entries)
+
+    def sizes(self, files):
+        """
+        Pass an iterable of file paths.
+        Returns a dict of the size of each file in bytes, keyed on path; the size is None if the file doesn't exist.
+        """
+        sizes = {}
+        to_stat = []
+        for this_file in files:
+            size = self._cache.get(os.fspath(this_file), _NOT_CACHED)
+            if size is _NOT_CACHED:
+                to_stat.append(this_file)
+            else:
+                sizes[this_file] = size
+        if to_stat:
+            start = time()
+            with ThreadPoolExecutor(
+                max_workers=min(self.workers, len(to_stat)), thread_name_prefix="file_probe"
+            ) as executor:
+                for this_file, size in zip(to_stat, executor.map(_file_size, to_stat)):
+                    self._cache.set(os.fspath(this_file), size)
+                    sizes[this_file] = size
+            logging.info(
+                "stat'ed {} files ({} cached) in {:.1f} seconds".format(
+                    len(to_stat), len(sizes) - len(to_stat), time() - start
+                )
+            )
+        return sizes
+
+    def size(self, this_file):
+        """Returns the size of a file in bytes, or None if it doesn't exist"""
+        return self.sizes([this_file])[this_file]
+
+
+def _file_size(this_file):
+    try:
+        return os.stat(this_file).st_size
+    except (FileNotFoundError, NotADirectoryError):
+        return _NO_SUCH_FILE
@@ -0,0 +1,179 @@
+import gzip
+import http.client
+import logging
+import socket
+import urllib.error
+import urllib.parse
+from io import BytesIO
+from threading import Lock
+from time import sleep
+
+CONFIG_SECTION = "http_client"
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 10
+DEFAULT_READ_TIMEOUT_SECONDS = 300
+DEFAULT_MAX_IDLE_CONNECTIONS_PER_HOST = 8
+DEFAULT_MAX_RETRIES = 2
+# initial delay before retrying a failed request; doubled for each subsequent retry
+RETRY_BACKOFF_SECONDS = 0.5
+# only these methods are retried after a failed request, as repeating them is safe
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+# HTTP statuses that indicate a (probably) transient problem that is worth retrying
+RETRYABLE_STATUSES = (502, 503, 504)
+
+# exceptions that indicate a kept-alive connection had been closed by the server before it was reused
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+_shared_transport = None
+_shared_transport_lock = Lock()
+
+
+def shared_transport(data_sources):
+    """
+    Pass the data sources config dict.
+    Returns the process-wide HttpTransport, creating it on first use with the parameters in the `http_client`
+    section of the config (if there is one).  All clients should use this, so that they share connection pools.
+    """
+    global _shared_transport
+    with _shared_transport_lock:
+        if _shared_transport is None:
+            config = data_sources.get(CONFIG_SECTION) or {}
+            _shared_transport = HttpTransport(
+                connect_timeout=config.get("connect_timeout_seconds", DEFAULT_CONNECT_TIMEOUT_SECONDS),
+                read_timeout=config.get("read_timeout_seconds", DEFAULT_READ_TIMEOUT_SECONDS),
+                max_idle_connections_per_host=config.get(
+                    "max_idle_connections_per_host", DEFAULT_MAX_IDLE_CONNECTIONS_PER_HOST
+                ),
+                max_retries=config.get("max_retries", DEFAULT_MAX_RETRIES),
+            )
+    return _shared_transport
+
+
+class HttpTransport:
+    """
+    Makes HTTP requests over persistent (keep-alive) connections, kept in a pool for each host, so that
+    consecutive requests to the same API don't each pay for a new TCP connection.
+
+    Failures are reported with the same exceptions as `urllib.request.urlopen()`: an error status raises
+    `urllib.error.HTTPError`, and a failure to connect raises `urllib.error.URLError`.  Requests using
+    idempotent methods are retried, with backoff, after connection failures and gateway/unavailable errors.
+    Responses with gzip content encoding are decoded.
+    """
+
+    def __init__(
+        self,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=DEFAULT_READ_TIMEOUT_SECONDS,
+        max_idle_connections_per_host=DEFAULT_MAX_IDLE_CONNECTIONS_PER_HOST,
+        max_retries=DEFAULT_MAX_RETRIES,
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle_connections_per_host = max_idle_connections_per_host
+        self.max_retries = max_retries
+        self._idle_connections = {}
+        self._lock = Lock()
+
+    def request(self, url, data=None, headers=None, method=None):
+        """
+        Pass a URL, and optionally request body (bytes), a dict of request headers and the HTTP method
+        (defaults to POST if there is a request body, otherwise GET).
+        Returns the response body, as bytes.
+        """
+        method = method or ("POST" if data is not None else "GET")
+        request_headers = {"Accept-Encoding": "gzip", **(headers or {})}
+        num_retries = 0
+        while True:
+            try:
+                return self._request_once(url, method, data, request_headers)
+            except urllib.error.URLError as e:
+                if method not in IDEMPOTENT_METHODS or num_retries >= self.max_retries or not self._is_retryable(e):
+                    raise
+                num_retries += 1
+                delay = RETRY_BACKOFF_SECONDS * (2 ** (num_retries - 1))
+                logging.warning(
+                    "{} {} failed ({}): retry {} of {} in {}s".format(
+                        method, url, e, num_retries, self.max_retries, delay
+                    )
+                )
+                sleep(delay)
+
+    def close(self):
+        """Closes all idle connections"""
+        with self._lock:
+            for this_pool in self._idle_connections.values():
+                for this_connection in this_pool:
+                    this_connection.close()
+            self._idle_connections = {}
+
+    def _request_once(self, url, method, data, headers):
+        parsed_url = urllib.parse.urlsplit(url)
+        if parsed_url.scheme not in ("http", "https") or not parsed_url.hostname:
+            raise urllib.error.URLError("unsupported URL {}".format(url))
+        pool_key = (parsed_url.scheme, parsed_url.hostname, parsed_url.port)
+        path = urllib.parse.urlunsplit(("", "", parsed_url.path or "/", parsed_url.query, ""))
+
+        connection, reused = self._get_connection(pool_key)
+        try:
+            try:
+                response = self._send(connection, method, path, data, headers)
+            except STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # the server closed the idle connection: nothing was processed, so just try a new connection
+                logging.debug("kept-alive connection to {} was closed by the server: reconnecting".format(pool_key))
+                connection.close()
+                connection = self._new_connection(pool_key)
+                response = self._send(connection, method, path, data, headers)
+            body = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise urllib.error.URLError(e) from e
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release_connection(pool_key, connection)
+
+        if "gzip" == (response.getheader("Content-Encoding") or "").lower():
+            body = gzip.decompress(body)
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, BytesIO(body))
+        return body
+
+    def _send(self, connection, method, path, data, headers):
+        if connection.sock is None:
+            connection.connect()
+            # the connection timeout has been used; from now on socket operations are reads/writes
+            connection.sock.settimeout(self.read_timeout)
+        connection.request(method, path, body=data, headers=headers)
+        return connection.getresponse()
+
+    def _get_connection(self, pool_key):
+        with self._lock:
+            idle = self._idle_connections.get(pool_key)
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(pool_key), False
+
+    def _new_connection(self, pool_key):
+        scheme, host, port = pool_key
+        connection_class = http.client.HTTPSConnection if "https" == scheme else http.client.HTTPConnection
+        logging.debug("opening new connection to {}://{}:{}".format(scheme, host, port))
+        return connection_class(host, port, timeout=self.connect_timeout)
+
+    def _release_connection(self, pool_key, connection):
+        with self._lock:
+            idle = self._idle_connections.setdefault(pool_key, [])
+            if len(idle) < self.max_idle_connections_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _is_retryable(self, error):
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code in RETRYABLE_STATUSES
+        # a URL error other than an HTTP error status means we couldn't connect, or the connection failed;
+        # but there's no point retrying if the host name couldn't be resolved
+        if isinstance(error.reason, socket.gaierror):
+            return False
+        return isinstance(error.reason, (OSError, http.client.HTTPException))
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+from pathlib import Path
+from threading import Lock
+
+# The data view job (data_view/bin/create_download_view_for_sample_data.py) writes a manifest of the data files
+# of each institution into the institution's directory in the institution view, so that the dash-api can find out
+# which data files exist, and their sizes, without going to the (slow) data file mount.  The manifest maps
+# public names to lane IDs to data file names to {"size": <bytes>, "mtime": <seconds>, "crc32": <int>}; the
+# CRC32 is optional.
+
+LANE_FILES_MANIFEST_FILE_NAME = ".lane_files_manifest.json"
+
+_shared_manifests = None
+_shared_manifests_lock = Lock()
+
+
+def shared_lane_files_manifests():
+    """Returns the process-wide LaneFilesManifests, creating it on first use"""
+    global _shared_manifests
+    with _shared_manifests_lock:
+        if _shared_manifests is None:
+            _shared_manifests = LaneFilesManifests()
+    return _shared_manifests
+
+
+def read_lane_files_manifest(institution_dir):
+    """
+    Pass the directory of an institution in the institution view.
+    Returns the lane files manifest of the institution, or None if there is no (readable) manifest.
+    """
+    try:
+        with open(Path(institution_dir, LANE_FILES_MANIFEST_FILE_NAME), "r") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as err:
+        logging.warning("ignoring unreadable lane files manifest in {}: {}".format(institution_dir, err))
+        return None
+
+
+def write_lane_files_manifest(institution_dir, manifest):
+    """
+    Pass the directory of an institution in the institution view, and its lane files manifest.
+    Writes the manifest, replacing any previous manifest; readers never see a partially written manifest.
+    """
+    manifest_file = Path(institution_dir, LANE_FILES_MANIFEST_FILE_NAME)
+    temp_file = manifest_file.with_name("{}.{}.tmp".format(manifest_file.name, os.getpid()))
+    with open(temp_file, "w") as file:
+        json.dump(manifest, file, separators=(",", ":"))
+    os.replace(temp_file, manifest_file)
+
+
+class LaneFilesManifests:
+    """
+    A cache of the lane files manifests of the institutions, keyed on institution directory.  A manifest is
+    reloaded when the modification time of its file changes.
+    """
+
+    def __init__(self):
+        self._manifests = {}
+        self._lock = Lock()
+
+    def get(self, institution_dir):
+        """
+        Pass the directory of an institution in the institution view.
+        Returns its lane files manifest, or None if there is none.
+        """
+        institution_dir = os.fspath(institution_dir)
+        try:
+            mtime = os.stat(os.path.join(institution_dir, LANE_FILES_MANIFEST_FILE_NAME)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            cached = self._manifests.get(institution_dir)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        manifest = None if mtime is None else read_lane_files_manifest(institution_dir)
+        if manifest is not None:
+            logging.info("loaded lane files manifest for {} ({} public names)".format(institution_dir, len(manifest)))
+        with self._lock:
+            self._manifests[institution_dir] = (mtime, manifest)
+        return manifest
+
+    def file_entry(self, data_file):
+        """
+        Pass the path of a data file in the institution view (<institution dir>/<public name>/<file name>).
+        Returns the manifest entry of the file (a dict with `size`, `mtime` and optionally `crc32`); or None if
+        the institution has no manifest, or the file isn't in it.
+        """
+        data_file = Path(data_file)
+        manifest = self.get(data_file.parent.parent)
+        if manifest is None:
+            return None
+        for lane_files in manifest.get(data_file.parent.name, {}).values():
+            if data_file.name in lane_files:
+                return lane_files[data_file.name]
+        return None
@@ -0,0 +1,215 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from threading import Condition, Event
+from time import time
+
+DEFAULT_PREFETCH_DEPTH = 4
+DEFAULT_BUFFER_SIZE = 256 * 1024 * 1024
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+
+# put in a file's block queue after the last block
+_END_OF_FILE = None
+
+
+class ReadAheadFiles:
+    """
+    Reads a sequence of files ahead of the code consuming them, in a pool of reader threads, so that the latency
+    of opening and reading each file (high on a network file system such as an rclone mount) overlaps with the
+    processing of earlier files.
+
+    Iterate to get a PrefetchedFile for each file, in order.  Up to `prefetch_depth` files are read at the same
+    time, in blocks of `block_size` bytes; the blocks waiting to be consumed take up to `buffer_size` bytes in
+    total, except that the file currently being consumed can always have one block read (so a file bigger than
+    the buffer never blocks, and memory use is bounded by `buffer_size` + `block_size` however big the file is).
+    Throughput is logged when iteration finishes.
+    """
+
+    def __init__(
+        self,
+        files,
+        prefetch_depth=DEFAULT_PREFETCH_DEPTH,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+        block_size=DEFAULT_BLOCK_SIZE,
+    ):
+        self.files = list(files)
+        self.prefetch_depth = prefetch_depth
+        self.block_size = block_size
+        self._budget = _ByteBudget(buffer_size)
+        self.bytes_read = 0
+        self.seconds_waiting = 0.0
+
+    def __iter__(self):
+        start = time()
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.prefetch_depth, thread_name_prefix="read_ahead") as executor:
+
+            def prefetch(index):
+                if index < len(self.files):
+                    prefetched_file = PrefetchedFile(self, index, self.files[index])
+                    executor.submit(self._read, prefetched_file)
+                    pending.append(prefetched_file)
+
+            try:
+                for index in range(self.prefetch_depth):
+                    prefetch(index)
+                for index in range(len(self.files)):
+                    prefetched_file = pending.popleft()
+                    self._budget.set_current_index(index)
+                    try:
+                        yield prefetched_file
+                    finally:
+                        prefetched_file.close()
+                    prefetch(index + self.prefetch_depth)
+            finally:
+                # stop any reads that are still going on (if iteration finished early)
+                for prefetched_file in pending:
+                    prefetched_file.close()
+        self._log_throughput(time() - start)
+
+    def _read(self, prefetched_file):
+        try:
+            with open(prefetched_file.path, "rb") as in_file:
+                prefetched_file.set_stat(os.fstat(in_file.fileno()))
+                while self._budget.acquire(self.block_size, prefetched_file.index, prefetched_file.closed):
+                    block = in_file.read(self.block_size)
+                    self._budget.release(self.block_size - len(block), prefetched_file.index)
+                    if not block:
+                        break
+                    prefetched_file.blocks.put(block)
+        except Exception as err:
+            prefetched_file.set_error(err)
+        finally:
+            prefetched_file.blocks.put(_END_OF_FILE)
+
+    def _log_throughput(self, elapsed_seconds):
+        megabytes = self.bytes_read / (1024 * 1024)
+        logging.info(
+            "read {} files ({:.1f} MB) in {:.1f}s: {:.1f} MB/s, with {} files read ahead; "
+            "{:.1f}s spent waiting for data".format(
+                len(self.files),
+                megabytes,
+                elapsed_seconds,
+                megabytes / elapsed_seconds if elapsed_seconds > 0 else 0,
+                self.prefetch_depth,
+                self.seconds_waiting,
+            )
+        )
+
+
+class PrefetchedFile:
+    """A file being read by ReadAheadFiles"""
+
+    def __init__(self, read_ahead, index, path):
+        self.path = path
+        self.index = index
+        self.blocks = Queue()
+        self.closed = Event()
+        self._read_ahead = read_ahead
+        self._opened = Event()
+        self._stat = None
+        self._error = None
+        self._end_of_file = False
+
+    def stat(self):
+        """
+        Returns the os.stat_result of the file, waiting until it has been opened.
+        Raises the exception raised when opening the file, if it couldn't be opened (e.g. FileNotFoundError).
+        """
+        self._wait(self._opened.wait)
+        if self._error is not None and self._stat is None:
+            raise self._error
+        return self._stat
+
+    def read_blocks(self):
+        """
+        Yields the blocks of the file content, in order.
+        Raises the exception raised while reading the file, if there was one.
+        """
+        self.stat()
+        while True:
+            block = self._wait(self.blocks.get)
+            if block is _END_OF_FILE:
+                self._end_of_file = True
+                break
+            self._read_ahead._budget.release(len(block), self.index)
+            self._read_ahead.bytes_read += len(block)
+            yield block
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Stops reading the file, and discards any blocks that haven't been consumed"""
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self._read_ahead._budget.wake()
+        while not self._end_of_file:
+            block = self.blocks.get()
+            if block is _END_OF_FILE:
+                self._end_of_file = True
+                break
+            self._read_ahead._budget.release(len(block), self.index)
+
+    def set_stat(self, file_stat):
+        self._stat = file_stat
+        self._opened.set()
+
+    def set_error(self, err):
+        self._error = err
+        self._opened.set()
+
+    def _wait(self, wait_function):
+        start = time()
+        result = wait_function()
+        self._read_ahead.seconds_waiting += time() - start
+        return result
+
+
+class _ByteBudget:
+    """Limits the number of bytes held in memory by the readers"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._used = 0
+        # bytes held for each file, keyed on file index
+        self._used_by_index = {}
+        self._current_index = 0
+        self._condition = Condition()
+
+    def acquire(self, num_bytes, index, closed):
+        """
+        Waits until `num_bytes` can be held for the file at `index` within the capacity; the file being consumed
+        can always hold one block (even if the capacity is used up by files read ahead of it, which can't be
+        consumed before it).  Returns False (without acquiring) if the file is closed in the meantime.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: closed.is_set()
+                or self._used + num_bytes <= self.capacity
+                or (index == self._current_index and self._used_by_index.get(index, 0) == 0)
+            )
+            if closed.is_set():
+                return False
+            self._used += num_bytes
+            self._used_by_index[index] = self._used_by_index.get(index, 0) + num_bytes
+            return True
+
+    def release(self, num_bytes, index):
+        with self._condition:
+            self._used -= num_bytes
+            self._used_by_index[index] -= num_bytes
+            if self._used_by_index[index] == 0:
+                del self._used_by_index[index]
+            self._condition.notify_all()
+
+    def set_current_index(self, index):
+        with self._condition:
+            self._current_index = index
+            self._condition.notify_all()
+
+    def wake(self):
+        with self._condition:
+            self._condition.notify_all()
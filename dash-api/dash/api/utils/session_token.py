@@ -0,0 +1,59 @@
+import hashlib
+import logging
+import os
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+# Session tokens are enabled by setting a secret key in this environment variable; it must be the same for every
+# dash-api worker (and kept secret:  anyone with the key can forge tokens).
+SESSION_TOKEN_SECRET_KEY_ENVIRON = "SESSION_TOKEN_SECRET_KEY"
+SESSION_TOKEN_TTL_ENVIRON = "SESSION_TOKEN_TTL_SECONDS"
+DEFAULT_SESSION_TOKEN_TTL_SECONDS = 8 * 60 * 60
+SESSION_TOKEN_SALT = "monocle-session-token"
+
+
+def session_tokens_from_environ():
+    """
+    Returns SessionTokens configured from the environment, or None if session tokens aren't enabled (i.e. the
+    environment variable SESSION_TOKEN_SECRET_KEY isn't set).
+    """
+    secret_key = os.environ.get(SESSION_TOKEN_SECRET_KEY_ENVIRON)
+    if not secret_key:
+        return None
+    ttl_seconds = int(os.environ.get(SESSION_TOKEN_TTL_ENVIRON, DEFAULT_SESSION_TOKEN_TTL_SECONDS))
+    return SessionTokens(secret_key, ttl_seconds)
+
+
+class SessionTokens:
+    """
+    Issues and verifies session tokens:  a dict of claims about a user (their user record), with the time the token
+    was issued, signed with an HMAC (SHA-256) using `secret_key`.  A token is valid for `ttl_seconds` after it was
+    issued.
+
+    The claims are signed, not encrypted, so they must not include anything secret.
+    """
+
+    def __init__(self, secret_key, ttl_seconds=DEFAULT_SESSION_TOKEN_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._serializer = URLSafeTimedSerializer(
+            secret_key, salt=SESSION_TOKEN_SALT, signer_kwargs={"digest_method": hashlib.sha256}
+        )
+
+    def issue(self, claims):
+        """Pass a dict of claims (which must be serializable as JSON).  Returns a signed token carrying them."""
+        return self._serializer.dumps(claims)
+
+    def verify(self, token):
+        """
+        Pass a token.
+        Returns the dict of claims it carries, or None if the token is missing, has expired, or isn't validly signed.
+        """
+        if not token:
+            return None
+        try:
+            return self._serializer.loads(token, max_age=self.ttl_seconds)
+        except SignatureExpired:
+            logging.info("session token has expired")
+        except BadSignature:
+            logging.warning("session token signature is not valid")
+        return None
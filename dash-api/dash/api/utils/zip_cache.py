@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from time import time
+from zipfile import is_zipfile
+
+from dash.api.utils.file import ZIP_SUFFIX
+from dash.api.utils.zip_jobs import ZIP_JOB_QUEUED, ZIP_JOB_RUNNING, read_zip_job_status
+
+ZIP_CACHE_TOKEN_SUFFIX = ".archive.json"
+# archives used more recently than this are never evicted, so an archive isn't deleted between a client being
+# redirected to it and the download starting
+EVICTION_GRACE_SECONDS = 300
+
+
+def zip_archive_key(dir_name_to_files):
+    """
+    Pass a dict of lists of files, keyed on the directory they should be put in within a ZIP archive (as passed
+    to zip_files()).
+    Returns a key for the content of the archive: a hash of the sorted list of directory names, files and file
+    modification times (a file that doesn't exist has none; it will be left out of the archive).  The key changes
+    if any of the files changes, so it can be used as the archive basename.
+    """
+    entries = []
+    for dir_name, files in dir_name_to_files.items():
+        for this_file in files:
+            try:
+                mtime = os.stat(this_file).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            entries.append([dir_name, str(this_file), mtime])
+    return hashlib.sha256(json.dumps(sorted(entries, key=lambda entry: entry[:2])).encode()).hexdigest()
+
+
+class ZipArchiveCache:
+    """
+    A cache of ZIP archives for bulk downloads, keyed on their content (see zip_archive_key()), so that any number
+    of download tokens for the same data share one archive.
+
+    The archive a token maps onto is recorded in a file alongside it (<token>.archive.json), so the mapping is
+    shared by every process with access to the download directory.  When the ZIP archives in the directory take up
+    more than `quota_bytes`, the least recently used are deleted (see evict()); the time an archive was last used
+    is recorded as its access time (see touch()).
+    """
+
+    def __init__(self, location, quota_bytes):
+        self.location = location
+        self.quota_bytes = quota_bytes
+
+    def archive_basename(self, token):
+        """Returns the basename of the archive a download token maps onto, or None if it hasn't been mapped"""
+        try:
+            with open(self._token_file(token), "r") as file:
+                return json.load(file)["archive"]
+        except FileNotFoundError:
+            return None
+
+    def map_token(self, token, dir_name_to_files):
+        """
+        Pass a download token, and the dict of lists of files to be put in the ZIP archive for it.
+        Maps the token onto the archive for these data, and returns its basename.
+        """
+        basename = zip_archive_key(dir_name_to_files)
+        token_file = self._token_file(token)
+        # written to a temporary file that then replaces the token file, so readers never see a partial file
+        temp_file = token_file.with_name("{}.{}.tmp".format(token_file.name, os.getpid()))
+        with open(temp_file, "w") as file:
+            json.dump({"archive": basename}, file)
+        os.replace(temp_file, token_file)
+        logging.info("download token {} maps onto ZIP archive {}".format(token, basename + ZIP_SUFFIX))
+        return basename
+
+    def touch(self, basename):
+        """Records that the archive has been used, by setting its access time (its modification time is kept)"""
+        zip_file = Path(self.location, basename + ZIP_SUFFIX)
+        try:
+            os.utime(zip_file, (time(), zip_file.stat().st_mtime))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep=()):
+        """
+        Deletes the least recently used ZIP archives in the cache directory until they take up no more than the
+        quota.  Archives whose basenames are in `keep`, archives that are being built (or are incomplete), and
+        archives used in the last EVICTION_GRACE_SECONDS are never deleted.
+        Returns the list of basenames of the archives deleted.
+        """
+        archives = []
+        total_bytes = 0
+        for zip_file in Path(self.location).glob("*" + ZIP_SUFFIX):
+            try:
+                file_stat = zip_file.stat()
+            except FileNotFoundError:
+                continue
+            total_bytes += file_stat.st_size
+            archives.append((file_stat.st_atime, file_stat.st_size, zip_file))
+        if total_bytes <= self.quota_bytes:
+            return []
+
+        evicted = []
+        grace_time = time() - EVICTION_GRACE_SECONDS
+        for last_used, size, zip_file in sorted(archives):
+            if total_bytes <= self.quota_bytes:
+                break
+            basename = zip_file.name[: -len(ZIP_SUFFIX)]
+            if basename in keep or last_used > grace_time or self._being_built(basename, zip_file):
+                continue
+            try:
+                zip_file.unlink()
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            evicted.append(basename)
+        logging.info(
+            "evicted {} ZIP archives from {}; {} bytes in use, quota {} bytes".format(
+                len(evicted), self.location, total_bytes, self.quota_bytes
+            )
+        )
+        if total_bytes > self.quota_bytes:
+            logging.warning(
+                "ZIP archives in {} are still over quota: the rest are in use or being built".format(self.location)
+            )
+        return evicted
+
+    def _being_built(self, basename, zip_file):
+        job_status = read_zip_job_status(basename, self.location)
+        if job_status is not None and job_status["status"] in (ZIP_JOB_QUEUED, ZIP_JOB_RUNNING):
+            return True
+        # an archive is only a valid ZIP file once it has been completely written
+        return not is_zipfile(zip_file)
+
+    def _token_file(self, token):
+        return Path(self.location, token + ZIP_CACHE_TOKEN_SUFFIX)
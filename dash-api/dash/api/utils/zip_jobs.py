@@ -0,0 +1,327 @@
+import fcntl
+import json
+import logging
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from math import ceil
+from pathlib import Path
+from threading import Event, Lock, Thread
+from time import time
+
+from dash.api.utils.file import ZIP_SUFFIX
+
+ZIP_JOB_QUEUED = "queued"
+ZIP_JOB_RUNNING = "running"
+ZIP_JOB_READY = "ready"
+ZIP_JOB_FAILED = "failed"
+# errors reported for a job that was queued or running in a process that no longer exists, and for a job whose
+# ZIP archive has since been deleted (e.g. by housekeeping); in either case the job can be submitted again
+ZIP_JOB_INTERRUPTED = "interrupted"
+ZIP_JOB_ARCHIVE_DELETED = "archive deleted"
+ZIP_JOB_STATUS_SUFFIX = ".status.json"
+# lock file in the download directory, locked by every process while it reads and claims the status file of a job
+ZIP_JOB_LOCK_FILE = ".zip_jobs.lock"
+# a job that failed can be submitted again after a delay, which doubles with each consecutive failure
+ZIP_JOB_RETRY_BASE_SECONDS = 60
+ZIP_JOB_RETRY_MAX_SECONDS = 60 * 60
+
+# the status file of each job that is queued or running is touched every ZIP_JOB_HEARTBEAT_SECONDS; a job whose
+# status file hasn't been touched for ZIP_JOB_STALE_SECONDS was interrupted, whatever process it claims to be in
+ZIP_JOB_HEARTBEAT_SECONDS = 30
+ZIP_JOB_STALE_SECONDS = 5 * ZIP_JOB_HEARTBEAT_SECONDS
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_QUEUED = 20
+
+_shared_queue = None
+_shared_queue_lock = Lock()
+
+
+class ZipJobQueueFullError(Exception):
+    """Raised when a ZIP archive job is submitted while the queue is full"""
+
+
+def shared_zip_job_queue(max_workers=DEFAULT_MAX_WORKERS, max_queued=DEFAULT_MAX_QUEUED):
+    """
+    Returns the process-wide ZipJobQueue, creating it on first use with the parameters passed.
+    """
+    global _shared_queue
+    with _shared_queue_lock:
+        if _shared_queue is None:
+            _shared_queue = ZipJobQueue(max_workers=max_workers, max_queued=max_queued)
+    return _shared_queue
+
+
+def read_zip_job_status(basename, location):
+    """
+    Pass the basename of a ZIP archive and the directory it is written to.
+    Returns the status of the job building the archive, as a dict with `status` (one of the ZIP_JOB_* states)
+    and `percent complete`; or None if no job has been submitted for the archive.
+    A job that was queued or running in a process that no longer exists (see _job_was_interrupted()), or a job that
+    completed but whose ZIP archive no longer exists, is reported as failed (see zip_job_can_be_resubmitted()).
+    A job that failed has the `error`, the time it `failed at`, and the number of consecutive `failures`.
+    """
+    status_file = _status_file(basename, location)
+    try:
+        with open(status_file, "r") as file:
+            content = file.read()
+            last_touched = os.fstat(file.fileno()).st_mtime
+    except FileNotFoundError:
+        return None
+    try:
+        job_status = json.loads(content)
+    except ValueError:
+        # the status file has been created, but the job that created it hasn't written to it (yet)
+        job_status = {"status": ZIP_JOB_QUEUED, "percent complete": 0}
+    if job_status["status"] in (ZIP_JOB_QUEUED, ZIP_JOB_RUNNING) and _job_was_interrupted(job_status, last_touched):
+        logging.warning(
+            "ZIP archive job for {} was interrupted (process {} on {} has gone)".format(
+                status_file, job_status.get("pid"), job_status.get("host")
+            )
+        )
+        job_status = {**job_status, "status": ZIP_JOB_FAILED, "error": ZIP_JOB_INTERRUPTED}
+    elif ZIP_JOB_READY == job_status["status"] and not Path(location, basename + ZIP_SUFFIX).is_file():
+        logging.info("ZIP archive built by job {} has been deleted".format(status_file))
+        job_status = {**job_status, "status": ZIP_JOB_FAILED, "error": ZIP_JOB_ARCHIVE_DELETED}
+    return job_status
+
+
+def zip_job_can_be_resubmitted(job_status):
+    """
+    Pass the status of a job (see read_zip_job_status()).
+    Returns True if the job was interrupted, or its ZIP archive has been deleted, or it failed long enough ago
+    (see zip_job_retry_after()), so it should be submitted again.
+    """
+    if job_status.get("error") in (ZIP_JOB_INTERRUPTED, ZIP_JOB_ARCHIVE_DELETED):
+        return True
+    return ZIP_JOB_FAILED == job_status["status"] and 0 == zip_job_retry_after(job_status)
+
+
+def zip_job_retry_after(job_status):
+    """
+    Pass the status of a failed job (see read_zip_job_status()).
+    Returns the number of seconds until the job can be submitted again (0 if it can be submitted now).
+    """
+    failed_at = job_status.get("failed at")
+    if failed_at is None:
+        return 0
+    retry_delay = min(
+        ZIP_JOB_RETRY_BASE_SECONDS * 2 ** max(job_status.get("failures", 1) - 1, 0), ZIP_JOB_RETRY_MAX_SECONDS
+    )
+    return max(0, ceil(failed_at + retry_delay - time()))
+
+
+class ZipJobQueue:
+    """
+    Builds ZIP archives in a pool of worker threads, so that large archives needn't be built while an HTTP
+    request waits for them.
+
+    The status of each job is written to a file alongside the ZIP archive (<basename>.status.json), so it can be
+    read by any process with access to the download directory -- not just the process that is running the job.
+    The status file is read and created while holding a lock on a file in the download directory (see
+    _locked_download_dir()), so each archive is only built once, even if several processes are asked for it, or
+    to resubmit it, at the same time.
+    While a job is queued or running, its status file is touched every ZIP_JOB_HEARTBEAT_SECONDS, so a job left
+    behind by a process that has gone can be recognized by any process, even if its PID has since been reused.
+    If a job fails, its partial ZIP archive is deleted, and the job can be submitted again after a delay that
+    grows with each consecutive failure (see zip_job_retry_after()).
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_queued=DEFAULT_MAX_QUEUED):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="zip_job")
+        self._num_pending = 0
+        # status files of the jobs that are queued or running, which are touched by the heartbeat thread
+        self._pending_status_files = set()
+        self._lock = Lock()
+        self._heartbeat_thread = None
+        self._stop_heartbeat = Event()
+
+    def submit(self, basename, location, build):
+        """
+        Pass the basename of a ZIP archive, the directory it is written to, and a function that builds it.
+        The function is passed a progress callback, which it should call with the number of files added to
+        the archive so far and the total number of files.
+        If no job has been submitted for the archive, or a previous job can be resubmitted, a job is queued.
+        Returns the status of the job (see read_zip_job_status()).
+        Raises ZipJobQueueFullError if a job would need to be queued, but all the workers are busy and there are
+        already `max_queued` jobs waiting.
+        """
+        with self._lock, _locked_download_dir(location):
+            job_status = read_zip_job_status(basename, location)
+            if job_status is not None and not zip_job_can_be_resubmitted(job_status):
+                return job_status
+            if self._num_pending >= self.max_workers + self.max_queued:
+                raise ZipJobQueueFullError(
+                    "cannot queue ZIP archive {}: {} jobs are already pending".format(basename, self._num_pending)
+                )
+            # consecutive failures are counted across resubmissions, so the delay before each retry grows
+            previous_failures = 0
+            if job_status is not None:
+                previous_failures = job_status.get("failures", 0)
+                try:
+                    _status_file(basename, location).unlink()
+                except FileNotFoundError:
+                    pass
+            if not self._claim(basename, location, previous_failures):
+                # another process got there first (without the lock, e.g. an older version)
+                return read_zip_job_status(basename, location) or {"status": ZIP_JOB_QUEUED, "percent complete": 0}
+            self._num_pending += 1
+            self._pending_status_files.add(_status_file(basename, location))
+            self._start_heartbeat()
+        logging.info("queued ZIP archive job for {}".format(_status_file(basename, location)))
+        self._executor.submit(self._run, basename, location, build, previous_failures)
+        return {"status": ZIP_JOB_QUEUED, "percent complete": 0}
+
+    def status(self, basename, location):
+        """Returns the status of the job building a ZIP archive (see read_zip_job_status())"""
+        return read_zip_job_status(basename, location)
+
+    def num_pending(self):
+        """Returns the number of jobs submitted by this process that are queued or running"""
+        with self._lock:
+            return self._num_pending
+
+    def close(self):
+        """Stops touching the status files of pending jobs (which will then be reported as interrupted)"""
+        self._stop_heartbeat.set()
+
+    def _start_heartbeat(self):
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = Thread(target=self._heartbeat, name="zip_job_heartbeat", daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        while not self._stop_heartbeat.wait(ZIP_JOB_HEARTBEAT_SECONDS):
+            with self._lock:
+                status_files = list(self._pending_status_files)
+            for status_file in status_files:
+                try:
+                    os.utime(status_file)
+                except FileNotFoundError:
+                    pass
+
+    def _claim(self, basename, location, previous_failures):
+        try:
+            file_descriptor = os.open(_status_file(basename, location), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return False
+        with os.fdopen(file_descriptor, "w") as file:
+            json.dump(_job_status(ZIP_JOB_QUEUED, failures=previous_failures), file)
+        return True
+
+    def _run(self, basename, location, build, previous_failures):
+        status_file = _status_file(basename, location)
+        percent_complete = 0
+        _write_status(status_file, _job_status(ZIP_JOB_RUNNING, failures=previous_failures))
+
+        def progress(num_files_done, num_files):
+            nonlocal percent_complete
+            this_percent_complete = int(100 * num_files_done / num_files) if num_files else 100
+            if this_percent_complete != percent_complete:
+                percent_complete = this_percent_complete
+                _write_status(status_file, _job_status(ZIP_JOB_RUNNING, percent_complete, previous_failures))
+
+        try:
+            build(progress)
+            final_status = _job_status(ZIP_JOB_READY, 100)
+            logging.info("ZIP archive job for {} is complete".format(status_file))
+        except Exception as err:
+            logging.exception("ZIP archive job for {} failed: {}".format(status_file, err))
+            # the partial ZIP archive mustn't be mistaken for a complete one, and would only waste space
+            try:
+                Path(location, basename + ZIP_SUFFIX).unlink()
+            except FileNotFoundError:
+                pass
+            final_status = {
+                **_job_status(ZIP_JOB_FAILED, percent_complete, previous_failures + 1),
+                "error": str(err),
+                "failed at": time(),
+            }
+        # the job no longer counts against the queue depth by the time anyone can see it has finished
+        with self._lock:
+            self._num_pending -= 1
+            self._pending_status_files.discard(status_file)
+        _write_status(status_file, final_status)
+
+
+@contextmanager
+def _locked_download_dir(location):
+    """
+    Context manager that holds an exclusive lock on the ZIP job lock file in the download directory.
+    The status file of a job that failed or was interrupted is deleted before the job is claimed again, so this
+    makes reading, deleting and claiming it one step for all processes; otherwise two processes could both find
+    the job failed, and the second would delete the status file just created by the first, and build the same
+    archive at the same time.
+    """
+    with open(Path(location, ZIP_JOB_LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _status_file(basename, location):
+    return Path(location, basename + ZIP_JOB_STATUS_SUFFIX)
+
+
+def _job_status(status, percent_complete=0, failures=0):
+    return {
+        "status": status,
+        "percent complete": percent_complete,
+        "pid": os.getpid(),
+        "host": socket.gethostname(),
+        "boot id": _boot_id(),
+        "failures": failures,
+    }
+
+
+def _write_status(status_file, job_status):
+    # written to a temporary file that then replaces the status file, so readers never see a partial file
+    temp_file = status_file.with_name("{}.{}.tmp".format(status_file.name, os.getpid()))
+    with open(temp_file, "w") as file:
+        json.dump(job_status, file)
+    os.replace(temp_file, status_file)
+
+
+def _job_was_interrupted(job_status, last_touched):
+    """
+    Pass the status of a job that is queued or running, and the time its status file was last touched.
+    Returns True if the job was interrupted:  its status file hasn't been touched by the heartbeat for
+    ZIP_JOB_STALE_SECONDS; or it was submitted on this host, and since then the host has been restarted or the
+    process that submitted it has gone.
+    """
+    if time() - last_touched > ZIP_JOB_STALE_SECONDS:
+        return True
+    if job_status.get("host") != socket.gethostname():
+        # the process can't be checked from this host, so the job is trusted for as long as the heartbeat lasts
+        return False
+    if job_status.get("boot id") != _boot_id():
+        return True
+    return not _process_exists(job_status.get("pid"))
+
+
+def _boot_id():
+    # identifies this boot of the host, so a PID recorded before a restart isn't mistaken for a process running now
+    try:
+        with open(BOOT_ID_FILE, "r") as boot_id_file:
+            return boot_id_file.read().strip()
+    except OSError:
+        return None
+
+
+def _process_exists(pid):
+    if pid is None:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,435 @@
+import errno
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+
+from dash.api.utils.lane_files_manifest import shared_lane_files_manifests
+
+# Writes ZIP archives whose entries are stored (not compressed), copying the file data into the archive with
+# os.sendfile() so it needn't pass through Python buffers.  The data we put in ZIP archives are mostly compressed
+# already (e.g. .fastq.gz), so compressing them again only costs CPU time.
+#
+# A ZIP entry header must give the CRC32 of the file data before the data.  If these are in a sidecar manifest
+# (a file named SIDECAR_MANIFEST_FILE_NAME in the same directory as the data file, mapping file names to
+# {"size": <bytes>, "mtime": <seconds>, "crc32": <int>}), or in the lane files manifest of the institution (see
+# utils/lane_files_manifest.py), they are used, provided the size and modification time match the file; otherwise
+# the file is read to calculate the CRC32, and the header is updated afterwards.
+#
+# StreamingZipWriter writes the same archives as a sequence of chunks of bytes, without writing to a file or seeking;
+# CRC32s that aren't in a manifest are given in a data descriptor after the file data instead.
+#
+# See https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT for the ZIP file format.
+
+SIDECAR_MANIFEST_FILE_NAME = ".zip_manifest.json"
+
+COPY_BLOCK_SIZE = 1024 * 1024
+# errors from os.sendfile() meaning it can't be used for this pair of files (e.g. on some FUSE file systems)
+SENDFILE_UNSUPPORTED_ERRNOS = (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EXDEV)
+
+# limits of the original ZIP format; beyond these ZIP64 extensions are needed, and the original fields are
+# set to the marker values
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_MAX_ENTRIES = 0xFFFF
+ZIP64_MARKER = 0xFFFFFFFF
+ZIP64_ENTRIES_MARKER = 0xFFFF
+
+ZIP_STORED = 0
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+# general purpose flag bit 11: file names are UTF-8
+ZIP_FLAG_UTF8 = 0x800
+# general purpose flag bit 3: the CRC32 and sizes are in a data descriptor after the file data
+ZIP_FLAG_DATA_DESCRIPTOR = 0x8
+# "version made by" upper byte 3 = UNIX, so external attributes hold file mode
+ZIP_CREATE_SYSTEM_UNIX = 3
+
+LOCAL_FILE_HEADER = struct.Struct("<4s5H3L2H")
+LOCAL_FILE_HEADER_SIGNATURE = b"PK\003\004"
+LOCAL_FILE_HEADER_CRC_OFFSET = 14
+CENTRAL_DIRECTORY_HEADER = struct.Struct("<4s6H3L5H2L")
+CENTRAL_DIRECTORY_HEADER_SIGNATURE = b"PK\001\002"
+END_OF_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\005\006"
+ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4sQ2H2L4Q")
+ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\006\006"
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE = b"PK\006\007"
+ZIP64_EXTRA_FIELD_ID = 0x0001
+DATA_DESCRIPTOR = struct.Struct("<4s3L")
+ZIP64_DATA_DESCRIPTOR = struct.Struct("<4sL2Q")
+DATA_DESCRIPTOR_SIGNATURE = b"PK\007\010"
+
+
+class _StoredZipArchive:
+    """
+    The parts of writing a ZIP archive with stored (uncompressed) entries that are common to StoredZipWriter and
+    StreamingZipWriter.  Subclasses implement _write_all() to output the archive.
+    """
+
+    def __init__(self, name):
+        self.filename = name
+        self._offset = 0
+        self._central_directory = []
+        self._sidecar_manifests = {}
+        self.bytes_copied = 0
+        self.num_crc32s_calculated = 0
+
+    def _precomputed_crc32(self, filename, file_stat):
+        directory, name = os.path.split(os.fspath(filename))
+        if directory not in self._sidecar_manifests:
+            self._sidecar_manifests[directory] = read_sidecar_manifest(directory)
+        manifest_entry = self._sidecar_manifests[directory].get(name)
+        if manifest_entry is None:
+            manifest_entry = shared_lane_files_manifests().file_entry(filename)
+        if (
+            manifest_entry is None
+            or manifest_entry.get("crc32") is None
+            or manifest_entry.get("size") != file_stat.st_size
+            or int(manifest_entry.get("mtime", -1)) != int(file_stat.st_mtime)
+        ):
+            return None
+        return manifest_entry["crc32"]
+
+    def _check_copied(self, filename, size, copied):
+        if copied != size:
+            raise OSError("{} changed while it was added to ZIP archive {}".format(filename, self.filename))
+
+    def _write(self, data):
+        self._write_all(data)
+        self._offset += len(data)
+
+    def _write_all(self, data):
+        raise NotImplementedError()
+
+    def _write_local_file_header(self, filename, file_stat, arcname, crc32, data_descriptor=False):
+        """
+        Writes the local file header for a file; if the CRC32 is None, it must be updated once the data have been
+        written -- or, if `data_descriptor` is true, written in a data descriptor after the data (in which case
+        the header gives no sizes either).
+        Returns the offset of the header, the encoded file name and the general purpose flags.
+        """
+        header_offset = self._offset
+        name = str(os.path.basename(filename) if arcname is None else arcname).encode("utf-8")
+        flags = ZIP_FLAG_UTF8 | (ZIP_FLAG_DATA_DESCRIPTOR if data_descriptor else 0)
+        size = 0 if data_descriptor else file_stat.st_size
+        zip64 = file_stat.st_size >= ZIP64_LIMIT
+        extra = struct.pack("<2H2Q", ZIP64_EXTRA_FIELD_ID, 16, size, size) if zip64 else b""
+        header_size = ZIP64_MARKER if zip64 else size
+        dos_time, dos_date = _dos_date_time(file_stat.st_mtime)
+        self._write(
+            LOCAL_FILE_HEADER.pack(
+                LOCAL_FILE_HEADER_SIGNATURE,
+                ZIP64_VERSION if zip64 else ZIP_VERSION,
+                flags,
+                ZIP_STORED,
+                dos_time,
+                dos_date,
+                crc32 or 0,
+                header_size,
+                header_size,
+                len(name),
+                len(extra),
+            )
+        )
+        self._write(name)
+        self._write(extra)
+        return header_offset, name, flags
+
+    def _write_central_directory(self):
+        central_directory_offset = self._offset
+        for name, flags, mtime, mode, crc32, size, header_offset in self._central_directory:
+            zip64_fields = []
+            if size >= ZIP64_LIMIT:
+                zip64_fields += [size, size]
+            if header_offset >= ZIP64_LIMIT:
+                zip64_fields.append(header_offset)
+            extra = (
+                struct.pack(
+                    "<2H{}Q".format(len(zip64_fields)), ZIP64_EXTRA_FIELD_ID, 8 * len(zip64_fields), *zip64_fields
+                )
+                if zip64_fields
+                else b""
+            )
+            version = ZIP64_VERSION if zip64_fields else ZIP_VERSION
+            dos_time, dos_date = _dos_date_time(mtime)
+            self._write(
+                CENTRAL_DIRECTORY_HEADER.pack(
+                    CENTRAL_DIRECTORY_HEADER_SIGNATURE,
+                    (ZIP_CREATE_SYSTEM_UNIX << 8) | version,
+                    version,
+                    flags,
+                    ZIP_STORED,
+                    dos_time,
+                    dos_date,
+                    crc32,
+                    _field_value(size, ZIP64_LIMIT, ZIP64_MARKER),
+                    _field_value(size, ZIP64_LIMIT, ZIP64_MARKER),
+                    len(name),
+                    len(extra),
+                    0,  # comment length
+                    0,  # disk number
+                    0,  # internal attributes
+                    (mode & 0xFFFF) << 16,
+                    _field_value(header_offset, ZIP64_LIMIT, ZIP64_MARKER),
+                )
+            )
+            self._write(name)
+            self._write(extra)
+        central_directory_size = self._offset - central_directory_offset
+        num_entries = len(self._central_directory)
+
+        if (
+            num_entries >= ZIP_MAX_ENTRIES
+            or central_directory_offset >= ZIP64_LIMIT
+            or central_directory_size >= ZIP64_LIMIT
+        ):
+            zip64_end_offset = self._offset
+            self._write(
+                ZIP64_END_OF_CENTRAL_DIRECTORY.pack(
+                    ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE,
+                    ZIP64_END_OF_CENTRAL_DIRECTORY.size - 12,  # size of the remaining record
+                    (ZIP_CREATE_SYSTEM_UNIX << 8) | ZIP64_VERSION,
+                    ZIP64_VERSION,
+                    0,  # this disk
+                    0,  # disk with the central directory
+                    num_entries,
+                    num_entries,
+                    central_directory_size,
+                    central_directory_offset,
+                )
+            )
+            self._write(
+                ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR.pack(
+                    ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE, 0, zip64_end_offset, 1
+                )
+            )
+        self._write(
+            END_OF_CENTRAL_DIRECTORY.pack(
+                END_OF_CENTRAL_DIRECTORY_SIGNATURE,
+                0,  # this disk
+                0,  # disk with the central directory
+                _field_value(num_entries, ZIP_MAX_ENTRIES, ZIP64_ENTRIES_MARKER),
+                _field_value(num_entries, ZIP_MAX_ENTRIES, ZIP64_ENTRIES_MARKER),
+                _field_value(central_directory_size, ZIP64_LIMIT, ZIP64_MARKER),
+                _field_value(central_directory_offset, ZIP64_LIMIT, ZIP64_MARKER),
+                0,  # comment length
+            )
+        )
+
+
+class StoredZipWriter(_StoredZipArchive):
+    """
+    Writes a ZIP archive with stored (uncompressed) entries.  Use as a context manager, or call close() when all
+    the files have been added.
+    """
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self._file = open(filename, "wb", buffering=0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, filename, arcname=None):
+        """
+        Pass the path of a file, and optionally its path within the archive (defaults to the file name).
+        Adds the file to the archive.
+        Raises FileNotFoundError if the file doesn't exist, in which case nothing is added to the archive.
+        """
+        with open(filename, "rb") as in_file:
+            file_stat = os.fstat(in_file.fileno())
+            crc32 = self._precomputed_crc32(filename, file_stat)
+            header_offset, name, flags = self._write_local_file_header(filename, file_stat, arcname, crc32)
+            if crc32 is None:
+                crc32 = self._copy_calculating_crc32(in_file, file_stat.st_size)
+                self._update_crc32(header_offset, crc32)
+            else:
+                self._copy(in_file, file_stat.st_size)
+        self._central_directory.append(
+            (name, flags, file_stat.st_mtime, file_stat.st_mode, crc32, file_stat.st_size, header_offset)
+        )
+
+    def write_blocks(self, filename, file_stat, blocks, arcname=None):
+        """
+        Pass the path of a file, its os.stat_result, an iterable of blocks of the file content (e.g. read ahead by
+        utils.read_ahead) and optionally its path within the archive (defaults to the file name).
+        Adds the file to the archive.
+        """
+        crc32 = self._precomputed_crc32(filename, file_stat)
+        header_offset, name, flags = self._write_local_file_header(filename, file_stat, arcname, crc32)
+        calculated_crc32 = 0
+        copied = 0
+        for block in blocks:
+            if crc32 is None:
+                calculated_crc32 = zlib.crc32(block, calculated_crc32)
+            self._write_all(block)
+            copied += len(block)
+        self._check_copied(filename, file_stat.st_size, copied)
+        self._offset += copied
+        self.bytes_copied += copied
+        if crc32 is None:
+            crc32 = calculated_crc32
+            self._update_crc32(header_offset, crc32)
+        self._central_directory.append(
+            (name, flags, file_stat.st_mtime, file_stat.st_mode, crc32, file_stat.st_size, header_offset)
+        )
+
+    def close(self):
+        """Writes the central directory, and closes the archive"""
+        if self._file.closed:
+            return
+        try:
+            self._write_central_directory()
+        finally:
+            self._file.close()
+
+    def _copy(self, in_file, size):
+        in_fd = in_file.fileno()
+        out_fd = self._file.fileno()
+        copied = 0
+        try:
+            while copied < size:
+                num_bytes = os.sendfile(out_fd, in_fd, copied, size - copied)
+                if 0 == num_bytes:
+                    break
+                copied += num_bytes
+        except OSError as err:
+            if copied > 0 or err.errno not in SENDFILE_UNSUPPORTED_ERRNOS:
+                raise
+            logging.debug("cannot use sendfile for {} ({}): copying via buffer".format(in_file.name, err))
+            self._copy_calculating_crc32(in_file, size)
+            return
+        self._check_copied(in_file.name, size, copied)
+        self._offset += copied
+        self.bytes_copied += copied
+
+    def _copy_calculating_crc32(self, in_file, size):
+        crc32 = 0
+        copied = 0
+        while copied < size:
+            block = in_file.read(min(COPY_BLOCK_SIZE, size - copied))
+            if not block:
+                break
+            crc32 = zlib.crc32(block, crc32)
+            self._write_all(block)
+            copied += len(block)
+        self._check_copied(in_file.name, size, copied)
+        self._offset += copied
+        self.bytes_copied += copied
+        return crc32
+
+    def _update_crc32(self, header_offset, crc32):
+        os.pwrite(self._file.fileno(), struct.pack("<L", crc32), header_offset + LOCAL_FILE_HEADER_CRC_OFFSET)
+        self.num_crc32s_calculated += 1
+
+    def _write_all(self, data):
+        # the archive file is unbuffered, so a write may be partial
+        view = memoryview(data)
+        while view:
+            view = view[self._file.write(view) :]
+
+
+class StreamingZipWriter(_StoredZipArchive):
+    """
+    Writes a ZIP archive with stored (uncompressed) entries as a sequence of chunks of bytes, e.g. for a streamed
+    HTTP response.  Iterate over stream() or stream_blocks() for each file, then over stream_central_directory().
+    The name passed is only used in messages.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._chunks = []
+
+    def stream(self, filename, arcname=None):
+        """
+        Pass the path of a file, and optionally its path within the archive (defaults to the file name).
+        Yields the chunks of the archive that add the file to it.
+        Raises FileNotFoundError if the file doesn't exist, in which case nothing is added to the archive.
+        """
+        with open(filename, "rb") as in_file:
+            file_stat = os.fstat(in_file.fileno())
+            blocks = iter(lambda: in_file.read(COPY_BLOCK_SIZE), b"")
+            yield from self.stream_blocks(filename, file_stat, blocks, arcname)
+
+    def stream_blocks(self, filename, file_stat, blocks, arcname=None):
+        """
+        Pass the path of a file, its os.stat_result, an iterable of blocks of the file content (e.g. read ahead by
+        utils.read_ahead) and optionally its path within the archive (defaults to the file name).
+        Yields the chunks of the archive that add the file to it.
+        """
+        crc32 = self._precomputed_crc32(filename, file_stat)
+        header_offset, name, flags = self._write_local_file_header(
+            filename, file_stat, arcname, crc32, data_descriptor=crc32 is None
+        )
+        yield from self._take_chunks()
+        calculated_crc32 = 0
+        copied = 0
+        for block in blocks:
+            if crc32 is None:
+                calculated_crc32 = zlib.crc32(block, calculated_crc32)
+            copied += len(block)
+            yield block
+        self._check_copied(filename, file_stat.st_size, copied)
+        self._offset += copied
+        self.bytes_copied += copied
+        if crc32 is None:
+            crc32 = calculated_crc32
+            self._write_data_descriptor(crc32, file_stat.st_size)
+            self.num_crc32s_calculated += 1
+        self._central_directory.append(
+            (name, flags, file_stat.st_mtime, file_stat.st_mode, crc32, file_stat.st_size, header_offset)
+        )
+        yield from self._take_chunks()
+
+    def stream_central_directory(self):
+        """Yields the last chunks of the archive, holding the central directory"""
+        self._write_central_directory()
+        yield from self._take_chunks()
+
+    def _write_all(self, data):
+        self._chunks.append(bytes(data))
+
+    def _take_chunks(self):
+        if self._chunks:
+            chunk = b"".join(self._chunks)
+            self._chunks = []
+            yield chunk
+
+    def _write_data_descriptor(self, crc32, size):
+        if size >= ZIP64_LIMIT:
+            self._write(ZIP64_DATA_DESCRIPTOR.pack(DATA_DESCRIPTOR_SIGNATURE, crc32, size, size))
+        else:
+            self._write(DATA_DESCRIPTOR.pack(DATA_DESCRIPTOR_SIGNATURE, crc32, size, size))
+
+
+def read_sidecar_manifest(directory):
+    """
+    Pass a directory.  Returns the dict of file sizes, modification times and CRC32s, keyed on file name, read
+    from the sidecar manifest in the directory; or an empty dict if there is no (readable) sidecar manifest.
+    """
+    try:
+        with open(os.path.join(directory, SIDECAR_MANIFEST_FILE_NAME), "r") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as err:
+        logging.warning("ignoring unreadable sidecar manifest in {}: {}".format(directory, err))
+        return {}
+
+
+def _field_value(value, limit, marker):
+    # the value of a field in the original ZIP format: the marker if the value is in a ZIP64 field instead
+    return value if value < limit else marker
+
+
+def _dos_date_time(mtime):
+    # DOS dates start in 1980
+    year, month, day, hour, minute, second = time.localtime(max(mtime, 315532800))[:6]
+    year = max(year, 1980)
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
@@ -1,14 +1,20 @@
 import json
+import os
 import unittest
 import urllib
 from http import HTTPStatus
 from os import environ
 from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import time
 from unittest.mock import Mock, call, patch
+from zipfile import ZipFile, is_zipfile
 
 from dash.api import exceptions, routes
 from dash.api.service.service_factory import ServiceFactory
-from flask import Response
+from dash.api.utils.session_token import SessionTokens
+from dash.api.utils.zip_jobs import ZIP_JOB_RETRY_BASE_SECONDS, ZipJobQueueFullError
+from flask import Flask, Response, g
 
 
 class TestRoutes(unittest.TestCase):
@@ -44,6 +50,16 @@ class TestRoutes(unittest.TestCase):
     def setUp(self) -> None:
         ServiceFactory.TEST_MODE = True
 
+    def temp_dir(self):
+        temp_dir = TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        return temp_dir.name
+
+    @staticmethod
+    def write_zip_file(dir_name_to_files, *, basename, location, **kwargs):
+        with ZipFile(Path(location, basename + ".zip"), "w") as zip_file:
+            zip_file.writestr("lane file", "lane")
+
     @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
     @patch("flask.Response.set_cookie")
     @patch("dash.api.routes.call_request_headers")
@@ -53,6 +69,7 @@ class TestRoutes(unittest.TestCase):
         mock_auth_token = "abcde1234"
         mock_redirect_url = "/mock/redirect/url"
         request_headers_mock.return_value = {"X-Target": mock_redirect_url}
+        auth_service_mock.return_value.session_tokens_enabled.return_value = False
         auth_service_mock.return_value.get_auth_token.return_value = mock_auth_token
         # When
         result = routes.set_auth_cookie_route({"username": "any name", "password": "anything"})
@@ -60,12 +77,101 @@ class TestRoutes(unittest.TestCase):
         set_cookie_mock.assert_called_once_with(
             self.MOCK_ENVIRONMENT["AUTH_COOKIE_NAME"], value=mock_auth_token.encode("utf8"), max_age=None
         )
+        auth_service_mock.return_value.invalidate_user_record.assert_called_once_with("any name")
         self.assertIsInstance(result, Response)
         self.assertEqual(result.content_type, "application/json; charset=UTF-8")
         self.assertEqual(result.status_code, HTTPStatus.TEMPORARY_REDIRECT)
         self.assertIsNotNone(result.headers.get("Location"))
         self.assertEqual(result.headers.get("Location"), mock_redirect_url)
 
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("flask.Response.set_cookie")
+    @patch("dash.api.routes.call_request_headers")
+    @patch.object(ServiceFactory, "authentication_service")
+    def test_set_auth_cookie_route_with_session_tokens(self, auth_service_mock, request_headers_mock, set_cookie_mock):
+        mock_session_token = "signed.session.token"
+        request_headers_mock.return_value = {"X-Target": "/mock/redirect/url"}
+        auth_service_mock.return_value.session_tokens_enabled.return_value = True
+        auth_service_mock.return_value.get_session_token.return_value = mock_session_token
+
+        result = routes.set_auth_cookie_route({"username": "any name", "password": "anything"})
+
+        auth_service_mock.return_value.get_session_token.assert_called_once_with("any name", "anything")
+        auth_service_mock.return_value.get_auth_token.assert_not_called()
+        set_cookie_mock.assert_called_once_with(
+            self.MOCK_ENVIRONMENT["AUTH_COOKIE_NAME"],
+            value=mock_session_token.encode("utf8"),
+            max_age=None,
+            httponly=True,
+        )
+        self.assertEqual(result.status_code, HTTPStatus.TEMPORARY_REDIRECT)
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("flask.Response.set_cookie")
+    @patch("dash.api.routes.call_request_headers")
+    @patch.object(ServiceFactory, "authentication_service")
+    def test_set_auth_cookie_route_with_session_tokens_and_invalid_credentials(
+        self, auth_service_mock, request_headers_mock, set_cookie_mock
+    ):
+        mock_redirect_url = "/mock/redirect/url"
+        request_headers_mock.return_value = {"X-Target": mock_redirect_url}
+        auth_service_mock.return_value.session_tokens_enabled.return_value = True
+        auth_service_mock.return_value.get_session_token.return_value = None
+
+        result = routes.set_auth_cookie_route({"username": "any name", "password": "wrong"})
+
+        set_cookie_mock.assert_called_once_with(self.MOCK_ENVIRONMENT["AUTH_COOKIE_NAME"], value="", expires=0)
+        self.assertEqual(result.status_code, HTTPStatus.TEMPORARY_REDIRECT)
+        self.assertEqual(result.headers.get("Location"), mock_redirect_url)
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.call_request_cookies")
+    @patch.object(ServiceFactory, "authentication_service")
+    def test_verify_auth_token_route(self, auth_service_mock, mock_cookies):
+        mock_cookies.return_value = {environ["AUTH_COOKIE_NAME"]: "signed.session.token"}
+        auth_service_mock.return_value.session_tokens_enabled.return_value = True
+        auth_service_mock.return_value.get_user_record_from_session_token.return_value = {"username": self.TEST_USER}
+
+        result = routes.verify_auth_token_route()
+
+        auth_service_mock.return_value.get_user_record_from_session_token.assert_called_once_with(
+            "signed.session.token"
+        )
+        self.assertEqual(HTTPStatus.OK, result.status_code)
+        self.assertEqual(self.TEST_USER, result.headers.get("X-Remote-User"))
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.call_request_cookies")
+    @patch.object(ServiceFactory, "authentication_service")
+    def test_verify_auth_token_route_with_invalid_token(self, auth_service_mock, mock_cookies):
+        mock_cookies.return_value = {environ["AUTH_COOKIE_NAME"]: "forged.session.token"}
+        auth_service_mock.return_value.session_tokens_enabled.return_value = True
+        auth_service_mock.return_value.get_user_record_from_session_token.return_value = None
+
+        self.assertEqual(HTTPStatus.UNAUTHORIZED, routes.verify_auth_token_route().status_code)
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.call_request_cookies")
+    @patch.object(ServiceFactory, "authentication_service")
+    def test_verify_auth_token_route_with_employee_type(self, auth_service_mock, mock_cookies):
+        mock_cookies.return_value = {environ["AUTH_COOKIE_NAME"]: "signed.session.token"}
+        auth_service_mock.return_value.session_tokens_enabled.return_value = True
+        auth_service_mock.return_value.get_user_record_from_session_token.return_value = {
+            "username": self.TEST_USER,
+            "type": "admin",
+        }
+
+        self.assertEqual(HTTPStatus.OK, routes.verify_auth_token_route(employee_type="admin").status_code)
+        self.assertEqual(HTTPStatus.UNAUTHORIZED, routes.verify_auth_token_route(employee_type="superuser").status_code)
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch.object(ServiceFactory, "authentication_service")
+    def test_verify_auth_token_route_without_session_tokens(self, auth_service_mock):
+        auth_service_mock.return_value.session_tokens_enabled.return_value = False
+
+        self.assertEqual(HTTPStatus.UNAUTHORIZED, routes.verify_auth_token_route().status_code)
+        auth_service_mock.return_value.get_user_record_from_session_token.assert_not_called()
+
     def test_set_auth_cookie_route_reject_missing_param(self):
         with self.assertRaises(KeyError):
             routes.set_auth_cookie_route({"this is a bad key": "any name", "password": "anything"})
@@ -87,6 +193,41 @@ class TestRoutes(unittest.TestCase):
         self.assertIsNotNone(result.headers.get("Location"))
         self.assertEqual(result.headers.get("Location"), mock_redirect_url)
 
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("flask.Response.set_cookie")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch.object(ServiceFactory, "authentication_service")
+    def test_delete_auth_cookie_route_invalidates_user_record(
+        self, auth_service_mock, username_mock, request_headers_mock, set_cookie_mock
+    ):
+        # Given
+        request_headers_mock.return_value = {}
+        username_mock.return_value = self.TEST_USER
+        # When
+        routes.delete_auth_cookie_route()
+        # Then
+        auth_service_mock.return_value.invalidate_user_record.assert_called_once_with(self.TEST_USER)
+        set_cookie_mock.assert_called_once_with(self.MOCK_ENVIRONMENT["AUTH_COOKIE_NAME"], value="", expires=0)
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("flask.Response.set_cookie")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch.object(ServiceFactory, "authentication_service")
+    def test_delete_auth_cookie_route_when_not_logged_in(
+        self, auth_service_mock, username_mock, request_headers_mock, set_cookie_mock
+    ):
+        # Given
+        request_headers_mock.return_value = {}
+        username_mock.side_effect = exceptions.NotAuthorisedException("no auth cookie")
+        # When
+        result = routes.delete_auth_cookie_route()
+        # Then
+        auth_service_mock.return_value.invalidate_user_record.assert_not_called()
+        set_cookie_mock.assert_called_once_with(self.MOCK_ENVIRONMENT["AUTH_COOKIE_NAME"], value="", expires=0)
+        self.assertEqual(result.status_code, HTTPStatus.TEMPORARY_REDIRECT)
+
     @patch("dash.api.routes.call_jsonify")
     @patch("dash.api.routes.get_authenticated_username")
     @patch.object(ServiceFactory, "user_service")
@@ -120,6 +261,37 @@ class TestRoutes(unittest.TestCase):
         self.assertTrue(len(result), 2)
         self.assertEqual(result[1], HTTPStatus.OK)
 
+    @patch("dash.api.routes.call_jsonify")
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch.object(ServiceFactory, "sample_tracking_service")
+    def test_get_batches_route_from_dashboard_snapshot(self, sample_tracking_service_mock, username_mock, resp_mock):
+        # Given
+        sample_tracking_service_mock.return_value.get_batches.return_value = self.SERVICE_CALL_RETURN_DATA
+        sample_tracking_service_mock.return_value.dashboard_snapshot_age.return_value = 123.4
+        username_mock.return_value = self.TEST_USER
+        # When
+        result = routes.get_batches_route()
+        # Then
+        resp_mock.assert_called_once_with({"batches": self.SERVICE_CALL_RETURN_DATA})
+        self.assertEqual(result[1], HTTPStatus.OK)
+        self.assertEqual(result[2], {"Age": "123"})
+
+    @patch("dash.api.routes.call_jsonify")
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch.object(ServiceFactory, "sample_tracking_service")
+    def test_get_batches_route_not_from_dashboard_snapshot(
+        self, sample_tracking_service_mock, username_mock, resp_mock
+    ):
+        # Given
+        sample_tracking_service_mock.return_value.get_batches.return_value = self.SERVICE_CALL_RETURN_DATA
+        sample_tracking_service_mock.return_value.dashboard_snapshot_age.return_value = None
+        username_mock.return_value = self.TEST_USER
+        # When
+        result = routes.get_batches_route()
+        # Then
+        self.assertEqual(result[1], HTTPStatus.OK)
+        self.assertEqual(result[2], {})
+
     @patch("dash.api.routes.call_jsonify")
     @patch("dash.api.routes.get_authenticated_username")
     @patch.object(ServiceFactory, "sample_tracking_service")
@@ -621,6 +793,10 @@ class TestRoutes(unittest.TestCase):
         zip_file_basename = mock_token
         zip_file_location = "some/dir"
         sample_data_service_mock.return_value.get_bulk_download_location.return_value = zip_file_location
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
         download_host = mock_host
         download_symlink = "downloads/"
         sample_data_service_mock.return_value.make_download_symlink.return_value = download_symlink
@@ -628,7 +804,13 @@ class TestRoutes(unittest.TestCase):
         result = routes.data_download_route(mock_token)
         # Then
         sample_data_service_mock.assert_called_once_with(self.TEST_USER)
-        zip_files_mock.assert_called_once_with(files_to_zip, basename=zip_file_basename, location=zip_file_location)
+        zip_files_mock.assert_called_once_with(
+            files_to_zip,
+            basename=zip_file_basename,
+            location=zip_file_location,
+            progress_callback=None,
+            read_ahead_config=None,
+        )
         sample_data_service_mock.return_value.make_download_symlink.assert_called_once_with(cross_institution=True)
         self.assertIsInstance(result, Response)
         self.assertIn(str(HTTPStatus.SEE_OTHER.value), result.status)
@@ -682,6 +864,10 @@ class TestRoutes(unittest.TestCase):
         zip_file_basename = mock_token
         zip_file_location = "some/dir"
         sample_data_service_mock.return_value.get_bulk_download_location.return_value = zip_file_location
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
         download_host = mock_host
         download_symlink = "downloads/"
         sample_data_service_mock.return_value.make_download_symlink.return_value = download_symlink
@@ -689,7 +875,13 @@ class TestRoutes(unittest.TestCase):
         result = routes.data_download_route(mock_token)
         # Then
         sample_data_service_mock.assert_called_once_with(self.TEST_USER)
-        zip_files_mock.assert_called_once_with(files_to_zip, basename=zip_file_basename, location=zip_file_location)
+        zip_files_mock.assert_called_once_with(
+            files_to_zip,
+            basename=zip_file_basename,
+            location=zip_file_location,
+            progress_callback=None,
+            read_ahead_config=None,
+        )
         sample_data_service_mock.return_value.make_download_symlink.assert_called_once_with(cross_institution=True)
         resp_mock.assert_called_once_with(
             {"download location": "https://{}/{}{}.zip".format(download_host, download_symlink, mock_token)}
@@ -741,6 +933,10 @@ class TestRoutes(unittest.TestCase):
         zip_file_basename = mock_token
         zip_file_location = "some/dir"
         sample_data_service_mock.return_value.get_bulk_download_location.return_value = zip_file_location
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
         download_host = ""
         download_symlink = "downloads/"
         sample_data_service_mock.return_value.make_download_symlink.return_value = download_symlink
@@ -748,7 +944,13 @@ class TestRoutes(unittest.TestCase):
         result = routes.data_download_route(mock_token)
         # Then
         sample_data_service_mock.assert_called_once_with(self.TEST_USER)
-        zip_files_mock.assert_called_once_with(files_to_zip, basename=zip_file_basename, location=zip_file_location)
+        zip_files_mock.assert_called_once_with(
+            files_to_zip,
+            basename=zip_file_basename,
+            location=zip_file_location,
+            progress_callback=None,
+            read_ahead_config=None,
+        )
         sample_data_service_mock.return_value.make_download_symlink.assert_called_once_with(cross_institution=True)
         self.assertIsInstance(result, Response)
         self.assertIn(str(HTTPStatus.SEE_OTHER.value), result.status)
@@ -791,6 +993,10 @@ class TestRoutes(unittest.TestCase):
         mock_token = "123"
         zip_file_location = "some/dir"
         sample_data_service_mock.return_value.get_bulk_download_location.return_value = zip_file_location
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
         download_host = mock_host
         download_symlink = "downloads/"
         sample_data_service_mock.return_value.make_download_symlink.return_value = download_symlink
@@ -824,6 +1030,10 @@ class TestRoutes(unittest.TestCase):
         mock_token = "123"
         zip_file_location = "some/dir"
         sample_data_service_mock.return_value.get_bulk_download_location.return_value = zip_file_location
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
         with self.assertRaises(RuntimeError):
             routes.data_download_route(mock_token)
 
@@ -853,6 +1063,10 @@ class TestRoutes(unittest.TestCase):
         mock_token = "123"
         zip_file_location = "some/dir"
         sample_data_service_mock.return_value.get_bulk_download_location.return_value = zip_file_location
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
         # When
         result = routes.data_download_route(mock_token)
         # Then
@@ -860,85 +1074,870 @@ class TestRoutes(unittest.TestCase):
         self.assertIsInstance(result, Response)
         self.assertIn(str(HTTPStatus.NOT_FOUND.value), result.status)
 
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
     @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.get_authenticated_project")
+    @patch("dash.api.routes.zip_files")
+    @patch("dash.api.routes.stream_zip_files")
     @patch.object(ServiceFactory, "sample_data_service")
-    def test_get_metadata_route_return_csv(self, sample_data_service_mock, username_mock):
+    @patch("pathlib.Path.is_dir")
+    @patch("pathlib.Path.is_file")
+    @patch("dash.api.routes.read_text_file")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    def test_data_download_route_streams_small_download(
+        self,
+        request_args_mock,
+        request_headers_mock,
+        read_text_file_mock,
+        is_file_mock,
+        is_dir_mock,
+        sample_data_service_mock,
+        stream_zip_files_mock,
+        zip_files_mock,
+        project_mock,
+        username_mock,
+    ):
         # Given
-        batches = self.SERVICE_CALL_RETURN_DATA
-        sample_filters = {"batches": batches}
+        request_args_mock.return_value = {}
+        request_headers_mock.return_value = {}
         username_mock.return_value = self.TEST_USER
-        sample_data_service_mock.return_value.get_csv_download.return_value = self.SERVICE_CALL_RETURN_CSV_DATA
+        project_mock.return_value = self.MOCK_PROJECT_ID
+        is_dir_mock.return_value = True
+        is_file_mock.return_value = True
+        lane_files = {"pubname": ["/lane file"]}
+        files_to_zip = {"pubname": [Path(self.MOCK_ENVIRONMENT["JUNO_DATA_INSTITUTION_VIEW"], "lane file")]}
+        read_text_file_mock.side_effect = self.download_files_content(lane_files, 1024)
+        stream_zip_files_mock.return_value = iter([b"PK", b"data"])
+        mock_token = "123"
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = 1024
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
         # When
-        result = routes.get_metadata_route(
-            {"sample filters": sample_filters, "csv filename": self.SERVICE_CALL_RETURN_CSV_FILENAME}
-        )
+        result = routes.data_download_route(mock_token)
         # Then
-        sample_data_service_mock.assert_called_with(self.TEST_USER)
-        sample_data_service_mock.return_value.get_csv_download.assert_called_once_with(
-            self.SERVICE_CALL_RETURN_CSV_FILENAME, sample_filters
-        )
-        self.assertIsNotNone(result)
-        self.assertIsInstance(result, type(Response("any content will do")))
-        self.assertEqual(result.status_code, HTTPStatus.OK)
-        self.assertEqual(result.content_type, self.EXPECTED_CSV_CONTENT_TYPE)
-        self.assertEqual(result.headers["Content-Disposition"], self.EXPECTED_CONTENT_DISPOSITION)
+        # the recorded download size is used, so the data files aren't looked at
+        sample_data_service_mock.return_value.get_lane_files_size.assert_not_called()
+        stream_zip_files_mock.assert_called_once_with(files_to_zip, basename=mock_token, read_ahead_config=None)
+        zip_files_mock.assert_not_called()
+        sample_data_service_mock.return_value.make_download_symlink.assert_not_called()
+        self.assertIsInstance(result, Response)
+        self.assertIn(str(HTTPStatus.OK.value), result.status)
+        self.assertEqual("application/zip", result.content_type)
+        self.assertEqual('attachment; filename="123.zip"', result.headers["Content-Disposition"])
+        self.assertEqual("no", result.headers["X-Accel-Buffering"])
+        self.assertEqual(b"PKdata", result.get_data())
 
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
     @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.get_authenticated_project")
+    @patch("dash.api.routes.stream_zip_files")
     @patch.object(ServiceFactory, "sample_data_service")
-    def test_get_metadata_route_return_csv_404(self, sample_data_service_mock, username_mock):
+    @patch("pathlib.Path.is_dir")
+    @patch("pathlib.Path.is_file")
+    @patch("dash.api.routes.read_text_file")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    @patch("dash.api.routes.call_jsonify")
+    def test_data_download_route_small_download_no_redirect(
+        self,
+        resp_mock,
+        request_args_mock,
+        request_headers_mock,
+        read_text_file_mock,
+        is_file_mock,
+        is_dir_mock,
+        sample_data_service_mock,
+        stream_zip_files_mock,
+        project_mock,
+        username_mock,
+    ):
         # Given
-        batches = self.SERVICE_CALL_RETURN_DATA
-        sample_filters = {"batches": batches}
+        mock_host = "mock_host.sanger.ac.uk"
+        request_args_mock.return_value = {"redirect": "false"}
+        request_headers_mock.return_value = {"X-Forwarded-Host": mock_host, "X-Forwarded-Port": "443"}
         username_mock.return_value = self.TEST_USER
-        sample_data_service_mock.return_value.get_csv_download.return_value = self.SERVICE_CALL_RETURN_CSV_NOT_FOUND
+        project_mock.return_value = self.MOCK_PROJECT_ID
+        is_dir_mock.return_value = True
+        is_file_mock.return_value = True
+        read_text_file_mock.side_effect = self.download_files_content({"pubname": ["/lane file"]}, 1024)
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = 1024
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
         # When
-        result = routes.get_metadata_route(
-            {"sample filters": sample_filters, "csv filename": self.SERVICE_CALL_RETURN_CSV_FILENAME}
-        )
+        result = routes.data_download_route("123")
         # Then
-        sample_data_service_mock.assert_called_with(self.TEST_USER)
-        sample_data_service_mock.return_value.get_csv_download.assert_called_once_with(
-            self.SERVICE_CALL_RETURN_CSV_FILENAME, sample_filters
-        )
-        self.assertIsInstance(result, Response)
-        self.assertIn(str(HTTPStatus.NOT_FOUND.value), result.status)
+        stream_zip_files_mock.assert_not_called()
+        # the download params aren't needed
+        read_text_file_mock.assert_called_once_with("some/dir/123.size.json")
+        resp_mock.assert_called_once_with({"download location": "https://{}/data_download/123".format(mock_host)})
+        self.assertEqual(HTTPStatus.OK, result[1])
 
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
     @patch("dash.api.routes.get_authenticated_username")
-    @patch("dash.api.routes.get_host_name")
+    @patch("dash.api.routes.get_authenticated_project")
+    @patch("dash.api.routes.zip_files")
+    @patch("dash.api.routes.stream_zip_files")
     @patch.object(ServiceFactory, "sample_data_service")
-    def test_get_metadata_for_download_route(self, sample_data_service_mock, host_name_mock, username_mock):
+    @patch("pathlib.Path.is_dir")
+    @patch("pathlib.Path.is_file")
+    @patch("dash.api.routes.read_text_file")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    @patch("dash.api.routes.write_text_file")
+    def test_data_download_route_does_not_stream_large_download(
+        self,
+        write_text_file_mock,
+        request_args_mock,
+        request_headers_mock,
+        read_text_file_mock,
+        is_file_mock,
+        is_dir_mock,
+        sample_data_service_mock,
+        stream_zip_files_mock,
+        zip_files_mock,
+        project_mock,
+        username_mock,
+    ):
         # Given
-        sample_data_service_mock.return_value.get_metadata_for_download.return_value = self.SERVICE_CALL_RETURN_CSV_DATA
+        request_args_mock.return_value = {}
+        request_headers_mock.return_value = {}
         username_mock.return_value = self.TEST_USER
-        host_name_mock.return_value = self.TEST_HOST_NAME
+        project_mock.return_value = self.MOCK_PROJECT_ID
+        is_dir_mock.return_value = True
+        # => mocks non-existence of the download size file, existence of JSON file with params, followed by
+        # non-existence of the ZIP archive
+        is_file_mock.side_effect = [False, True, False]
+        lane_files = {"pubname": ["/lane file"]}
+        files_to_zip = {"pubname": [Path(self.MOCK_ENVIRONMENT["JUNO_DATA_INSTITUTION_VIEW"], "lane file")]}
+        read_text_file_mock.return_value = json.dumps(lane_files)
+        sample_data_service_mock.return_value.get_lane_files_size.return_value = 1025
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = 1024
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
+        sample_data_service_mock.return_value.make_download_symlink.return_value = "downloads/"
         # When
-        result = routes.get_metadata_for_download_route("fake institution key", "pipeline", "successful")
+        result = routes.data_download_route("123")
         # Then
-        sample_data_service_mock.assert_called_once_with(self.TEST_USER)
-        sample_data_service_mock.return_value.get_metadata_for_download.assert_called_once()
-        self.assertIsInstance(result, type(Response("any content will do")))
-        self.assertEqual(result.status_code, HTTPStatus.OK)
-        self.assertEqual(result.content_type, self.EXPECTED_CSV_CONTENT_TYPE)
-        self.assertEqual(result.headers["Content-Disposition"], self.EXPECTED_CONTENT_DISPOSITION)
-
-    def test_get_host_name(self):
-        request_mock = Mock()
-        request_mock.host = self.TEST_HOST_NAME
-        hostname = routes.get_host_name(request_mock)
-        self.assertEqual(hostname, self.TEST_HOST_NAME)
+        stream_zip_files_mock.assert_not_called()
+        # the download size is found, and recorded for later requests
+        sample_data_service_mock.return_value.get_lane_files_size.assert_called_once_with(files_to_zip)
+        write_text_file_mock.assert_called_once_with("some/dir/123.size.json", json.dumps({"total size": 1025}))
+        # the download params are only read once
+        read_text_file_mock.assert_called_once()
+        zip_files_mock.assert_called_once_with(
+            files_to_zip, basename="123", location="some/dir", progress_callback=None, read_ahead_config=None
+        )
+        self.assertIn(str(HTTPStatus.SEE_OTHER.value), result.status)
+        self.assertEqual("/downloads/123.zip", result.headers["Location"])
 
     @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
-    @patch("dash.api.routes.call_request_cookies")
-    def test_get_authenticated_username_nontest_mode(self, mock_cookies):
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.get_authenticated_project")
+    @patch("dash.api.routes.zip_files")
+    @patch("dash.api.routes.ZipArchiveCache")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("pathlib.Path.is_dir")
+    @patch("pathlib.Path.is_file")
+    @patch("dash.api.routes.read_text_file")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    def test_data_download_route_maps_token_onto_cached_zip_file(
+        self,
+        request_args_mock,
+        request_headers_mock,
+        read_text_file_mock,
+        is_file_mock,
+        is_dir_mock,
+        sample_data_service_mock,
+        zip_cache_mock,
+        zip_files_mock,
+        project_mock,
+        username_mock,
+    ):
         # Given
-        mock_cookies.return_value = {environ["AUTH_COOKIE_NAME"]: self.TEST_AUTH_TOKEN}
-        ServiceFactory.TEST_MODE = False
-
-        # When
-        username = routes.get_authenticated_username()
+        mock_host = "mock_host.sanger.ac.uk"
+        request_args_mock.return_value = {}
+        request_headers_mock.return_value = {"X-Forwarded-Host": mock_host, "X-Forwarded-Port": "443"}
+        username_mock.return_value = self.TEST_USER
+        project_mock.return_value = self.MOCK_PROJECT_ID
+        is_dir_mock.return_value = True
+        # => mocks existence of JSON file with params, followed by non-existence of the ZIP archive
+        is_file_mock.side_effect = [True, False]
+        lane_files = {"pubname": ["/lane file"]}
+        files_to_zip = {"pubname": [Path(self.MOCK_ENVIRONMENT["JUNO_DATA_INSTITUTION_VIEW"], "lane file")]}
+        read_text_file_mock.return_value = json.dumps(lane_files)
+        mock_token = "123"
+        mock_archive_key = "abc"
+        zip_file_location = self.temp_dir()
+        download_symlink = "downloads/"
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = zip_file_location
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = 1024
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
+        sample_data_service_mock.return_value.make_download_symlink.return_value = download_symlink
+        zip_cache_mock.return_value.archive_basename.return_value = None
+        zip_cache_mock.return_value.map_token.return_value = mock_archive_key
+        zip_files_mock.side_effect = self.write_zip_file
+        # When
+        result = routes.data_download_route(mock_token)
+        # Then
+        zip_cache_mock.assert_called_once_with(zip_file_location, 1024)
+        zip_cache_mock.return_value.map_token.assert_called_once_with(mock_token, files_to_zip)
+        zip_files_mock.assert_called_once_with(
+            files_to_zip,
+            basename=zip_files_mock.call_args[1]["basename"],
+            location=zip_file_location,
+            progress_callback=None,
+            read_ahead_config=None,
+        )
+        # the archive is built under a temporary name, then moved into place
+        self.assertNotEqual(mock_archive_key, zip_files_mock.call_args[1]["basename"])
+        self.assertEqual([mock_archive_key + ".zip"], os.listdir(zip_file_location))
+        zip_cache_mock.return_value.evict.assert_called_once_with(keep=[mock_archive_key])
+        zip_cache_mock.return_value.touch.assert_called_once_with(mock_archive_key)
+        self.assertIsInstance(result, Response)
+        self.assertIn(str(HTTPStatus.SEE_OTHER.value), result.status)
+        self.assertEqual(
+            "https://{}/{}{}.zip".format(mock_host, download_symlink, mock_archive_key), result.headers["Location"]
+        )
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.get_authenticated_project")
+    @patch("dash.api.routes.zip_files")
+    @patch("dash.api.routes.ZipArchiveCache")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("dash.api.routes.read_text_file")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    def test_data_download_route_replaces_partial_cached_zip_file(
+        self,
+        request_args_mock,
+        request_headers_mock,
+        read_text_file_mock,
+        sample_data_service_mock,
+        zip_cache_mock,
+        zip_files_mock,
+        project_mock,
+        username_mock,
+    ):
+        # Given
+        request_args_mock.return_value = {}
+        request_headers_mock.return_value = {}
+        project_mock.return_value = self.MOCK_PROJECT_ID
+        username_mock.return_value = self.TEST_USER
+        mock_archive_key = "abc"
+        zip_file_location = self.temp_dir()
+        # left behind by a build that died part-way
+        Path(zip_file_location, mock_archive_key + ".zip").write_bytes(b"PK partial")
+        Path(zip_file_location, "123.params.json").touch()
+        read_text_file_mock.return_value = json.dumps({"pubname": ["/lane file"]})
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = zip_file_location
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = 1024
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
+        sample_data_service_mock.return_value.make_download_symlink.return_value = "downloads/"
+        zip_cache_mock.return_value.archive_basename.return_value = mock_archive_key
+        zip_files_mock.side_effect = self.write_zip_file
+        # When
+        result = routes.data_download_route("123")
+        # Then
+        zip_files_mock.assert_called_once()
+        self.assertTrue(is_zipfile(Path(zip_file_location, mock_archive_key + ".zip")))
+        self.assertIn(str(HTTPStatus.SEE_OTHER.value), result.status)
+        self.assertEqual("/downloads/{}.zip".format(mock_archive_key), result.headers["Location"])
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.get_authenticated_project")
+    @patch("dash.api.routes.zip_files")
+    @patch("dash.api.routes.ZipArchiveCache")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("dash.api.routes.read_text_file")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    def test_data_download_route_failed_cached_zip_file_build_leaves_no_archive(
+        self,
+        request_args_mock,
+        request_headers_mock,
+        read_text_file_mock,
+        sample_data_service_mock,
+        zip_cache_mock,
+        zip_files_mock,
+        project_mock,
+        username_mock,
+    ):
+        # Given
+        request_args_mock.return_value = {}
+        request_headers_mock.return_value = {}
+        project_mock.return_value = self.MOCK_PROJECT_ID
+        username_mock.return_value = self.TEST_USER
+        zip_file_location = self.temp_dir()
+        Path(zip_file_location, "123.params.json").touch()
+        read_text_file_mock.return_value = json.dumps({"pubname": ["/lane file"]})
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = zip_file_location
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = 1024
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
+        zip_cache_mock.return_value.archive_basename.return_value = "abc"
+
+        def write_partial_zip_file(dir_name_to_files, *, basename, location, **kwargs):
+            Path(location, basename + ".zip").write_bytes(b"PK partial")
+            raise OSError("disk full")
+
+        zip_files_mock.side_effect = write_partial_zip_file
+        # When
+        with self.assertRaises(OSError):
+            routes.data_download_route("123")
+        # Then
+        self.assertEqual(["123.params.json"], os.listdir(zip_file_location))
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.zip_files")
+    @patch("dash.api.routes.ZipArchiveCache")
+    @patch("dash.api.routes.is_zipfile", return_value=True)
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("pathlib.Path.is_dir")
+    @patch("pathlib.Path.is_file")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    def test_data_download_route_reuse_cached_zip_file(
+        self,
+        request_args_mock,
+        request_headers_mock,
+        is_file_mock,
+        is_dir_mock,
+        sample_data_service_mock,
+        _is_zipfile_mock,
+        zip_cache_mock,
+        zip_files_mock,
+        username_mock,
+    ):
+        # Given
+        request_args_mock.return_value = {}
+        request_headers_mock.return_value = {}
+        username_mock.return_value = self.TEST_USER
+        is_dir_mock.return_value = True
+        is_file_mock.return_value = True
+        mock_archive_key = "abc"
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = 1024
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = None
+        sample_data_service_mock.return_value.make_download_symlink.return_value = "downloads/"
+        zip_cache_mock.return_value.archive_basename.return_value = mock_archive_key
+        # When
+        result = routes.data_download_route("123")
+        # Then
+        zip_cache_mock.return_value.map_token.assert_not_called()
+        zip_files_mock.assert_not_called()
+        zip_cache_mock.return_value.touch.assert_called_once_with(mock_archive_key)
+        self.assertIn(str(HTTPStatus.SEE_OTHER.value), result.status)
+        self.assertEqual("/downloads/{}.zip".format(mock_archive_key), result.headers["Location"])
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.get_authenticated_project")
+    @patch("dash.api.routes.zip_files")
+    @patch("dash.api.routes.shared_zip_job_queue")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("pathlib.Path.is_dir")
+    @patch("pathlib.Path.is_file")
+    @patch("dash.api.routes.read_text_file")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    @patch("dash.api.routes.call_jsonify")
+    def test_data_download_route_submits_zip_job(
+        self,
+        resp_mock,
+        request_args_mock,
+        request_headers_mock,
+        read_text_file_mock,
+        is_file_mock,
+        is_dir_mock,
+        sample_data_service_mock,
+        zip_job_queue_mock,
+        zip_files_mock,
+        project_mock,
+        username_mock,
+    ):
+        # Given
+        request_args_mock.return_value = {"redirect": "false"}
+        request_headers_mock.return_value = {}
+        username_mock.return_value = self.TEST_USER
+        project_mock.return_value = self.MOCK_PROJECT_ID
+        is_dir_mock.return_value = True
+        # mocks existence of JSON file with params
+        is_file_mock.return_value = True
+        lane_files = {"pubname": ["/lane file"]}
+        files_to_zip = {"pubname": [Path(self.MOCK_ENVIRONMENT["JUNO_DATA_INSTITUTION_VIEW"], "lane file")]}
+        read_text_file_mock.return_value = json.dumps(lane_files)
+        mock_token = "123"
+        zip_file_location = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = zip_file_location
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = {
+            "max_workers": 2,
+            "max_queued": 10,
+        }
+        mock_read_ahead_config = {"prefetch_depth": 4, "buffer_size": 1024}
+        sample_data_service_mock.return_value.get_bulk_download_read_ahead_config.return_value = mock_read_ahead_config
+        zip_job_queue_mock.return_value.status.return_value = None
+        zip_job_queue_mock.return_value.submit.return_value = {"status": "queued", "percent complete": 0}
+        # When
+        result = routes.data_download_route(mock_token)
+        # Then
+        zip_job_queue_mock.assert_called_once_with(max_workers=2, max_queued=10)
+        zip_job_queue_mock.return_value.submit.assert_called_once()
+        submit_args = zip_job_queue_mock.return_value.submit.call_args[0]
+        self.assertEqual((mock_token, zip_file_location), submit_args[:2])
+        zip_files_mock.assert_not_called()
+        # the job runs the function passed to build the ZIP archive
+        mock_progress_callback = Mock()
+        submit_args[2](mock_progress_callback)
+        zip_files_mock.assert_called_once_with(
+            files_to_zip,
+            basename=mock_token,
+            location=zip_file_location,
+            progress_callback=mock_progress_callback,
+            read_ahead_config=mock_read_ahead_config,
+        )
+        sample_data_service_mock.return_value.make_download_symlink.assert_not_called()
+        resp_mock.assert_called_once_with({"status": "queued", "percent complete": 0})
+        self.assertEqual(HTTPStatus.ACCEPTED, result[1])
+        self.assertEqual(str(routes.ZIP_JOB_POLL_INTERVAL_SECONDS), result[2]["Retry-After"])
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.shared_zip_job_queue")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("pathlib.Path.is_dir")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    def test_data_download_route_zip_job_running(
+        self,
+        request_args_mock,
+        request_headers_mock,
+        is_dir_mock,
+        sample_data_service_mock,
+        zip_job_queue_mock,
+        username_mock,
+    ):
+        # Given
+        request_args_mock.return_value = {}
+        request_headers_mock.return_value = {}
+        username_mock.return_value = self.TEST_USER
+        is_dir_mock.return_value = True
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = {
+            "max_workers": 2,
+            "max_queued": 10,
+        }
+        zip_job_queue_mock.return_value.status.return_value = {"status": "running", "percent complete": 42}
+        # When
+        result = routes.data_download_route("123")
+        # Then
+        zip_job_queue_mock.return_value.submit.assert_not_called()
+        self.assertIsInstance(result, Response)
+        self.assertIn(str(HTTPStatus.ACCEPTED.value), result.status)
+        self.assertIn("42% complete", result.get_data(as_text=True))
+        self.assertEqual(str(routes.ZIP_JOB_POLL_INTERVAL_SECONDS), result.headers["Refresh"])
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.shared_zip_job_queue")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("pathlib.Path.is_dir")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    def test_data_download_route_zip_job_ready(
+        self,
+        request_args_mock,
+        request_headers_mock,
+        is_dir_mock,
+        sample_data_service_mock,
+        zip_job_queue_mock,
+        username_mock,
+    ):
+        # Given
+        mock_host = "mock_host.sanger.ac.uk"
+        request_args_mock.return_value = {}
+        request_headers_mock.return_value = {"X-Forwarded-Host": mock_host, "X-Forwarded-Port": "443"}
+        username_mock.return_value = self.TEST_USER
+        is_dir_mock.return_value = True
+        mock_token = "123"
+        download_symlink = "downloads/"
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = {
+            "max_workers": 2,
+            "max_queued": 10,
+        }
+        sample_data_service_mock.return_value.make_download_symlink.return_value = download_symlink
+        zip_job_queue_mock.return_value.status.return_value = {"status": "ready", "percent complete": 100}
+        # When
+        result = routes.data_download_route(mock_token)
+        # Then
+        zip_job_queue_mock.return_value.submit.assert_not_called()
+        self.assertIsInstance(result, Response)
+        self.assertIn(str(HTTPStatus.SEE_OTHER.value), result.status)
+        self.assertEqual(
+            "https://{}/{}{}.zip".format(mock_host, download_symlink, mock_token), result.headers["Location"]
+        )
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.shared_zip_job_queue")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("pathlib.Path.is_dir")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    def test_data_download_route_zip_job_failed(
+        self,
+        request_args_mock,
+        request_headers_mock,
+        is_dir_mock,
+        sample_data_service_mock,
+        zip_job_queue_mock,
+        username_mock,
+    ):
+        # Given
+        request_args_mock.return_value = {}
+        request_headers_mock.return_value = {}
+        username_mock.return_value = self.TEST_USER
+        is_dir_mock.return_value = True
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = {
+            "max_workers": 2,
+            "max_queued": 10,
+        }
+        zip_job_queue_mock.return_value.status.return_value = {
+            "status": "failed",
+            "percent complete": 10,
+            "error": "disk full",
+            "failures": 1,
+            "failed at": time(),
+        }
+        # When
+        result = routes.data_download_route("123")
+        # Then
+        zip_job_queue_mock.return_value.submit.assert_not_called()
+        self.assertIsInstance(result, Response)
+        self.assertIn(str(HTTPStatus.SERVICE_UNAVAILABLE.value), result.status)
+        self.assertLessEqual(int(result.headers["Retry-After"]), ZIP_JOB_RETRY_BASE_SECONDS)
+        self.assertGreater(int(result.headers["Retry-After"]), ZIP_JOB_RETRY_BASE_SECONDS - 5)
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.get_authenticated_project")
+    @patch("dash.api.routes.shared_zip_job_queue")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("pathlib.Path.is_dir")
+    @patch("pathlib.Path.is_file")
+    @patch("dash.api.routes.read_text_file")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_request_args")
+    def test_data_download_route_zip_job_queue_full(
+        self,
+        request_args_mock,
+        request_headers_mock,
+        read_text_file_mock,
+        is_file_mock,
+        is_dir_mock,
+        sample_data_service_mock,
+        zip_job_queue_mock,
+        project_mock,
+        username_mock,
+    ):
+        # Given
+        request_args_mock.return_value = {}
+        request_headers_mock.return_value = {}
+        username_mock.return_value = self.TEST_USER
+        project_mock.return_value = self.MOCK_PROJECT_ID
+        is_dir_mock.return_value = True
+        is_file_mock.return_value = True
+        read_text_file_mock.return_value = json.dumps({"pubname": ["/lane file"]})
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_zip_job_config.return_value = {
+            "max_workers": 2,
+            "max_queued": 10,
+        }
+        zip_job_queue_mock.return_value.status.return_value = None
+        zip_job_queue_mock.return_value.submit.side_effect = ZipJobQueueFullError("queue full")
+        # When
+        result = routes.data_download_route("123")
+        # Then
+        self.assertIsInstance(result, Response)
+        self.assertIn(str(HTTPStatus.SERVICE_UNAVAILABLE.value), result.status)
+        self.assertEqual(str(routes.ZIP_JOB_QUEUE_FULL_RETRY_SECONDS), result.headers["Retry-After"])
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.read_zip_job_status")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_jsonify")
+    def test_data_download_status_route(
+        self, resp_mock, request_headers_mock, sample_data_service_mock, read_zip_job_status_mock, username_mock
+    ):
+        # Given
+        request_headers_mock.return_value = {}
+        username_mock.return_value = self.TEST_USER
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        read_zip_job_status_mock.return_value = {"status": "running", "percent complete": 42, "pid": 1}
+        # When
+        result = routes.data_download_status_route("123")
+        # Then
+        read_zip_job_status_mock.assert_called_once_with("123", "some/dir")
+        resp_mock.assert_called_once_with({"status": "running", "percent complete": 42})
+        self.assertEqual(HTTPStatus.OK, result[1])
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.read_zip_job_status")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_jsonify")
+    def test_data_download_status_route_ready(
+        self, resp_mock, request_headers_mock, sample_data_service_mock, read_zip_job_status_mock, username_mock
+    ):
+        # Given
+        request_headers_mock.return_value = {}
+        username_mock.return_value = self.TEST_USER
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.make_download_symlink.return_value = "downloads/"
+        read_zip_job_status_mock.return_value = {"status": "ready", "percent complete": 100, "pid": 1}
+        # When
+        result = routes.data_download_status_route("123")
+        # Then
+        resp_mock.assert_called_once_with(
+            {"status": "ready", "percent complete": 100, "download location": "/downloads/123.zip"}
+        )
+        self.assertEqual(HTTPStatus.OK, result[1])
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.read_zip_job_status")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("pathlib.Path.is_file")
+    def test_data_download_status_route_return_404(
+        self, is_file_mock, sample_data_service_mock, read_zip_job_status_mock, username_mock
+    ):
+        # Given
+        username_mock.return_value = self.TEST_USER
+        is_file_mock.return_value = False
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = None
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        read_zip_job_status_mock.return_value = None
+        # When
+        result = routes.data_download_status_route("123")
+        # Then
+        self.assertIsInstance(result, Response)
+        self.assertIn(str(HTTPStatus.NOT_FOUND.value), result.status)
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.read_zip_job_status")
+    @patch("dash.api.routes.ZipArchiveCache")
+    @patch.object(ServiceFactory, "sample_data_service")
+    @patch("dash.api.routes.call_request_headers")
+    @patch("dash.api.routes.call_jsonify")
+    def test_data_download_status_route_cached_zip_file(
+        self,
+        resp_mock,
+        request_headers_mock,
+        sample_data_service_mock,
+        zip_cache_mock,
+        read_zip_job_status_mock,
+        username_mock,
+    ):
+        # Given
+        request_headers_mock.return_value = {}
+        username_mock.return_value = self.TEST_USER
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = 1024
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        sample_data_service_mock.return_value.make_download_symlink.return_value = "downloads/"
+        zip_cache_mock.return_value.archive_basename.return_value = "abc"
+        read_zip_job_status_mock.return_value = {"status": "ready", "percent complete": 100, "pid": 1}
+        # When
+        result = routes.data_download_status_route("123")
+        # Then
+        read_zip_job_status_mock.assert_called_once_with("abc", "some/dir")
+        resp_mock.assert_called_once_with(
+            {"status": "ready", "percent complete": 100, "download location": "/downloads/abc.zip"}
+        )
+        self.assertEqual(HTTPStatus.OK, result[1])
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.read_zip_job_status")
+    @patch("dash.api.routes.ZipArchiveCache")
+    @patch.object(ServiceFactory, "sample_data_service")
+    def test_data_download_status_route_return_404_if_token_not_mapped(
+        self, sample_data_service_mock, zip_cache_mock, read_zip_job_status_mock, username_mock
+    ):
+        # Given
+        username_mock.return_value = self.TEST_USER
+        sample_data_service_mock.return_value.get_bulk_download_location.return_value = "some/dir"
+        sample_data_service_mock.return_value.get_bulk_download_zip_cache_quota.return_value = 1024
+        sample_data_service_mock.return_value.get_bulk_download_stream_max_size.return_value = None
+        zip_cache_mock.return_value.archive_basename.return_value = None
+        # When
+        result = routes.data_download_status_route("123")
+        # Then
+        read_zip_job_status_mock.assert_not_called()
+        self.assertIsInstance(result, Response)
+        self.assertIn(str(HTTPStatus.NOT_FOUND.value), result.status)
+
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch.object(ServiceFactory, "sample_data_service")
+    def test_get_metadata_route_return_csv(self, sample_data_service_mock, username_mock):
+        # Given
+        batches = self.SERVICE_CALL_RETURN_DATA
+        sample_filters = {"batches": batches}
+        username_mock.return_value = self.TEST_USER
+        sample_data_service_mock.return_value.get_csv_download.return_value = self.SERVICE_CALL_RETURN_CSV_DATA
+        # When
+        result = routes.get_metadata_route(
+            {"sample filters": sample_filters, "csv filename": self.SERVICE_CALL_RETURN_CSV_FILENAME}
+        )
+        # Then
+        sample_data_service_mock.assert_called_with(self.TEST_USER)
+        sample_data_service_mock.return_value.get_csv_download.assert_called_once_with(
+            self.SERVICE_CALL_RETURN_CSV_FILENAME, sample_filters
+        )
+        self.assertIsNotNone(result)
+        self.assertIsInstance(result, type(Response("any content will do")))
+        self.assertEqual(result.status_code, HTTPStatus.OK)
+        self.assertEqual(result.content_type, self.EXPECTED_CSV_CONTENT_TYPE)
+        self.assertEqual(result.headers["Content-Disposition"], self.EXPECTED_CONTENT_DISPOSITION)
+
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch.object(ServiceFactory, "sample_data_service")
+    def test_get_metadata_route_return_streamed_csv(self, sample_data_service_mock, username_mock):
+        # Given
+        sample_filters = {"batches": self.SERVICE_CALL_RETURN_DATA}
+        username_mock.return_value = self.TEST_USER
+        sample_data_service_mock.return_value.get_csv_download.return_value = {
+            **self.SERVICE_CALL_RETURN_CSV_DATA,
+            "content": iter(["a,csv,header\n", "a,csv,row\n", "another,csv,row\n"]),
+        }
+        # When
+        result = routes.get_metadata_route(
+            {"sample filters": sample_filters, "csv filename": self.SERVICE_CALL_RETURN_CSV_FILENAME}
+        )
+        # Then
+        self.assertEqual(result.status_code, HTTPStatus.OK)
+        self.assertTrue(result.is_streamed)
+        self.assertEqual(result.content_type, self.EXPECTED_CSV_CONTENT_TYPE)
+        self.assertEqual(result.headers["Content-Disposition"], self.EXPECTED_CONTENT_DISPOSITION)
+        self.assertEqual("a,csv,header\na,csv,row\nanother,csv,row\n", result.get_data(as_text=True))
+
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch.object(ServiceFactory, "sample_data_service")
+    def test_get_metadata_route_return_csv_404(self, sample_data_service_mock, username_mock):
+        # Given
+        batches = self.SERVICE_CALL_RETURN_DATA
+        sample_filters = {"batches": batches}
+        username_mock.return_value = self.TEST_USER
+        sample_data_service_mock.return_value.get_csv_download.return_value = self.SERVICE_CALL_RETURN_CSV_NOT_FOUND
+        # When
+        result = routes.get_metadata_route(
+            {"sample filters": sample_filters, "csv filename": self.SERVICE_CALL_RETURN_CSV_FILENAME}
+        )
+        # Then
+        sample_data_service_mock.assert_called_with(self.TEST_USER)
+        sample_data_service_mock.return_value.get_csv_download.assert_called_once_with(
+            self.SERVICE_CALL_RETURN_CSV_FILENAME, sample_filters
+        )
+        self.assertIsInstance(result, Response)
+        self.assertIn(str(HTTPStatus.NOT_FOUND.value), result.status)
+
+    @patch("dash.api.routes.get_authenticated_username")
+    @patch("dash.api.routes.get_host_name")
+    @patch.object(ServiceFactory, "sample_data_service")
+    def test_get_metadata_for_download_route(self, sample_data_service_mock, host_name_mock, username_mock):
+        # Given
+        sample_data_service_mock.return_value.get_metadata_for_download.return_value = self.SERVICE_CALL_RETURN_CSV_DATA
+        username_mock.return_value = self.TEST_USER
+        host_name_mock.return_value = self.TEST_HOST_NAME
+        # When
+        result = routes.get_metadata_for_download_route("fake institution key", "pipeline", "successful")
+        # Then
+        sample_data_service_mock.assert_called_once_with(self.TEST_USER)
+        sample_data_service_mock.return_value.get_metadata_for_download.assert_called_once()
+        self.assertIsInstance(result, type(Response("any content will do")))
+        self.assertEqual(result.status_code, HTTPStatus.OK)
+        self.assertEqual(result.content_type, self.EXPECTED_CSV_CONTENT_TYPE)
+        self.assertEqual(result.headers["Content-Disposition"], self.EXPECTED_CONTENT_DISPOSITION)
+
+    def test_get_host_name(self):
+        request_mock = Mock()
+        request_mock.host = self.TEST_HOST_NAME
+        hostname = routes.get_host_name(request_mock)
+        self.assertEqual(hostname, self.TEST_HOST_NAME)
+
+    @patch.dict(environ, MOCK_ENVIRONMENT, clear=True)
+    @patch("dash.api.routes.call_request_cookies")
+    def test_get_authenticated_username_nontest_mode(self, mock_cookies):
+        # Given
+        mock_cookies.return_value = {environ["AUTH_COOKIE_NAME"]: self.TEST_AUTH_TOKEN}
+        ServiceFactory.TEST_MODE = False
+
+        # When
+        username = routes.get_authenticated_username()
         # Then
         self.assertEqual(username, self.TEST_USER)
 
+    @patch.dict(environ, {**MOCK_ENVIRONMENT, "SESSION_TOKEN_SECRET_KEY": "mock_secret_key"}, clear=True)
+    @patch("dash.api.routes.call_request_cookies")
+    def test_get_authenticated_username_with_session_token(self, mock_cookies):
+        user_record = {"username": self.TEST_USER, "memberOf": [], "projects": [self.MOCK_PROJECT_ID]}
+        session_token = SessionTokens("mock_secret_key").issue(user_record)
+        mock_cookies.return_value = {environ["AUTH_COOKIE_NAME"]: session_token}
+        ServiceFactory.TEST_MODE = False
+
+        with Flask(__name__).test_request_context():
+            username = routes.get_authenticated_username()
+
+            self.assertEqual(self.TEST_USER, username)
+            # the user record from the token is used for the rest of the request
+            self.assertEqual({self.TEST_USER: user_record}, g.user_records)
+
+    @patch.dict(environ, {**MOCK_ENVIRONMENT, "SESSION_TOKEN_SECRET_KEY": "mock_secret_key"}, clear=True)
+    @patch("dash.api.routes.call_request_cookies")
+    def test_get_authenticated_username_with_invalid_session_token(self, mock_cookies):
+        forged_token = SessionTokens("another_secret_key").issue({"username": self.TEST_USER})
+        ServiceFactory.TEST_MODE = False
+
+        for auth_token in (forged_token, self.TEST_AUTH_TOKEN):
+            mock_cookies.return_value = {environ["AUTH_COOKIE_NAME"]: auth_token}
+            with Flask(__name__).test_request_context():
+                with self.assertRaises(exceptions.NotAuthorisedException):
+                    routes.get_authenticated_username()
+
     @patch("dash.api.routes.call_request_cookies")
     def test_get_authenticated_username_nontest_mode_with_no_cookie(self, mock_cookies):
         # Given
@@ -968,3 +1967,13 @@ class TestRoutes(unittest.TestCase):
         username = routes.get_authenticated_username()
         # Then
         self.assertIsNone(username)
+
+    @staticmethod
+    def download_files_content(lane_files, download_size):
+        # mocks read_text_file() for the download params file and the download size file of a token
+        def read_text_file(filename):
+            if filename.endswith(".size.json"):
+                return json.dumps({"total size": download_size})
+            return json.dumps(lane_files)
+
+        return read_text_file
@@ -0,0 +1,114 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from os import environ
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import DataSources.dashboard_snapshot
+from DataSources.dashboard_snapshot import SNAPSHOT_FORMAT_VERSION, DashboardSnapshot
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+
+class DashboardSnapshotTest(TestCase):
+
+    test_config = "dash/tests/mock_data/data_sources.yml"
+    mock_project = "juno"
+    mock_snapshot_data = {
+        "batches": {"FakOne": {"_ERROR": None, "expected": 2, "received": 2, "deliveries": []}},
+        "progress": {"date": ["Sep 2019"], "samples received": [0], "samples sequenced": [0]},
+        "sequencing_status": {"FakOne": {"_ERROR": None}},
+        "pipeline_status": {"FakOne": {"_ERROR": None}},
+    }
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.snapshot_store = DashboardSnapshot(set_up=False)
+        self.snapshot_store.snapshot_dir = Path(self.temp_dir.name)
+        patcher = patch.object(DataSources.dashboard_snapshot, "_loaded_snapshots", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_disabled_without_config(self):
+        snapshot_store = DashboardSnapshot(set_up=False)
+        snapshot_store.set_up(self.test_config)
+
+        self.assertFalse(snapshot_store.enabled)
+        self.assertIsNone(snapshot_store.latest(self.mock_project))
+        with self.assertRaises(RuntimeError):
+            snapshot_store.save(self.mock_project, self.mock_snapshot_data)
+
+    @patch.dict(environ, {"MOCK_SNAPSHOT_DIR": "/path/to/snapshots"}, clear=True)
+    @patch("DataSources.dashboard_snapshot.yaml.load")
+    def test_set_up(self, mock_yaml_load):
+        mock_yaml_load.return_value = {
+            "dashboard_snapshot": {"snapshot_dir_environ": "MOCK_SNAPSHOT_DIR", "max_age_seconds": 60}
+        }
+        snapshot_store = DashboardSnapshot(set_up=False)
+        snapshot_store.set_up(self.test_config)
+
+        self.assertTrue(snapshot_store.enabled)
+        self.assertEqual(Path("/path/to/snapshots"), snapshot_store.snapshot_dir)
+        self.assertEqual(60, snapshot_store.max_age_seconds)
+
+    def test_save_and_load_latest(self):
+        snapshot_file = self.snapshot_store.save(self.mock_project, self.mock_snapshot_data)
+
+        self.assertEqual(Path(self.temp_dir.name, self.mock_project), snapshot_file.parent)
+        snapshot = self.snapshot_store.latest(self.mock_project)
+        self.assertEqual(SNAPSHOT_FORMAT_VERSION, snapshot["format_version"])
+        self.assertEqual(self.mock_project, snapshot["project"])
+        for this_section in self.mock_snapshot_data:
+            self.assertEqual(self.mock_snapshot_data[this_section], snapshot[this_section])
+        self.assertLess(DashboardSnapshot.age_seconds(snapshot), 10)
+
+    def test_latest_is_most_recent_snapshot(self):
+        self.snapshot_store.save(self.mock_project, {"batches": "first"})
+        self.snapshot_store.save(self.mock_project, {"batches": "second"})
+
+        self.assertEqual("second", self.snapshot_store.latest(self.mock_project)["batches"])
+
+    def test_latest_is_none_if_no_snapshot(self):
+        self.assertIsNone(self.snapshot_store.latest(self.mock_project))
+
+    def test_latest_is_none_if_snapshot_too_old(self):
+        snapshot_file = self.snapshot_store.save(self.mock_project, self.mock_snapshot_data)
+        self.write_snapshot_file(snapshot_file, created=datetime.now() - timedelta(hours=2))
+        self.snapshot_store.max_age_seconds = 3600
+
+        self.assertIsNone(self.snapshot_store.latest(self.mock_project))
+
+    def test_latest_is_none_if_wrong_format_version(self):
+        snapshot_file = self.snapshot_store.save(self.mock_project, self.mock_snapshot_data)
+        self.write_snapshot_file(snapshot_file, format_version=SNAPSHOT_FORMAT_VERSION + 1)
+
+        self.assertIsNone(self.snapshot_store.latest(self.mock_project))
+
+    def test_snapshot_file_is_loaded_once(self):
+        self.snapshot_store.save(self.mock_project, self.mock_snapshot_data)
+
+        first_snapshot = self.snapshot_store.latest(self.mock_project)
+        second_snapshot = self.snapshot_store.latest(self.mock_project)
+
+        self.assertIs(first_snapshot, second_snapshot)
+
+    def test_old_snapshots_are_deleted(self):
+        self.snapshot_store.versions_to_keep = 2
+        snapshot_files = [self.snapshot_store.save(self.mock_project, {"batches": i}) for i in range(4)]
+
+        remaining_files = sorted(Path(self.temp_dir.name, self.mock_project).iterdir())
+
+        self.assertEqual(snapshot_files[-2:], remaining_files)
+
+    def write_snapshot_file(self, snapshot_file, created=None, format_version=SNAPSHOT_FORMAT_VERSION):
+        with open(snapshot_file, "r") as file:
+            snapshot = json.load(file)
+        snapshot["format_version"] = format_version
+        if created is not None:
+            snapshot["created"] = created.isoformat()
+        with open(snapshot_file, "w") as file:
+            json.dump(snapshot, file)
@@ -1,14 +1,19 @@
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
-from DataSources.institution_data import InstitutionData
+from DataSources.institution_data import InstitutionData, InstitutionDirectory
 from DataSources.ldap_data import LdapDataError
 
 LDAP_INSTITUTIONS_SEARCH_RESULT = [
     ("dn1", {"cn": [b"CenQuaRes"], "description": [b"Center for Qualia Research"], "memberUid": [b"US", b"AU"]}),
     ("dn2", {"cn": [b"WelSanIns"], "description": [b"Wellcome Sanger Institute"], "memberUid": [b"UK"]}),
 ]
+LDAP_INSTITUTIONS_VERSION_SEARCH_RESULT = [
+    ("dn1", {"modifyTimestamp": [b"20220301120000Z"]}),
+    ("dn2", {"modifyTimestamp": [b"20220302120000Z"]}),
+]
 TEST_CONFIG = "dash/tests/mock_data/data_sources.yml"
+TTL_SECONDS = 60
 
 
 class InstitutionDataTest(TestCase):
@@ -136,3 +141,93 @@ class InstitutionDataTest(TestCase):
             ],
             actual_institution_names,
         )
+
+    @patch.object(InstitutionData, "ldap_search")
+    def test_get_institution_names_by_key(self, mock_ldap_search):
+        mock_ldap_search.return_value = LDAP_INSTITUTIONS_SEARCH_RESULT
+
+        self.assertEqual(
+            {"CenQuaRes": "Center for Qualia Research", "WelSanIns": "Wellcome Sanger Institute"},
+            self.institution_data.get_institution_names_by_key_regardless_of_user_membership(),
+        )
+
+    @patch.object(InstitutionData, "ldap_search")
+    def test_get_institutions_version(self, mock_ldap_search):
+        mock_ldap_search.return_value = LDAP_INSTITUTIONS_VERSION_SEARCH_RESULT
+
+        self.assertEqual((2, b"20220302120000Z"), self.institution_data._get_institutions_version())
+        mock_ldap_search.assert_called_once_with(
+            self.institution_data._get_institutions_ldap_filter(), ["modifyTimestamp"]
+        )
+
+    @patch.object(InstitutionData, "ldap_search")
+    def test_get_institutions_version_without_timestamps(self, mock_ldap_search):
+        mock_ldap_search.return_value = [("dn1", {})]
+
+        self.assertIsNone(self.institution_data._get_institutions_version())
+
+
+class InstitutionDirectoryTest(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.directory = InstitutionDirectory(TTL_SECONDS, clock=lambda: self.now)
+        self.institution_data = Mock()
+        self.institution_data._get_institutions_version.return_value = (2, b"20220302120000Z")
+        self.institution_data._get_all_institutions_from_ldap.return_value = [{"key": "FakIns", "name": "Fake"}]
+
+    def test_institutions_are_read_once_within_ttl(self):
+        for _ in range(3):
+            institutions = self.directory.institutions(self.institution_data)
+
+        self.assertEqual([{"key": "FakIns", "name": "Fake"}], institutions)
+        self.institution_data._get_all_institutions_from_ldap.assert_called_once()
+        self.institution_data._get_institutions_version.assert_called_once()
+
+    def test_returns_a_copy(self):
+        self.directory.institutions(self.institution_data)[0]["name"] = "changed"
+
+        self.assertEqual("Fake", self.directory.institutions(self.institution_data)[0]["name"])
+
+    def test_institutions_are_not_read_again_after_ttl_if_unchanged(self):
+        self.directory.institutions(self.institution_data)
+        self.now += TTL_SECONDS
+
+        self.directory.institutions(self.institution_data)
+
+        self.institution_data._get_all_institutions_from_ldap.assert_called_once()
+        self.assertEqual(2, self.institution_data._get_institutions_version.call_count)
+
+    def test_institutions_are_read_again_after_ttl_if_changed(self):
+        self.directory.institutions(self.institution_data)
+        self.now += TTL_SECONDS
+        self.institution_data._get_institutions_version.return_value = (3, b"20220303120000Z")
+        self.institution_data._get_all_institutions_from_ldap.return_value = []
+
+        self.assertEqual([], self.directory.institutions(self.institution_data))
+        self.assertEqual(2, self.institution_data._get_all_institutions_from_ldap.call_count)
+
+    def test_institutions_are_read_again_after_ttl_if_version_unknown(self):
+        self.institution_data._get_institutions_version.return_value = None
+        self.directory.institutions(self.institution_data)
+        self.now += TTL_SECONDS
+
+        self.directory.institutions(self.institution_data)
+
+        self.assertEqual(2, self.institution_data._get_all_institutions_from_ldap.call_count)
+
+    def test_invalidate(self):
+        self.directory.institutions(self.institution_data)
+
+        self.directory.invalidate()
+        self.directory.institutions(self.institution_data)
+
+        self.assertEqual(2, self.institution_data._get_all_institutions_from_ldap.call_count)
+
+    def test_disabled_directory_always_reads_from_ldap(self):
+        directory = InstitutionDirectory(0)
+
+        directory.institutions(self.institution_data)
+        directory.institutions(self.institution_data)
+
+        self.assertEqual(2, self.institution_data._get_all_institutions_from_ldap.call_count)
+        self.institution_data._get_institutions_version.assert_not_called()
@@ -0,0 +1,111 @@
+import logging
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import ldap
+from dash.api.exceptions import LdapDataError
+from DataSources.ldap_connection_pool import LdapConnectionPool
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+LDAP_URL = "ldap://fake-container:389"
+BIND_DN = "cn=admin,dc=monocle"
+BIND_PASSWORD = "secret"
+
+
+class LdapConnectionPoolTest(TestCase):
+    def setUp(self):
+        initialize_patch = patch("DataSources.ldap_connection_pool.ldap.initialize")
+        self.mock_initialize = initialize_patch.start()
+        self.addCleanup(initialize_patch.stop)
+        self.mock_initialize.side_effect = lambda url: Mock(spec=ldap.ldapobject.SimpleLDAPObject)
+
+    def pool(self, **kwargs):
+        return LdapConnectionPool(LDAP_URL, BIND_DN, BIND_PASSWORD, **kwargs)
+
+    def test_connection_is_bound_once_and_reused(self):
+        pool = self.pool(size=2)
+
+        for _ in range(3):
+            pool.call(lambda conn: conn.search_s("base", ldap.SCOPE_SUBTREE, "(filter)"))
+
+        self.mock_initialize.assert_called_once_with(LDAP_URL)
+        with pool.connection() as conn:
+            pass
+        conn.simple_bind_s.assert_called_once_with(BIND_DN, BIND_PASSWORD)
+        self.assertEqual(3, conn.search_s.call_count)
+
+    def test_returns_result_of_operation(self):
+        self.assertEqual(42, self.pool().call(lambda conn: 42))
+
+    def test_connections_are_not_shared_by_concurrent_users(self):
+        pool = self.pool(size=2)
+
+        with pool.connection() as conn_1:
+            with pool.connection() as conn_2:
+                self.assertIsNot(conn_1, conn_2)
+        self.assertEqual(2, self.mock_initialize.call_count)
+
+    def test_times_out_when_all_connections_are_in_use(self):
+        pool = self.pool(size=1, acquire_timeout_seconds=0.01)
+
+        with pool.connection():
+            with self.assertRaises(LdapDataError):
+                with pool.connection():
+                    pass
+
+    def test_waits_for_a_connection_to_be_released(self):
+        pool = self.pool(size=1, acquire_timeout_seconds=5)
+        used = []
+
+        with pool.connection() as conn:
+            thread = Thread(target=lambda: used.append(pool.call(lambda conn: conn)))
+            thread.start()
+        thread.join()
+
+        self.assertEqual([conn], used)
+        self.assertEqual(1, self.mock_initialize.call_count)
+
+    def test_reconnects_when_server_is_down(self):
+        pool = self.pool(size=2)
+        with pool.connection() as conn_1, pool.connection() as conn_2:
+            conn_1.search_s.side_effect = ldap.SERVER_DOWN()
+
+        self.assertEqual("result", pool.call(lambda conn: conn.search_s() and "result"))
+
+        self.assertEqual(3, self.mock_initialize.call_count)
+        conn_1.unbind_s.assert_called_once()
+        conn_2.unbind_s.assert_called_once()
+        self.assertEqual(1, pool._num_connections)
+
+    def test_raises_if_server_is_still_down(self):
+        self.mock_initialize.side_effect = ldap.SERVER_DOWN()
+        pool = self.pool()
+
+        with self.assertRaises(ldap.SERVER_DOWN):
+            pool.call(lambda conn: conn)
+        self.assertEqual(0, pool._num_connections)
+
+    def test_replaces_dead_idle_connection(self):
+        pool = self.pool(check_interval_seconds=0)
+        with pool.connection() as dead_conn:
+            dead_conn.whoami_s.side_effect = ldap.SERVER_DOWN()
+
+        with pool.connection() as conn:
+            self.assertIsNot(dead_conn, conn)
+        dead_conn.unbind_s.assert_called_once()
+        self.assertEqual(1, pool._num_connections)
+
+    def test_does_not_check_recently_used_connection(self):
+        pool = self.pool(check_interval_seconds=60)
+        with pool.connection() as first_conn:
+            pass
+
+        with pool.connection() as conn:
+            self.assertIs(first_conn, conn)
+        conn.whoami_s.assert_not_called()
+
+    def test_rejects_bad_size(self):
+        with self.assertRaises(ValueError):
+            self.pool(size=0)
@@ -1,6 +1,7 @@
 from unittest import TestCase
 from unittest.mock import Mock, patch
 
+import ldap
 from dash.api.exceptions import LdapDataError
 from DataSources.ldap_data import LdapData
 from ldap import SCOPE_SUBTREE
@@ -38,7 +39,18 @@ MOCK_LDAP_RESULT_GROUP = (
         "memberUid": [b"UK"],
     },
 )
+MOCK_LDAP_RESULT_GROUP_502 = (
+    "cn=FakOne,ou=groups,dc=monocle,dc=dev,dc=pam,dc=sanger,dc=ac,dc=uk",
+    {
+        "cn": [b"FakOne"],
+        "description": [b"Fake institution one"],
+        "gidNumber": [b"502"],
+        "objectClass": [b"posixGroup", b"top"],
+        "memberUid": [],
+    },
+)
 MOCK_LDAP_SEARCH_FILTER = "(some string)"
+MOCK_USER_DN = "cn=mock_user_sanger_ac_uk,ou=users,dc=monocle,dc=pam,dc=sanger,dc=ac,dc=uk"
 MOCK_REQUIRED_ATTRIBUTES_FOR_GROUP_SEARCH = ["cn"]
 
 
@@ -124,6 +136,57 @@ class LdapDataTest(TestCase):
 
         self.assertIsInstance(user_ldap_result, tuple)
 
+    @patch.object(LdapData, "ldap_search")
+    def test_groups_search_makes_one_search(self, mock_ldap_search):
+        mock_ldap_search.return_value = [MOCK_LDAP_RESULT_GROUP, MOCK_LDAP_RESULT_GROUP_502]
+
+        results = self.ldap_data.ldap_search_groups_by_gids(
+            ["501", "502", "503", "501"], GROUP_OBJ_CONFIG_KEY, MOCK_REQUIRED_ATTRIBUTES_FOR_GROUP_SEARCH
+        )
+
+        mock_ldap_search.assert_called_once_with(
+            "(&(objectClass=posixGroup)(|(gidNumber=501)(gidNumber=502)(gidNumber=503)))"
+        )
+        self.assertEqual({"501": MOCK_LDAP_RESULT_GROUP, "502": MOCK_LDAP_RESULT_GROUP_502}, results)
+
+    @patch.object(LdapData, "ldap_search")
+    def test_groups_search_with_no_gids(self, mock_ldap_search):
+        self.assertEqual(
+            {},
+            self.ldap_data.ldap_search_groups_by_gids(
+                [], GROUP_OBJ_CONFIG_KEY, MOCK_REQUIRED_ATTRIBUTES_FOR_GROUP_SEARCH
+            ),
+        )
+        mock_ldap_search.assert_not_called()
+
+    @patch.object(LdapData, "ldap_search")
+    def test_groups_search_rejects_empty_required_attributes(self, mock_ldap_search):
+        with self.assertRaises(ValueError):
+            self.ldap_data.ldap_search_groups_by_gids(["501"], GROUP_OBJ_CONFIG_KEY, [])
+
+    @patch.object(LdapData, "ldap_search")
+    def test_groups_search_rejects_empty_gid(self, mock_ldap_search):
+        with self.assertRaises(LdapDataError):
+            self.ldap_data.ldap_search_groups_by_gids(
+                ["501", ""], GROUP_OBJ_CONFIG_KEY, MOCK_REQUIRED_ATTRIBUTES_FOR_GROUP_SEARCH
+            )
+
+    @patch.object(LdapData, "ldap_search")
+    def test_groups_search_rejects_multiple_search_results_for_a_gid(self, mock_ldap_search):
+        mock_ldap_search.return_value = [MOCK_LDAP_RESULT_GROUP, MOCK_LDAP_RESULT_GROUP]
+
+        with self.assertRaises(LdapDataError):
+            self.ldap_data.ldap_search_groups_by_gids(
+                ["501"], GROUP_OBJ_CONFIG_KEY, MOCK_REQUIRED_ATTRIBUTES_FOR_GROUP_SEARCH
+            )
+
+    @patch.object(LdapData, "ldap_search")
+    def test_groups_search_rejects_group_record_without_required_attribute(self, mock_ldap_search):
+        mock_ldap_search.return_value = [MOCK_LDAP_RESULT_GROUP, MOCK_LDAP_RESULT_GROUP_502]
+
+        with self.assertRaises(LdapDataError):
+            self.ldap_data.ldap_search_groups_by_gids(["501", "502"], GROUP_OBJ_CONFIG_KEY, ["memberUid"])
+
     def test_ldap_search_by_attribute_value_rejects_on_empty_value(self):
         with self.assertRaises(LdapDataError):
             self.ldap_data.ldap_search_by_attribute_value(MOCK_LDAP_OBJECT_CLASS, MOCK_LDAP_OBJECT_ATTRIBUTE, None)
@@ -149,26 +212,26 @@ class LdapDataTest(TestCase):
 
         self.assertEqual(expected_result, actual_result)
 
-    @patch.object(LdapData, "connection")
-    def test_ldap_search_raises_on_connection_exception(self, mock_connection):
-        mock_connection.side_effect = ConnectionError()
+    @patch.object(LdapData, "connection_pool")
+    def test_ldap_search_raises_on_connection_exception(self, mock_connection_pool):
+        mock_connection_pool.return_value.call.side_effect = ConnectionError()
 
         with self.assertRaises(LdapDataError):
             self.ldap_data.ldap_search(MOCK_LDAP_SEARCH_FILTER)
 
-    @patch.object(LdapData, "connection")
-    def test_ldap_search_raises_on_library_exception(self, mock_connection):
+    @patch.object(LdapData, "connection_pool")
+    def test_ldap_search_raises_on_library_exception(self, mock_connection_pool):
         mock_ldap_object = Mock()
         mock_ldap_object.search_s.side_effect = ValueError()
-        mock_connection.return_value = mock_ldap_object
+        mock_connection_pool.return_value.call.side_effect = lambda operation: operation(mock_ldap_object)
 
         with self.assertRaises(LdapDataError):
             self.ldap_data.ldap_search(MOCK_LDAP_SEARCH_FILTER)
 
-    @patch.object(LdapData, "connection")
-    def test_ldap_search_calls_ldap_library_search_method_with_expected_search_filter(self, mock_connection):
+    @patch.object(LdapData, "connection_pool")
+    def test_ldap_search_calls_ldap_library_search_method_with_expected_search_filter(self, mock_connection_pool):
         mock_ldap_object = Mock()
-        mock_connection.return_value = mock_ldap_object
+        mock_connection_pool.return_value.call.side_effect = lambda operation: operation(mock_ldap_object)
 
         self.ldap_data.ldap_search(MOCK_LDAP_SEARCH_FILTER)
 
@@ -176,13 +239,76 @@ class LdapDataTest(TestCase):
             self.ldap_data.config["openldap"]["MONOCLE_LDAP_BASE_DN"], SCOPE_SUBTREE, MOCK_LDAP_SEARCH_FILTER
         )
 
-    @patch.object(LdapData, "connection")
-    def test_ldap_search_returns_result_from_ldap_library_search_method(self, mock_connection):
+    @patch.object(LdapData, "connection_pool")
+    def test_ldap_search_passes_attributes_to_ldap_library_search_method(self, mock_connection_pool):
+        mock_ldap_object = Mock()
+        mock_connection_pool.return_value.call.side_effect = lambda operation: operation(mock_ldap_object)
+
+        self.ldap_data.ldap_search(MOCK_LDAP_SEARCH_FILTER, ["modifyTimestamp"])
+
+        mock_ldap_object.search_s.assert_called_once_with(
+            self.ldap_data.config["openldap"]["MONOCLE_LDAP_BASE_DN"],
+            SCOPE_SUBTREE,
+            MOCK_LDAP_SEARCH_FILTER,
+            ["modifyTimestamp"],
+        )
+
+    @patch.object(LdapData, "connection_pool")
+    def test_ldap_search_returns_result_from_ldap_library_search_method(self, mock_connection_pool):
         mock_ldap_object = Mock()
         expected_result = 42
         mock_ldap_object.search_s.return_value = expected_result
-        mock_connection.return_value = mock_ldap_object
+        mock_connection_pool.return_value.call.side_effect = lambda operation: operation(mock_ldap_object)
 
         actual_result = self.ldap_data.ldap_search(MOCK_LDAP_SEARCH_FILTER)
 
         self.assertEqual(expected_result, actual_result)
+
+    @patch("DataSources.ldap_data.ldap.initialize")
+    def test_ldap_bind_as(self, mock_initialize):
+        self.assertTrue(self.ldap_data.ldap_bind_as(MOCK_USER_DN, "secret"))
+
+        mock_initialize.assert_called_once_with(self.ldap_data.config["ldap_url"])
+        mock_initialize.return_value.simple_bind_s.assert_called_once_with(MOCK_USER_DN, "secret")
+        mock_initialize.return_value.unbind_s.assert_called_once()
+
+    @patch("DataSources.ldap_data.ldap.initialize")
+    def test_ldap_bind_as_with_invalid_credentials(self, mock_initialize):
+        mock_initialize.return_value.simple_bind_s.side_effect = ldap.INVALID_CREDENTIALS()
+
+        self.assertFalse(self.ldap_data.ldap_bind_as(MOCK_USER_DN, "wrong"))
+        mock_initialize.return_value.unbind_s.assert_called_once()
+
+    @patch("DataSources.ldap_data.ldap.initialize")
+    def test_ldap_bind_as_rejects_empty_password(self, mock_initialize):
+        self.assertFalse(self.ldap_data.ldap_bind_as(MOCK_USER_DN, ""))
+        mock_initialize.assert_not_called()
+
+    @patch("DataSources.ldap_data.ldap.initialize")
+    def test_ldap_bind_as_raises_on_library_exception(self, mock_initialize):
+        mock_initialize.return_value.simple_bind_s.side_effect = ldap.SERVER_DOWN()
+
+        with self.assertRaises(LdapDataError):
+            self.ldap_data.ldap_bind_as(MOCK_USER_DN, "secret")
+
+    @patch("DataSources.ldap_data.shared_ldap_connection_pool")
+    def test_connection_pool_is_shared(self, mock_shared_pool):
+        self.assertIs(mock_shared_pool.return_value, self.ldap_data.connection_pool())
+        mock_shared_pool.assert_called_once_with(
+            {
+                "ldap_url": self.ldap_data.config["ldap_url"],
+                "bind_dn": self.ldap_data.config["openldap"]["MONOCLE_LDAP_BIND_DN"],
+                "bind_password": self.ldap_data.config["openldap"]["MONOCLE_LDAP_BIND_PASSWORD"],
+            }
+        )
+
+    def test_connection_pool_config(self):
+        self.ldap_data.config["connection_pool_size"] = 8
+        self.ldap_data.config["connection_check_interval_seconds"] = 15
+        self.ldap_data.config["connection_acquire_timeout_seconds"] = 5
+
+        pool_config = self.ldap_data.get_connection_pool_config()
+
+        self.assertEqual(8, pool_config["size"])
+        self.assertEqual(15, pool_config["check_interval_seconds"])
+        self.assertEqual(5, pool_config["acquire_timeout_seconds"])
@@ -1,14 +1,17 @@
 import logging
+import urllib.error
 import urllib.parse
-import urllib.request
 from unittest import TestCase
 from unittest.mock import patch
 
+import DataSources.institution_data
+import DataSources.metadata_download
+from dash.api.utils.http_transport import HttpTransport
 from DataSources.metadata_download import MetadataDownload, MonocleDownloadClient, ProtocolError
 
 logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
 
-INSTITUTIONS = {"TheChiUniHonKon": {"name": "The Chinese University of Hong Kong"}}
+INSTITUTIONS = {"TheChiUniHonKon": "The Chinese University of Hong Kong"}
 
 
 class MetadataDownloadTest(TestCase):
@@ -312,6 +315,19 @@ class MetadataDownloadTest(TestCase):
         "status": {"order": 1, "title": "status", "value": "PASS"},
     }
 
+    mock_download_columns = """{  "download_columns": {
+                                          "metadata": ["Sanger_Sample_ID", "Lane_ID"],
+                                          "qc_data": ["lane_id", "status"],
+                                          "in_silico_data": ["Sample_id", "ST"]
+                                          }
+                                    }"""
+
+    expected_download_columns = {
+        "metadata": ["Sanger_Sample_ID", "Lane_ID"],
+        "qc_data": ["lane_id", "status"],
+        "in_silico_data": ["Sample_id", "ST"],
+    }
+
     def setUp(self):
         self.download = MetadataDownload(set_up=False)
         self.download._institutions = None
@@ -354,11 +370,18 @@ class MetadataDownloadTest(TestCase):
             endpoint = self.bad_api_endpoint + self.mock_download_param[0]
             doomed.make_request("http://fake-container" + endpoint)
 
-    @patch("DataSources.metadata_download.MonocleSampleTracking")
+    def test_institution_data_shared_with_sample_tracking(self):
+        # both must use the same module, or each has its own institution directory
+        # (DataServices.sample_tracking_services uses DataSources.institution_data)
+        self.assertIs(DataSources.institution_data.InstitutionData, DataSources.metadata_download.InstitutionData)
+
+    @patch("DataSources.metadata_download.InstitutionData")
     @patch.object(MonocleDownloadClient, "make_request")
-    def test_download_metadata(self, mock_request, mock_sample_tracking_services):
+    def test_download_metadata(self, mock_request, mock_institution_data):
         mock_request.return_value = self.mock_metadata_download
-        mock_sample_tracking_services.return_value.get_institutions.return_value = INSTITUTIONS
+        mock_institution_data.return_value.get_institution_names_by_key_regardless_of_user_membership.return_value = (
+            INSTITUTIONS
+        )
 
         lanes = self.download.get_metadata(self.mock_project, self.mock_download_param)
 
@@ -374,13 +397,13 @@ class MetadataDownloadTest(TestCase):
         # check data are correct
         self.assertEqual(this_lane, self.expected_metadata, msg="returned metadata differ from expected metadata")
 
-    @patch("DataSources.metadata_download.MonocleSampleTracking")
+    @patch("DataSources.metadata_download.InstitutionData")
     @patch.object(MonocleDownloadClient, "make_request")
     def test_download_metadata_does_not_replace_submitting_institution_key_if_institution_is_not_in_institution_list(
-        self, mock_request, mock_sample_tracking_services
+        self, mock_request, mock_institution_data
     ):
         mock_request.return_value = self.mock_metadata_download
-        mock_sample_tracking_services.return_value.get_institutions.return_value = {}
+        mock_institution_data.return_value.get_institution_names_by_key_regardless_of_user_membership.return_value = {}
 
         lanes = self.download.get_metadata(self.mock_project, self.mock_download_param)
 
@@ -388,13 +411,13 @@ class MetadataDownloadTest(TestCase):
         expected_submitting_institution["value"] = list(INSTITUTIONS.keys())[0]
         self.assertEqual(lanes[0]["submitting_institution"], expected_submitting_institution)
 
-    @patch("DataSources.metadata_download.MonocleSampleTracking")
+    @patch("DataSources.metadata_download.InstitutionData")
     @patch.object(MonocleDownloadClient, "make_request")
-    def test_download_metadata_with_samples_without_submitting_institution(
-        self, mock_request, mock_sample_tracking_services
-    ):
+    def test_download_metadata_with_samples_without_submitting_institution(self, mock_request, mock_institution_data):
         mock_request.return_value = '{"download": [{"sanger_sample_id": {"value": "fake_id"}}]}'
-        mock_sample_tracking_services.return_value.get_institutions.return_value = INSTITUTIONS
+        mock_institution_data.return_value.get_institution_names_by_key_regardless_of_user_membership.return_value = (
+            INSTITUTIONS
+        )
 
         lanes = self.download.get_metadata(self.mock_project, self.mock_download_param)
 
@@ -443,15 +466,28 @@ class MetadataDownloadTest(TestCase):
         self.maxDiff = None
         self.assertEqual(this_lane, self.expected_qc_data, msg="returned QC data differ from expected data")
 
+    @patch.object(MonocleDownloadClient, "make_request")
+    def test_download_columns(self, mock_request):
+        mock_request.return_value = self.mock_download_columns
+        download_columns = self.download.get_download_columns(self.mock_project)
+        self.assertEqual(self.expected_download_columns, download_columns)
+        mock_request.assert_called_once_with("http://fake-container/metadata/juno/download_columns")
+
+    @patch.object(MonocleDownloadClient, "make_request")
+    def test_reject_bad_download_columns_response(self, mock_request):
+        with self.assertRaises(ProtocolError):
+            mock_request.return_value = self.mock_bad_download
+            self.download.get_download_columns(self.mock_project)
+
     @patch.object(MonocleDownloadClient, "make_request")
     def test_reject_bad_download_qc_data_response(self, mock_request):
         with self.assertRaises(ProtocolError):
             mock_request.return_value = self.mock_bad_download
             self.download.get_qc_data(self.mock_project, self.mock_download_param[0])
 
-    @patch.object(urllib.request, "urlopen")
-    def test_download_qc_data_when_no_qc_data_available(self, mock_urlopen):
-        mock_urlopen.side_effect = urllib.error.HTTPError("not found", 404, "", "", "")
+    @patch.object(HttpTransport, "request")
+    def test_download_qc_data_when_no_qc_data_available(self, mock_request):
+        mock_request.side_effect = urllib.error.HTTPError("not found", 404, "", "", "")
         lanes = self.download.get_qc_data(self.mock_project, self.mock_download_param)
         # response should be and empty list in case of a 404
         self.assertIsInstance(lanes, list)
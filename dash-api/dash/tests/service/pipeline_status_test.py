@@ -1,15 +1,31 @@
 import logging
+import os
 from os import environ
+from pathlib import Path
+from shutil import copyfile
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 from unittest.mock import patch
 
+import DataSources.pipeline_status
 from DataSources.pipeline_status import PipelineStatus, PipelineStatusDataError
-from pandas import DataFrame, errors
+from pandas import DataFrame, concat, errors
 
 # this helps to supress messages that may crop up with using TestCase.assertRaises()
 logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
 
 
+class SynchronousThread:
+    """stands in for threading.Thread, so that background reloading happens before start() returns"""
+
+    def __init__(self, target, args=(), daemon=None):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        self.target(*self.args)
+
+
 class PipelineStatusTest(TestCase):
 
     test_config = "dash/tests/mock_data/data_sources.yml"
@@ -159,3 +175,86 @@ class PipelineStatusTest(TestCase):
     def test_all_failed_lane_status(self):
         lane_status = self.pipeline_status.lane_status(self.mock_all_failed_lane_id)
         self.assertEqual(self.expected_all_failed_lane_status, lane_status)
+
+    def test_lanes_status(self):
+        lanes_status = self.pipeline_status.lanes_status(
+            [
+                self.mock_missing_lane_id,
+                self.mock_successful_lane_id,
+                self.mock_all_pending_lane_id,
+                self.mock_qc_failed_lane_id,
+                self.mock_aa_failed_lane_id,
+                # repeated lane IDs are harmless
+                self.mock_successful_lane_id,
+            ]
+        )
+        self.assertEqual(
+            {
+                self.mock_missing_lane_id: self.expected_missing_lane_status,
+                self.mock_successful_lane_id: self.expected_successful_lane_status,
+                self.mock_all_pending_lane_id: self.expected_all_pending_lane_status,
+                self.mock_qc_failed_lane_id: self.expected_qc_failed_lane_status,
+                self.mock_aa_failed_lane_id: self.expected_aa_failed_lane_status,
+            },
+            lanes_status,
+        )
+
+    def test_lanes_status_no_lanes(self):
+        self.assertEqual({}, self.pipeline_status.lanes_status([]))
+
+    def test_lanes_status_with_repeated_lane_in_data(self):
+        # if the data have more than one row for a lane, the first is used
+        dataframe = self.pipeline_status.dataframe
+        repeated_row = dataframe.loc[[self.mock_successful_lane_id]].replace("Done", "Failed")
+        self.pipeline_status.lane_status_index = self.pipeline_status._build_lane_status_index(
+            concat([dataframe, repeated_row])
+        )
+
+        lanes_status = self.pipeline_status.lanes_status([self.mock_successful_lane_id])
+
+        self.assertEqual({self.mock_successful_lane_id: self.expected_successful_lane_status}, lanes_status)
+
+    @patch.dict(environ, mock_environment, clear=True)
+    def test_data_are_shared_by_instances(self):
+        other_pipeline_status = PipelineStatus(self.mock_project_id, config=self.test_config)
+
+        self.assertIs(self.pipeline_status.dataframe, other_pipeline_status.dataframe)
+        self.assertIs(self.pipeline_status.lane_status_index, other_pipeline_status.lane_status_index)
+
+    @patch.object(DataSources.pipeline_status, "Thread", new=SynchronousThread)
+    def test_data_are_reloaded_when_file_changes(self):
+        with TemporaryDirectory() as data_dir:
+            csv_file = Path(data_dir, "status", "pipelines.csv")
+            csv_file.parent.mkdir()
+            copyfile(self.test_csv_file, csv_file)
+            with patch.dict(environ, {"JUNO_DATA": data_dir}, clear=True):
+                original_pipeline_status = PipelineStatus(self.mock_project_id, config=self.test_config)
+                with open(csv_file, "a") as file:
+                    file.write("new#lane,Done,Done,-,Done,-,-,-,Done,Done\n")
+                # make sure the modification time changes even if the file system has coarse timestamps
+                os.utime(csv_file, ns=(0, 0))
+
+                reloaded_pipeline_status = PipelineStatus(self.mock_project_id, config=self.test_config)
+                # data from before the reload are returned while the file is reloaded...
+                self.assertIs(original_pipeline_status.dataframe, reloaded_pipeline_status.dataframe)
+                # ...and subsequent instances get the reloaded data
+                new_pipeline_status = PipelineStatus(self.mock_project_id, config=self.test_config)
+
+        self.assertIsNot(original_pipeline_status.dataframe, new_pipeline_status.dataframe)
+        self.assertTrue(new_pipeline_status.lane_status("new#lane")["SUCCESS"])
+
+    @patch.object(DataSources.pipeline_status, "Thread", new=SynchronousThread)
+    def test_previous_data_are_used_if_changed_file_is_bad(self):
+        with TemporaryDirectory() as data_dir:
+            csv_file = Path(data_dir, "status", "pipelines.csv")
+            csv_file.parent.mkdir()
+            copyfile(self.test_csv_file, csv_file)
+            with patch.dict(environ, {"JUNO_DATA": data_dir}, clear=True):
+                original_pipeline_status = PipelineStatus(self.mock_project_id, config=self.test_config)
+                copyfile(self.missing_col_csv_file, csv_file)
+                os.utime(csv_file, ns=(0, 0))
+
+                PipelineStatus(self.mock_project_id, config=self.test_config)
+                new_pipeline_status = PipelineStatus(self.mock_project_id, config=self.test_config)
+
+        self.assertIs(original_pipeline_status.dataframe, new_pipeline_status.dataframe)
@@ -1,10 +1,15 @@
 from copy import deepcopy
 from os import environ
 from pathlib import Path, PurePath
+from tempfile import TemporaryDirectory
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
+import DataServices.sample_data_services
 import yaml
+from dash.api.utils import zip_writer
+from dash.api.utils.file_probe import FileProbe
+from dash.api.utils.lane_files_manifest import write_lane_files_manifest
 from DataServices.sample_data_services import (
     ZIP_COMPRESSION_FACTOR_ASSEMBLIES_ANNOTATIONS,
     DataSourceConfigError,
@@ -349,6 +354,12 @@ class MonocleSampleDataTest(TestCase):
             "some_qc_thing": {"order": 2, "title": "QC_Thing", "value": "42"},
         }
     ]
+    # all the columns the metadata API can download
+    mock_download_columns = {
+        "metadata": ["Sanger_Sample_ID", "Something_Made_Up", "Also_Made_Up", "Lane_ID", "Public_Name"],
+        "qc_data": ["lane_id", "QC_Thing"],
+        "in_silico_data": ["Sample_id", "In_Silico_Thing", "Another_In_Silico_Thing"],
+    }
     # the return value when no in silico data are available
     in_silico_data_available_not_available = []
     # the return value when no QC data are available
@@ -672,6 +683,29 @@ class MonocleSampleDataTest(TestCase):
             bulk_download_info,
         )
 
+    @patch.object(Path, "exists", return_value=True)
+    @patch.object(MonocleSampleData, "_get_file_probe")
+    @patch.object(SampleMetadata, "get_samples")
+    @patch.dict(environ, mock_environment, clear=True)
+    def test_get_bulk_download_info_checks_file_sizes_at_once(
+        self, get_sample_metadata_mock, get_file_probe_mock, _path_exists_mock
+    ):
+        get_sample_metadata_mock.return_value = self.mock_samples
+        file_size = 420024
+        file_probe = get_file_probe_mock.return_value
+        file_probe.sizes.side_effect = lambda lane_files: {lane_file: file_size for lane_file in lane_files}
+
+        bulk_download_info = self.monocle_data.get_bulk_download_info(
+            {"batches": self.inst_key_batch_date_pairs}, assemblies=True, annotations=False
+        )
+
+        num_lanes = 5
+        self.assertEqual(format_file_size(file_size * num_lanes), bulk_download_info["size"])
+        # the files are checked once when they are listed, then all their sizes are got at once
+        self.assertEqual(2, file_probe.sizes.call_count)
+        self.assertEqual(num_lanes, len(file_probe.sizes.call_args[0][0]))
+        file_probe.size.assert_not_called()
+
     @patch.object(MonocleDownloadClient, "metadata")
     def test_get_metadata(self, mock_metadata_fetch):
         """
@@ -874,20 +908,17 @@ class MonocleSampleDataTest(TestCase):
 
     @patch.dict(environ, mock_environment, clear=True)
     @patch.object(SampleMetadata, "get_samples")
-    @patch.object(PipelineStatus, "lane_status")
-    def test_get_filtered_samples_with_pipeline_success_filter(self, lane_status_mock, get_sample_metadata_mock):
+    @patch.object(PipelineStatus, "lanes_status")
+    def test_get_filtered_samples_with_pipeline_success_filter(self, lanes_status_mock, get_sample_metadata_mock):
         self.get_mock_data2()
         get_sample_metadata_mock.return_value = self.mock_samples2
-        # assigning list to side_effect returns next value each time mocked function is called
-        # N.B.  the code only checks each sample's lanes until it finds one that succeeded.
-        #       The mock data have 3 lanes for fake_sample_id_1, but after the second lane is
-        #       checked and found to be successful, no more lanes for fake_sample_id_1 should
-        #       be checked.  => even though we have mocked 4 lanes, only 3 calls are expected
-        lane_status_mock.side_effect = [
-            {"SUCCESS": False, "FAILED": True},  # fake_sample_id_1: first lane failed
-            {"SUCCESS": True, "FAILED": False},  # fake_sample_id_1: second lane succeeded
-            {"SUCCESS": False, "FAILED": True},  # fake_sample_id_2: lane failed
-        ]
+        # the status of all lanes is looked up with a single call
+        lanes_status_mock.return_value = {
+            "fake_lane_id_1": {"SUCCESS": False, "FAILED": True},  # fake_sample_id_1: first lane failed
+            "fake_lane_id_2": {"SUCCESS": True, "FAILED": False},  # fake_sample_id_1: second lane succeeded
+            "fake_lane_id_3": {"SUCCESS": False, "FAILED": True},  # fake_sample_id_1: third lane failed
+            "fake_lane_id_4": {"SUCCESS": False, "FAILED": True},  # fake_sample_id_2: lane failed
+        }
 
         # should return fake_sample_id_1 as it has one successful lane
         actual_samples = self.monocle_data.get_filtered_samples(
@@ -897,23 +928,22 @@ class MonocleSampleDataTest(TestCase):
         expected_samples = self.mock_filtered_samples2
         # logging.critical("\nEXPECTED:\n{}\nGOT:\n{}".format(expected_samples, actual_samples))
         self.assertEqual(expected_samples, actual_samples)
+        lanes_status_mock.assert_called_once()
         self.get_mock_data()
 
     @patch.dict(environ, mock_environment, clear=True)
     @patch.object(SampleMetadata, "get_samples")
-    @patch.object(PipelineStatus, "lane_status")
-    def test_get_filtered_samples_with_pipeline_complete_filter(self, lane_status_mock, get_sample_metadata_mock):
+    @patch.object(PipelineStatus, "lanes_status")
+    def test_get_filtered_samples_with_pipeline_complete_filter(self, lanes_status_mock, get_sample_metadata_mock):
         self.get_mock_data2()
         get_sample_metadata_mock.return_value = self.mock_samples2
-        # assigning list to side_effect returns next value each time mocked function is called
-        # N.B.  the code only checks each sample's lanes until it finds one that completed.
-        #       The mock data have 3 lanes for fake_sample_id_1, but after the first lane is
-        #       checked and found to be complete, no more lanes for fake_sample_id_1 should
-        #       be checked.  => even though we have mocked 4 lanes, only 2 calls are expected
-        lane_status_mock.side_effect = [
-            {"SUCCESS": False, "FAILED": True},  # fake_sample_id_1: first lane failed => complete
-            {"SUCCESS": False, "FAILED": False},  # fake_sample_id_2: no status available => incomplete
-        ]
+        # the status of all lanes is looked up with a single call
+        lanes_status_mock.return_value = {
+            "fake_lane_id_1": {"SUCCESS": False, "FAILED": True},  # fake_sample_id_1: first lane failed => complete
+            "fake_lane_id_2": {"SUCCESS": False, "FAILED": False},  # fake_sample_id_1: no status => incomplete
+            "fake_lane_id_3": {"SUCCESS": False, "FAILED": False},  # fake_sample_id_1: no status => incomplete
+            "fake_lane_id_4": {"SUCCESS": False, "FAILED": False},  # fake_sample_id_2: no status => incomplete
+        }
 
         # should return fake_sample_id_1 as it has one complete lane
         actual_samples = self.monocle_data.get_filtered_samples(
@@ -964,6 +994,103 @@ class MonocleSampleDataTest(TestCase):
 
         self.assertEqual({}, public_name_to_lane_files)
 
+    @patch.object(Path, "exists", return_value=False)
+    def test_get_public_name_to_lane_files_dict_uses_lane_files_manifest(self, path_exists_mock):
+        lane_with_file = "lane_with_file"
+        samples = [{"inst_key": INSTITUTION_KEY, "public_name": PUBLIC_NAME, "lanes": [lane_with_file, "lane_without"]}]
+        file_entry = {"size": 1, "mtime": 0}
+
+        with TemporaryDirectory() as inst_view_dir:
+            Path(inst_view_dir, INSTITUTION_KEY).mkdir()
+            write_lane_files_manifest(
+                Path(inst_view_dir, INSTITUTION_KEY),
+                {PUBLIC_NAME: {lane_with_file: {f"{lane_with_file}.contigs_spades.fa": file_entry}}},
+            )
+            with patch.dict(environ, {**self.mock_environment, "JUNO_DATA_INSTITUTION_VIEW": inst_view_dir}):
+                public_name_to_lane_files = self.monocle_data.get_public_name_to_lane_files_dict(
+                    samples, assemblies=True, annotations=False
+                )
+
+        expected_lane_files = [
+            PurePath(inst_view_dir, INSTITUTION_KEY, PUBLIC_NAME, f"{lane_with_file}.contigs_spades.fa")
+        ]
+        self.assertEqual({PUBLIC_NAME: expected_lane_files}, public_name_to_lane_files)
+        path_exists_mock.assert_not_called()
+
+    @patch.object(Path, "exists")
+    def test_get_public_name_to_lane_files_dict_uses_file_probe(self, path_exists_mock):
+        samples = [
+            {"inst_key": INSTITUTION_KEY, "public_name": PUBLIC_NAME, "lanes": ["lane_with_file", "lane_without"]}
+        ]
+        file_probe = FileProbe(workers=4, cache_ttl_seconds=60)
+
+        with TemporaryDirectory() as inst_view_dir:
+            lane_file = Path(inst_view_dir, INSTITUTION_KEY, PUBLIC_NAME, "lane_with_file.contigs_spades.fa")
+            lane_file.parent.mkdir(parents=True)
+            lane_file.write_text("ACGT")
+            monocle_data = MonocleSampleData(MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False)
+            monocle_data.data_source_config = {"data_download": {"file_probe_workers": 4}}
+            monocle_data.current_project = self.mock_project_id
+            with patch.dict(environ, {**self.mock_environment, "JUNO_DATA_INSTITUTION_VIEW": inst_view_dir}), patch(
+                "DataServices.sample_data_services.shared_file_probe", return_value=file_probe
+            ):
+                public_name_to_lane_files = monocle_data.get_public_name_to_lane_files_dict(
+                    samples, assemblies=True, annotations=False
+                )
+                lane_file.unlink()
+
+                # the size was cached when the file was found
+                file_sizes = monocle_data._get_file_sizes([lane_file])
+
+        self.assertEqual({PUBLIC_NAME: [lane_file]}, public_name_to_lane_files)
+        self.assertEqual({lane_file: 4}, file_sizes)
+        path_exists_mock.assert_not_called()
+
+    def test_get_file_size_uses_lane_files_manifest(self):
+        with TemporaryDirectory() as inst_view_dir:
+            Path(inst_view_dir, INSTITUTION_KEY).mkdir()
+            write_lane_files_manifest(
+                Path(inst_view_dir, INSTITUTION_KEY),
+                {PUBLIC_NAME: {"lane": {"lane.contigs_spades.fa": {"size": 123, "mtime": 0}}}},
+            )
+
+            # the file isn't on the data file mount, but its size is in the manifest
+            file_size = self.monocle_data._get_file_size(
+                Path(inst_view_dir, INSTITUTION_KEY, PUBLIC_NAME, "lane.contigs_spades.fa")
+            )
+
+        self.assertEqual(123, file_size)
+
+    def test_get_lane_files_size(self):
+        file_probe = Mock(spec=FileProbe)
+        with TemporaryDirectory() as inst_view_dir:
+            Path(inst_view_dir, INSTITUTION_KEY).mkdir()
+            write_lane_files_manifest(
+                Path(inst_view_dir, INSTITUTION_KEY),
+                {PUBLIC_NAME: {"lane": {"lane.contigs_spades.fa": {"size": 123, "mtime": 0}}}},
+            )
+            in_manifest = Path(inst_view_dir, INSTITUTION_KEY, PUBLIC_NAME, "lane.contigs_spades.fa")
+            not_in_manifest = [
+                Path(inst_view_dir, INSTITUTION_KEY, PUBLIC_NAME, "lane.annotation.gff"),
+                Path(inst_view_dir, INSTITUTION_KEY, PUBLIC_NAME, "missing.annotation.gff"),
+            ]
+            file_probe.sizes.return_value = {not_in_manifest[0]: 4, not_in_manifest[1]: None}
+
+            with patch.object(MonocleSampleData, "_get_file_probe", return_value=file_probe):
+                total_size = self.monocle_data.get_lane_files_size(
+                    {PUBLIC_NAME: [in_manifest, not_in_manifest[0]], "another public name": [not_in_manifest[1]]}
+                )
+
+        self.assertEqual(127, total_size)
+        # the files that aren't in the manifest are all checked at once
+        file_probe.sizes.assert_called_once_with(not_in_manifest)
+
+    def test_lane_files_manifests_shared_with_zip_writer(self):
+        # both must use the same module, or each has its own cache of manifests
+        self.assertIs(
+            zip_writer.shared_lane_files_manifests, DataServices.sample_data_services.shared_lane_files_manifests
+        )
+
     def test_get_public_name_to_lane_files_dict_rejects_if_data_institution_view_env_var_is_not_set(self):
         samples = list(self.mock_seq_status.values())
 
@@ -1025,6 +1152,104 @@ class MonocleSampleDataTest(TestCase):
         with self.assertRaises(DataSourceConfigError):
             monocle_data_with_bad_config.get_bulk_download_max_samples_per_zip()
 
+    def test_get_bulk_download_zip_job_config_not_configured(self):
+        self.assertIsNone(self.monocle_data.get_bulk_download_zip_job_config())
+
+    def test_get_bulk_download_zip_job_config(self):
+        monocle_data = MonocleSampleData(MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False)
+        monocle_data.data_source_config = {"data_download": {"zip_job_workers": 3, "zip_job_max_queued": 0}}
+        self.assertEqual({"max_workers": 3, "max_queued": 0}, monocle_data.get_bulk_download_zip_job_config())
+
+    def test_get_bulk_download_zip_job_config_reject_bad_config(self):
+        monocle_data_with_bad_config = MonocleSampleData(
+            MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False
+        )
+        for bad_config in ({"zip_job_workers": 0, "zip_job_max_queued": 10}, {"zip_job_workers": 2}):
+            monocle_data_with_bad_config.data_source_config = {"data_download": bad_config}
+            with self.assertRaises(DataSourceConfigError):
+                monocle_data_with_bad_config.get_bulk_download_zip_job_config()
+
+    def test_get_bulk_download_read_ahead_config_not_configured(self):
+        self.assertIsNone(self.monocle_data.get_bulk_download_read_ahead_config())
+
+    def test_get_bulk_download_read_ahead_config(self):
+        monocle_data = MonocleSampleData(MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False)
+        monocle_data.data_source_config = {"data_download": {"zip_read_ahead_files": 4, "zip_read_ahead_buffer_mb": 64}}
+        self.assertEqual(
+            {"prefetch_depth": 4, "buffer_size": 64 * 1024 * 1024}, monocle_data.get_bulk_download_read_ahead_config()
+        )
+
+    def test_get_bulk_download_read_ahead_config_reject_bad_config(self):
+        monocle_data_with_bad_config = MonocleSampleData(
+            MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False
+        )
+        for bad_config in ({"zip_read_ahead_files": 0, "zip_read_ahead_buffer_mb": 64}, {"zip_read_ahead_files": 4}):
+            monocle_data_with_bad_config.data_source_config = {"data_download": bad_config}
+            with self.assertRaises(DataSourceConfigError):
+                monocle_data_with_bad_config.get_bulk_download_read_ahead_config()
+
+    def test_get_bulk_download_zip_cache_quota_not_configured(self):
+        self.assertIsNone(self.monocle_data.get_bulk_download_zip_cache_quota())
+
+    def test_get_bulk_download_zip_cache_quota(self):
+        monocle_data = MonocleSampleData(MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False)
+        monocle_data.data_source_config = {"data_download": {"zip_cache_quota_gb": 1.5}}
+        self.assertEqual(3 * 512 * 1024 * 1024, monocle_data.get_bulk_download_zip_cache_quota())
+
+    def test_get_bulk_download_zip_cache_quota_reject_bad_config(self):
+        monocle_data_with_bad_config = MonocleSampleData(
+            MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False
+        )
+        for bad_quota in (0, "lots"):
+            monocle_data_with_bad_config.data_source_config = {"data_download": {"zip_cache_quota_gb": bad_quota}}
+            with self.assertRaises(DataSourceConfigError):
+                monocle_data_with_bad_config.get_bulk_download_zip_cache_quota()
+
+    def test_get_bulk_download_file_probe_config_not_configured(self):
+        self.assertIsNone(self.monocle_data.get_bulk_download_file_probe_config())
+
+    def test_get_bulk_download_file_probe_config(self):
+        monocle_data = MonocleSampleData(MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False)
+        monocle_data.data_source_config = {
+            "data_download": {"file_probe_workers": 32, "file_probe_cache_ttl_seconds": 60}
+        }
+        self.assertEqual({"workers": 32, "cache_ttl_seconds": 60}, monocle_data.get_bulk_download_file_probe_config())
+
+    def test_get_bulk_download_file_probe_config_without_cache(self):
+        monocle_data = MonocleSampleData(MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False)
+        monocle_data.data_source_config = {"data_download": {"file_probe_workers": 32}}
+        self.assertEqual({"workers": 32, "cache_ttl_seconds": 0}, monocle_data.get_bulk_download_file_probe_config())
+
+    def test_get_bulk_download_file_probe_config_reject_bad_config(self):
+        monocle_data_with_bad_config = MonocleSampleData(
+            MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False
+        )
+        for bad_config in (
+            {"file_probe_workers": 0},
+            {"file_probe_workers": "lots"},
+            {"file_probe_workers": 32, "file_probe_cache_ttl_seconds": -1},
+        ):
+            monocle_data_with_bad_config.data_source_config = {"data_download": bad_config}
+            with self.assertRaises(DataSourceConfigError):
+                monocle_data_with_bad_config.get_bulk_download_file_probe_config()
+
+    def test_get_bulk_download_stream_max_size_not_configured(self):
+        self.assertIsNone(self.monocle_data.get_bulk_download_stream_max_size())
+
+    def test_get_bulk_download_stream_max_size(self):
+        monocle_data = MonocleSampleData(MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False)
+        monocle_data.data_source_config = {"data_download": {"stream_max_size_mb": 100}}
+        self.assertEqual(100 * 1024 * 1024, monocle_data.get_bulk_download_stream_max_size())
+
+    def test_get_bulk_download_stream_max_size_reject_bad_config(self):
+        monocle_data_with_bad_config = MonocleSampleData(
+            MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False
+        )
+        for bad_max_size in (-1, "lots"):
+            monocle_data_with_bad_config.data_source_config = {"data_download": {"stream_max_size_mb": bad_max_size}}
+            with self.assertRaises(DataSourceConfigError):
+                monocle_data_with_bad_config.get_bulk_download_stream_max_size()
+
     @patch.object(MonocleSampleData, "make_download_symlink")
     @patch.object(MonocleDownloadClient, "qc_data")
     @patch.object(MonocleDownloadClient, "in_silico_data")
@@ -1091,6 +1316,154 @@ class MonocleSampleDataTest(TestCase):
 
         self.assertEqual(self.expected_metadata_download_error_response, metadata_download)
 
+    @patch.object(MonocleSampleData, "make_download_symlink")
+    @patch.object(MonocleDownloadClient, "download_columns")
+    @patch.object(MonocleDownloadClient, "qc_data")
+    @patch.object(MonocleDownloadClient, "in_silico_data")
+    @patch.object(MonocleDownloadClient, "metadata")
+    def test_get_metadata_for_download_streamed(
+        self,
+        mock_metadata_fetch,
+        mock_in_silico_data_fetch,
+        mock_qc_data_fetch,
+        mock_download_columns_fetch,
+        mock_make_symlink,
+    ):
+        mock_download_columns_fetch.return_value = self.mock_download_columns
+        mock_metadata_fetch.return_value = self.mock_metadata
+        mock_in_silico_data_fetch.return_value = self.mock_in_silico_data
+        mock_qc_data_fetch.return_value = self.mock_qc_data
+        mock_make_symlink.return_value = MOCK_DOWNLOAD_PATH
+
+        with patch.object(MonocleSampleData, "_get_csv_stream_chunk_size", return_value=100):
+            metadata_download = self.monocle_data.get_metadata_for_download(
+                MOCK_DOWNLOAD_HOST, self.mock_institution_keys[0], "sequencing", "successful"
+            )
+
+        self.assertEqual(
+            self.expected_metadata_download, {**metadata_download, "content": "".join(metadata_download["content"])}
+        )
+
+    @patch.object(MonocleSampleData, "make_download_symlink")
+    @patch.object(MonocleSampleData, "_get_samples_for_download")
+    @patch.object(MonocleDownloadClient, "download_columns")
+    @patch.object(MonocleDownloadClient, "qc_data")
+    @patch.object(MonocleDownloadClient, "in_silico_data")
+    @patch.object(MonocleDownloadClient, "metadata")
+    def test_get_metadata_for_download_streamed_in_chunks(
+        self,
+        mock_metadata_fetch,
+        mock_in_silico_data_fetch,
+        mock_qc_data_fetch,
+        mock_download_columns_fetch,
+        mock_get_samples,
+        mock_make_symlink,
+    ):
+        mock_download_columns_fetch.return_value = {
+            **self.mock_download_columns,
+            "in_silico_data": ["Sample_id", "In_Silico_Thing"],
+        }
+        mock_get_samples.return_value = {
+            "fake_sample_id_1": ["fake_lane_id_1", "fake_lane_id_2", "fake_lane_id_3"],
+            "fake_sample_id_2": ["fake_lane_id_4"],
+        }
+
+        # the client is called for each chunk of samples, so return only the data for the requested IDs
+        def data_for_ids(mock_data, id_field):
+            return lambda project, ids: [row for row in mock_data if row[id_field]["value"] in ids]
+
+        # fake_sample_id_1 is in the first chunk, and has no in silico data
+        mock_in_silico_data = [
+            {
+                "lane_id": {"order": 1, "title": "Sample_id", "value": "fake_lane_id_4"},
+                "some_in_silico_thing": {"order": 2, "title": "In_Silico_Thing", "value": "pos"},
+            }
+        ]
+        mock_metadata_fetch.side_effect = data_for_ids(self.mock_metadata, "sanger_sample_id")
+        mock_in_silico_data_fetch.side_effect = data_for_ids(mock_in_silico_data, "lane_id")
+        mock_qc_data_fetch.side_effect = data_for_ids(self.mock_qc_data, "lane_id")
+        mock_make_symlink.return_value = MOCK_DOWNLOAD_PATH
+        expected_csv = self.monocle_data.get_metadata_for_download(
+            MOCK_DOWNLOAD_HOST, self.mock_institution_keys[0], "sequencing", "successful"
+        )["content"]
+
+        with patch.object(MonocleSampleData, "_get_csv_stream_chunk_size", return_value=1):
+            metadata_download = self.monocle_data.get_metadata_for_download(
+                MOCK_DOWNLOAD_HOST, self.mock_institution_keys[0], "sequencing", "successful"
+            )
+            csv_chunks = list(metadata_download["content"])
+
+        self.assertIn("In_Silico_Thing", expected_csv)
+        self.assertEqual(expected_csv, "".join(csv_chunks))
+
+    @patch.object(MonocleSampleData, "make_download_symlink")
+    @patch.object(MonocleSampleData, "_get_samples_for_download")
+    @patch.object(MonocleDownloadClient, "download_columns")
+    @patch.object(MonocleDownloadClient, "qc_data")
+    @patch.object(MonocleDownloadClient, "in_silico_data")
+    @patch.object(MonocleDownloadClient, "metadata")
+    def test_get_metadata_for_download_streamed_without_some_data_type(
+        self,
+        mock_metadata_fetch,
+        mock_in_silico_data_fetch,
+        mock_qc_data_fetch,
+        mock_download_columns_fetch,
+        mock_get_samples,
+        mock_make_symlink,
+    ):
+        mock_download_columns_fetch.return_value = self.mock_download_columns
+        mock_get_samples.return_value = {
+            "fake_sample_id_1": ["fake_lane_id_1"],
+            "fake_sample_id_2": ["fake_lane_id_2"],
+        }
+        mock_metadata_fetch.side_effect = lambda project, ids: [
+            row for row in self.mock_metadata if row["sanger_sample_id"]["value"] in ids
+        ]
+        # none of the samples have in silico data
+        mock_in_silico_data_fetch.return_value = []
+        mock_qc_data_fetch.return_value = []
+        mock_make_symlink.return_value = MOCK_DOWNLOAD_PATH
+
+        with patch.object(MonocleSampleData, "_get_csv_stream_chunk_size", return_value=1):
+            csv_chunks = self.monocle_data.get_metadata_for_download(
+                MOCK_DOWNLOAD_HOST, self.mock_institution_keys[0], "sequencing", "successful"
+            )["content"]
+            # the first chunk is output before the second chunk is retrieved
+            first_chunk = next(csv_chunks)
+            self.assertEqual(1, mock_metadata_fetch.call_count)
+            remaining_chunks = list(csv_chunks)
+
+        header_row, first_row = first_chunk.splitlines()
+        self.assertIn('"In_Silico_Thing"', header_row)
+        self.assertIn('"fake_sample_id_1"', first_row)
+        self.assertEqual(1, len(remaining_chunks))
+        self.assertIn('"fake_sample_id_2"', remaining_chunks[0])
+        self.assertNotIn("In_Silico_Thing", remaining_chunks[0])
+
+    @patch.object(MonocleSampleData, "make_download_symlink")
+    @patch.object(MonocleSampleData, "_get_samples_for_download")
+    def test_get_metadata_for_download_streamed_not_found_ok(self, mock_get_samples, mock_make_symlink):
+        mock_get_samples.return_value = {}
+        mock_make_symlink.return_value = MOCK_DOWNLOAD_PATH
+
+        with patch.object(MonocleSampleData, "_get_csv_stream_chunk_size", return_value=100):
+            metadata_download = self.monocle_data.get_metadata_for_download(
+                MOCK_DOWNLOAD_HOST, self.mock_institution_keys[0], "sequencing", "successful"
+            )
+
+        self.assertEqual(self.expected_metadata_download_not_found, metadata_download)
+
+    def test_get_csv_stream_chunk_size_not_configured(self):
+        self.assertIsNone(self.monocle_data._get_csv_stream_chunk_size())
+
+    def test_get_csv_stream_chunk_size_reject_bad_config(self):
+        monocle_data_with_bad_config = MonocleSampleData(
+            MonocleSampleTracking_ref=self.monocle_sample_tracking, set_up=False
+        )
+        monocle_data_with_bad_config.data_source_config = {"metadata_download_common": {"csv_stream_chunk_size": 0}}
+        with self.assertRaises(DataSourceConfigError):
+            monocle_data_with_bad_config._get_csv_stream_chunk_size()
+
     # get_csv_download() mostly covered by get_metadata_for_download() tests above
     # this checks param validation
     def test_get_csv_download_reject_invalid_download_params(self):
@@ -0,0 +1,115 @@
+import logging
+from timeit import repeat
+from unittest import TestCase
+
+from DataServices.sample_status_filter import filter_samples_by_lane_status, lane_outcome_passes
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+
+class SampleStatusFilterTest(TestCase):
+
+    mock_samples = [
+        {"sanger_sample_id": "sample_1"},
+        {"sanger_sample_id": "sample_2"},
+        {"sanger_sample_id": "sample_3"},
+    ]
+    mock_lanes_by_sample_id = {
+        "sample_1": ["lane_1a", "lane_1b"],
+        "sample_2": ["lane_2"],
+        "sample_3": [],
+    }
+    mock_sequencing_outcomes = {
+        "lane_1a": {"complete": True, "success": False},
+        "lane_1b": {"complete": True, "success": True},
+        "lane_2": {"complete": True, "success": False},
+    }
+    mock_pipeline_outcomes = {
+        "lane_1a": {"complete": True, "success": True},
+        "lane_1b": {"complete": False, "success": False},
+        "lane_2": {"complete": False, "success": False},
+    }
+
+    def test_lane_outcome_passes(self):
+        lane_outcome = {"complete": True, "success": False}
+
+        self.assertTrue(lane_outcome_passes(lane_outcome, {}))
+        self.assertTrue(lane_outcome_passes(lane_outcome, {"complete": True}))
+        self.assertTrue(lane_outcome_passes(lane_outcome, {"complete": True, "success": False}))
+        self.assertFalse(lane_outcome_passes(lane_outcome, {"complete": True, "success": True}))
+        self.assertFalse(lane_outcome_passes(lane_outcome, {"complete": False}))
+
+    def test_single_filter(self):
+        passing_samples = filter_samples_by_lane_status(
+            self.mock_samples, self.mock_lanes_by_sample_id, [({"success": True}, self.mock_sequencing_outcomes)]
+        )
+
+        self.assertEqual([{"sanger_sample_id": "sample_1"}], passing_samples)
+
+    def test_sample_passes_if_any_lane_passes(self):
+        passing_samples = filter_samples_by_lane_status(
+            self.mock_samples, self.mock_lanes_by_sample_id, [({"success": False}, self.mock_sequencing_outcomes)]
+        )
+
+        self.assertEqual([{"sanger_sample_id": "sample_1"}, {"sanger_sample_id": "sample_2"}], passing_samples)
+
+    def test_sample_without_lanes_never_passes(self):
+        passing_samples = filter_samples_by_lane_status(
+            self.mock_samples, self.mock_lanes_by_sample_id, [({}, self.mock_sequencing_outcomes)]
+        )
+
+        self.assertNotIn({"sanger_sample_id": "sample_3"}, passing_samples)
+
+    def test_combined_filters(self):
+        status_filters = [
+            ({"complete": True}, self.mock_sequencing_outcomes),
+            ({"complete": False}, self.mock_pipeline_outcomes),
+        ]
+
+        passing_samples = filter_samples_by_lane_status(self.mock_samples, self.mock_lanes_by_sample_id, status_filters)
+
+        self.assertEqual([{"sanger_sample_id": "sample_1"}, {"sanger_sample_id": "sample_2"}], passing_samples)
+
+    def test_combined_filters_can_be_passed_by_different_lanes(self):
+        # sample_1 passes sequencing with lane_1b, and pipeline with lane_1a
+        status_filters = [
+            ({"success": True}, self.mock_sequencing_outcomes),
+            ({"success": True}, self.mock_pipeline_outcomes),
+        ]
+
+        passing_samples = filter_samples_by_lane_status(self.mock_samples, self.mock_lanes_by_sample_id, status_filters)
+
+        self.assertEqual([{"sanger_sample_id": "sample_1"}], passing_samples)
+
+    def test_no_filters(self):
+        passing_samples = filter_samples_by_lane_status(self.mock_samples, self.mock_lanes_by_sample_id, [])
+
+        self.assertEqual(self.mock_samples, passing_samples)
+
+    def test_time_taken_scales_linearly(self):
+        # benchmark with 10k and 100k samples: linear scaling means 10x the time for 10x the samples; allow for
+        # plenty of noise, but a quadratic algorithm would take ~100x as long
+        time_taken = {num_samples: self.time_filter(num_samples) for num_samples in (10000, 100000)}
+        logging.info("time to filter samples: {}".format(time_taken))
+
+        self.assertLess(time_taken[100000], 30 * time_taken[10000])
+
+    def time_filter(self, num_samples):
+        samples = [{"sanger_sample_id": "sample_{}".format(i)} for i in range(num_samples)]
+        lanes_by_sample_id = {
+            "sample_{}".format(i): ["lane_{}a".format(i), "lane_{}b".format(i)] for i in range(num_samples)
+        }
+        sequencing_outcomes = {}
+        pipeline_outcomes = {}
+        for i in range(num_samples):
+            sequencing_outcomes["lane_{}a".format(i)] = {"complete": True, "success": i % 2 == 0}
+            sequencing_outcomes["lane_{}b".format(i)] = {"complete": True, "success": i % 3 == 0}
+            pipeline_outcomes["lane_{}a".format(i)] = {"complete": i % 5 != 0, "success": i % 5 != 0}
+            pipeline_outcomes["lane_{}b".format(i)] = {"complete": False, "success": False}
+        status_filters = [({"success": True}, sequencing_outcomes), ({"complete": True}, pipeline_outcomes)]
+
+        return min(
+            repeat(
+                lambda: filter_samples_by_lane_status(samples, lanes_by_sample_id, status_filters), number=1, repeat=3
+            )
+        )
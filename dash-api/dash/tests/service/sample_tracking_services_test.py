@@ -1,17 +1,24 @@
 import urllib.error
 import urllib.request
-from copy import deepcopy
-from datetime import datetime
+from copy import copy, deepcopy
+from datetime import datetime, timedelta
 from os import environ
 from unittest import TestCase
 from unittest.mock import patch
 
+import numpy
 import yaml
-from DataServices.sample_tracking_services import MonocleSampleTracking
+from DataServices.sample_tracking_services import (
+    MLWH_DATETIME_STAMP_CACHE_SIZE,
+    MonocleSampleTracking,
+    _convert_mlwh_datetime_stamp_to_date_stamp,
+    convert_mlwh_datetime_stamps_to_dates,
+)
 from DataSources.institution_data import InstitutionData
 from DataSources.pipeline_status import PipelineStatus
 from DataSources.sample_metadata import MonocleClient, SampleMetadata
 from DataSources.sequencing_status import MLWH_Client, SequencingStatus
+from utils.cache import TTLCache
 
 INSTITUTION_KEY = "GenWel"
 PUBLIC_NAME = "SCN9A"
@@ -316,6 +323,17 @@ class MonocleSampleTrackingTest(TestCase):
 
         self.assertEqual(self.expected_progress_data, progress_data)
 
+    def test_get_progress_counts_lanes_sequenced(self):
+        mock_seq_data = deepcopy(self.mock_seq_data)
+        mock_seq_data["fake_sample_id_1"]["lanes"][0]["complete_datetime"] = "2020-05-03T09:12:44Z"
+        mock_seq_data["fake_sample_id_3"]["lanes"][0]["complete_datetime"] = "2021-05-04T17:01:02Z"
+        self.monocle_sample_tracking.sequencing_status_data = {"FakOne": mock_seq_data, "FakTwo": mock_seq_data}
+
+        progress_data = self.monocle_sample_tracking.get_progress()
+
+        self.assertEqual(self.expected_progress_data["samples received"], progress_data["samples received"])
+        self.assertEqual([0] * 8 + [2] * 12 + [4], progress_data["samples sequenced"])
+
     def test_get_institutions(self):
         expected_institutions = {
             "FakOne": {"name": "Fake institution One"},
@@ -392,6 +410,24 @@ class MonocleSampleTrackingTest(TestCase):
 
         self.assertEqual(self.expected_dropout_data, httpdropout)
 
+    @patch.dict(environ, mock_environment, clear=True)
+    @patch.object(SequencingStatus, "get_multiple_samples")
+    def test_get_sequencing_status_concurrent_requests_keep_per_institution_errors(self, get_multiple_samples_mock):
+        def get_multiple_samples(sample_ids):
+            if "fake_sample_id_3" in sample_ids:
+                raise urllib.error.HTTPError("/nowhere", "500", "server error", "yes", "no")
+            return deepcopy(self.mock_seq_data)
+
+        get_multiple_samples_mock.side_effect = get_multiple_samples
+        self.monocle_sample_tracking.sequencing_status_source.mlwh_client.config["max_concurrent_requests"] = 2
+        self.monocle_sample_tracking.sequencing_status_data = None
+
+        seq_status_data = self.monocle_sample_tracking.get_sequencing_status()
+
+        self.assertEqual(2, get_multiple_samples_mock.call_count)
+        self.assertIsNone(seq_status_data["FakOne"]["_ERROR"])
+        self.assertEqual(self.expected_dropout_data["FakTwo"], seq_status_data["FakTwo"])
+
     def test_get_batches(self):
         batches_data = self.monocle_sample_tracking.get_batches()
 
@@ -410,6 +446,88 @@ class MonocleSampleTrackingTest(TestCase):
 
         self.assertEqual(self.expected_dropout_data, batches_data)
 
+    def test_convert_mlwh_datetime_stamps_to_dates(self):
+        dates = convert_mlwh_datetime_stamps_to_dates(["2020-04-29T11:03:35Z", "2021-05-02T23:31:49+0100"])
+
+        self.assertEqual(numpy.dtype("datetime64[D]"), dates.dtype)
+        self.assertEqual(["2020-04-29", "2021-05-02"], dates.astype(str).tolist())
+
+    def test_convert_mlwh_datetime_stamps_to_dates_rejects_invalid_timestamp(self):
+        with self.assertRaises(ValueError):
+            convert_mlwh_datetime_stamps_to_dates(["29/04/2020 11:03:35"])
+
+    def test_convert_mlwh_datetime_stamp_to_date_stamp_cache_is_bounded(self):
+        start = datetime(2020, 1, 1)
+        for seconds in range(MLWH_DATETIME_STAMP_CACHE_SIZE + 1):
+            self.monocle_sample_tracking.convert_mlwh_datetime_stamp_to_date_stamp(
+                (start + timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            )
+
+        self.assertEqual(
+            MLWH_DATETIME_STAMP_CACHE_SIZE, _convert_mlwh_datetime_stamp_to_date_stamp.cache_info().currsize
+        )
+
+    def test_get_sequencing_dates(self):
+        sequencing_dates = self.monocle_sample_tracking.get_sequencing_dates()
+
+        self.assertEqual(["FakOne", "FakTwo"], list(sequencing_dates))
+        self.assertEqual(
+            ["fake_sample_id_1", "fake_sample_id_2", "fake_sample_id_3", "fake_sample_id_4"],
+            sequencing_dates["FakOne"]["sample_ids"],
+        )
+        self.assertEqual(
+            ["2020-04-29", "2020-11-16", "2021-05-02", "2021-05-02"],
+            sequencing_dates["FakOne"]["received"].astype(str).tolist(),
+        )
+        self.assertEqual([], sequencing_dates["FakOne"]["sequenced"].tolist())
+        self.assertIs(sequencing_dates, self.monocle_sample_tracking.get_sequencing_dates())
+
+    def test_get_sequencing_dates_dropout(self):
+        self.monocle_sample_tracking.sequencing_status_data = self.expected_dropout_data
+
+        sequencing_dates = self.monocle_sample_tracking.get_sequencing_dates()
+
+        self.assertEqual({"FakOne": None, "FakTwo": None}, sequencing_dates)
+
+    def test_get_batch_sample_ids(self):
+        expected_batch_sample_ids = {
+            "2020-04-29": ["fake_sample_id_1"],
+            "2020-11-16": ["fake_sample_id_2"],
+            "2021-05-02": ["fake_sample_id_3", "fake_sample_id_4"],
+        }
+
+        batch_sample_ids = self.monocle_sample_tracking.get_batch_sample_ids()
+
+        self.assertEqual({"FakOne": expected_batch_sample_ids, "FakTwo": expected_batch_sample_ids}, batch_sample_ids)
+        self.assertIs(batch_sample_ids, self.monocle_sample_tracking.get_batch_sample_ids())
+
+    def test_get_batch_sample_ids_rebuilt_for_new_sequencing_status(self):
+        self.monocle_sample_tracking.get_batch_sample_ids()
+        self.monocle_sample_tracking.sequencing_status_data = self.expected_dropout_data
+
+        batch_sample_ids = self.monocle_sample_tracking.get_batch_sample_ids()
+
+        self.assertEqual({"FakOne": {}, "FakTwo": {}}, batch_sample_ids)
+
+    @patch.dict(environ, mock_environment, clear=True)
+    @patch.object(SequencingStatus, "get_multiple_samples")
+    def test_get_batch_sample_ids_shared_with_cached_sequencing_status(self, mock_seq_samples_query):
+        mock_seq_samples_query.return_value = deepcopy(self.mock_seq_data)
+        self.monocle_sample_tracking.sequencing_status_source.cache = TTLCache(60)
+        # another user's request, sharing the process-wide sequencing status cache
+        other_sample_tracking = copy(self.monocle_sample_tracking)
+
+        batch_sample_ids = []
+        for this_sample_tracking in [self.monocle_sample_tracking, other_sample_tracking]:
+            this_sample_tracking.sequencing_status_data = None
+            batch_sample_ids.append(this_sample_tracking.get_batch_sample_ids())
+
+        self.assertEqual(2, mock_seq_samples_query.call_count)
+        self.assertEqual(batch_sample_ids[0], batch_sample_ids[1])
+        self.assertIsNot(batch_sample_ids[0], batch_sample_ids[1])
+        for this_institution in ["FakOne", "FakTwo"]:
+            self.assertIs(batch_sample_ids[0][this_institution], batch_sample_ids[1][this_institution])
+
     @patch.dict(environ, mock_environment, clear=True)
     def test_sequencing_status_summary(self):
         seq_status_summary = self.monocle_sample_tracking.sequencing_status_summary()
@@ -442,6 +560,73 @@ class MonocleSampleTrackingTest(TestCase):
         # logging.critical("\nEXPECTED:\n{}\nGOT:\n{}".format(self.expected_pipeline_summary, pipeline_summary))
         self.assertEqual(self.expected_dropout_data, pipeline_summary)
 
+    @patch.dict(environ, mock_environment, clear=True)
+    def test_create_dashboard_snapshot(self):
+        self.addCleanup(setattr, self.monocle_sample_tracking, "use_dashboard_snapshot", True)
+        # a snapshot that exists already must not be used
+        self.monocle_sample_tracking.dashboard_snapshot = self.mock_dashboard_snapshot()
+        self.addCleanup(setattr, self.monocle_sample_tracking, "dashboard_snapshot", None)
+
+        snapshot = self.monocle_sample_tracking.create_dashboard_snapshot()
+
+        self.assertEqual(
+            {
+                "batches": self.expected_batches,
+                "progress": self.expected_progress_data,
+                "sequencing_status": self.expected_seq_summary,
+                "pipeline_status": self.expected_pipeline_summary,
+            },
+            snapshot,
+        )
+
+    def test_create_dashboard_snapshot_rejects_user_record(self):
+        self.monocle_sample_tracking.user_record = {"memberOf": []}
+        self.addCleanup(setattr, self.monocle_sample_tracking, "user_record", None)
+
+        with self.assertRaises(ValueError):
+            self.monocle_sample_tracking.create_dashboard_snapshot()
+
+    def test_dashboard_data_from_snapshot(self):
+        self.monocle_sample_tracking.dashboard_snapshot = self.mock_dashboard_snapshot()
+        self.addCleanup(setattr, self.monocle_sample_tracking, "dashboard_snapshot", None)
+        self.addCleanup(setattr, self.monocle_sample_tracking, "dashboard_snapshot_used", False)
+
+        self.assertIsNone(self.monocle_sample_tracking.dashboard_snapshot_age())
+        # data for institutions other than those returned by get_institutions() should be excluded
+        self.assertEqual({"FakOne": "batches 1", "FakTwo": "batches 2"}, self.monocle_sample_tracking.get_batches())
+        self.assertEqual(
+            {"FakOne": "sequencing 1", "FakTwo": "sequencing 2"},
+            self.monocle_sample_tracking.sequencing_status_summary(),
+        )
+        self.assertEqual(
+            {"FakOne": "pipeline 1", "FakTwo": "pipeline 2"}, self.monocle_sample_tracking.pipeline_status_summary()
+        )
+        self.assertEqual("project progress", self.monocle_sample_tracking.get_progress())
+        self.assertAlmostEqual(600, self.monocle_sample_tracking.dashboard_snapshot_age(), delta=10)
+
+    @patch.dict(environ, mock_environment, clear=True)
+    def test_dashboard_data_not_from_snapshot_if_institution_missing(self):
+        snapshot = self.mock_dashboard_snapshot()
+        del snapshot["batches"]["FakTwo"]
+        self.monocle_sample_tracking.dashboard_snapshot = snapshot
+        self.addCleanup(setattr, self.monocle_sample_tracking, "dashboard_snapshot", None)
+
+        batches_data = self.monocle_sample_tracking.get_batches()
+
+        self.assertEqual(self.expected_batches, batches_data)
+        self.assertIsNone(self.monocle_sample_tracking.dashboard_snapshot_age())
+
+    def mock_dashboard_snapshot(self):
+        return {
+            "format_version": 1,
+            "project": self.mock_project_id,
+            "created": (datetime.now() - timedelta(seconds=600)).isoformat(),
+            "batches": {"FakOne": "batches 1", "FakTwo": "batches 2", "FakThree": "batches 3"},
+            "progress": "project progress",
+            "sequencing_status": {"FakOne": "sequencing 1", "FakTwo": "sequencing 2", "FakThree": "sequencing 3"},
+            "pipeline_status": {"FakOne": "pipeline 1", "FakTwo": "pipeline 2", "FakThree": "pipeline 3"},
+        }
+
     def test_project_information_rejects_if_no_project_given(self):
         self.monocle_sample_tracking.current_project = None
 
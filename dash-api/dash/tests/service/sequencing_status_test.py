@@ -1,9 +1,13 @@
+import json
 import logging
+from threading import Event, Thread
+from time import sleep, time
 from unittest import TestCase
-from unittest.mock import patch
-from urllib.error import URLError
+from unittest.mock import Mock, patch
+from urllib.error import HTTPError, URLError
 
 from DataSources.sequencing_status import MLWH_Client, ProtocolError, SequencingStatus
+from utils.cache import TTLCache
 
 logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
 
@@ -214,6 +218,142 @@ class SequencingStatusTest(TestCase):
                         msg="lane item {} is wrong type".format(required),
                     )
 
+    def mock_find_by_ids_response(self, endpoint, post_data=None):
+        return json.dumps({"samples": [{"id": this_sample_id, "lanes": []} for this_sample_id in post_data]})
+
+    @patch.object(MLWH_Client, "make_request")
+    def test_get_multiple_samples_in_chunks(self, mock_request):
+        mock_request.side_effect = self.mock_find_by_ids_response
+        self.seq_status.mlwh_client.config["find_by_ids_chunk_size"] = 2
+        self.seq_status.mlwh_client.config["find_by_ids_max_concurrent_chunks"] = 2
+        sample_ids = ["sample_{}".format(i) for i in range(5)]
+
+        samples = self.seq_status.get_multiple_samples(sample_ids)
+
+        self.assertEqual(3, mock_request.call_count)
+        for this_call in mock_request.call_args_list:
+            self.assertLessEqual(len(this_call[1]["post_data"]), 2)
+        self.assertEqual(set(sample_ids), set(samples))
+
+    @patch("DataSources.sequencing_status.sleep")
+    @patch.object(MLWH_Client, "make_request")
+    def test_failed_chunk_is_retried(self, mock_request, mock_sleep):
+        failures = [HTTPError("/nowhere", 503, "unavailable", {}, None)]
+
+        def make_request(endpoint, post_data=None):
+            if "sample_2" in post_data and failures:
+                raise failures.pop()
+            return self.mock_find_by_ids_response(endpoint, post_data=post_data)
+
+        mock_request.side_effect = make_request
+        self.seq_status.mlwh_client.config["find_by_ids_chunk_size"] = 2
+        self.seq_status.mlwh_client.config["find_by_ids_retries"] = 1
+        sample_ids = ["sample_{}".format(i) for i in range(5)]
+
+        samples = self.seq_status.get_multiple_samples(sample_ids)
+
+        self.assertEqual(4, mock_request.call_count)
+        mock_sleep.assert_called_once()
+        self.assertEqual(set(sample_ids), set(samples))
+
+    @patch("DataSources.sequencing_status.sleep")
+    @patch.object(MLWH_Client, "make_request")
+    def test_chunk_failure_raised_when_retries_exhausted(self, mock_request, mock_sleep):
+        mock_request.side_effect = HTTPError("/nowhere", 500, "server error", {}, None)
+        self.seq_status.mlwh_client.config["find_by_ids_chunk_size"] = 2
+        self.seq_status.mlwh_client.config["find_by_ids_retries"] = 2
+
+        with self.assertRaises(HTTPError):
+            self.seq_status.get_multiple_samples(["sample_{}".format(i) for i in range(5)])
+        self.assertEqual(3, mock_request.call_count)
+
+    @patch.object(MLWH_Client, "make_request")
+    def test_client_error_is_not_retried(self, mock_request):
+        mock_request.side_effect = HTTPError("/nowhere", 400, "bad request", {}, None)
+        self.seq_status.mlwh_client.config["find_by_ids_retries"] = 2
+
+        with self.assertRaises(HTTPError):
+            self.seq_status.get_multiple_samples(self.expected_sample_ids)
+        mock_request.assert_called_once()
+
+    @patch.object(MLWH_Client, "make_request")
+    def test_get_institution_samples_uses_cache(self, mock_request):
+        mock_request.return_value = self.mock_get_multiple_samples
+        self.seq_status.cache = TTLCache(60)
+
+        first = self.seq_status.get_institution_samples("juno", "FakOne", self.expected_sample_ids)
+        second = self.seq_status.get_institution_samples("juno", "FakOne", list(reversed(self.expected_sample_ids)))
+
+        self.assertEqual(first, second)
+        mock_request.assert_called_once()
+
+    @patch.object(MLWH_Client, "make_request")
+    def test_get_institution_samples_cache_miss_on_different_samples(self, mock_request):
+        mock_request.return_value = self.mock_get_multiple_samples
+        self.seq_status.cache = TTLCache(60)
+
+        self.seq_status.get_institution_samples("juno", "FakOne", self.expected_sample_ids)
+        self.seq_status.get_institution_samples("juno", "FakOne", self.expected_sample_ids[:1])
+        self.seq_status.get_institution_samples("juno", "FakTwo", self.expected_sample_ids)
+
+        self.assertEqual(3, mock_request.call_count)
+
+    @patch.object(MLWH_Client, "make_request")
+    def test_get_institution_samples_concurrent_cache_misses(self, mock_request):
+        mlwh_request_started = Event()
+        release_mlwh_request = Event()
+
+        def slow_request(*args, **kwargs):
+            mlwh_request_started.set()
+            release_mlwh_request.wait(10)
+            return self.mock_get_multiple_samples
+
+        mock_request.side_effect = slow_request
+        self.seq_status.cache = TTLCache(60)
+        results = []
+
+        def get_institution_samples():
+            results.append(self.seq_status.get_institution_samples("juno", "FakOne", self.expected_sample_ids))
+
+        threads = [Thread(target=get_institution_samples) for _ in range(3)]
+        threads[0].start()
+        mlwh_request_started.wait(10)
+        for thread in threads[1:]:
+            thread.start()
+        # wait until the other threads are waiting for the first one's MLWH request
+        start = time()
+        while self.seq_status.cache._loading[("juno", "FakOne")][1] < len(threads) and time() - start < 10:
+            sleep(0.01)
+        release_mlwh_request.set()
+        for thread in threads:
+            thread.join(10)
+
+        mock_request.assert_called_once()
+        self.assertEqual(3, len(results))
+        self.assertTrue(all(results[0] == result for result in results))
+
+    @patch.object(MLWH_Client, "make_request")
+    def test_get_institution_samples_entry_derived_data_kept_with_cache_entry(self, mock_request):
+        mock_request.return_value = self.mock_get_multiple_samples
+        self.seq_status.cache = TTLCache(60)
+        build = Mock(return_value={"derived": "data"})
+
+        first = self.seq_status.get_institution_samples_entry("juno", "FakOne", self.expected_sample_ids)
+        second = self.seq_status.get_institution_samples_entry("juno", "FakOne", self.expected_sample_ids)
+
+        self.assertIs(first, second)
+        self.assertIs(first.derived("derived", build), second.derived("derived", build))
+        build.assert_called_once_with(first.samples)
+
+    @patch.object(MLWH_Client, "make_request")
+    def test_get_institution_samples_without_cache(self, mock_request):
+        mock_request.return_value = self.mock_get_multiple_samples
+
+        self.seq_status.get_institution_samples("juno", "FakOne", self.expected_sample_ids)
+        self.seq_status.get_institution_samples("juno", "FakOne", self.expected_sample_ids)
+
+        self.assertEqual(2, mock_request.call_count)
+
     @patch.object(MLWH_Client, "make_request")
     def test_reject_bad_get_sample_response(self, mock_request):
         with self.assertRaises(ProtocolError):
@@ -0,0 +1,34 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from dash.api.service.service_factory import UserService, _get_user_record
+from flask import Flask
+
+MOCK_USER_RECORD = {"username": "mock_user", "memberOf": [], "projects": ["juno"]}
+
+
+@patch("dash.api.service.service_factory.MonocleUser")
+class ServiceFactoryTest(TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    @patch("DataSources.user_data.UserData")
+    def test_user_record_is_looked_up_once_per_request(self, _user_data_mock, monocle_user_mock):
+        monocle_user_mock.return_value.record = MOCK_USER_RECORD
+
+        with self.app.test_request_context():
+            user_records = [_get_user_record("mock_user"), UserService("mock_user").user_details]
+        with self.app.test_request_context():
+            user_records.append(_get_user_record("mock_user"))
+
+        self.assertEqual([MOCK_USER_RECORD] * 3, user_records)
+        # once for each request
+        self.assertEqual(2, monocle_user_mock.call_count)
+
+    def test_user_record_outside_a_request(self, monocle_user_mock):
+        monocle_user_mock.return_value.record = MOCK_USER_RECORD
+
+        self.assertEqual(MOCK_USER_RECORD, _get_user_record("mock_user"))
+        self.assertEqual(MOCK_USER_RECORD, _get_user_record("mock_user"))
+
+        self.assertEqual(2, monocle_user_mock.call_count)
@@ -1,9 +1,12 @@
 import logging
+from os import environ
 from unittest import TestCase
-from unittest.mock import call, patch
+from unittest.mock import patch
 
 from dash.api.exceptions import LdapDataError
-from DataSources.user_data import UserAuthentication, UserData
+from dash.api.utils.cache import TTLCache
+from dash.api.utils.session_token import SessionTokens
+from DataSources.user_data import UserAuthentication, UserData, invalidate_user_details
 
 logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
 
@@ -38,6 +41,26 @@ class MonocleUserAuthenticationTest(TestCase):
         actual_username = self.userauth.get_username_from_token(mock_token)
         self.assertEqual(expected_username, actual_username)
 
+    @patch.dict(environ, {}, clear=True)
+    def test_session_tokens_not_enabled_by_default(self):
+        self.assertFalse(UserAuthentication().session_tokens_enabled())
+
+    @patch.dict(environ, {"SESSION_TOKEN_SECRET_KEY": "mock_secret_key"}, clear=True)
+    def test_session_token(self):
+        userauth = UserAuthentication()
+        user_details = {"username": "test_user", "memberOf": [], "projects": ["juno"]}
+
+        session_token = userauth.get_session_token(user_details)
+
+        self.assertTrue(userauth.session_tokens_enabled())
+        self.assertEqual(user_details, userauth.get_user_details_from_session_token(session_token))
+
+    @patch.dict(environ, {"SESSION_TOKEN_SECRET_KEY": "mock_secret_key"}, clear=True)
+    def test_session_token_without_username_is_rejected(self):
+        session_token = SessionTokens("mock_secret_key").issue({"memberOf": [], "projects": ["juno"]})
+
+        self.assertIsNone(UserAuthentication().get_user_details_from_session_token(session_token))
+
 
 class MonocleUserDataTest(TestCase):
 
@@ -164,6 +187,9 @@ class MonocleUserDataTest(TestCase):
         self.user_data = UserData(set_up=False)
         self.user_data.set_up(self.test_config)
 
+    def find_mock_groups(self, gids, group_object_config_key, required_attributes):
+        return {gid: self.mock_ldap_result_group for gid in gids}
+
     def test_init(self):
         for expected_config_key in self.expected_config_keys:
             expected_config_value = self.user_data.config[expected_config_key]
@@ -191,37 +217,37 @@ class MonocleUserDataTest(TestCase):
         user_ldap_result = self.user_data.ldap_search_user_by_username("any_valid_string")
         self.assertIsInstance(user_ldap_result, tuple)
 
-    @patch.object(UserData, "ldap_search_group_by_gid")
+    @patch.object(UserData, "ldap_search_groups_by_gids")
     @patch.object(UserData, "ldap_search_user_by_username")
     def test_get_user_details(self, mock_user_query, mock_group_query):
         # reject search that finds no user (should never happen: search should only be done after authentication)
         with self.assertRaises(LdapDataError):
             mock_user_query.return_value = None
-            mock_group_query.return_value = self.mock_ldap_result_group
+            mock_group_query.side_effect = self.find_mock_groups
             user_details = self.user_data.get_user_details("mock_does_not_exist")
         # reject user record with uid attribute that doesn't match search term
         with self.assertRaises(LdapDataError):
             mock_user_query.return_value = self.mock_ldap_result_user
-            mock_group_query.return_value = self.mock_ldap_result_group
+            mock_group_query.side_effect = self.find_mock_groups
             user_details = self.user_data.get_user_details("some_other_user")
         # reject user record with empty project attribute
         with self.assertRaises(LdapDataError):
             mock_user_query.return_value = self.mock_ldap_result_user_empty_businessCategory
-            mock_group_query.return_value = self.mock_ldap_result_group
+            mock_group_query.side_effect = self.find_mock_groups
             user_details = self.user_data.get_user_details("mock_user_empty_projects")
         # reject user record with empty membership attribute
         with self.assertRaises(LdapDataError):
             mock_user_query.return_value = self.mock_ldap_result_user_empty_o
-            mock_group_query.return_value = self.mock_ldap_result_group
+            mock_group_query.side_effect = self.find_mock_groups
             user_details = self.user_data.get_user_details("mock_user_empty_o")
         # reject user record with membership of non-existent group
         with self.assertRaises(LdapDataError):
             mock_user_query.return_value = self.mock_ldap_result_user
-            mock_group_query.return_value = None
+            mock_group_query.side_effect = lambda *args: {}
             user_details = self.user_data.get_user_details("mock_user")
         # now test a working search, to check data returned are correct
         mock_user_query.return_value = self.mock_ldap_result_user
-        mock_group_query.return_value = self.mock_ldap_result_group
+        mock_group_query.side_effect = self.find_mock_groups
         user_details = self.user_data.get_user_details("mock_user")
         # data structure
         self.assertIsInstance(user_details, dict)
@@ -239,27 +265,85 @@ class MonocleUserDataTest(TestCase):
         self.assertEqual("Wellcome Sanger Institute", user_details["memberOf"][0]["inst_name"])
         self.assertEqual(["UK"], user_details["memberOf"][0]["country_names"])
 
-    @patch.object(UserData, "ldap_search_group_by_gid")
+    @patch.object(UserData, "ldap_bind_as")
+    @patch.object(UserData, "ldap_search_user_by_username")
+    def test_verify_password(self, mock_user_query, mock_bind):
+        mock_user_query.return_value = self.mock_ldap_result_user
+        mock_bind.return_value = True
+
+        self.assertTrue(self.user_data.verify_password("mock_user", "secret"))
+        mock_bind.assert_called_once_with(self.mock_ldap_result_user[0], "secret")
+
+    @patch.object(UserData, "ldap_bind_as")
+    @patch.object(UserData, "ldap_search_user_by_username")
+    def test_verify_password_of_unknown_user(self, mock_user_query, mock_bind):
+        mock_user_query.return_value = None
+
+        self.assertFalse(self.user_data.verify_password("no_such_user", "secret"))
+        mock_bind.assert_not_called()
+
+    @patch("DataSources.user_data._user_details_cache", TTLCache(60))
+    @patch.object(UserData, "ldap_search_groups_by_gids")
+    @patch.object(UserData, "ldap_search_user_by_username")
+    def test_get_user_details_are_cached(self, mock_user_query, mock_group_query):
+        mock_user_query.return_value = self.mock_ldap_result_user
+        mock_group_query.side_effect = self.find_mock_groups
+
+        user_details = self.user_data.get_user_details("mock_user")
+        user_details["memberOf"].clear()
+        cached_user_details = self.user_data.get_user_details("mock_user")
+
+        mock_user_query.assert_called_once()
+        # the cached details aren't changed by changes to those returned
+        self.assertEqual("WelSanIns", cached_user_details["memberOf"][0]["inst_id"])
+
+    @patch("DataSources.user_data._user_details_cache", TTLCache(60))
+    @patch.object(UserData, "ldap_search_groups_by_gids")
+    @patch.object(UserData, "ldap_search_user_by_username")
+    def test_invalidate_user_details(self, mock_user_query, mock_group_query):
+        mock_user_query.return_value = self.mock_ldap_result_user
+        mock_group_query.side_effect = self.find_mock_groups
+        self.user_data.get_user_details("mock_user")
+
+        invalidate_user_details("mock_user")
+        self.user_data.get_user_details("mock_user")
+
+        self.assertEqual(2, mock_user_query.call_count)
+
+    @patch("DataSources.user_data._user_details_cache", None)
+    @patch.object(UserData, "ldap_search_groups_by_gids")
+    @patch.object(UserData, "ldap_search_user_by_username")
+    def test_get_user_details_are_not_cached_by_default(self, mock_user_query, mock_group_query):
+        mock_user_query.return_value = self.mock_ldap_result_user
+        mock_group_query.side_effect = self.find_mock_groups
+
+        self.user_data.get_user_details("mock_user")
+        self.user_data.get_user_details("mock_user")
+
+        self.assertEqual(2, mock_user_query.call_count)
+
+    @patch.object(UserData, "ldap_search_groups_by_gids")
     @patch.object(UserData, "ldap_search_user_by_username")
     def test_get_user_details_calls_group_search_with_expected_args(self, mock_user_query, mock_group_query):
         mock_user_query.return_value = self.mock_ldap_result_user
-        mock_group_query.return_value = self.mock_ldap_result_group
+        mock_group_query.side_effect = self.find_mock_groups
 
         self.user_data.get_user_details("mock_user")
 
         expected_group_object_config_key = "user_group_obj"
         expected_attributes = ["cn", "description", "memberUid"]
-        expected_group_search_calls = [
-            call(org_gid_bytes.decode("UTF-8"), expected_group_object_config_key, expected_attributes)
-            for org_gid_bytes in self.mock_ldap_result_user[1]["o"]
-        ]
-        mock_group_query.assert_has_calls(expected_group_search_calls)
+        # all the user's groups are searched for at once
+        mock_group_query.assert_called_once_with(
+            [org_gid_bytes.decode("UTF-8") for org_gid_bytes in self.mock_ldap_result_user[1]["o"]],
+            expected_group_object_config_key,
+            expected_attributes,
+        )
 
-    @patch.object(UserData, "ldap_search_group_by_gid")
+    @patch.object(UserData, "ldap_search_groups_by_gids")
     @patch.object(UserData, "ldap_search_user_by_username")
     def test_get_user_details_no_employee_type(self, mock_user_query, mock_group_query):
         mock_user_query.return_value = self.mock_ldap_result_user_no_type
-        mock_group_query.return_value = self.mock_ldap_result_group
+        mock_group_query.side_effect = self.find_mock_groups
         user_details = self.user_data.get_user_details("mock_user_no_type")
         self.assertEqual("mock_user_no_type", user_details["username"])
         with self.assertRaises(KeyError):
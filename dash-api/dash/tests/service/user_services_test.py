@@ -24,6 +24,28 @@ class MonocleAuthenticationTest(TestCase):
         self.assertIsInstance(auth_token, type("a string"))
         self.assertEqual(auth_token, self.mock_auth_token)
 
+    @patch("DataSources.user_data.UserData")
+    @patch.object(UserAuthentication, "get_session_token")
+    def test_get_session_token(self, mock_get_session_token, mock_user_data):
+        mock_user_data.return_value.verify_password.return_value = True
+        mock_user_data.return_value.get_user_details.return_value = {"username": self.mock_username}
+        mock_get_session_token.return_value = self.mock_auth_token
+
+        session_token = self.auth.get_session_token(self.mock_username, self.mock_password)
+
+        self.assertEqual(self.mock_auth_token, session_token)
+        mock_user_data.return_value.verify_password.assert_called_once_with(self.mock_username, self.mock_password)
+        mock_get_session_token.assert_called_once_with({"username": self.mock_username})
+
+    @patch("DataSources.user_data.UserData")
+    @patch.object(UserAuthentication, "get_session_token")
+    def test_get_session_token_with_invalid_credentials(self, mock_get_session_token, mock_user_data):
+        mock_user_data.return_value.verify_password.return_value = False
+
+        self.assertIsNone(self.auth.get_session_token(self.mock_username, self.mock_password))
+        mock_user_data.return_value.get_user_details.assert_not_called()
+        mock_get_session_token.assert_not_called()
+
 
 class MonocleUserTest(TestCase):
 
@@ -58,14 +80,17 @@ class MonocleUserTest(TestCase):
         self.user = MonocleUser(set_up=False)
         self.user.user_data.set_up(self.test_config)
 
+    def find_mock_groups(self, gids, group_object_config_key, required_attributes):
+        return {gid: self.mock_ldap_result_group for gid in gids}
+
     def test_init(self):
         self.assertIsInstance(self.user, MonocleUser)
 
-    @patch.object(UserData, "ldap_search_group_by_gid")
+    @patch.object(UserData, "ldap_search_groups_by_gids")
     @patch.object(UserData, "ldap_search_user_by_username")
     def test_load_user_record(self, mock_user_query, mock_group_query):
         mock_user_query.return_value = self.mock_ldap_result_user
-        mock_group_query.return_value = self.mock_ldap_result_group
+        mock_group_query.side_effect = self.find_mock_groups
         user_record = self.user.load_user_record("mock_user")
         self.assertIsInstance(user_record, type({"a": "dict"}))
         self.assertIsInstance(user_record, type({"a": "dict"}))
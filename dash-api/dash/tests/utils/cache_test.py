@@ -0,0 +1,111 @@
+from threading import Barrier, Event, Thread
+from unittest import TestCase
+
+from utils.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(10, max_entries=2, clock=self.clock)
+
+    def test_get_returns_stored_value(self):
+        self.cache.set("a", 1)
+
+        self.assertEqual(1, self.cache.get("a"))
+
+    def test_get_returns_default_for_missing_key(self):
+        self.assertEqual("default", self.cache.get("nope", "default"))
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.set("a", 1)
+        self.clock.now = 10
+
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(0, len(self.cache))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+
+        self.assertEqual(1, self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(3, self.cache.get("c"))
+
+    def test_invalidate(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+
+        self.cache.invalidate("a")
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(2, self.cache.get("b"))
+
+        self.cache.invalidate()
+        self.assertEqual(0, len(self.cache))
+
+    def test_zero_ttl_disables_cache(self):
+        cache = TTLCache(0)
+
+        cache.set("a", 1)
+
+        self.assertFalse(cache.enabled)
+        self.assertIsNone(cache.get("a"))
+
+    def test_get_or_load_loads_missing_value(self):
+        self.assertEqual(1, self.cache.get_or_load("a", lambda: 1))
+        self.assertEqual(1, self.cache.get_or_load("a", lambda: 2))
+        self.assertEqual(3, self.cache.get_or_load("a", lambda: 3, is_valid=lambda value: value > 1))
+
+    def test_get_or_load_loads_each_key_once_at_a_time(self):
+        cache = TTLCache(60)
+        num_threads = 4
+        all_waiting = Barrier(num_threads + 1)
+        release_load = Event()
+        loads = []
+
+        def load():
+            loads.append(1)
+            release_load.wait(10)
+            return "value"
+
+        def get():
+            all_waiting.wait(10)
+            results.append(cache.get_or_load("a", load))
+
+        results = []
+        threads = [Thread(target=get) for _ in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        all_waiting.wait(10)
+        release_load.set()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(1, len(loads))
+        self.assertEqual(["value"] * num_threads, results)
+        self.assertEqual({}, cache._loading)
+
+    def test_get_or_load_is_retried_after_failure(self):
+        def fail():
+            raise RuntimeError("load failed")
+
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_load("a", fail)
+
+        self.assertEqual(1, self.cache.get_or_load("a", lambda: 1))
+
+    def test_get_or_load_with_cache_disabled(self):
+        cache = TTLCache(0)
+
+        self.assertEqual(1, cache.get_or_load("a", lambda: 1))
+        self.assertEqual(2, cache.get_or_load("a", lambda: 2))
@@ -0,0 +1,61 @@
+import logging
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from utils.file_probe import FileProbe
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+NUM_FILES = 20
+
+
+class TestFileProbe(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.files = []
+        for i in range(NUM_FILES):
+            this_file = Path(self.temp_dir.name, "lane_{}.fa".format(i))
+            this_file.write_bytes(b"A" * i)
+            self.files.append(this_file)
+        self.non_existent_file = Path(self.temp_dir.name, "non-existent.file")
+
+    def test_sizes(self):
+        sizes = FileProbe(workers=4, cache_ttl_seconds=0).sizes(self.files + [self.non_existent_file])
+
+        expected_sizes = {this_file: i for i, this_file in enumerate(self.files)}
+        self.assertEqual({**expected_sizes, self.non_existent_file: None}, sizes)
+
+    def test_size(self):
+        file_probe = FileProbe(workers=4, cache_ttl_seconds=0)
+
+        self.assertEqual(3, file_probe.size(self.files[3]))
+        self.assertIsNone(file_probe.size(self.non_existent_file))
+
+    def test_file_in_non_existent_directory(self):
+        self.assertIsNone(FileProbe(workers=4, cache_ttl_seconds=0).size(Path(self.files[0], "lane.fa")))
+
+    def test_results_are_cached(self):
+        file_probe = FileProbe(workers=4, cache_ttl_seconds=60)
+        file_probe.sizes(self.files + [self.non_existent_file])
+
+        with patch("os.stat", side_effect=AssertionError("file stat'ed again")):
+            sizes = file_probe.sizes(self.files + [self.non_existent_file])
+
+        self.assertEqual(NUM_FILES - 1, sizes[self.files[-1]])
+        self.assertIsNone(sizes[self.non_existent_file])
+
+    def test_results_not_cached_if_ttl_is_0(self):
+        file_probe = FileProbe(workers=4, cache_ttl_seconds=0)
+        file_probe.size(self.files[1])
+        os.truncate(self.files[1], 0)
+
+        self.assertEqual(0, file_probe.size(self.files[1]))
+
+    def test_errors_other_than_no_such_file_are_raised(self):
+        with patch("os.stat", side_effect=PermissionError("permission denied")):
+            with self.assertRaises(PermissionError):
+                FileProbe(workers=4, cache_ttl_seconds=60).sizes(self.files)
@@ -1,10 +1,12 @@
 from functools import reduce
-from pathlib import PurePath
+from pathlib import Path, PurePath
+from tempfile import TemporaryDirectory
 from unittest import TestCase
-from unittest.mock import Mock, create_autospec
-from zipfile import ZIP_DEFLATED, ZipFile
+from unittest.mock import Mock, call, create_autospec
+from zipfile import ZipFile
 
-from utils.file import WRITE_MODE, ZIP_COMPRESSION_LEVEL, complete_zipfile, format_file_size, zip_files
+from utils.file import complete_zipfile, format_file_size, stream_zip_files, zip_files
+from utils.zip_writer import StoredZipWriter
 
 PUBLIC_NAME_TO_LANE_FILES = {
     "pub_name_1": [PurePath("a_file.txt"), PurePath("another_file.fastq")],
@@ -20,7 +22,7 @@ EMPTY_ZIP_FILE = "dash/tests/mock_data/zip/empty.zip"
 
 class TestFileUtil(TestCase):
 
-    ZipFileMock = create_autospec(ZipFile)
+    ZipFileMock = create_autospec(StoredZipWriter)
 
     def tearDown(self):
         self.ZipFileMock.reset_mock()
@@ -62,9 +64,7 @@ class TestFileUtil(TestCase):
         )
 
         expected_zip_file_full_name = PurePath(location) / ZIP_FILE_NAME
-        self.ZipFileMock.assert_called_once_with(
-            expected_zip_file_full_name, mode=WRITE_MODE, compression=ZIP_DEFLATED, compresslevel=ZIP_COMPRESSION_LEVEL
-        )
+        self.ZipFileMock.assert_called_once_with(expected_zip_file_full_name)
         num_files = reduce(lambda accum, lane_files: accum + len(lane_files), PUBLIC_NAME_TO_LANE_FILES.values(), 0)
         self.assertEqual(zipfile_instance.write.call_count, num_files)
         for public_name, files in PUBLIC_NAME_TO_LANE_FILES.items():
@@ -79,29 +79,93 @@ class TestFileUtil(TestCase):
         zip_files(PUBLIC_NAME_TO_LANE_FILES, basename=BASENAME, injected_zip_file_lib=self.ZipFileMock)
 
         expected_zip_file_full_name = PurePath(".") / ZIP_FILE_NAME
-        self.ZipFileMock.assert_called_once_with(
-            expected_zip_file_full_name, mode=WRITE_MODE, compression=ZIP_DEFLATED, compresslevel=ZIP_COMPRESSION_LEVEL
-        )
+        self.ZipFileMock.assert_called_once_with(expected_zip_file_full_name)
         num_files = 4
         zipfile_instance.write("non-existent.file")
         self.assertEqual(zipfile_instance.write.call_count, num_files + 1)
 
+    def test_zip_files_reports_progress(self):
+        progress_callback = Mock()
+
+        zip_files(
+            PUBLIC_NAME_TO_LANE_FILES,
+            basename=BASENAME,
+            injected_zip_file_lib=self.ZipFileMock,
+            progress_callback=progress_callback,
+        )
+
+        self.assertEqual([call(1, 4), call(2, 4), call(3, 4), call(4, 4)], progress_callback.call_args_list)
+
+    def test_zip_files_with_read_ahead(self):
+        with TemporaryDirectory() as temp_dir:
+            dir_name_to_files = {}
+            for public_name in ("pub_name_1", "pub_name_2"):
+                dir_name_to_files[public_name] = []
+                for file_name in ("{}.fa".format(public_name), "{}.gff".format(public_name)):
+                    this_file = Path(temp_dir, file_name)
+                    this_file.write_text(file_name)
+                    dir_name_to_files[public_name].append(this_file)
+            dir_name_to_files["pub_name_2"].append(Path(temp_dir, "non-existent.file"))
+
+            zip_files(
+                dir_name_to_files,
+                basename=BASENAME,
+                location=temp_dir,
+                read_ahead_config={"prefetch_depth": 2, "buffer_size": 1024},
+            )
+
+            with ZipFile(Path(temp_dir, ZIP_FILE_NAME)) as zip_file:
+                self.assertIsNone(zip_file.testzip())
+                self.assertEqual(
+                    [
+                        "pub_name_1/pub_name_1.fa",
+                        "pub_name_1/pub_name_1.gff",
+                        "pub_name_2/pub_name_2.fa",
+                        "pub_name_2/pub_name_2.gff",
+                    ],
+                    zip_file.namelist(),
+                )
+                self.assertEqual(b"pub_name_2.gff", zip_file.read("pub_name_2/pub_name_2.gff"))
+
+    def test_stream_zip_files(self):
+        for read_ahead_config in (None, {"prefetch_depth": 2, "buffer_size": 1024}):
+            with TemporaryDirectory() as temp_dir:
+                dir_name_to_files = {
+                    "pub_name_1": [Path(temp_dir, "lane_1.fa")],
+                    "pub_name_2": [Path(temp_dir, "lane_2.fa"), Path(temp_dir, "non-existent.file")],
+                }
+                Path(temp_dir, "lane_1.fa").write_text("lane_1")
+                Path(temp_dir, "lane_2.fa").write_text("lane_2")
+
+                chunks = stream_zip_files(dir_name_to_files, basename=BASENAME, read_ahead_config=read_ahead_config)
+                zip_file_name = Path(temp_dir, ZIP_FILE_NAME)
+                zip_file_name.write_bytes(b"".join(chunks))
+
+                with ZipFile(zip_file_name) as zip_file:
+                    self.assertIsNone(zip_file.testzip())
+                    self.assertEqual(["pub_name_1/lane_1.fa", "pub_name_2/lane_2.fa"], zip_file.namelist())
+                    self.assertEqual(b"lane_2", zip_file.read("pub_name_2/lane_2.fa"))
+
+    def test_stream_zip_files_empty_archive(self):
+        with TemporaryDirectory() as temp_dir:
+            zip_file_name = Path(temp_dir, ZIP_FILE_NAME)
+            zip_file_name.write_bytes(b"".join(stream_zip_files({}, basename=BASENAME)))
+
+            with ZipFile(zip_file_name) as zip_file:
+                self.assertEqual([], zip_file.namelist())
+
     def test_zip_files_to_current_folder_if_no_location_given(self):
         zip_files(PUBLIC_NAME_TO_LANE_FILES, basename=BASENAME, injected_zip_file_lib=self.ZipFileMock)
 
         expected_zip_file_full_name = PurePath(".") / ZIP_FILE_NAME
-        self.ZipFileMock.assert_called_once_with(
-            expected_zip_file_full_name, mode=WRITE_MODE, compression=ZIP_DEFLATED, compresslevel=ZIP_COMPRESSION_LEVEL
-        )
+        self.ZipFileMock.assert_called_once_with(expected_zip_file_full_name)
 
     def test_zip_files_creates_empty_archive_if_no_files_passed(self):
         zip_files({}, basename=BASENAME, injected_zip_file_lib=self.ZipFileMock)
 
         expected_zip_file_full_name = PurePath(".") / ZIP_FILE_NAME
         # Instantiating `ZipFile` creates an empty ZIP archive even if `write()` isn't called.
-        self.ZipFileMock.assert_called_once_with(
-            expected_zip_file_full_name, mode=WRITE_MODE, compression=ZIP_DEFLATED, compresslevel=ZIP_COMPRESSION_LEVEL
-        )
+        self.ZipFileMock.assert_called_once_with(expected_zip_file_full_name)
 
     def test_complete_zipfile(self):
         self.assertTrue(complete_zipfile(GOOD_ZIP_FILE))
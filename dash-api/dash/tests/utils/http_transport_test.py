@@ -0,0 +1,123 @@
+import gzip
+import logging
+import threading
+import urllib.error
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+from unittest.mock import patch
+
+import utils.http_transport as http_transport
+from utils.http_transport import HttpTransport, shared_transport
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    client_ports = []
+
+    def do_GET(self):
+        MockApiHandler.client_ports.append(self.client_address[1])
+        if "/gzipped" == self.path:
+            self._respond(200, gzip.compress(b"compressed content"), {"Content-Encoding": "gzip"})
+        elif "/not_found" == self.path:
+            self._respond(404, b"no such thing")
+        else:
+            self._respond(200, b"plain content")
+
+    def do_POST(self):
+        MockApiHandler.client_ports.append(self.client_address[1])
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self._respond(200, body)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, body, headers={}):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class HttpTransportTest(TestCase):
+    def setUp(self):
+        MockApiHandler.client_ports = []
+        self.server = HTTPServer(("127.0.0.1", 0), MockApiHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.base_url = "http://127.0.0.1:{}".format(self.server.server_port)
+        self.transport = HttpTransport(connect_timeout=2, read_timeout=2, max_retries=0)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_request(self):
+        self.assertEqual(b"plain content", self.transport.request(self.base_url + "/anything"))
+
+    def test_post_request(self):
+        self.assertEqual(b"posted", self.transport.request(self.base_url + "/anything", data=b"posted"))
+
+    def test_connection_is_reused(self):
+        for _ in range(3):
+            self.transport.request(self.base_url + "/anything")
+        self.assertEqual(3, len(MockApiHandler.client_ports))
+        self.assertEqual(1, len(set(MockApiHandler.client_ports)), msg="expected all requests on one connection")
+
+    def test_gzipped_response_is_decoded(self):
+        self.assertEqual(b"compressed content", self.transport.request(self.base_url + "/gzipped"))
+
+    def test_error_status_raises_http_error(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.transport.request(self.base_url + "/not_found")
+        self.assertEqual(404, context.exception.code)
+        self.assertEqual(b"no such thing", context.exception.read())
+
+    def test_connection_still_usable_after_error_status(self):
+        with self.assertRaises(urllib.error.HTTPError):
+            self.transport.request(self.base_url + "/not_found")
+        self.assertEqual(b"plain content", self.transport.request(self.base_url + "/anything"))
+
+    def test_reject_unsupported_url(self):
+        with self.assertRaises(urllib.error.URLError):
+            self.transport.request("ftp://127.0.0.1/anything")
+
+    def test_connection_failure_raises_url_error(self):
+        port = self.server.server_port
+        self.tearDown()
+        with self.assertRaises(urllib.error.URLError):
+            HttpTransport(connect_timeout=2, read_timeout=2, max_retries=0).request(
+                "http://127.0.0.1:{}/anything".format(port)
+            )
+        self.setUp()
+
+    @patch.object(http_transport, "sleep")
+    def test_get_is_retried_after_unavailable_status(self, mock_sleep):
+        transport = HttpTransport(max_retries=2)
+        unavailable = urllib.error.HTTPError("/anything", 503, "unavailable", {}, None)
+        with patch.object(transport, "_request_once", side_effect=[unavailable, b"content"]) as mock_request_once:
+            self.assertEqual(b"content", transport.request(self.base_url + "/anything"))
+        self.assertEqual(2, mock_request_once.call_count)
+        mock_sleep.assert_called_once_with(http_transport.RETRY_BACKOFF_SECONDS)
+
+    @patch.object(http_transport, "sleep")
+    def test_post_is_not_retried(self, mock_sleep):
+        transport = HttpTransport(max_retries=2)
+        unavailable = urllib.error.HTTPError("/anything", 503, "unavailable", {}, None)
+        with patch.object(transport, "_request_once", side_effect=[unavailable, b"content"]) as mock_request_once:
+            with self.assertRaises(urllib.error.HTTPError):
+                transport.request(self.base_url + "/anything", data=b"posted")
+        self.assertEqual(1, mock_request_once.call_count)
+        mock_sleep.assert_not_called()
+
+    @patch.object(http_transport, "_shared_transport", None)
+    def test_shared_transport_uses_config(self):
+        transport = shared_transport({"http_client": {"read_timeout_seconds": 42, "max_retries": 5}})
+        self.assertEqual(42, transport.read_timeout)
+        self.assertEqual(5, transport.max_retries)
+        self.assertEqual(http_transport.DEFAULT_CONNECT_TIMEOUT_SECONDS, transport.connect_timeout)
+        self.assertIs(transport, shared_transport({}))
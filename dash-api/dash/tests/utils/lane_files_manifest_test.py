@@ -0,0 +1,70 @@
+import logging
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from utils.lane_files_manifest import (
+    LANE_FILES_MANIFEST_FILE_NAME,
+    LaneFilesManifests,
+    read_lane_files_manifest,
+    write_lane_files_manifest,
+)
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+INSTITUTION_KEY = "GenWel"
+PUBLIC_NAME = "SCN9A"
+FILE_ENTRY = {"size": 123, "mtime": 1.5, "crc32": 456}
+MANIFEST = {PUBLIC_NAME: {"lane_1": {"lane_1.contigs_spades.fa": FILE_ENTRY}, "lane_2": {}}}
+
+
+class TestLaneFilesManifest(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.institution_dir = Path(self.temp_dir.name, INSTITUTION_KEY)
+        self.institution_dir.mkdir()
+
+    def test_write_and_read(self):
+        write_lane_files_manifest(self.institution_dir, MANIFEST)
+
+        self.assertEqual(MANIFEST, read_lane_files_manifest(self.institution_dir))
+        self.assertEqual([LANE_FILES_MANIFEST_FILE_NAME], os.listdir(self.institution_dir))
+
+    def test_read_if_none(self):
+        self.assertIsNone(read_lane_files_manifest(self.institution_dir))
+
+    def test_read_if_unreadable(self):
+        Path(self.institution_dir, LANE_FILES_MANIFEST_FILE_NAME).write_text("{not json")
+
+        self.assertIsNone(read_lane_files_manifest(self.institution_dir))
+
+    def test_get_reloads_changed_manifest(self):
+        manifests = LaneFilesManifests()
+        write_lane_files_manifest(self.institution_dir, MANIFEST)
+        self.assertEqual(MANIFEST, manifests.get(self.institution_dir))
+
+        write_lane_files_manifest(self.institution_dir, {})
+        manifest_file = Path(self.institution_dir, LANE_FILES_MANIFEST_FILE_NAME)
+        os.utime(manifest_file, ns=(0, manifest_file.stat().st_mtime_ns + 1))
+
+        self.assertEqual({}, manifests.get(self.institution_dir))
+
+    def test_get_if_none(self):
+        self.assertIsNone(LaneFilesManifests().get(self.institution_dir))
+
+    def test_file_entry(self):
+        manifests = LaneFilesManifests()
+        write_lane_files_manifest(self.institution_dir, MANIFEST)
+
+        self.assertEqual(
+            FILE_ENTRY, manifests.file_entry(Path(self.institution_dir, PUBLIC_NAME, "lane_1.contigs_spades.fa"))
+        )
+        self.assertIsNone(manifests.file_entry(Path(self.institution_dir, PUBLIC_NAME, "lane_2.contigs_spades.fa")))
+        self.assertIsNone(manifests.file_entry(Path(self.institution_dir, "other", "lane_1.contigs_spades.fa")))
+
+    def test_file_entry_if_no_manifest(self):
+        self.assertIsNone(
+            LaneFilesManifests().file_entry(Path(self.institution_dir, PUBLIC_NAME, "lane_1.contigs_spades.fa"))
+        )
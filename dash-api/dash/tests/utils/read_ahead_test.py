@@ -0,0 +1,113 @@
+import logging
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event
+from time import sleep
+from unittest import TestCase
+from unittest.mock import patch
+
+from utils.read_ahead import ReadAheadFiles
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+NUM_FILES = 10
+FILE_SIZE = 10000
+WAIT_TIMEOUT_SECONDS = 10
+
+
+class TestReadAheadFiles(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.files = []
+        self.contents = []
+        for i in range(NUM_FILES):
+            this_file = Path(self.temp_dir.name, "file_{}".format(i))
+            content = os.urandom(FILE_SIZE + i)
+            this_file.write_bytes(content)
+            self.files.append(this_file)
+            self.contents.append(content)
+
+    def test_files_are_read_in_order(self):
+        read_ahead = ReadAheadFiles(self.files, prefetch_depth=3, buffer_size=4096, block_size=1024)
+
+        contents = [b"".join(prefetched_file.read_blocks()) for prefetched_file in read_ahead]
+
+        self.assertEqual(self.contents, contents)
+        self.assertEqual(sum(len(content) for content in self.contents), read_ahead.bytes_read)
+
+    def test_stat(self):
+        prefetched_files = iter(ReadAheadFiles(self.files, prefetch_depth=2))
+
+        prefetched_file = next(prefetched_files)
+
+        self.assertEqual(self.files[0], prefetched_file.path)
+        self.assertEqual(FILE_SIZE, prefetched_file.stat().st_size)
+
+    def test_files_bigger_than_buffer(self):
+        read_ahead = ReadAheadFiles(self.files, prefetch_depth=4, buffer_size=10, block_size=100)
+
+        contents = [b"".join(prefetched_file.read_blocks()) for prefetched_file in read_ahead]
+
+        self.assertEqual(self.contents, contents)
+
+    def test_memory_use_is_bounded_with_slow_consumer(self):
+        block_size = 1024
+        buffer_size = 4 * block_size
+        big_file = Path(self.temp_dir.name, "big_file")
+        big_file.write_bytes(os.urandom(64 * block_size))
+        read_ahead = ReadAheadFiles(
+            [big_file] + self.files, prefetch_depth=3, buffer_size=buffer_size, block_size=block_size
+        )
+        max_used = 0
+
+        for prefetched_file in read_ahead:
+            for _ in prefetched_file.read_blocks():
+                # give the readers time to read as far ahead as they are allowed to
+                sleep(0.005)
+                max_used = max(max_used, read_ahead._budget._used)
+
+        self.assertLessEqual(max_used, buffer_size + block_size)
+        self.assertEqual(0, read_ahead._budget._used)
+
+    def test_non_existent_file(self):
+        files = [self.files[0], Path(self.temp_dir.name, "non-existent.file"), self.files[1]]
+        contents = []
+
+        for prefetched_file in ReadAheadFiles(files, prefetch_depth=2):
+            try:
+                contents.append(b"".join(prefetched_file.read_blocks()))
+            except FileNotFoundError:
+                contents.append(None)
+
+        self.assertEqual([self.contents[0], None, self.contents[1]], contents)
+
+    def test_files_are_read_ahead(self):
+        # the first file can't be consumed until the files after it have been opened
+        opened = []
+        all_opened = Event()
+        real_open = open
+
+        def mock_open(path, *args, **kwargs):
+            opened.append(path)
+            if len(opened) == 3:
+                all_opened.set()
+            return real_open(path, *args, **kwargs)
+
+        with patch("builtins.open", side_effect=mock_open):
+            prefetched_files = iter(ReadAheadFiles(self.files[:3], prefetch_depth=3))
+            next(prefetched_files)
+
+            self.assertTrue(all_opened.wait(WAIT_TIMEOUT_SECONDS))
+        self.assertEqual(set(self.files[:3]), set(opened))
+
+    def test_stopping_early_does_not_block(self):
+        read_ahead = ReadAheadFiles(self.files, prefetch_depth=4, buffer_size=1024, block_size=512)
+
+        # breaking out of the loop closes the iterator, which must stop the reads still going on
+        for prefetched_file in read_ahead:
+            next(prefetched_file.read_blocks())
+            break
+
+        self.assertLess(read_ahead.bytes_read, FILE_SIZE)
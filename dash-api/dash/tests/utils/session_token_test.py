@@ -0,0 +1,60 @@
+import logging
+from os import environ
+from unittest import TestCase
+from unittest.mock import patch
+
+from utils.session_token import SessionTokens, session_tokens_from_environ
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+SECRET_KEY = "mock_secret_key"
+CLAIMS = {
+    "username": "fbloggs",
+    "memberOf": [{"inst_id": "FakIns", "inst_name": "Fake Institution", "country_names": ["UK"]}],
+    "projects": ["juno"],
+}
+
+
+class TestSessionTokens(TestCase):
+    def test_verify_issued_token(self):
+        session_tokens = SessionTokens(SECRET_KEY)
+
+        self.assertEqual(CLAIMS, session_tokens.verify(session_tokens.issue(CLAIMS)))
+
+    def test_verify_rejects_token_signed_with_another_key(self):
+        token = SessionTokens("another_secret_key").issue(CLAIMS)
+
+        self.assertIsNone(SessionTokens(SECRET_KEY).verify(token))
+
+    def test_verify_rejects_tampered_token(self):
+        session_tokens = SessionTokens(SECRET_KEY)
+        token = session_tokens.issue(CLAIMS)
+        # a token is <payload>.<timestamp>.<signature>:  this is another payload with the original signature
+        other_payload = session_tokens.issue({**CLAIMS, "username": "admin"}).rsplit(".", 2)[0]
+        tampered_token = ".".join([other_payload] + token.rsplit(".", 2)[1:])
+
+        self.assertIsNone(session_tokens.verify(tampered_token))
+
+    def test_verify_rejects_expired_token(self):
+        session_tokens = SessionTokens(SECRET_KEY, ttl_seconds=60)
+        with patch("itsdangerous.timed.time.time", return_value=1000000):
+            token = session_tokens.issue(CLAIMS)
+        with patch("itsdangerous.timed.time.time", return_value=1000000 + 61):
+            self.assertIsNone(session_tokens.verify(token))
+
+    def test_verify_rejects_missing_or_malformed_token(self):
+        session_tokens = SessionTokens(SECRET_KEY)
+
+        for token in (None, "", "ZmJsb2dnczpmb29iYXI=", "not.a.token"):
+            self.assertIsNone(session_tokens.verify(token))
+
+    @patch.dict(environ, {"SESSION_TOKEN_SECRET_KEY": SECRET_KEY, "SESSION_TOKEN_TTL_SECONDS": "60"}, clear=True)
+    def test_session_tokens_from_environ(self):
+        session_tokens = session_tokens_from_environ()
+
+        self.assertEqual(60, session_tokens.ttl_seconds)
+        self.assertEqual(CLAIMS, session_tokens.verify(SessionTokens(SECRET_KEY).issue(CLAIMS)))
+
+    @patch.dict(environ, {}, clear=True)
+    def test_session_tokens_not_enabled(self):
+        self.assertIsNone(session_tokens_from_environ())
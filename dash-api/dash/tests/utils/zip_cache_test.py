@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import time
+from unittest import TestCase
+from zipfile import ZipFile
+
+from utils.zip_cache import EVICTION_GRACE_SECONDS, ZipArchiveCache, zip_archive_key
+from utils.zip_jobs import ZIP_JOB_STATUS_SUFFIX
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+ARCHIVE_SIZE = 1000
+# longer ago than the eviction grace period
+LONG_AGO = time() - 10 * EVICTION_GRACE_SECONDS
+
+
+class TestZipArchiveKey(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.files = []
+        for file_name in ("lane_1.fa", "lane_2.fa"):
+            this_file = Path(self.temp_dir.name, file_name)
+            this_file.write_text(file_name)
+            self.files.append(this_file)
+
+    def test_key_is_independent_of_order(self):
+        self.assertEqual(
+            zip_archive_key({"pub_name_1": self.files[:1], "pub_name_2": self.files[1:]}),
+            zip_archive_key({"pub_name_2": self.files[1:], "pub_name_1": self.files[:1]}),
+        )
+
+    def test_key_depends_on_directory_names(self):
+        self.assertNotEqual(
+            zip_archive_key({"pub_name_1": self.files}),
+            zip_archive_key({"pub_name_2": self.files}),
+        )
+
+    def test_key_changes_if_a_file_changes(self):
+        key = zip_archive_key({"pub_name": self.files})
+        os.utime(self.files[0], (LONG_AGO, LONG_AGO))
+
+        self.assertNotEqual(key, zip_archive_key({"pub_name": self.files}))
+
+    def test_key_with_non_existent_file(self):
+        files = self.files + [Path(self.temp_dir.name, "non-existent.file")]
+
+        self.assertEqual(zip_archive_key({"pub_name": files}), zip_archive_key({"pub_name": files}))
+
+
+class TestZipArchiveCache(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.location = self.temp_dir.name
+
+    def test_map_token(self):
+        zip_cache = ZipArchiveCache(self.location, ARCHIVE_SIZE)
+        data_file = Path(self.location, "lane_1.fa")
+        data_file.write_text("lane_1")
+
+        basename = zip_cache.map_token("token_1", {"pub_name": [data_file]})
+        zip_cache.map_token("token_2", {"pub_name": [data_file]})
+
+        self.assertEqual(zip_archive_key({"pub_name": [data_file]}), basename)
+        self.assertEqual(basename, zip_cache.archive_basename("token_1"))
+        self.assertEqual(basename, zip_cache.archive_basename("token_2"))
+
+    def test_archive_basename_if_token_not_mapped(self):
+        self.assertIsNone(ZipArchiveCache(self.location, ARCHIVE_SIZE).archive_basename("token"))
+
+    def test_evict_least_recently_used(self):
+        for basename, last_used in (("oldest", LONG_AGO - 2), ("newest", LONG_AGO), ("middle", LONG_AGO - 1)):
+            self.write_archive(basename, last_used)
+        zip_cache = ZipArchiveCache(self.location, 2 * Path(self.location, "oldest.zip").stat().st_size)
+
+        evicted = zip_cache.evict()
+
+        self.assertEqual(["oldest"], evicted)
+        self.assertEqual({"middle.zip", "newest.zip"}, self.archives())
+
+    def test_touch_makes_archive_most_recently_used(self):
+        zip_cache = ZipArchiveCache(self.location, ARCHIVE_SIZE)
+        self.write_archive("archive_1", LONG_AGO - 1)
+        self.write_archive("archive_2", LONG_AGO)
+        mtime = Path(self.location, "archive_1.zip").stat().st_mtime
+
+        zip_cache.touch("archive_1")
+
+        self.assertEqual(mtime, Path(self.location, "archive_1.zip").stat().st_mtime)
+        self.assertEqual(["archive_2"], zip_cache.evict())
+
+    def test_evict_nothing_if_within_quota(self):
+        zip_cache = ZipArchiveCache(self.location, 2 * ARCHIVE_SIZE)
+        self.write_archive("archive_1", LONG_AGO)
+
+        self.assertEqual([], zip_cache.evict())
+        self.assertEqual({"archive_1.zip"}, self.archives())
+
+    def test_evict_never_deletes_archives_kept_recently_used_or_being_built(self):
+        zip_cache = ZipArchiveCache(self.location, ARCHIVE_SIZE)
+        self.write_archive("kept", LONG_AGO)
+        self.write_archive("recently_used", time())
+        self.write_archive("being_built", LONG_AGO)
+        Path(self.location, "being_built" + ZIP_JOB_STATUS_SUFFIX).write_text(
+            json.dumps({"status": "running", "percent complete": 50, "pid": os.getpid()})
+        )
+        Path(self.location, "incomplete.zip").write_bytes(b"PK\x03\x04")
+        os.utime(Path(self.location, "incomplete.zip"), (LONG_AGO, LONG_AGO))
+
+        self.assertEqual([], zip_cache.evict(keep=["kept"]))
+        self.assertEqual({"kept.zip", "recently_used.zip", "being_built.zip", "incomplete.zip"}, self.archives())
+
+    def write_archive(self, basename, last_used):
+        zip_file_name = Path(self.location, basename + ".zip")
+        with ZipFile(zip_file_name, "w") as zip_file:
+            zip_file.writestr("data", b"\0" * ARCHIVE_SIZE)
+        os.utime(zip_file_name, (last_used, LONG_AGO))
+
+    def archives(self):
+        return {zip_file.name for zip_file in Path(self.location).glob("*.zip")}
@@ -0,0 +1,306 @@
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from time import sleep, time
+from unittest import TestCase
+from unittest.mock import patch
+
+from utils.zip_jobs import (
+    ZIP_JOB_ARCHIVE_DELETED,
+    ZIP_JOB_FAILED,
+    ZIP_JOB_INTERRUPTED,
+    ZIP_JOB_QUEUED,
+    ZIP_JOB_READY,
+    ZIP_JOB_RETRY_BASE_SECONDS,
+    ZIP_JOB_RETRY_MAX_SECONDS,
+    ZIP_JOB_RUNNING,
+    ZIP_JOB_STALE_SECONDS,
+    ZipJobQueue,
+    ZipJobQueueFullError,
+    _boot_id,
+    read_zip_job_status,
+    zip_job_can_be_resubmitted,
+    zip_job_retry_after,
+)
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+BASENAME = "0123456789abcdef"
+WAIT_TIMEOUT_SECONDS = 10
+
+
+class TestZipJobQueue(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.location = self.temp_dir.name
+        self.queue = ZipJobQueue(max_workers=1, max_queued=1)
+        self.addCleanup(self.queue.close)
+        self.release_build = Event()
+        # make sure no build is left blocked when a test fails
+        self.addCleanup(self.release_build.set)
+
+    def test_status_is_none_if_no_job_submitted(self):
+        self.assertIsNone(read_zip_job_status(BASENAME, self.location))
+
+    def test_job_builds_archive(self):
+        job_status = self.queue.submit(BASENAME, self.location, self.write_archive)
+
+        self.assertEqual(ZIP_JOB_QUEUED, job_status["status"])
+        job_status = self.wait_for_status(BASENAME, ZIP_JOB_READY)
+        self.assertEqual(100, job_status["percent complete"])
+        self.assertTrue(Path(self.location, BASENAME + ".zip").is_file())
+        self.assertEqual(0, self.queue.num_pending())
+
+    def test_status_reports_progress(self):
+        def build(progress):
+            progress(1, 4)
+            self.release_build.wait(WAIT_TIMEOUT_SECONDS)
+            self.write_archive(progress)
+
+        self.queue.submit(BASENAME, self.location, build)
+
+        job_status = self.wait_for_status(BASENAME, ZIP_JOB_RUNNING, percent_complete=25)
+        self.assertEqual(25, job_status["percent complete"])
+        self.release_build.set()
+        self.wait_for_status(BASENAME, ZIP_JOB_READY)
+
+    def test_job_is_only_submitted_once(self):
+        num_builds = []
+
+        def build(progress):
+            num_builds.append(1)
+            self.release_build.wait(WAIT_TIMEOUT_SECONDS)
+            self.write_archive(progress)
+
+        self.queue.submit(BASENAME, self.location, build)
+        self.queue.submit(BASENAME, self.location, build)
+        self.release_build.set()
+        self.wait_for_status(BASENAME, ZIP_JOB_READY)
+        self.queue.submit(BASENAME, self.location, build)
+
+        self.assertEqual(1, len(num_builds))
+
+    def test_failed_job(self):
+        def build(progress):
+            self.write_archive(progress)
+            raise OSError("disk full")
+
+        self.queue.submit(BASENAME, self.location, build)
+
+        job_status = self.wait_for_status(BASENAME, ZIP_JOB_FAILED)
+        self.assertEqual("disk full", job_status["error"])
+        self.assertEqual(1, job_status["failures"])
+        # the partial ZIP archive is deleted
+        self.assertFalse(Path(self.location, BASENAME + ".zip").exists())
+        # a failed job is not resubmitted until the retry delay has passed
+        self.assertFalse(zip_job_can_be_resubmitted(job_status))
+        self.assertEqual(ZIP_JOB_RETRY_BASE_SECONDS, zip_job_retry_after(job_status))
+        self.assertEqual(ZIP_JOB_FAILED, self.queue.submit(BASENAME, self.location, build)["status"])
+
+    def test_failed_job_is_resubmitted_after_retry_delay(self):
+        def build(progress):
+            raise OSError("disk full")
+
+        self.queue.submit(BASENAME, self.location, build)
+        job_status = self.wait_for_status(BASENAME, ZIP_JOB_FAILED)
+        self.backdate_failure(job_status, ZIP_JOB_RETRY_BASE_SECONDS)
+
+        self.queue.submit(BASENAME, self.location, build)
+
+        job_status = self.wait_for_status(BASENAME, ZIP_JOB_FAILED, failures=2)
+        # the retry delay doubles with each consecutive failure
+        self.assertEqual(2 * ZIP_JOB_RETRY_BASE_SECONDS, zip_job_retry_after(job_status))
+        self.backdate_failure(job_status, 2 * ZIP_JOB_RETRY_BASE_SECONDS)
+
+        self.queue.submit(BASENAME, self.location, self.write_archive)
+
+        self.wait_for_status(BASENAME, ZIP_JOB_READY)
+
+    def test_failed_job_is_resubmitted_once_by_concurrent_submits(self):
+        with open(Path(self.location, BASENAME + ".status.json"), "w") as status_file:
+            json.dump(
+                {
+                    "status": ZIP_JOB_FAILED,
+                    "percent complete": 0,
+                    "failures": 1,
+                    "failed at": time() - ZIP_JOB_RETRY_MAX_SECONDS,
+                },
+                status_file,
+            )
+        num_builds = []
+
+        def build(progress):
+            num_builds.append(1)
+            self.release_build.wait(WAIT_TIMEOUT_SECONDS)
+            self.write_archive(progress)
+
+        # the first submit is slow to act on the failed status it reads, giving the other (as if in another
+        # process, so not sharing its queue's lock) time to read it too, if it isn't locked out
+        status_reads = []
+
+        def read_status_slowly(basename, location):
+            job_status = read_zip_job_status(basename, location)
+            status_reads.append(job_status)
+            if 1 == len(status_reads):
+                sleep(0.2)
+            return job_status
+
+        other_queue = ZipJobQueue(max_workers=1, max_queued=1)
+        self.addCleanup(other_queue.close)
+        with patch("utils.zip_jobs.read_zip_job_status", side_effect=read_status_slowly):
+            submits = [
+                Thread(target=queue.submit, args=(BASENAME, self.location, build))
+                for queue in (self.queue, other_queue)
+            ]
+            submits[0].start()
+            sleep(0.05)
+            submits[1].start()
+            for submit in submits:
+                submit.join(WAIT_TIMEOUT_SECONDS)
+        self.release_build.set()
+        self.wait_for_status(BASENAME, ZIP_JOB_READY)
+
+        self.assertEqual(1, len(num_builds))
+
+    def test_retry_delay_is_capped(self):
+        job_status = {"status": ZIP_JOB_FAILED, "percent complete": 0, "failures": 20, "failed at": time()}
+
+        self.assertEqual(ZIP_JOB_RETRY_MAX_SECONDS, zip_job_retry_after(job_status))
+
+    def test_queue_full(self):
+        def build(basename):
+            def build_archive(progress):
+                self.release_build.wait(WAIT_TIMEOUT_SECONDS)
+                self.write_archive(progress, basename=basename)
+
+            return build_archive
+
+        # one job running, and one queued
+        self.queue.submit("running_job", self.location, build("running_job"))
+        self.queue.submit("queued_job", self.location, build("queued_job"))
+
+        with self.assertRaises(ZipJobQueueFullError):
+            self.queue.submit(BASENAME, self.location, build(BASENAME))
+        self.assertIsNone(read_zip_job_status(BASENAME, self.location))
+        self.release_build.set()
+        self.wait_for_status("queued_job", ZIP_JOB_READY)
+        self.queue.submit(BASENAME, self.location, build(BASENAME))
+        self.wait_for_status(BASENAME, ZIP_JOB_READY)
+
+    def test_interrupted_job_is_resubmitted(self):
+        # a job left running by a process that no longer exists
+        finished_process = subprocess.Popen([sys.executable, "-c", "pass"])
+        finished_process.wait()
+        self.write_status(pid=finished_process.pid)
+
+        job_status = read_zip_job_status(BASENAME, self.location)
+        self.assertEqual(ZIP_JOB_FAILED, job_status["status"])
+        self.assertEqual(ZIP_JOB_INTERRUPTED, job_status["error"])
+
+        self.queue.submit(BASENAME, self.location, self.write_archive)
+        self.wait_for_status(BASENAME, ZIP_JOB_READY)
+
+    def test_job_is_interrupted_if_status_file_is_stale(self):
+        # the PID of a process that has gone may have been reused, so a live process doesn't keep the job alive
+        self.write_status(pid=os.getpid(), age_seconds=ZIP_JOB_STALE_SECONDS + 1)
+
+        self.assertEqual(ZIP_JOB_INTERRUPTED, read_zip_job_status(BASENAME, self.location).get("error"))
+
+    def test_unwritten_status_file(self):
+        status_file = Path(self.location, BASENAME + ".status.json")
+        status_file.touch()
+
+        self.assertEqual(ZIP_JOB_QUEUED, read_zip_job_status(BASENAME, self.location)["status"])
+
+        # the process that created the status file died before writing to it
+        self.backdate_status_file(ZIP_JOB_STALE_SECONDS + 1)
+        self.assertEqual(ZIP_JOB_INTERRUPTED, read_zip_job_status(BASENAME, self.location).get("error"))
+
+    def test_job_is_interrupted_if_host_restarted(self):
+        self.write_status(pid=os.getpid(), boot_id="a previous boot")
+
+        self.assertEqual(ZIP_JOB_INTERRUPTED, read_zip_job_status(BASENAME, self.location).get("error"))
+
+    def test_job_on_another_host_is_trusted_while_status_file_is_fresh(self):
+        finished_process = subprocess.Popen([sys.executable, "-c", "pass"])
+        finished_process.wait()
+        self.write_status(pid=finished_process.pid, host="another host")
+
+        self.assertEqual(ZIP_JOB_RUNNING, read_zip_job_status(BASENAME, self.location)["status"])
+
+    @patch("utils.zip_jobs.ZIP_JOB_HEARTBEAT_SECONDS", 0.01)
+    def test_heartbeat_touches_status_file_of_pending_job(self):
+        def build(progress):
+            self.release_build.wait(WAIT_TIMEOUT_SECONDS)
+            self.write_archive(progress)
+
+        self.queue.submit(BASENAME, self.location, build)
+        self.wait_for_status(BASENAME, ZIP_JOB_RUNNING)
+        self.backdate_status_file(ZIP_JOB_STALE_SECONDS + 1)
+
+        start = time()
+        while time() - start < WAIT_TIMEOUT_SECONDS:
+            if time() - Path(self.location, BASENAME + ".status.json").stat().st_mtime < ZIP_JOB_STALE_SECONDS:
+                break
+            sleep(0.01)
+        self.assertEqual(ZIP_JOB_RUNNING, read_zip_job_status(BASENAME, self.location)["status"])
+        self.release_build.set()
+        self.wait_for_status(BASENAME, ZIP_JOB_READY)
+
+    def test_job_is_resubmitted_if_archive_deleted(self):
+        self.queue.submit(BASENAME, self.location, self.write_archive)
+        self.wait_for_status(BASENAME, ZIP_JOB_READY)
+        Path(self.location, BASENAME + ".zip").unlink()
+
+        job_status = read_zip_job_status(BASENAME, self.location)
+        self.assertEqual(ZIP_JOB_FAILED, job_status["status"])
+        self.assertEqual(ZIP_JOB_ARCHIVE_DELETED, job_status["error"])
+
+        self.queue.submit(BASENAME, self.location, self.write_archive)
+        self.wait_for_status(BASENAME, ZIP_JOB_READY)
+
+    def write_archive(self, progress, basename=BASENAME):
+        Path(self.location, basename + ".zip").touch()
+
+    def write_status(self, pid, host=None, boot_id=None, age_seconds=0):
+        with open(Path(self.location, BASENAME + ".status.json"), "w") as status_file:
+            json.dump(
+                {
+                    "status": ZIP_JOB_RUNNING,
+                    "percent complete": 50,
+                    "pid": pid,
+                    "host": host or socket.gethostname(),
+                    "boot id": boot_id or _boot_id(),
+                },
+                status_file,
+            )
+        self.backdate_status_file(age_seconds)
+
+    def backdate_status_file(self, seconds):
+        touched = time() - seconds
+        os.utime(Path(self.location, BASENAME + ".status.json"), (touched, touched))
+
+    def backdate_failure(self, job_status, seconds):
+        with open(Path(self.location, BASENAME + ".status.json"), "w") as status_file:
+            json.dump({**job_status, "failed at": job_status["failed at"] - seconds}, status_file)
+
+    def wait_for_status(self, basename, status, percent_complete=None, failures=None):
+        start = time()
+        while time() - start < WAIT_TIMEOUT_SECONDS:
+            job_status = read_zip_job_status(basename, self.location)
+            if (
+                job_status is not None
+                and status == job_status["status"]
+                and percent_complete in (None, job_status["percent complete"])
+                and failures in (None, job_status.get("failures"))
+            ):
+                return job_status
+            sleep(0.01)
+        self.fail("ZIP job {} did not reach status {}".format(basename, status))
@@ -0,0 +1,219 @@
+import errno
+import json
+import logging
+import os
+import zlib
+from pathlib import Path, PurePath
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+from zipfile import ZIP_STORED, ZipFile
+
+import utils.zip_writer
+from utils.lane_files_manifest import write_lane_files_manifest
+from utils.zip_writer import (
+    SIDECAR_MANIFEST_FILE_NAME,
+    ZIP_FLAG_DATA_DESCRIPTOR,
+    StoredZipWriter,
+    StreamingZipWriter,
+    read_sidecar_manifest,
+)
+
+logging.basicConfig(format="%(asctime)-15s %(levelname)s:  %(message)s", level="CRITICAL")
+
+FILE_CONTENTS = {
+    "lane_1.fastq.gz": os.urandom(3 * 1024 * 1024 + 7),
+    "lane_1.contigs_spades.fa": b">contig\nACGT\n",
+    "lane_2.fastq.gz": b"",
+}
+
+
+class TestStoredZipWriter(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.data_dir = Path(self.temp_dir.name, "data")
+        self.data_dir.mkdir()
+        self.data_files = []
+        for file_name, content in FILE_CONTENTS.items():
+            data_file = Path(self.data_dir, file_name)
+            data_file.write_bytes(content)
+            self.data_files.append(data_file)
+        self.zip_file_name = Path(self.temp_dir.name, "archive.zip")
+
+    def test_writes_stored_entries(self):
+        with StoredZipWriter(self.zip_file_name) as writer:
+            for data_file in self.data_files:
+                writer.write(data_file, PurePath("pub_name", data_file.name))
+
+        self.assertEqual(len(FILE_CONTENTS), writer.num_crc32s_calculated)
+        self.assert_archive_contents({"pub_name/{}".format(name): content for name, content in FILE_CONTENTS.items()})
+
+    def test_arcname_defaults_to_file_name(self):
+        with StoredZipWriter(self.zip_file_name) as writer:
+            writer.write(self.data_files[1])
+
+        self.assert_archive_contents({self.data_files[1].name: FILE_CONTENTS[self.data_files[1].name]})
+
+    def test_non_existent_file_is_not_added(self):
+        with StoredZipWriter(self.zip_file_name) as writer:
+            writer.write(self.data_files[1])
+            with self.assertRaises(FileNotFoundError):
+                writer.write(Path(self.data_dir, "non-existent.file"))
+
+        self.assert_archive_contents({self.data_files[1].name: FILE_CONTENTS[self.data_files[1].name]})
+
+    def test_empty_archive(self):
+        with StoredZipWriter(self.zip_file_name):
+            pass
+
+        self.assert_archive_contents({})
+
+    def test_uses_crc32_from_sidecar_manifest(self):
+        self.write_sidecar_manifest()
+
+        with StoredZipWriter(self.zip_file_name) as writer:
+            for data_file in self.data_files:
+                writer.write(data_file, data_file.name)
+
+        self.assertEqual(0, writer.num_crc32s_calculated)
+        self.assert_archive_contents(FILE_CONTENTS)
+
+    def test_uses_crc32_from_lane_files_manifest(self):
+        # the data directory is a public name directory, in an institution directory with a lane files manifest
+        lane_files = {}
+        for data_file in self.data_files:
+            file_stat = data_file.stat()
+            lane_files[data_file.name] = {
+                "size": file_stat.st_size,
+                "mtime": file_stat.st_mtime,
+                "crc32": zlib.crc32(data_file.read_bytes()),
+            }
+        write_lane_files_manifest(self.temp_dir.name, {self.data_dir.name: {"lane": lane_files}})
+
+        with StoredZipWriter(self.zip_file_name) as writer:
+            for data_file in self.data_files:
+                writer.write(data_file, data_file.name)
+
+        self.assertEqual(0, writer.num_crc32s_calculated)
+        self.assert_archive_contents(FILE_CONTENTS)
+
+    def test_ignores_out_of_date_sidecar_manifest_entries(self):
+        self.write_sidecar_manifest()
+        changed_file = self.data_files[1]
+        changed_content = b">contig\nACGTACGT\n"
+        changed_file.write_bytes(changed_content)
+
+        with StoredZipWriter(self.zip_file_name) as writer:
+            for data_file in self.data_files:
+                writer.write(data_file, data_file.name)
+
+        self.assertEqual(1, writer.num_crc32s_calculated)
+        self.assert_archive_contents({**FILE_CONTENTS, changed_file.name: changed_content})
+
+    def test_copies_via_buffer_if_sendfile_unsupported(self):
+        self.write_sidecar_manifest()
+
+        with patch("os.sendfile", side_effect=OSError(errno.EINVAL, "Invalid argument")):
+            with StoredZipWriter(self.zip_file_name) as writer:
+                for data_file in self.data_files:
+                    writer.write(data_file, data_file.name)
+
+        self.assert_archive_contents(FILE_CONTENTS)
+
+    def test_zip64(self):
+        # lower the ZIP64 thresholds, so the ZIP64 extensions are needed for every size and offset, and the
+        # number of entries
+        with patch.object(utils.zip_writer, "ZIP64_LIMIT", 1), patch.object(utils.zip_writer, "ZIP_MAX_ENTRIES", 1):
+            with StoredZipWriter(self.zip_file_name) as writer:
+                for data_file in self.data_files:
+                    writer.write(data_file, data_file.name)
+
+        self.assert_archive_contents(FILE_CONTENTS)
+
+    def test_streams_entries_with_data_descriptors(self):
+        writer = StreamingZipWriter(self.zip_file_name.name)
+
+        self.write_stream(writer, self.data_files)
+
+        self.assertEqual(len(FILE_CONTENTS), writer.num_crc32s_calculated)
+        self.assert_archive_contents(FILE_CONTENTS)
+        with ZipFile(self.zip_file_name) as zip_file:
+            for info in zip_file.infolist():
+                self.assertTrue(info.flag_bits & ZIP_FLAG_DATA_DESCRIPTOR)
+
+    def test_streams_entries_with_crc32_from_sidecar_manifest(self):
+        self.write_sidecar_manifest()
+        writer = StreamingZipWriter(self.zip_file_name.name)
+
+        self.write_stream(writer, self.data_files)
+
+        self.assertEqual(0, writer.num_crc32s_calculated)
+        self.assert_archive_contents(FILE_CONTENTS)
+        with ZipFile(self.zip_file_name) as zip_file:
+            for info in zip_file.infolist():
+                self.assertFalse(info.flag_bits & ZIP_FLAG_DATA_DESCRIPTOR)
+
+    def test_streams_blocks(self):
+        writer = StreamingZipWriter(self.zip_file_name.name)
+
+        with open(self.zip_file_name, "wb") as out_file:
+            for data_file in self.data_files:
+                content = data_file.read_bytes()
+                blocks = [content[:10], content[10:]]
+                for chunk in writer.stream_blocks(data_file, data_file.stat(), blocks, data_file.name):
+                    out_file.write(chunk)
+            for chunk in writer.stream_central_directory():
+                out_file.write(chunk)
+
+        self.assert_archive_contents(FILE_CONTENTS)
+
+    def test_streaming_non_existent_file_adds_nothing(self):
+        writer = StreamingZipWriter(self.zip_file_name.name)
+
+        with self.assertRaises(FileNotFoundError):
+            list(writer.stream(Path(self.data_dir, "non-existent.file")))
+        self.write_stream(writer, self.data_files[1:2])
+
+        self.assert_archive_contents({self.data_files[1].name: FILE_CONTENTS[self.data_files[1].name]})
+
+    def test_streaming_zip64(self):
+        with patch.object(utils.zip_writer, "ZIP64_LIMIT", 1), patch.object(utils.zip_writer, "ZIP_MAX_ENTRIES", 1):
+            self.write_stream(StreamingZipWriter(self.zip_file_name.name), self.data_files)
+
+        self.assert_archive_contents(FILE_CONTENTS)
+
+    def test_read_sidecar_manifest_if_none(self):
+        self.assertEqual({}, read_sidecar_manifest(self.data_dir))
+
+    def test_read_sidecar_manifest_if_unreadable(self):
+        Path(self.data_dir, SIDECAR_MANIFEST_FILE_NAME).write_text("{not json")
+
+        self.assertEqual({}, read_sidecar_manifest(self.data_dir))
+
+    def write_stream(self, writer, data_files):
+        with open(self.zip_file_name, "wb") as out_file:
+            for data_file in data_files:
+                for chunk in writer.stream(data_file, data_file.name):
+                    out_file.write(chunk)
+            for chunk in writer.stream_central_directory():
+                out_file.write(chunk)
+
+    def write_sidecar_manifest(self):
+        manifest = {}
+        for data_file in self.data_files:
+            file_stat = data_file.stat()
+            manifest[data_file.name] = {
+                "size": file_stat.st_size,
+                "mtime": file_stat.st_mtime,
+                "crc32": zlib.crc32(data_file.read_bytes()),
+            }
+        Path(self.data_dir, SIDECAR_MANIFEST_FILE_NAME).write_text(json.dumps(manifest))
+
+    def assert_archive_contents(self, expected_contents):
+        with ZipFile(self.zip_file_name) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(sorted(expected_contents), sorted(zip_file.namelist()))
+            for info in zip_file.infolist():
+                self.assertEqual(ZIP_STORED, info.compress_type)
+                self.assertEqual(expected_contents[info.filename], zip_file.read(info))
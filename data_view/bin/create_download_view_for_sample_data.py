@@ -1,52 +1,181 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
 import logging
 import os
 import re
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from os import path
 from pathlib import Path, PurePath
 from sys import argv
+from threading import Lock
 from urllib.error import HTTPError
 
 from dash.api.service.DataSources.institution_data import InstitutionData
 from dash.api.service.DataSources.sample_metadata import SampleMetadata
 from dash.api.service.DataSources.sequencing_status import SequencingStatus
-
-
-def create_download_view_for_sample_data(project, db, institution_keys, data_dir, output_dir):
-    data_file_lookup_by_lane_id = _get_data_file_lookup_by_lane_id(data_dir)
+from dash.api.utils.lane_files_manifest import read_lane_files_manifest, write_lane_files_manifest
+
+CRC32_BLOCK_SIZE = 8 * 1024 * 1024
+# incremented if the format of the data view state file changes; a state file of another version is ignored
+DATA_VIEW_STATE_VERSION = 1
+# an incremental run does a full run instead if the last full run was longer ago than this; directory modification
+# times aren't reliably updated on the data file mount, so an incremental run can miss new data files
+DEFAULT_FULL_RESCAN_HOURS = 24
+
+# one SequencingStatus (so one MLWH API client, and its config read once) is shared by every lookup; see
+# _get_sequencing_status_data()
+_sequencing_status = None
+_sequencing_status_lock = Lock()
+
+
+def create_download_view_for_sample_data(
+    project,
+    db,
+    institution_keys,
+    data_dir,
+    output_dir,
+    calculate_crc32=False,
+    state_file=None,
+    incremental=False,
+    lookup_workers=1,
+    full_rescan_hours=DEFAULT_FULL_RESCAN_HOURS,
+):
+    # The state file (if any) records the listing of the data directory and the data files of each public name.
+    # The next run uses it to prune the directories of public names that are no longer wanted; an incremental run
+    # also uses it to list only the data directories that have changed, and to leave alone public name directories
+    # whose data files haven't changed.  The state file also records when the last full run was, so an incremental
+    # run can do a full run instead if the last one was more than `full_rescan_hours` ago.
+    previous_state = {}
+    if state_file is not None:
+        state_file = Path(state_file).absolute()
+        previous_state = _read_data_view_state(state_file)
+    if incremental and not previous_state:
+        logging.warning("No data view state from a previous run: the whole data view will be created")
+        incremental = False
+    run_time = time.time()
+    last_full_run_time = previous_state.get("full_run_time")
+    if incremental and (last_full_run_time is None or run_time - last_full_run_time >= full_rescan_hours * 60 * 60):
+        logging.info(f"No full run in the last {full_rescan_hours} hours: the whole data view will be created")
+        incremental = False
+    if not incremental:
+        last_full_run_time = run_time
+    previous_dir_listings = None
+    if state_file is not None:
+        previous_dir_listings = previous_state.get("data_dirs", {}) if incremental else {}
+
+    data_file_lookup_by_lane_id, data_dir_listings = _get_data_file_lookup_by_lane_id(data_dir, previous_dir_listings)
+    institutions_state = {}
     if len(institution_keys) == 0:
         logging.warning("No institutions were given.")
     else:
-        for institution_key in institution_keys:
-            logging.info(f"{institution_key}: getting samples and lane information")
-            public_names_to_lane_ids = _get_public_names_with_lane_ids(project, institution_key, db)
+        public_names_to_lane_ids_by_institution = _get_public_names_with_lane_ids_of_institutions(
+            project, institution_keys, db, lookup_workers
+        )
+        for institution_key, public_names_to_lane_ids in public_names_to_lane_ids_by_institution:
+            previous_lane_files = previous_state.get("institutions", {}).get(institution_key, {})
 
             logging.info(f"{institution_key}: creating subdirectories")
             with _cd(Path(output_dir)):
 
-                if public_names_to_lane_ids:
+                if public_names_to_lane_ids or previous_lane_files:
                     _mkdir(institution_key)
 
                     with _cd(institution_key):
-                        for public_name, lane_ids in public_names_to_lane_ids.items():
-                            for lane_id in lane_ids:
-                                _create_public_name_dir_with_symlinks(
-                                    data_file_lookup_by_lane_id, public_name, lane_id, institution_key, data_dir
-                                )
-                            if not lane_ids:
-                                logging.debug(f'Creating empty directory "{public_name}" for {institution_key}.')
-                                _mkdir(public_name)
+                        institutions_state[institution_key] = _update_institution_dir(
+                            institution_key,
+                            public_names_to_lane_ids,
+                            data_file_lookup_by_lane_id,
+                            previous_lane_files,
+                            calculate_crc32,
+                            incremental,
+                        )
                 else:
                     logging.debug(f"Not creating output dir for {institution_key} because there are no samples")
 
+    if state_file is not None:
+        logging.info(f"Writing data view state to {state_file}")
+        _write_data_view_state(
+            state_file,
+            {
+                "version": DATA_VIEW_STATE_VERSION,
+                "full_run_time": last_full_run_time,
+                "data_dirs": data_dir_listings,
+                "institutions": institutions_state,
+            },
+        )
+
+
+def _update_institution_dir(
+    institution_key,
+    public_names_to_lane_ids,
+    data_file_lookup_by_lane_id,
+    previous_lane_files,
+    calculate_crc32,
+    incremental,
+):
+    # creates the public name directories of an institution (in the current directory), and returns the data files
+    # of each lane of each public name, for the data view state
+    # the data files of each lane are also recorded in a manifest, so the dash-api needn't look for them on the
+    # data file mount
+    previous_manifest = _read_lane_files_manifest()
+    manifest = {}
+    lane_files = {}
+    for public_name, lane_ids in public_names_to_lane_ids.items():
+        if lane_ids is None:
+            # the lanes of this sample couldn't be looked up: it's left as it was
+            if public_name in previous_lane_files:
+                lane_files[public_name] = previous_lane_files[public_name]
+            if public_name in previous_manifest:
+                manifest[public_name] = previous_manifest[public_name]
+            continue
+        data_files_by_lane_id = {lane_id: _get_data_files(data_file_lookup_by_lane_id, lane_id) for lane_id in lane_ids}
+        lane_files[public_name] = {
+            lane_id: [str(data_file) for data_file in data_files]
+            for lane_id, data_files in data_files_by_lane_id.items()
+        }
+        previous_public_name_manifest = previous_manifest.get(public_name, {})
+        if (
+            incremental
+            and lane_files[public_name] == previous_lane_files.get(public_name)
+            and _lane_files_manifest_is_complete(
+                previous_public_name_manifest, lane_files[public_name], calculate_crc32
+            )
+        ):
+            logging.debug(f'Data files of "{public_name}" for {institution_key} are unchanged.')
+            manifest[public_name] = previous_public_name_manifest
+            continue
+        if public_name in previous_lane_files:
+            _remove_stale_symlinks(public_name, previous_lane_files[public_name], lane_files[public_name])
+        manifest[public_name] = {}
+        for lane_id, data_files in data_files_by_lane_id.items():
+            _create_public_name_dir_with_symlinks(data_files, public_name, lane_id, institution_key)
+            manifest[public_name][lane_id] = _get_lane_files_manifest_entries(
+                data_files, previous_public_name_manifest.get(lane_id, {}), calculate_crc32
+            )
+        if not lane_ids:
+            logging.debug(f'Creating empty directory "{public_name}" for {institution_key}.')
+            _mkdir(public_name)
+
+    for public_name in previous_lane_files.keys() - public_names_to_lane_ids.keys():
+        logging.info(f'{institution_key}: removing directory "{public_name}", which is no longer wanted')
+        _remove_public_name_dir(public_name)
 
-def _get_data_file_lookup_by_lane_id(data_dir):
+    logging.info(f"{institution_key}: writing lane files manifest")
+    _write_lane_files_manifest(manifest)
+    return lane_files
+
+
+def _get_data_file_lookup_by_lane_id(data_dir, previous_dir_listings=None):
     # this find all the data files, and returns a dict to look up the paths from lane IDs
     # (note glob() is slow on big directories, so calling it just once provides a huge speed up)
+    # if previous directory listings are passed (possibly none), the data directory is listed one directory at a
+    # time instead, reusing the listings of directories that haven't changed (see _list_data_dir()); the new
+    # listings are returned along with the dict (or None, if the data directory was globbed)
 
     # this regex matches data files (files with names based on lane ID)
     # and provides a capture group for the lane ID
@@ -54,22 +183,79 @@ def _get_data_file_lookup_by_lane_id(data_dir):
     data_file_lookup_by_lane_id = {}
     num_data_files = 0
 
-    with _cd(data_dir):
-        for this_file in list(Path().glob("**/*")):
-            # pick out the data files
-            data_file_name_match = data_file_name_pattern.search(str(this_file))
-            if data_file_name_match:
-                lane_id = data_file_name_match.group(1)
-                this_file_full_path = PurePath(data_dir).joinpath(this_file)
-                logging.debug("Found file for lane {}:  {}".format(lane_id, this_file_full_path))
-                num_data_files += 1
-                if lane_id in data_file_lookup_by_lane_id:
-                    data_file_lookup_by_lane_id[lane_id].append(this_file_full_path)
-                else:
-                    data_file_lookup_by_lane_id[lane_id] = [this_file_full_path]
+    if previous_dir_listings is None:
+        with _cd(data_dir):
+            data_dir_paths = [str(this_file) for this_file in Path().glob("**/*")]
+        dir_listings = None
+    else:
+        data_dir_paths, dir_listings = _list_data_dir(data_dir, previous_dir_listings)
+
+    for this_file in data_dir_paths:
+        # pick out the data files
+        data_file_name_match = data_file_name_pattern.search(this_file)
+        if data_file_name_match:
+            lane_id = data_file_name_match.group(1)
+            this_file_full_path = PurePath(data_dir).joinpath(this_file)
+            logging.debug("Found file for lane {}:  {}".format(lane_id, this_file_full_path))
+            num_data_files += 1
+            if lane_id in data_file_lookup_by_lane_id:
+                data_file_lookup_by_lane_id[lane_id].append(this_file_full_path)
+            else:
+                data_file_lookup_by_lane_id[lane_id] = [this_file_full_path]
     logging.info("Found {} data files under {}".format(num_data_files, data_dir))
 
-    return data_file_lookup_by_lane_id
+    return data_file_lookup_by_lane_id, dir_listings
+
+
+def _list_data_dir(data_dir, previous_dir_listings):
+    # returns the paths of everything under the data directory, relative to it (like Path().glob("**/*") from
+    # within it), and the listing of each directory, keyed on relative path: {"mtime": <ns>, "entries": [[<name>,
+    # <is dir>], ...]}
+    # a directory is only listed again if its modification time has changed since its previous listing; its
+    # modification time is read before it's listed, so a change made while it's being listed is picked up next time
+    dir_listings = {}
+    data_dir_paths = []
+    num_dirs_listed = 0
+    dirs_to_list = [""]
+    while dirs_to_list:
+        this_dir = dirs_to_list.pop()
+        mtime = os.stat(path.join(data_dir, this_dir)).st_mtime_ns
+        listing = previous_dir_listings.get(this_dir)
+        if listing is None or listing["mtime"] != mtime:
+            with os.scandir(path.join(data_dir, this_dir)) as entries:
+                listing = {
+                    "mtime": mtime,
+                    "entries": sorted([entry.name, entry.is_dir(follow_symlinks=False)] for entry in entries),
+                }
+            num_dirs_listed += 1
+        dir_listings[this_dir] = listing
+        for name, is_dir in listing["entries"]:
+            entry_path = path.join(this_dir, name)
+            data_dir_paths.append(entry_path)
+            if is_dir:
+                dirs_to_list.append(entry_path)
+    logging.info(
+        "Listed {} of {} directories under {} (the rest are unchanged)".format(
+            num_dirs_listed, len(dir_listings), data_dir
+        )
+    )
+    return data_dir_paths, dir_listings
+
+
+def _get_public_names_with_lane_ids_of_institutions(project, institution_keys, db, lookup_workers):
+    # returns a list of (institution key, public names to lane IDs) tuples, in the order of the institution keys;
+    # up to `lookup_workers` institutions are looked up at the same time (the directories are created one
+    # institution at a time afterwards, as _cd() changes the working directory of the whole process)
+    def get_public_names_with_lane_ids(institution_key):
+        logging.info(f"{institution_key}: getting samples and lane information")
+        return _get_public_names_with_lane_ids(project, institution_key, db)
+
+    max_workers = min(len(institution_keys), lookup_workers)
+    if max_workers < 2:
+        return [(i, get_public_names_with_lane_ids(i)) for i in institution_keys]
+    logging.info(f"Looking up samples and lanes of {len(institution_keys)} institutions, {max_workers} at a time")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(zip(institution_keys, executor.map(get_public_names_with_lane_ids, institution_keys)))
 
 
 def _get_public_names_with_lane_ids(project, institution_key, db):
@@ -104,29 +290,31 @@ def _get_public_names_with_lane_ids(project, institution_key, db):
 
     logging.info(f"{institution_key}: {len(public_names_to_sanger_sample_id)} public names")
 
+    if not public_names_to_sanger_sample_id:
+        return {}
+
+    # the sequencing status of all the institution's samples is requested at once (the MLWH API client splits
+    # the request into chunks, and retries chunks that fail)
+    # MLWH API can be fragile: catch HTTP errors
+    try:
+        seq_data = _get_sequencing_status_data(list(public_names_to_sanger_sample_id.values()))
+    except HTTPError as e:
+        logging.error("Failed to get sequence data for {} samples: {}".format(institution_key, repr(e)))
+        # the lanes are unknown, rather than none: the public name directories mustn't be pruned
+        return {public_name: None for public_name in public_names_to_sanger_sample_id}
+
     num_lanes = 0
     public_names_to_lane_ids = {}
     for public_name, sanger_sample_id in public_names_to_sanger_sample_id.items():
-        # MLWH API can be fragile: catch HTTP errors
-        try:
-            seq_data = _get_sequencing_status_data([sanger_sample_id])
-            lane_ids_of_one_sample = []
-            for sample in seq_data.keys():
-                for lane in seq_data[sample]["lanes"]:
-                    num_lanes += 1
-                    lane_ids_of_one_sample.append(lane["id"])
-            if lane_ids_of_one_sample:
-                logging.debug(f'{institution_key}: {len(lane_ids_of_one_sample)} lanes for "{public_name}"')
-                public_names_to_lane_ids[public_name] = lane_ids_of_one_sample
-            else:
-                logging.debug(f'{institution_key}: No lanes found for "{public_name}"')
-                # We add public names w/ no lanes, as we want to
-                # create empty public name directories as well.
-                public_names_to_lane_ids[public_name] = []
-        except HTTPError as e:
-            logging.error(
-                "Failed to get sequence data for {} sample {}: {}".format(institution_key, public_name, repr(e))
-            )
+        lane_ids_of_one_sample = [lane["id"] for lane in seq_data.get(sanger_sample_id, {}).get("lanes", [])]
+        num_lanes += len(lane_ids_of_one_sample)
+        if lane_ids_of_one_sample:
+            logging.debug(f'{institution_key}: {len(lane_ids_of_one_sample)} lanes for "{public_name}"')
+        else:
+            logging.debug(f'{institution_key}: No lanes found for "{public_name}"')
+        # We add public names w/ no lanes, as we want to
+        # create empty public name directories as well.
+        public_names_to_lane_ids[public_name] = lane_ids_of_one_sample
 
     logging.info(f"{institution_key} has a total of {num_lanes} lanes")
 
@@ -134,12 +322,14 @@ def _get_public_names_with_lane_ids(project, institution_key, db):
 
 
 def _get_sequencing_status_data(sanger_sample_ids):
-    return SequencingStatus().get_multiple_samples(sanger_sample_ids)
+    global _sequencing_status
+    with _sequencing_status_lock:
+        if _sequencing_status is None:
+            _sequencing_status = SequencingStatus()
+    return _sequencing_status.get_multiple_samples(sanger_sample_ids)
 
 
-def _create_public_name_dir_with_symlinks(data_file_lookup_by_lane_id, public_name, lane_id, institution_key, data_dir):
-    data_files = _get_data_files(data_file_lookup_by_lane_id, lane_id)
-
+def _create_public_name_dir_with_symlinks(data_files, public_name, lane_id, institution_key):
     logging.debug(f'Creating directory "{public_name}" for lane {lane_id} for {institution_key}.')
     _mkdir(public_name)
 
@@ -166,6 +356,110 @@ def _create_symlink_to(path_to_file, symlink_name):
             Path(symlink_name).symlink_to(path_to_file)
 
 
+def _remove_stale_symlinks(public_name, previous_lane_files, lane_files):
+    # removes the symlinks to data files no longer wanted for a public name, or whose target has changed
+    wanted = {data_file for data_files in lane_files.values() for data_file in data_files}
+    stale = {data_file for data_files in previous_lane_files.values() for data_file in data_files} - wanted
+    for data_file in stale:
+        _remove_symlink(PurePath(public_name, PurePath(data_file).name))
+
+
+def _remove_symlink(symlink_name):
+    logging.debug(f'Removing symlink "{symlink_name}".')
+    if Path(symlink_name).is_symlink():
+        Path(symlink_name).unlink()
+
+
+def _remove_public_name_dir(public_name):
+    # only symlinks are removed (and then the directory, if that leaves it empty), so this never deletes anything
+    # but the data view itself
+    public_name_dir = Path(public_name)
+    if not public_name_dir.is_dir():
+        return
+    for entry in public_name_dir.iterdir():
+        if entry.is_symlink():
+            entry.unlink()
+    try:
+        public_name_dir.rmdir()
+    except OSError as err:
+        logging.warning(f"Directory {public_name} in {Path().absolute()} was not removed: {err}")
+
+
+def _lane_files_manifest_is_complete(public_name_manifest, lane_files, calculate_crc32):
+    # whether the manifest of a public name has an entry for each of its data files (with a CRC32, if required)
+    for lane_id, data_files in lane_files.items():
+        entries = public_name_manifest.get(lane_id)
+        if entries is None or set(entries) != {PurePath(data_file).name for data_file in data_files}:
+            return False
+        if calculate_crc32 and any(entry.get("crc32") is None for entry in entries.values()):
+            return False
+    return True
+
+
+def _get_lane_files_manifest_entries(data_files, previous_entries, calculate_crc32):
+    # the CRC32 of a file is kept from the previous manifest unless the file has changed, as calculating it means
+    # reading the whole file
+    entries = {}
+    for data_file in data_files:
+        try:
+            file_stat = os.stat(data_file)
+        except OSError as err:
+            logging.error("data file {} cannot be added to the lane files manifest: {}".format(data_file, err))
+            continue
+        entry = {"size": file_stat.st_size, "mtime": file_stat.st_mtime}
+        previous_entry = previous_entries.get(data_file.name, {})
+        if (
+            previous_entry.get("crc32") is not None
+            and previous_entry.get("size") == entry["size"]
+            and previous_entry.get("mtime") == entry["mtime"]
+        ):
+            entry["crc32"] = previous_entry["crc32"]
+        elif calculate_crc32:
+            entry["crc32"] = _calculate_crc32(data_file)
+        entries[data_file.name] = entry
+    return entries
+
+
+def _calculate_crc32(data_file):
+    logging.debug(f"Calculating CRC32 of {data_file}.")
+    crc32 = 0
+    with open(data_file, "rb") as file:
+        for block in iter(lambda: file.read(CRC32_BLOCK_SIZE), b""):
+            crc32 = zlib.crc32(block, crc32)
+    return crc32
+
+
+def _read_lane_files_manifest():
+    return read_lane_files_manifest(Path()) or {}
+
+
+def _write_lane_files_manifest(manifest):
+    write_lane_files_manifest(Path(), manifest)
+
+
+def _read_data_view_state(state_file):
+    try:
+        with open(state_file, "r") as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as err:
+        logging.warning(f"Ignoring unreadable data view state {state_file}: {err}")
+        return {}
+    if state.get("version") != DATA_VIEW_STATE_VERSION:
+        logging.warning(f"Ignoring data view state {state_file} of version {state.get('version')}")
+        return {}
+    return state
+
+
+def _write_data_view_state(state_file, state):
+    # written to a temporary file that then replaces the state file, so a failed run never leaves a partial file
+    temp_file = state_file.with_name("{}.{}.tmp".format(state_file.name, os.getpid()))
+    with open(temp_file, "w") as file:
+        json.dump(state, file, separators=(",", ":"))
+    os.replace(temp_file, state_file)
+
+
 # Allows to `cd` in the context of the `with` statement and automatically
 # `cd` back  upon leaving the corresponding`with` statement
 # (credits to https://stackoverflow.com/a/24176022/4579279).
@@ -192,6 +486,38 @@ if __name__ == "__main__":
     parser.add_argument("-D", "--data_dir", help="Data file directory")
     parser.add_argument("-O", "--output_dir", help="Institition view (output) file directory")
     parser.add_argument("-P", "--project", choices=["juno", "gps"], default="juno", help="Project")
+    parser.add_argument(
+        "-C",
+        "--crc32",
+        action="store_true",
+        help="Calculate the CRC32 of new and changed data files for the lane files manifest (used for ZIP archives)",
+    )
+    parser.add_argument(
+        "-S",
+        "--state_file",
+        help="File recording the data view state, so public name directories no longer wanted can be pruned",
+    )
+    parser.add_argument(
+        "-I",
+        "--incremental",
+        action="store_true",
+        help="Only update the data view for changes since the run that wrote the state file (requires --state_file)",
+    )
+    parser.add_argument(
+        "-F",
+        "--full_rescan_hours",
+        type=float,
+        default=DEFAULT_FULL_RESCAN_HOURS,
+        help="Do a full run instead of an incremental one if the last full run was longer ago than this "
+        f"[default: {DEFAULT_FULL_RESCAN_HOURS}]",
+    )
+    parser.add_argument(
+        "-W",
+        "--lookup_workers",
+        type=int,
+        default=1,
+        help="Number of institutions whose samples and lanes are looked up at the same time [default: 1]",
+    )
     parser.add_argument(
         "-L",
         "--log_level",
@@ -200,6 +526,8 @@ if __name__ == "__main__":
         default="WARNING",
     )
     options = parser.parse_args(argv[1:])
+    if options.incremental and options.state_file is None:
+        parser.error("--incremental requires --state_file")
 
     project = options.project
 
@@ -217,4 +545,9 @@ if __name__ == "__main__":
         InstitutionData().get_all_institution_keys_regardless_of_user_membership(),
         options.data_dir,
         options.output_dir,
+        calculate_crc32=options.crc32,
+        state_file=options.state_file,
+        incremental=options.incremental,
+        lookup_workers=options.lookup_workers,
+        full_rescan_hours=options.full_rescan_hours,
     )
@@ -1,8 +1,18 @@
+import os
+import zlib
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 from unittest.mock import patch
+from urllib.error import HTTPError
 
-from bin.create_download_view_for_sample_data import create_download_view_for_sample_data
+from bin.create_download_view_for_sample_data import (
+    DATA_VIEW_STATE_VERSION,
+    DEFAULT_FULL_RESCAN_HOURS,
+    _list_data_dir,
+    _remove_public_name_dir,
+    create_download_view_for_sample_data,
+)
 
 PROJECT = "juno"
 DATA_DIR = "/abs/path/data"
@@ -15,6 +25,7 @@ INSTITUTION_KEYS = [
     "WelSanIns",
 ]
 OUTPUT_DIR = "/abs/path/output"
+STATE_FILE = "/abs/path/data_view_state.json"
 SAMPLE_IDS = ["a", "b", "c", "d", "e"]
 PUBLIC_NAMES = list(map(lambda sanger_sample_id: sanger_sample_id * 2, SAMPLE_IDS))
 INSTITUTION_WITHOUT_LANES = {
@@ -74,6 +85,20 @@ class CreateDownloadViewForSampleDataTest(TestCase):
         self.create_symlink_to = create_symlink_patch.start()
         mkdir_patch = patch("bin.create_download_view_for_sample_data._mkdir")
         self.mkdir = mkdir_patch.start()
+        read_manifest_patch = patch(
+            "bin.create_download_view_for_sample_data._read_lane_files_manifest", return_value={}
+        )
+        self.read_lane_files_manifest = read_manifest_patch.start()
+        self.addCleanup(read_manifest_patch.stop)
+        write_manifest_patch = patch("bin.create_download_view_for_sample_data._write_lane_files_manifest")
+        self.write_lane_files_manifest = write_manifest_patch.start()
+        self.addCleanup(write_manifest_patch.stop)
+        remove_symlink_patch = patch("bin.create_download_view_for_sample_data._remove_symlink")
+        self.remove_symlink = remove_symlink_patch.start()
+        self.addCleanup(remove_symlink_patch.stop)
+        remove_public_name_dir_patch = patch("bin.create_download_view_for_sample_data._remove_public_name_dir")
+        self.remove_public_name_dir = remove_public_name_dir_patch.start()
+        self.addCleanup(remove_public_name_dir_patch.stop)
 
     def test_create_folder_per_institution_with_public_name(self):
         create_download_view_for_sample_data(PROJECT, self.db, INSTITUTION_KEYS, DATA_DIR, OUTPUT_DIR)
@@ -101,6 +126,247 @@ class CreateDownloadViewForSampleDataTest(TestCase):
             data_file.resolve()
             self.create_symlink_to.assert_any_call(data_file, data_file.name)
 
+    def test_lanes_of_each_institution_are_looked_up_at_once(self):
+        with patch(
+            "bin.create_download_view_for_sample_data._get_sequencing_status_data", wraps=get_sequencing_status_data
+        ) as sequencing_status_data_mock:
+            create_download_view_for_sample_data(PROJECT, self.db, INSTITUTION_KEYS, DATA_DIR, OUTPUT_DIR)
+
+        self.assertEqual(
+            sorted([[SAMPLE_IDS[0], SAMPLE_IDS[1]], [SAMPLE_IDS[2], SAMPLE_IDS[3]], [SAMPLE_IDS[4]]]),
+            sorted(call_args[0][0] for call_args in sequencing_status_data_mock.call_args_list),
+        )
+
+    def test_look_up_institutions_in_parallel(self):
+        with patch("bin.create_download_view_for_sample_data._get_data_files", return_value=[Path("x.vcf")]):
+            create_download_view_for_sample_data(PROJECT, self.db, INSTITUTION_KEYS, DATA_DIR, OUTPUT_DIR)
+            serial_calls = self.mkdir.call_args_list + self.create_symlink_to.call_args_list
+            self.mkdir.reset_mock()
+            self.create_symlink_to.reset_mock()
+
+            create_download_view_for_sample_data(
+                PROJECT, self.db, INSTITUTION_KEYS, DATA_DIR, OUTPUT_DIR, lookup_workers=3
+            )
+
+        self.assertEqual(serial_calls, self.mkdir.call_args_list + self.create_symlink_to.call_args_list)
+
+    def test_write_lane_files_manifest_per_institution(self):
+        with TemporaryDirectory() as temp_dir:
+            data_files = self.make_data_files(temp_dir)
+            with patch("bin.create_download_view_for_sample_data._get_data_files", return_value=data_files):
+                create_download_view_for_sample_data(PROJECT, self.db, INSTITUTION_KEYS, DATA_DIR, OUTPUT_DIR)
+
+            self.assertEqual(len(INSTITUTIONS_WITH_PUBLIC_NAMES), self.write_lane_files_manifest.call_count)
+            lane_files = {data_file.name: self.expected_manifest_entry(data_file) for data_file in data_files}
+            self.write_lane_files_manifest.assert_any_call(
+                {PUBLIC_NAMES[0]: {LANES[0]: lane_files, LANES[1]: lane_files}, PUBLIC_NAMES[1]: {}}
+            )
+            self.write_lane_files_manifest.assert_any_call(
+                {PUBLIC_NAMES[2]: {LANES[2]: lane_files}, PUBLIC_NAMES[3]: {}}
+            )
+            self.write_lane_files_manifest.assert_any_call({PUBLIC_NAMES[4]: {}})
+
+    def test_lane_files_manifest_excludes_non_existent_files(self):
+        with patch(
+            "bin.create_download_view_for_sample_data._get_data_files", return_value=[Path("/non-existent.file")]
+        ):
+            create_download_view_for_sample_data(PROJECT, self.db, INSTITUTION_KEYS, DATA_DIR, OUTPUT_DIR)
+
+        self.write_lane_files_manifest.assert_any_call({PUBLIC_NAMES[2]: {LANES[2]: {}}, PUBLIC_NAMES[3]: {}})
+
+    def test_lane_files_manifest_crc32s(self):
+        with TemporaryDirectory() as temp_dir:
+            data_files = self.make_data_files(temp_dir)
+            unchanged_file, changed_file = data_files[0], data_files[1]
+            # the CRC32 of an unchanged file is taken from the previous manifest
+            self.read_lane_files_manifest.return_value = {
+                PUBLIC_NAMES[2]: {
+                    LANES[2]: {
+                        unchanged_file.name: {**self.expected_manifest_entry(unchanged_file), "crc32": 123},
+                        changed_file.name: {"size": 1, "mtime": 0, "crc32": 456},
+                    }
+                }
+            }
+
+            with patch("bin.create_download_view_for_sample_data._get_data_files", return_value=data_files):
+                create_download_view_for_sample_data(
+                    PROJECT, self.db, INSTITUTION_KEYS, DATA_DIR, OUTPUT_DIR, calculate_crc32=True
+                )
+
+            manifest = next(
+                call_args[0][0]
+                for call_args in self.write_lane_files_manifest.call_args_list
+                if PUBLIC_NAMES[2] in call_args[0][0]
+            )
+            self.assertEqual(123, manifest[PUBLIC_NAMES[2]][LANES[2]][unchanged_file.name]["crc32"])
+            self.assertEqual(
+                zlib.crc32(changed_file.read_bytes()), manifest[PUBLIC_NAMES[2]][LANES[2]][changed_file.name]["crc32"]
+            )
+
+    def test_write_data_view_state(self):
+        state = self.run_with_state({})
+
+        self.assertEqual(DATA_VIEW_STATE_VERSION, state["version"])
+        self.assertEqual({}, state["data_dirs"])
+        self.assertEqual(
+            {
+                "MinHeaCenLab": {
+                    PUBLIC_NAMES[0]: {LANES[0]: [data_file_path(LANES[0])], LANES[1]: [data_file_path(LANES[1])]},
+                    PUBLIC_NAMES[1]: {},
+                },
+                "WelSanIns": {PUBLIC_NAMES[2]: {LANES[2]: [data_file_path(LANES[2])]}, PUBLIC_NAMES[3]: {}},
+                "LabCenEstPar": {PUBLIC_NAMES[4]: {}},
+            },
+            state["institutions"],
+        )
+
+    def test_incremental_run_leaves_unchanged_public_names_alone(self):
+        previous_state = self.run_with_state({})
+        self.read_lane_files_manifest.side_effect = self.written_lane_files_manifests()
+        self.mkdir.reset_mock()
+        self.create_symlink_to.reset_mock()
+
+        state = self.run_with_state(previous_state, incremental=True)
+
+        self.assertEqual(previous_state["institutions"], state["institutions"])
+        self.create_symlink_to.assert_not_called()
+        for public_name in PUBLIC_NAMES:
+            self.assert_mkdir_not_called_with(public_name)
+        self.remove_symlink.assert_not_called()
+        self.remove_public_name_dir.assert_not_called()
+
+    def test_incremental_run_updates_changed_public_names(self):
+        previous_state = self.run_with_state({})
+        previous_state["institutions"]["WelSanIns"][PUBLIC_NAMES[2]][LANES[2]] = ["/abs/path/data/old.fa"]
+        self.read_lane_files_manifest.side_effect = self.written_lane_files_manifests()
+        self.create_symlink_to.reset_mock()
+
+        self.run_with_state(previous_state, incremental=True)
+
+        self.remove_symlink.assert_called_once_with(Path(PUBLIC_NAMES[2], "old.fa"))
+        self.create_symlink_to.assert_called_once_with(Path(data_file_path(LANES[2])), f"{LANES[2]}.fa")
+
+    def test_incremental_run_keeps_time_of_last_full_run(self):
+        previous_state = self.run_with_state({})
+
+        state = self.run_with_state(previous_state, incremental=True)
+
+        self.assertEqual(previous_state["full_run_time"], state["full_run_time"])
+
+    def test_incremental_run_is_full_run_if_last_full_run_is_too_old(self):
+        previous_state = self.run_with_state({})
+        previous_state["full_run_time"] -= (DEFAULT_FULL_RESCAN_HOURS + 1) * 60 * 60
+        self.read_lane_files_manifest.side_effect = self.written_lane_files_manifests()
+        self.create_symlink_to.reset_mock()
+
+        state = self.run_with_state(previous_state, incremental=True)
+
+        self.assertGreater(state["full_run_time"], previous_state["full_run_time"])
+        # every public name directory is updated, although none has changed
+        self.assertEqual(len(LANES), self.create_symlink_to.call_count)
+
+    def test_stale_public_name_dirs_are_pruned(self):
+        previous_state = self.run_with_state({})
+        previous_state["institutions"]["WelSanIns"]["stale_public_name"] = {"lane": ["/abs/path/data/lane.fa"]}
+
+        state = self.run_with_state(previous_state, incremental=True)
+
+        self.remove_public_name_dir.assert_called_once_with("stale_public_name")
+        self.assertNotIn("stale_public_name", state["institutions"]["WelSanIns"])
+
+    def test_public_name_is_not_pruned_if_its_lanes_cannot_be_looked_up(self):
+        previous_state = self.run_with_state({})
+
+        def get_sequencing_status_data_failing(sanger_sample_ids):
+            if SAMPLE_IDS[2] in sanger_sample_ids:
+                raise HTTPError("url", 500, "MLWH API error", {}, None)
+            return get_sequencing_status_data(sanger_sample_ids)
+
+        with patch(
+            "bin.create_download_view_for_sample_data._get_sequencing_status_data",
+            get_sequencing_status_data_failing,
+        ):
+            state = self.run_with_state(previous_state, incremental=True)
+
+        self.remove_public_name_dir.assert_not_called()
+        self.assertEqual(
+            previous_state["institutions"]["WelSanIns"][PUBLIC_NAMES[2]],
+            state["institutions"]["WelSanIns"][PUBLIC_NAMES[2]],
+        )
+
+    def test_remove_public_name_dir_only_removes_symlinks(self):
+        with TemporaryDirectory() as temp_dir:
+            data_file = Path(temp_dir, "lane.fa")
+            data_file.write_text("lane")
+            for public_name in ("public_name_1", "public_name_2"):
+                Path(temp_dir, public_name).mkdir()
+                Path(temp_dir, public_name, data_file.name).symlink_to(data_file)
+            Path(temp_dir, "public_name_2", "not_a_symlink").write_text("kept")
+
+            _remove_public_name_dir(Path(temp_dir, "public_name_1"))
+            _remove_public_name_dir(Path(temp_dir, "public_name_2"))
+
+            self.assertFalse(Path(temp_dir, "public_name_1").exists())
+            self.assertEqual(["not_a_symlink"], os.listdir(Path(temp_dir, "public_name_2")))
+            self.assertTrue(data_file.is_file())
+
+    def test_list_data_dir_only_lists_changed_directories(self):
+        with TemporaryDirectory() as data_dir:
+            for data_file in ("assembly/1_1#1.contigs_spades.fa", "annotation/1_1#1.spades.gff"):
+                Path(data_dir, data_file).parent.mkdir(exist_ok=True)
+                Path(data_dir, data_file).write_text(data_file)
+            data_dir_paths, dir_listings = _list_data_dir(data_dir, {})
+            expected_paths = {
+                "assembly",
+                "annotation",
+                "assembly/1_1#1.contigs_spades.fa",
+                "annotation/1_1#1.spades.gff",
+            }
+            self.assertEqual(expected_paths, set(data_dir_paths))
+
+            Path(data_dir, "assembly/2_2#2.contigs_spades.fa").write_text("new data file")
+            # the previous listing of "annotation" is reused: this shows it wasn't listed again
+            dir_listings["annotation"]["entries"] = [["cached.gff", False]]
+            data_dir_paths, _ = _list_data_dir(data_dir, dir_listings)
+
+        self.assertEqual(
+            {"assembly", "annotation", "assembly/1_1#1.contigs_spades.fa", "assembly/2_2#2.contigs_spades.fa"}
+            | {"annotation/cached.gff"},
+            set(data_dir_paths),
+        )
+
+    def run_with_state(self, previous_state, incremental=False):
+        # runs the script with the data view state `previous_state`, and returns the new state
+        with patch(
+            "bin.create_download_view_for_sample_data._read_data_view_state", return_value=previous_state
+        ), patch("bin.create_download_view_for_sample_data._write_data_view_state") as write_data_view_state, patch(
+            "bin.create_download_view_for_sample_data._list_data_dir", return_value=([], {})
+        ), patch(
+            "bin.create_download_view_for_sample_data._get_data_files",
+            side_effect=lambda data_file_lookup_by_lane_id, lane_id: [Path(data_file_path(lane_id))],
+        ), patch(
+            "bin.create_download_view_for_sample_data._lane_files_manifest_is_complete", return_value=True
+        ):
+            create_download_view_for_sample_data(
+                PROJECT, self.db, INSTITUTION_KEYS, DATA_DIR, OUTPUT_DIR, state_file=STATE_FILE, incremental=incremental
+            )
+        return write_data_view_state.call_args[0][1]
+
+    def written_lane_files_manifests(self):
+        return [call_args[0][0] for call_args in self.write_lane_files_manifest.call_args_list]
+
+    def make_data_files(self, temp_dir):
+        data_files = []
+        for file_name in ("lane.contigs_spades.fa", "lane.spades.gff"):
+            data_file = Path(temp_dir, file_name)
+            data_file.write_text(file_name)
+            data_files.append(data_file)
+        return data_files
+
+    def expected_manifest_entry(self, data_file):
+        file_stat = os.stat(data_file)
+        return {"size": file_stat.st_size, "mtime": file_stat.st_mtime}
+
     def assert_mkdir_not_called_with(self, institution_id):
         try:
             self.mkdir.assert_any_call(institution_id)
@@ -109,8 +375,15 @@ class CreateDownloadViewForSampleDataTest(TestCase):
         raise AssertionError(f'Expected `mkdir` to not have been called w/ "{institution_id}".')
 
 
+def data_file_path(lane_id):
+    return f"{DATA_DIR}/{lane_id}.fa"
+
+
 def get_sequencing_status_data(sanger_sample_ids):
-    return SEQUENCING_STATUS_DATA[sanger_sample_ids[0]]
+    seq_data = {}
+    for sanger_sample_id in sanger_sample_ids:
+        seq_data.update(SEQUENCING_STATUS_DATA[sanger_sample_id])
+    return seq_data
 
 
 class DB:
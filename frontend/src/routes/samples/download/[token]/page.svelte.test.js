@@ -87,6 +87,40 @@ describe("on", () => {
     });
   });
 
+  describe("download still being prepared", () => {
+    beforeEach(() => {
+      jest.useFakeTimers();
+    });
+
+    afterEach(() => {
+      jest.useRealTimers();
+      xmlHttpRequestMock.status = undefined;
+    });
+
+    it("repeats the request after a while and keeps showing the loading indicator", () => {
+      xmlHttpRequestMock.open.mockClear();
+      const { getByLabelText } = render(InterstitialPage, {
+        data: { downloadToken: DOWNLOAD_TOKEN },
+      });
+      const loadCallback = xmlHttpRequestMock.addEventListener.mock.calls.find(
+        (args) => args[0] === EVENT_NAME_LOAD
+      )[1];
+      xmlHttpRequestMock.status = 202;
+      xmlHttpRequestMock.responseText = `{"status":"running","percent complete":42}`;
+
+      loadCallback();
+
+      expect(xmlHttpRequestMock.open).toHaveBeenCalledTimes(1);
+      jest.runOnlyPendingTimers();
+      expect(xmlHttpRequestMock.open).toHaveBeenCalledTimes(2);
+      expect(xmlHttpRequestMock.open).toHaveBeenLastCalledWith(
+        "GET",
+        `/data_download/${DOWNLOAD_TOKEN}?redirect=false`
+      );
+      expect(getByLabelText(LABEL_LOADING_INDICATOR)).toBeDefined();
+    });
+  });
+
   describe("error", () => {
     const EVENT_NAME_ERROR = "error";
 
@@ -19,6 +19,8 @@ HTTP_SUCCEEDED_STATUS = 200
 
 UPLOAD_EXTENSION = ".xlsx"
 
+DOWNLOAD_DATA_TYPES = ("metadata", "qc_data", "in_silico_data")
+
 # regex for names allowed for filters; interpolated into SQL, so must prevent injection
 # (this is easy in practice, as it only has to match column names we choose to sue the the db schema)
 FIELD_NAME_REGEX = "^[a-zA-Z0-9_]+$"
@@ -206,6 +208,18 @@ def get_project_information(dao: MonocleDatabaseService):
     return result, HTTP_SUCCEEDED_STATUS
 
 
+def get_download_columns_route():
+    """
+    Column titles of the metadata, QC data and in silico data downloads, in the order they are downloaded;
+    these are the same for every download, so a client can know all the columns before it has any data
+    """
+    download_columns = {
+        data_type: [column["title"] for column in application.config[data_type]["spreadsheet_definition"].values()]
+        for data_type in DOWNLOAD_DATA_TYPES
+    }
+    return convert_to_json({"download_columns": download_columns}), HTTP_SUCCEEDED_STATUS
+
+
 def _get_uploaded_spreadsheet(file_name_param):
     # returns uploaded spreadsheet file, or None if missing
     try:
@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import MagicMock, patch
 
 import metadata.api.routes as mar
+from flask import Flask
 from metadata.api.routes import update_in_silico_data_route, update_qc_data_route, update_sample_metadata_route
 from metadata.tests.test_data import TEST_LANE_IN_SILICO_1, TEST_LANE_QC_DATA_1, TEST_SAMPLE_1
 
@@ -216,3 +217,34 @@ class TestRoutes(unittest.TestCase):
         under_test = mar.get_samples_route(fakeDB)
         mocked_jsoncall.assert_called_once()
         self.assertEqual(under_test, ("", 404))
+
+    @patch("metadata.api.routes.convert_to_json")
+    def test_get_download_columns_route(self, mocked_jsoncall):
+        mocked_jsoncall.return_value = "expected"
+        app = Flask(__name__)
+        app.config.update(
+            {
+                "metadata": {
+                    "spreadsheet_definition": {
+                        "sanger_sample_id": {"title": "Sanger_Sample_ID"},
+                        "lane_id": {"title": "Lane_ID"},
+                    }
+                },
+                "qc_data": {
+                    "spreadsheet_definition": {"lane_id": {"title": "lane_id"}, "rel_abun_sa": {"title": "QC"}}
+                },
+                "in_silico_data": {"spreadsheet_definition": {"lane_id": {"title": "Sample_id"}}},
+            }
+        )
+        with app.app_context():
+            under_test = mar.get_download_columns_route()
+        mocked_jsoncall.assert_called_once_with(
+            {
+                "download_columns": {
+                    "metadata": ["Sanger_Sample_ID", "Lane_ID"],
+                    "qc_data": ["lane_id", "QC"],
+                    "in_silico_data": ["Sample_id"],
+                }
+            }
+        )
+        self.assertEqual(under_test, ("expected", 200))